@@ -0,0 +1,104 @@
+"""
+backfill_approval_queue.py
+──────────────────────────
+Builds the Approval_queue collection (one document per approver, employee,
+payroll_month and level still waiting for a decision) from Status.
+
+Safe to re-run: items are upserted by their key. Items whose month is no
+longer pending in Status are removed at the end of the run.
+
+Usage:
+    python backfill_approval_queue.py                 # upsert + prune stale items
+    python backfill_approval_queue.py --rebuild       # drop Approval_queue first
+    python backfill_approval_queue.py --drop-legacy   # also drop Pending / HR_Pending
+"""
+
+import argparse
+import asyncio
+from collections import Counter
+from datetime import datetime
+
+from pymongo import ReplaceOne
+
+from main import client, db, build_approval_queue_items, approval_queue_item_hash, ensure_approval_queue_indexes
+
+BATCH_SIZE = 500
+
+
+async def backfill(rebuild: bool = False, drop_legacy: bool = False):
+    queue_collection = db["Approval_queue"]
+
+    if rebuild:
+        await queue_collection.drop()
+        print("🗑️ Dropped Approval_queue")
+
+    await ensure_approval_queue_indexes()
+    print("✅ Approval_queue indexes ensured")
+
+    total_docs = await db["Status"].count_documents({})
+    print(f"\n📂 Status: {total_docs} documents")
+
+    synced_at = datetime.utcnow().isoformat()
+    processed_docs = 0
+    written = 0
+    per_level = Counter()
+    operations = []
+
+    async for status_doc in db["Status"].find({}, batch_size=100):
+        processed_docs += 1
+
+        for item in build_approval_queue_items(status_doc):
+            item["content_hash"] = approval_queue_item_hash(item)
+            item["synced_at"] = synced_at
+            per_level[item["level"]] += 1
+            operations.append(ReplaceOne({"_id": item["_id"]}, item, upsert=True))
+
+        if len(operations) >= BATCH_SIZE:
+            await queue_collection.bulk_write(operations, ordered=False)
+            written += len(operations)
+            operations = []
+
+        if processed_docs % 100 == 0:
+            print(f"➡️ Processed {processed_docs}/{total_docs} docs | Items: {written + len(operations)}")
+
+    if operations:
+        await queue_collection.bulk_write(operations, ordered=False)
+        written += len(operations)
+
+    # Anything not touched in this run is no longer pending in Status
+    pruned = await queue_collection.delete_many({"synced_at": {"$lt": synced_at}})
+
+    print("\n📊 Approval_queue DONE")
+    print(f"   ✅ Items written : {written}")
+    for level, count in sorted(per_level.items()):
+        print(f"      {level}: {count}")
+    print(f"   🗑️ Stale pruned  : {pruned.deleted_count}")
+
+    if drop_legacy:
+        await db["Pending"].drop()
+        await db["HR_Pending"].drop()
+        print("🗑️ Dropped legacy Pending / HR_Pending")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Build Approval_queue from Status")
+    parser.add_argument("--rebuild", action="store_true", help="drop Approval_queue before backfilling")
+    parser.add_argument("--drop-legacy", action="store_true", help="drop the old Pending / HR_Pending collections")
+    args = parser.parse_args()
+
+    print("\n" + "#"*60)
+    print("# Status → Approval_queue Backfill")
+    print(f"# Started: {datetime.utcnow().isoformat()}")
+    print("#"*60)
+
+    try:
+        await backfill(rebuild=args.rebuild, drop_legacy=args.drop_legacy)
+        print("\n" + "#"*60)
+        print(f"# Finished: {datetime.utcnow().isoformat()}")
+        print("#"*60)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,130 @@
+"""
+backfill_ope_entries.py
+───────────────────────
+Builds the flat OPE_entries collection (one document per OPE entry) from
+the nested OPE_data.Data[{month_range: [entries]}] layout.
+
+Safe to re-run: rows are upserted by entry _id. Rows whose entry no longer
+exists in OPE_data are removed at the end of the run.
+
+Employees whose mirror sync failed outside a transaction are listed in
+OPE_entries_stale; --stale re-syncs just those (entries and rollups) and
+clears them.
+
+Usage:
+    python backfill_ope_entries.py            # upsert + prune stale rows
+    python backfill_ope_entries.py --rebuild  # drop OPE_entries first
+    python backfill_ope_entries.py --stale    # repair employees in OPE_entries_stale
+"""
+
+import argparse
+import asyncio
+from datetime import datetime
+
+from pymongo import ReplaceOne
+
+from main import client, db, build_ope_entry_rows, ensure_ope_entry_indexes, sync_ope_entries
+
+BATCH_SIZE = 500
+
+
+async def backfill(rebuild: bool = False):
+    entries_collection = db["OPE_entries"]
+
+    if rebuild:
+        await entries_collection.drop()
+        print("🗑️ Dropped OPE_entries")
+
+    await ensure_ope_entry_indexes()
+    print("✅ OPE_entries indexes ensured")
+
+    total_docs = await db["OPE_data"].count_documents({})
+    print(f"\n📂 OPE_data: {total_docs} documents")
+
+    synced_at = datetime.utcnow().isoformat()
+    processed_docs = 0
+    written = 0
+    missing_ids = 0
+    operations = []
+
+    async for doc in db["OPE_data"].find({}, batch_size=50):
+        processed_docs += 1
+
+        for data_item in doc.get("Data", []):
+            for entries in data_item.values():
+                missing_ids += sum(1 for e in entries if isinstance(e, dict) and not e.get("_id"))
+
+        for row in build_ope_entry_rows(doc):
+            row["synced_at"] = synced_at
+            operations.append(ReplaceOne({"_id": row["_id"]}, row, upsert=True))
+
+        if len(operations) >= BATCH_SIZE:
+            await entries_collection.bulk_write(operations, ordered=False)
+            written += len(operations)
+            operations = []
+
+        if processed_docs % 100 == 0:
+            print(f"➡️ Processed {processed_docs}/{total_docs} docs | Rows: {written + len(operations)}")
+
+    if operations:
+        await entries_collection.bulk_write(operations, ordered=False)
+        written += len(operations)
+
+    # Anything not touched in this run no longer exists in OPE_data
+    pruned = await entries_collection.delete_many({"synced_at": {"$lt": synced_at}})
+
+    print("\n📊 OPE_entries DONE")
+    print(f"   ✅ Rows written : {written}")
+    print(f"   🗑️ Stale pruned : {pruned.deleted_count}")
+    print(f"   ⚠️ Entries without _id (skipped): {missing_ids}")
+    print("\n👉 Run rebuild_ope_rollups.py next to refresh OPE_rollups")
+
+
+async def repair_stale():
+    stale_collection = db["OPE_entries_stale"]
+    total = await stale_collection.count_documents({})
+    print(f"\n📂 OPE_entries_stale: {total} employees")
+
+    repaired = 0
+    failed = 0
+    async for stale in stale_collection.find({}):
+        employee_id = stale["_id"]
+        try:
+            rows = await sync_ope_entries(employee_id)
+            await stale_collection.delete_one({"_id": employee_id, "failed_at": stale.get("failed_at")})
+            repaired += 1
+            print(f"✅ {employee_id}: {rows} rows")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {employee_id}: {e}")
+
+    print("\n📊 OPE_entries_stale DONE")
+    print(f"   ✅ Repaired : {repaired}")
+    print(f"   ❌ Failed   : {failed}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Build OPE_entries from OPE_data")
+    parser.add_argument("--rebuild", action="store_true", help="drop OPE_entries before backfilling")
+    parser.add_argument("--stale", action="store_true", help="only re-sync employees listed in OPE_entries_stale")
+    args = parser.parse_args()
+
+    print("\n" + "#"*60)
+    print("# OPE_data → OPE_entries Backfill")
+    print(f"# Started: {datetime.utcnow().isoformat()}")
+    print("#"*60)
+
+    try:
+        if args.stale:
+            await repair_stale()
+        else:
+            await backfill(rebuild=args.rebuild)
+        print("\n" + "#"*60)
+        print(f"# Finished: {datetime.utcnow().isoformat()}")
+        print("#"*60)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
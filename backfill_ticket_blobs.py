@@ -0,0 +1,165 @@
+"""
+backfill_ticket_blobs.py
+────────────────────────
+Registers ticket PDFs uploaded before receipts were content-addressed.
+
+For every GridFS file referenced by an OPE_data / Temp_OPE_data entry the
+SHA-256 is read from the file document (or computed by streaming the file
+once and stored). Files with identical content are collapsed onto the
+oldest copy: entries are re-pointed at it and the extra copies are deleted.
+Ticket_blobs is then written with the recounted references.
+
+Run it in a quiet window - uploads made while it runs may be miscounted.
+Safe to re-run.
+
+Usage:
+    python backfill_ticket_blobs.py            # hash, de-duplicate, recount
+    python backfill_ticket_blobs.py --dry-run  # report duplicates only
+"""
+
+import argparse
+import asyncio
+import hashlib
+from collections import defaultdict
+from datetime import datetime
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from pymongo import ReplaceOne
+
+from main import client, db, is_gridfs_id, sync_ope_entries, ensure_ticket_blob_indexes
+
+ENTRY_COLLECTIONS = ["OPE_data", "Temp_OPE_data"]
+
+
+def iter_entries(doc):
+    for data_item in doc.get("Data", []):
+        for entries in data_item.values():
+            for entry in entries:
+                if isinstance(entry, dict):
+                    yield entry
+
+
+async def file_digest(bucket, file_doc) -> str:
+    """SHA-256 of a GridFS file, computed (and stored) if the upload predates hashing."""
+    if file_doc.get("sha256"):
+        return file_doc["sha256"]
+
+    hasher = hashlib.sha256()
+    grid_out = await bucket.open_download_stream(file_doc["_id"])
+    while True:
+        chunk = await grid_out.readchunk()
+        if not chunk:
+            break
+        hasher.update(chunk)
+    digest = hasher.hexdigest()
+    await db["fs.files"].update_one({"_id": file_doc["_id"]}, {"$set": {"sha256": digest}})
+    return digest
+
+
+async def backfill(dry_run: bool = False):
+    bucket = AsyncIOMotorGridFSBucket(db)
+    await ensure_ticket_blob_indexes()
+    print("✅ Ticket_blobs indexes ensured")
+
+    # 1. Count references per file
+    refcounts = defaultdict(int)
+    for coll in ENTRY_COLLECTIONS:
+        async for doc in db[coll].find({}, {"Data": 1}, batch_size=50):
+            for entry in iter_entries(doc):
+                pdf_id = entry.get("ticket_pdf")
+                if pdf_id and is_gridfs_id(pdf_id):
+                    refcounts[pdf_id] += 1
+    print(f"\n📂 Referenced ticket PDFs: {len(refcounts)}")
+
+    # 2. Hash every referenced file, oldest first so the oldest copy wins
+    by_digest = defaultdict(list)
+    hashed = 0
+    ids = [ObjectId(file_id) for file_id in refcounts]
+    async for file_doc in db["fs.files"].find({"_id": {"$in": ids}}).sort("uploadDate", 1):
+        digest = await file_digest(bucket, file_doc)
+        by_digest[digest].append(file_doc)
+        hashed += 1
+        if hashed % 100 == 0:
+            print(f"➡️ Hashed {hashed}/{len(ids)} files")
+    missing = len(ids) - hashed
+
+    remap = {}
+    for digest, files in by_digest.items():
+        canonical = str(files[0]["_id"])
+        for dup in files[1:]:
+            remap[str(dup["_id"])] = canonical
+    print(f"🔁 Duplicate copies: {len(remap)} across {sum(1 for f in by_digest.values() if len(f) > 1)} receipts")
+
+    if dry_run:
+        print("\n👉 Dry run - nothing written")
+        return
+
+    # 3. Re-point entries at the surviving copy
+    rewritten_docs = 0
+    if remap:
+        for coll in ENTRY_COLLECTIONS:
+            async for doc in db[coll].find({}, {"employeeId": 1, "Data": 1}, batch_size=50):
+                changed = False
+                for entry in iter_entries(doc):
+                    canonical = remap.get(entry.get("ticket_pdf"))
+                    if canonical:
+                        entry["ticket_pdf"] = canonical
+                        changed = True
+                if not changed:
+                    continue
+                await db[coll].update_one({"_id": doc["_id"]}, {"$set": {"Data": doc["Data"]}})
+                if coll == "OPE_data":
+                    await sync_ope_entries(doc["employeeId"])
+                rewritten_docs += 1
+
+        for dup_id in remap:
+            await bucket.delete(ObjectId(dup_id))
+
+    # 4. Write Ticket_blobs with the recounted references
+    now = datetime.utcnow()
+    operations = []
+    for digest, files in by_digest.items():
+        canonical = files[0]
+        operations.append(ReplaceOne(
+            {"_id": digest},
+            {
+                "file_id": str(canonical["_id"]),
+                "refcount": sum(refcounts[str(f["_id"])] for f in files),
+                "length": canonical.get("length", 0),
+                "created_at": canonical.get("uploadDate") or now,
+                "updated_at": now,
+            },
+            upsert=True
+        ))
+    if operations:
+        await db["Ticket_blobs"].bulk_write(operations, ordered=False)
+
+    print("\n📊 Ticket_blobs DONE")
+    print(f"   ✅ Receipts registered : {len(operations)}")
+    print(f"   📝 Documents rewritten : {rewritten_docs}")
+    print(f"   🗑️ Copies deleted      : {len(remap)}")
+    print(f"   ⚠️ Missing GridFS files: {missing}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Register and de-duplicate ticket PDFs in Ticket_blobs")
+    parser.add_argument("--dry-run", action="store_true", help="report duplicates without writing")
+    args = parser.parse_args()
+
+    print("\n" + "#"*60)
+    print("# Ticket PDFs → Ticket_blobs Backfill")
+    print(f"# Started: {datetime.utcnow().isoformat()}")
+    print("#"*60)
+
+    try:
+        await backfill(dry_run=args.dry_run)
+        print("\n" + "#"*60)
+        print(f"# Finished: {datetime.utcnow().isoformat()}")
+        print("#"*60)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
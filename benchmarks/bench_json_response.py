@@ -0,0 +1,120 @@
+"""
+bench_json_response.py
+──────────────────────
+Times SafeJSONResponse against the previous implementation (recursive
+sanitize copy + json.dumps) on a payload shaped like
+/api/admin/analysis/duplicate-locations: thousands of locations, each
+with its all_claims rows, and a sprinkling of NaN amounts.
+
+"legacy" includes FastAPI's jsonable_encoder pass, which the old endpoints
+went through before render(); "render only" compares the two render()
+methods on the same already-encoded content.
+
+Usage:
+    python benchmarks/bench_json_response.py
+    python benchmarks/bench_json_response.py --locations 5000 --claims 20 --repeat 5
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from main import SafeJSONResponse
+
+
+class LegacySafeJSONResponse(JSONResponse):
+    """SafeJSONResponse as it was before the single-pass renderer."""
+    def render(self, content) -> bytes:
+        def sanitize(obj):
+            if isinstance(obj, float):
+                if math.isnan(obj) or math.isinf(obj):
+                    return 0.0
+                return obj
+            if isinstance(obj, dict):
+                return {k: sanitize(v) for k, v in obj.items()}
+            if isinstance(obj, list):
+                return [sanitize(i) for i in obj]
+            return obj
+        return json.dumps(sanitize(content), ensure_ascii=False).encode("utf-8")
+
+
+def build_payload(locations: int, claims: int, seed: int = 7) -> dict:
+    rng = random.Random(seed)
+    cities = ["Mumbai", "Pune", "Thane", "Navi Mumbai", "Nashik", "Vashi", "Andheri", "Borivali"]
+    location_analysis = []
+    for i in range(locations):
+        route = f"{rng.choice(cities)} → {rng.choice(cities)} #{i}"
+        all_claims = []
+        for _ in range(claims):
+            amount = rng.choice([float("nan"), float("inf")]) if rng.random() < 0.01 else round(rng.uniform(50, 5000), 2)
+            all_claims.append({
+                "employee_id": f"JHS{rng.randint(100, 999)}",
+                "employee_name": f"Employee {rng.randint(1, 5000)}",
+                "date": f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                "month_range": "Mar 2026",
+                "amount": amount,
+                "travel_mode": rng.choice(["Auto", "Cab", "Train", "Bus"]),
+                "client": f"Client {rng.randint(1, 300)}",
+                "status": rng.choice(["pending", "approved", "rejected"]),
+            })
+        location_analysis.append({
+            "location_route": route,
+            "total_claims": claims,
+            "unique_employees": rng.randint(1, claims),
+            "duplicate_claims": rng.randint(1, claims),
+            "amount_stats": {"average": 1000.0, "minimum": 50.0, "maximum": 5000.0, "spread": 4950.0},
+            "all_claims": all_claims,
+        })
+    return {
+        "location_analysis": location_analysis,
+        "total_locations_analyzed": locations,
+        "total_duplicate_claims": locations * claims,
+    }
+
+
+def best_of(repeat: int, fn) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SafeJSONResponse rendering")
+    parser.add_argument("--locations", type=int, default=2000)
+    parser.add_argument("--claims", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    payload = build_payload(args.locations, args.claims)
+    legacy_body = LegacySafeJSONResponse(jsonable_encoder(payload)).body
+    new_body = SafeJSONResponse(payload).body
+    assert json.loads(legacy_body) == json.loads(new_body), "renderers disagree"
+
+    print(f"\n📦 Payload: {args.locations} locations x {args.claims} claims ({len(new_body) / 1024 / 1024:.1f} MB JSON)")
+
+    encoded = jsonable_encoder(payload)
+    results = [
+        ("legacy (jsonable_encoder + render)", best_of(args.repeat, lambda: LegacySafeJSONResponse(jsonable_encoder(payload)))),
+        ("new (direct SafeJSONResponse)", best_of(args.repeat, lambda: SafeJSONResponse(payload))),
+        ("legacy render only", best_of(args.repeat, lambda: LegacySafeJSONResponse(encoded))),
+        ("new render only", best_of(args.repeat, lambda: SafeJSONResponse(encoded))),
+    ]
+    for name, seconds in results:
+        print(f"   {name:<38} {seconds * 1000:8.1f} ms")
+    print(f"\n🚀 End to end: {results[0][1] / results[1][1]:.1f}x | render only: {results[2][1] / results[3][1]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
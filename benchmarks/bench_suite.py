@@ -0,0 +1,187 @@
+"""
+bench_suite.py
+──────────────
+Micro-benchmarks for the Python side of the OPE data model, on data from
+generate_dataset.py (same seed → same data → comparable numbers).
+
+In-memory benchmarks (always run) time the pure transformations on
+generated documents: OPE_data → OPE_entries rows, rollups, approval-queue
+items, audit rows and SafeJSONResponse rendering.
+
+With --live the suite also times the DB-backed builders against a database
+seeded by generate_dataset.py: get_all_ope_entries, admin_client_analysis
+and the client-wise / partner-wise / audit export row iterators. For those
+the MongoDB time (from command monitoring) is split out, so "python" is
+the part an optimisation in main.py can change.
+
+Save a run with --save and compare a later one with --baseline.
+
+Usage:
+    python benchmarks/bench_suite.py --employees 2000 --months 24
+    python benchmarks/bench_suite.py --live --db OPE_bench --save baseline.json
+    python benchmarks/bench_suite.py --live --db OPE_bench --baseline baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import generate_dataset
+
+
+def timed(repeat: int, fn) -> dict:
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return {"best": min(timings), "median": statistics.median(timings), "result": result}
+
+
+async def timed_async(repeat: int, fn) -> dict:
+    import main
+
+    timings, mongo, trips = [], [], 0
+    result = None
+    for _ in range(repeat):
+        async with main.query_budget(10 ** 9, repeat_threshold=10 ** 9) as stats:
+            started = time.perf_counter()
+            result = await fn()
+            timings.append(time.perf_counter() - started)
+        mongo.append(stats.mongo_seconds)
+        trips = stats.round_trips
+    best = min(range(repeat), key=lambda i: timings[i])
+    return {
+        "best": timings[best],
+        "median": statistics.median(timings),
+        "mongo": mongo[best],
+        "python": max(0.0, timings[best] - mongo[best]),
+        "round_trips": trips,
+        "result": result,
+    }
+
+
+def in_memory_benchmarks(args) -> dict:
+    import main
+
+    docs = {"OPE_data": [], "Status": []}
+    for collection, doc in generate_dataset.generate(args.employees, args.months, args.seed,
+                                                     receipt_ids=[f"{i:024x}" for i in range(200)]):
+        if collection in docs:
+            docs[collection].append(doc)
+    entry_count = sum(len(e) for d in docs["OPE_data"] for item in d["Data"] for e in item.values())
+    print(f"\n📦 In memory: {len(docs['OPE_data'])} employees, {entry_count} entries")
+
+    results = {}
+    rows_by_employee = []
+
+    def entry_rows():
+        rows_by_employee.clear()
+        for doc in docs["OPE_data"]:
+            rows_by_employee.append(main.build_ope_entry_rows(doc))
+        return rows_by_employee
+
+    results["build_ope_entry_rows"] = timed(args.repeat, entry_rows)
+    all_rows = [row for rows in rows_by_employee for row in rows]
+    results["build_rollup_docs"] = timed(args.repeat, lambda: [main.build_rollup_docs(rows) for rows in rows_by_employee])
+    results["build_approval_queue_items"] = timed(
+        args.repeat, lambda: [main.build_approval_queue_items(doc) for doc in docs["Status"]])
+
+    receipt_claims = {}
+    for row in all_rows:
+        if row.get("ticket_pdf"):
+            receipt_claims[row["ticket_pdf"]] = receipt_claims.get(row["ticket_pdf"], 0) + 1
+    emp_details = {"Designation Name": "Manager", "Partner": "Partner 1", "ReportingEmpName": "Manager 1"}
+    results["build_audit_entry"] = timed(
+        args.repeat, lambda: [main.build_audit_entry(row, emp_details, receipt_claims) for row in all_rows])
+
+    payload = {"entries": all_rows}
+    results["SafeJSONResponse.render"] = timed(args.repeat, lambda: main.SafeJSONResponse(payload).body)
+    return results
+
+
+async def live_benchmarks(args) -> dict:
+    import main
+
+    admin = {"employee_code": generate_dataset.HR_CODE}
+    entries = await main.db["OPE_entries"].estimated_document_count()
+    print(f"\n🗄️ Live: {args.db} ({entries} OPE_entries rows)")
+
+    async def consume(rows):
+        return [row async for row in rows]
+
+    results = {}
+    results["get_all_ope_entries"] = await timed_async(args.repeat, lambda: main.get_all_ope_entries())
+    results["admin_client_analysis"] = await timed_async(
+        args.repeat, lambda: main.admin_client_analysis(payroll_month=None, current_user=admin))
+    results["iter_client_wise_rows"] = await timed_async(args.repeat, lambda: consume(main.iter_client_wise_rows()))
+    results["iter_partner_wise_rows"] = await timed_async(args.repeat, lambda: consume(main.iter_partner_wise_rows()))
+    results["iter_audit_entries"] = await timed_async(args.repeat, lambda: consume(main.iter_audit_entries()))
+
+    all_entries = results["get_all_ope_entries"]["result"]
+    results["render get_all_ope_entries"] = timed(
+        args.repeat, lambda: main.SafeJSONResponse({"entries": all_entries}).body)
+    return results
+
+
+def report(results: dict, baseline: dict):
+    print(f"\n{'benchmark':<32} {'best ms':>10} {'median ms':>10} {'python ms':>10} {'mongo ms':>10} {'trips':>6} {'vs base':>8}")
+    for name, r in results.items():
+        python_ms = f"{r['python'] * 1000:10.1f}" if "python" in r else f"{'':>10}"
+        mongo_ms = f"{r['mongo'] * 1000:10.1f}" if "mongo" in r else f"{'':>10}"
+        trips = f"{r['round_trips']:6d}" if "round_trips" in r else f"{'':>6}"
+        versus = ""
+        if name in baseline and baseline[name]["best"]:
+            versus = f"{baseline[name]['best'] / r['best']:7.2f}x"
+        print(f"{name:<32} {r['best'] * 1000:10.1f} {r['median'] * 1000:10.1f} {python_ms} {mongo_ms} {trips} {versus:>8}")
+
+
+async def main_async():
+    parser = argparse.ArgumentParser(description="OPE micro-benchmark suite")
+    parser.add_argument("--employees", type=int, default=2000, help="in-memory dataset size")
+    parser.add_argument("--months", type=int, default=24)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--live", action="store_true", help="also time the DB-backed builders")
+    parser.add_argument("--db", default="OPE_bench", help="database seeded by generate_dataset.py")
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against a JSON file written by --save")
+    args = parser.parse_args()
+
+    load_dotenv()
+    os.environ["MONGO_DB"] = args.db
+    import main
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    try:
+        results = in_memory_benchmarks(args)
+        if args.live:
+            results.update(await live_benchmarks(args))
+    finally:
+        main.client.close()
+
+    report(results, baseline)
+
+    if args.save:
+        clean = {name: {k: v for k, v in r.items() if k != "result"} for name, r in results.items()}
+        with open(args.save, "w") as f:
+            json.dump({"params": vars(args), "results": clean}, f, indent=2)
+        print(f"\n💾 Saved to {args.save}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main_async())
@@ -0,0 +1,192 @@
+"""
+check_rollups.py
+────────────────
+Exercises the incremental OPE_entries / OPE_rollups sync on a database
+seeded by generate_dataset.py. Each step edits OPE_data through the app's
+own write path (update_ope_data) and then checks the touched employee:
+
+  1. OPE_entries rows equal build_ope_entry_rows() over the OPE_data
+     document (fields, filing positions).
+  2. OPE_rollups groups equal build_rollup_docs() over those rows - what
+     rebuild_ope_rollups.py would write.
+
+Steps per round: amount edit, status change, client change (moves the
+entry to another group), delete of one entry, delete of a whole month.
+Exits with status 1 on the first mismatch.
+
+Refuses to run against the app's own MONGO_DB unless --force is given.
+
+Usage:
+    python benchmarks/check_rollups.py --employees 200 --months 6
+    python benchmarks/check_rollups.py --db OPE_check --rounds 50 --seed 7
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import random
+import sys
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import generate_dataset
+
+IGNORED_FIELDS = ("synced_at", "updated_at")
+
+
+def comparable_rollup(doc: dict) -> dict:
+    doc = {k: v for k, v in doc.items() if k not in IGNORED_FIELDS}
+    doc["_id"] = tuple(doc["_id"].values())
+    doc["travel_modes"] = sorted(doc["travel_modes"])
+    return doc
+
+
+def rollups_match(found: dict, expected: dict) -> bool:
+    """Equal up to float drift in the $inc-maintained sums."""
+    for field in set(found) | set(expected):
+        a, b = found.get(field), expected.get(field)
+        if isinstance(a, float) or isinstance(b, float):
+            if a is None or b is None or not math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6):
+                return False
+        elif a != b:
+            return False
+    return True
+
+
+async def check_employee(db, main, employee_id: str) -> list:
+    """Mismatches between the mirrors of one employee and a rebuild from OPE_data."""
+    problems = []
+    ope_doc = await db["OPE_data"].find_one({"employeeId": employee_id})
+    expected_rows = {row["_id"]: row for row in main.build_ope_entry_rows(ope_doc or {})}
+    found_rows = {
+        row["_id"]: row
+        async for row in db["OPE_entries"].find({"employee_id": employee_id, "data_index": {"$ne": None}})
+    }
+    for entry_id in set(expected_rows) | set(found_rows):
+        expected = {k: v for k, v in expected_rows.get(entry_id, {}).items() if k not in IGNORED_FIELDS}
+        found = {k: v for k, v in found_rows.get(entry_id, {}).items() if k not in IGNORED_FIELDS}
+        if expected != found:
+            problems.append(f"OPE_entries {entry_id}: expected {expected or 'no row'}, found {found or 'no row'}")
+
+    all_rows = await db["OPE_entries"].find({"employee_id": employee_id}).to_list(length=None)
+    expected_groups = {doc["_id"]: doc for doc in map(comparable_rollup, main.build_rollup_docs(all_rows))}
+    found_groups = {
+        doc["_id"]: doc
+        for doc in map(comparable_rollup, await db["OPE_rollups"].find({"employee_id": employee_id}).to_list(length=None))
+    }
+    for group_id in set(expected_groups) | set(found_groups):
+        expected, found = expected_groups.get(group_id), found_groups.get(group_id)
+        if expected is None or found is None or not rollups_match(found, expected):
+            problems.append(f"OPE_rollups {group_id}: expected {expected or 'no group'}, found {found or 'no group'}")
+    return problems
+
+
+def pick_entry(rng: random.Random, ope_doc: dict):
+    """A random (data_index, month_range, entry_index, entry) of the document."""
+    slots = [
+        (i, month_range, j, entry)
+        for i, data_item in enumerate(ope_doc.get("Data", []))
+        for month_range, entries in data_item.items()
+        for j, entry in enumerate(entries)
+    ]
+    return rng.choice(slots) if slots else None
+
+
+async def run_step(db, main, rng: random.Random, step: str, employee_id: str) -> bool:
+    """Apply one change through update_ope_data; False when the employee has nothing to change."""
+    ope_doc = await db["OPE_data"].find_one({"employeeId": employee_id})
+    picked = pick_entry(rng, ope_doc or {})
+    if picked is None:
+        return False
+    i, month_range, j, entry = picked
+    path = f"Data.{i}.{month_range}.{j}"
+    query = {"employeeId": employee_id}
+
+    if step == "amount":
+        update = {"$set": {f"{path}.amount": round(rng.uniform(50, 5000), 2)}}
+    elif step == "status":
+        current = (entry.get("status") or "").lower()
+        update = {"$set": {f"{path}.status": rng.choice([s for s in ("pending", "approved", "rejected") if s != current])}}
+    elif step == "client":
+        update = {"$set": {f"{path}.client": f"Check Client {rng.randint(1, 3)}", f"{path}.travel_mode": "Bus Pass"}}
+    elif step == "delete":
+        update = {"$pull": {f"Data.{i}.{month_range}": {"_id": entry["_id"]}}}
+    else:  # delete-month
+        update = {"$pull": {"Data": {month_range: {"$exists": True}}}}
+        ids = [e.get("_id") for e in ope_doc["Data"][i][month_range]]
+        await main.update_ope_data(employee_id, ids, query, update)
+        return True
+
+    await main.update_ope_data(employee_id, [entry["_id"]], query, update)
+    return True
+
+
+async def run_checks(args) -> int:
+    import main
+
+    db = main.db
+    if not args.skip_seed:
+        await generate_dataset.write_dataset(db, args)
+
+    employees = await db["OPE_data"].distinct("employeeId")
+    rng = random.Random(args.seed)
+    checked = 0
+    for round_no in range(1, args.rounds + 1):
+        employee_id = rng.choice(employees)
+        for step in ("amount", "status", "client", "delete", "delete-month"):
+            if not await run_step(db, main, rng, step, employee_id):
+                continue
+            problems = await check_employee(db, main, employee_id)
+            checked += 1
+            if problems:
+                print(f"❌ Round {round_no}, {step} on {employee_id}:")
+                for problem in problems[:10]:
+                    print(f"   {problem}")
+                return 1
+        if round_no % 10 == 0:
+            print(f"➡️ {round_no}/{args.rounds} rounds | {checked} checks")
+
+    print("\n📊 Rollup check DONE")
+    print(f"   ✅ Checks passed: {checked}")
+    return 0
+
+
+async def main_async():
+    parser = argparse.ArgumentParser(description="Check the incremental OPE_entries / OPE_rollups sync")
+    parser.add_argument("--employees", type=int, default=200)
+    parser.add_argument("--months", type=int, default=6)
+    parser.add_argument("--min-entries", type=int, default=2)
+    parser.add_argument("--max-entries", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=20, help="rounds of the five changes")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", default="OPE_check")
+    parser.add_argument("--skip-seed", action="store_true", help="reuse an already seeded --db")
+    parser.add_argument("--force", action="store_true", help="allow running against the app's MONGO_DB")
+    args = parser.parse_args()
+    args.receipts, args.drop, args.legacy_pending = 0, True, False
+
+    load_dotenv()
+    if args.db == os.getenv("MONGO_DB") and not args.force:
+        sys.exit(f"❌ {args.db} is the application database - pass --force or pick another --db")
+    os.environ["MONGO_DB"] = args.db
+
+    print("\n" + "#"*60)
+    print("# OPE_entries / OPE_rollups incremental sync check")
+    print(f"# Started: {datetime.utcnow().isoformat()}")
+    print("#"*60)
+
+    import main
+    try:
+        status = await run_checks(args)
+    finally:
+        main.client.close()
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    asyncio.run(main_async())
@@ -0,0 +1,454 @@
+"""
+generate_dataset.py
+───────────────────
+Seedable synthetic OPE dataset for benchmarks and load tests. The same
+seed and scale always produce the same documents.
+
+Writes Employee_details / Employee, Partner, Reporting_managers, Admin,
+user, OPE_data (nested Data[{month: [entries]}]), Temp_OPE_data, Status
+(2- and 3-level approval_status arrays), GridFS receipts with
+Ticket_blobs, and the derived OPE_entries / OPE_rollups / Approval_queue
+mirrors. The legacy Pending / HR_Pending documents can be added with
+--legacy-pending. Employees are generated and written in batches, so
+50k employees x several years fits in constant memory.
+
+Every generated user logs in with the password "bench".
+
+Refuses to write into the app's own MONGO_DB unless --force is given.
+
+Usage:
+    python benchmarks/generate_dataset.py --employees 1000 --months 24
+    python benchmarks/generate_dataset.py --employees 50000 --months 36 --db OPE_bench_50k --drop
+"""
+
+import argparse
+import asyncio
+import calendar
+import hashlib
+import io
+import os
+import random
+import sys
+from collections import defaultdict
+from datetime import datetime
+
+from bson import ObjectId
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HR_CODE = "JHS729"
+BENCH_PASSWORD = "bench"
+MONTH_NAMES = [calendar.month_abbr[m] for m in range(1, 13)]
+DESIGNATIONS = ["Associate", "Senior Associate", "Assistant Manager", "Manager", "Senior Manager", "Director"]
+TRAVEL_MODES = ["Auto", "Cab", "Train", "Bus", "Metro", "Rail Pass", "Bus Pass", "Flight"]
+CITIES = ["Andheri", "Bandra", "Borivali", "Churchgate", "Dadar", "Ghatkopar", "Goregaon", "Kurla",
+          "Malad", "Mulund", "Nariman Point", "Powai", "Thane", "Vashi", "Worli", "Pune", "Navi Mumbai"]
+BATCH_SIZE = 500
+
+
+def payroll_months(count: int, last: tuple = (2026, 3)) -> list:
+    """count payroll months ("Mar 2026" style) ending at last, oldest first."""
+    year, month = last
+    months = []
+    for _ in range(count):
+        months.append(f"{MONTH_NAMES[month - 1]} {year}")
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    return months[::-1]
+
+
+def object_id(rng: random.Random) -> ObjectId:
+    """ObjectId drawn from the seeded generator, so reruns produce identical ids."""
+    return ObjectId(rng.getrandbits(96).to_bytes(12, "big"))
+
+
+def emp_code(n: int) -> str:
+    return f"JHS{n + 1000:05d}"
+
+
+def build_org(rng: random.Random, employees: int) -> dict:
+    """Partners, reporting managers and employees with their reporting lines."""
+    partner_count = max(3, employees // 40)
+    manager_count = max(5, employees // 8)
+    codes = [emp_code(i) for i in range(employees)]
+
+    partners = [{"code": codes[i], "name": f"Partner {i + 1}"} for i in range(partner_count)]
+    managers = []
+    for i in range(partner_count, partner_count + manager_count):
+        managers.append({"code": codes[i], "name": f"Manager {i + 1}", "partner": rng.choice(partners)})
+
+    people = []
+    for i, code in enumerate(codes):
+        if i < partner_count:
+            partner = partners[i]
+            rm = {"code": partner["code"], "name": partner["name"], "partner": partner}
+        elif i < partner_count + manager_count:
+            partner = managers[i - partner_count]["partner"]
+            rm = {"code": partner["code"], "name": partner["name"], "partner": partner}
+        else:
+            rm = rng.choice(managers)
+            partner = rm["partner"]
+        people.append({
+            "code": code,
+            "name": f"Employee {i + 1}",
+            "designation": rng.choice(DESIGNATIONS),
+            "gender": rng.choice(["Male", "Female"]),
+            "rm": rm,
+            "partner": partner,
+            "is_manager": partner_count <= i < partner_count + manager_count,
+            "ope_limit": rng.choice([3000, 5000, 5000, 8000]),
+        })
+    return {"partners": partners, "managers": managers, "people": people}
+
+
+def build_catalogue(rng: random.Random, clients: int = 300) -> list:
+    catalogue = []
+    for c in range(clients):
+        client = f"Client {c + 1:03d}"
+        for p in range(rng.randint(1, 4)):
+            catalogue.append({
+                "client": client,
+                "project_id": f"P{c + 1:03d}{p + 1}",
+                "project_name": f"{client} Engagement {p + 1}",
+                "project_type": rng.choice(["Audit", "Tax", "Advisory", "Compliance"]),
+            })
+    return catalogue
+
+
+def reference_docs(org: dict) -> dict:
+    """Employee_details / Employee / Partner / Reporting_managers / Admin documents."""
+    reports = defaultdict(list)
+    partner_staff = defaultdict(list)
+    details, employees = [], []
+    for person in org["people"]:
+        reports[person["rm"]["code"]].append(person["code"])
+        partner_staff[person["partner"]["code"]].append(person["code"])
+        details.append({
+            "EmpID": person["code"],
+            "Emp Name": person["name"],
+            "Designation Name": person["designation"],
+            "Gender": person["gender"],
+            "Partner": person["partner"]["name"],
+            "PartnerEmpCode": person["partner"]["code"],
+            "ReportingEmpName": person["rm"]["name"],
+            "ReportingEmpCode": person["rm"]["code"],
+            "OPE LIMIT": person["ope_limit"],
+        })
+        employees.append({
+            "EmployeeId": person["code"],
+            "EmployeeName": person["name"],
+            "ReportingEmpCode": person["rm"]["code"],
+            "Reporting_Manager": person["rm"]["name"],
+            "PartnerEmpCode": person["partner"]["code"],
+            "Partner": person["partner"]["name"],
+            "OPE_limit": person["ope_limit"],
+        })
+    partners = [{"PartnerEmpCode": p["code"], "Partner_Name": p["name"], "EmployeesCodes": partner_staff[p["code"]]}
+                for p in org["partners"]]
+    managers = [{"ReportingEmpCode": m["code"], "ReportingEmpName": m["name"], "EmployeesCodes": reports[m["code"]]}
+                for m in org["managers"]]
+    return {
+        "Employee_details": details,
+        "Employee": employees,
+        "Partner": partners,
+        "Reporting_managers": managers,
+        "Admin": [{"employee_codes": [HR_CODE, org["people"][0]["code"]]}],
+    }
+
+
+def approval_month(person: dict, month: str, total: float, state: str, submitted: str) -> dict:
+    """One approval_status element, advanced to the given state."""
+    if person["is_manager"]:
+        levels = [("Partner", person["partner"]), ("HR", {"code": HR_CODE, "name": "HR"})]
+        limit, label, submitter = 0, "Reporting_Manager", "Reporting_Manager"
+    else:
+        limit = person["ope_limit"]
+        label = "Greater" if total > limit else "Less"
+        submitter = "Employee"
+        levels = [("Reporting Manager", person["rm"])]
+        if total > limit:
+            levels.append(("Partner", person["partner"]))
+        levels.append(("HR", {"code": HR_CODE, "name": "HR"}))
+
+    doc = {
+        "payroll_month": month,
+        "ope_label": label,
+        "submitter_type": submitter,
+        "total_levels": len(levels),
+        "limit": limit,
+        "total_amount": round(total, 2),
+        "submission_date": submitted,
+    }
+    # state: approved | rejected | pending-L1 | pending-L2 | pending-L3
+    done = len(levels) if state == "approved" else int(state[-1]) - 1 if state.startswith("pending") else 0
+    for i, (level_name, approver) in enumerate(levels):
+        level = f"L{i + 1}"
+        doc[level] = {
+            "status": i < done,
+            "approver_name": approver["name"],
+            "approver_code": approver["code"],
+            "approved_date": submitted if i < done else None,
+            "level_name": level_name,
+        }
+    if state == "approved":
+        doc.update({"current_level": f"L{len(levels)}", "overall_status": "approved"})
+    elif state == "rejected":
+        doc["L1"].update({"rejected": True, "rejection_reason": "Insufficient supporting documents"})
+        doc.update({"current_level": "L1", "overall_status": "rejected"})
+    else:
+        doc.update({"current_level": state.split("-")[1], "overall_status": "pending"})
+    return doc
+
+
+def month_state(rng: random.Random, age: int, levels: int) -> str:
+    """Older months are settled; the last couple are still moving through approvals."""
+    if age > 2 or rng.random() < 0.3:
+        return "rejected" if rng.random() < 0.05 else "approved"
+    return f"pending-L{rng.randint(1, levels)}"
+
+
+def make_entry(rng: random.Random, month: str, project: dict, receipt_pool: list, status: str, status_doc_id) -> dict:
+    month_name, year = month.split()
+    month_no = MONTH_NAMES.index(month_name) + 1
+    day = rng.randint(1, calendar.monthrange(int(year), month_no)[1])
+    travel_mode = rng.choice(TRAVEL_MODES)
+    origin, destination = rng.sample(CITIES, 2)
+    amount = round(rng.lognormvariate(5.5, 0.8), 2) if "Pass" not in travel_mode else float(rng.choice([600, 1200, 2400]))
+    submitted = f"{year}-{month_no:02d}-{min(day + 2, 28):02d}T10:00:00"
+    # ~40% carry a receipt; drawing from a pool makes some receipts repeat
+    ticket_pdf = rng.choice(receipt_pool) if receipt_pool and rng.random() < 0.4 else None
+    return {
+        "_id": object_id(rng),
+        "date": f"{year}-{month_no:02d}-{day:02d}",
+        **project,
+        "location_from": origin,
+        "location_to": destination,
+        "travel_mode": travel_mode,
+        "amount": amount,
+        "remarks": rng.choice(["", "Client visit", "Site audit", "Documents pickup", "Late night"]),
+        "ticket_pdf": ticket_pdf,
+        "created_time": submitted,
+        "updated_time": submitted,
+        "status": status,
+        "submitted_time": submitted,
+        "status_doc_id": status_doc_id,
+        "payroll_month": month,
+        "approved_by": None,
+        "approved_date": None,
+        "rejected_by": None,
+        "rejected_date": None,
+        "rejection_reason": None,
+    }
+
+
+def employee_documents(rng: random.Random, person: dict, months: list, catalogue: list,
+                       receipt_pool: list, entries_range: tuple) -> dict:
+    """OPE_data, Status and (sometimes) Temp_OPE_data for one employee."""
+    header = {
+        "employeeId": person["code"],
+        "employeeName": person["name"],
+        "designation": person["designation"],
+        "gender": person["gender"],
+        "partner": person["partner"]["name"],
+        "reportingManager": person["rm"]["name"],
+        "department": "",
+    }
+    status_doc = {"_id": object_id(rng), "employeeId": person["code"], "employeeName": person["name"], "approval_status": []}
+    projects = rng.sample(catalogue, min(3, len(catalogue)))
+    data = []
+
+    for age, month in enumerate(reversed(months)):
+        if rng.random() > 0.8:
+            continue
+        count = rng.randint(*entries_range)
+        entries = [make_entry(rng, month, rng.choice(projects), receipt_pool, "pending", status_doc["_id"])
+                   for _ in range(count)]
+        total = sum(e["amount"] for e in entries)
+        levels = 2 if person["is_manager"] or total <= person["ope_limit"] else 3
+        state = month_state(rng, age, levels)
+        entry_status = "pending" if state.startswith("pending") else state
+        for e in entries:
+            e["status"] = entry_status
+            if entry_status == "approved":
+                e["approved_by"], e["approved_date"] = HR_CODE, e["submitted_time"]
+        data.insert(0, {month: entries})
+        status_doc["approval_status"].insert(0, approval_month(person, month, total, state, entries[0]["submitted_time"]))
+
+    docs = {"OPE_data": None, "Status": None, "Temp_OPE_data": None}
+    if data:
+        docs["OPE_data"] = {**header, "Data": data}
+        docs["Status"] = status_doc
+    if rng.random() < 0.3:
+        draft_month = payroll_months(1, next_month(months[-1]))[0]
+        drafts = [make_entry(rng, draft_month, rng.choice(projects), receipt_pool, "saved", None)
+                  for _ in range(rng.randint(1, 5))]
+        for e in drafts:
+            for field in ("submitted_time", "status_doc_id", "payroll_month", "approved_by", "approved_date",
+                          "rejected_by", "rejected_date", "rejection_reason"):
+                e.pop(field)
+        docs["Temp_OPE_data"] = {**header, "Data": [{draft_month: drafts}]}
+    return docs
+
+
+def next_month(month: str) -> tuple:
+    name, year = month.split()
+    m = MONTH_NAMES.index(name) + 1
+    return (int(year) + 1, 1) if m == 12 else (int(year), m + 1)
+
+
+def synthetic_pdf(rng: random.Random, n: int) -> bytes:
+    body = bytes(rng.getrandbits(8) for _ in range(rng.randint(2, 40) * 1024))
+    return b"%PDF-1.4\n% synthetic receipt " + str(n).encode() + b"\n" + body + b"\n%%EOF\n"
+
+
+def generate(employees: int, months: int, seed: int, receipts: int = 0, entries_range: tuple = (2, 12),
+             receipt_ids: list = None):
+    """
+    Yield ("collection", doc) pairs for a whole dataset, employee by
+    employee. receipt_ids are the GridFS ids entries may point at.
+    """
+    rng = random.Random(seed)
+    org = build_org(rng, employees)
+    catalogue = build_catalogue(rng)
+    month_list = payroll_months(months)
+    for collection, docs in reference_docs(org).items():
+        for doc in docs:
+            yield collection, doc
+    for person in org["people"]:
+        for collection, doc in employee_documents(rng, person, month_list, catalogue,
+                                                  receipt_ids or [], entries_range).items():
+            if doc is not None:
+                yield collection, doc
+
+
+async def write_dataset(db, args):
+    import main
+    from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+    from passlib.context import CryptContext
+
+    if args.drop:
+        for name in await db.list_collection_names():
+            await db.drop_collection(name)
+        print(f"🗑️ Dropped every collection in {args.db}")
+
+    # Receipts first, so entries can reference them
+    rng = random.Random(args.seed + 1)
+    bucket = AsyncIOMotorGridFSBucket(db) if args.receipts else None
+    receipt_ids, receipt_digests = [], {}
+    for n in range(args.receipts):
+        content = synthetic_pdf(rng, n)
+        digest = hashlib.sha256(content).hexdigest()
+        file_id = await bucket.upload_from_stream(f"bench_receipt_{n}.pdf", io.BytesIO(content),
+                                                  metadata={"content_type": "application/pdf"})
+        await db["fs.files"].update_one({"_id": file_id}, {"$set": {"sha256": digest}})
+        receipt_ids.append(str(file_id))
+        receipt_digests[str(file_id)] = (digest, len(content))
+    if receipt_ids:
+        print(f"📎 Uploaded {len(receipt_ids)} receipts to GridFS")
+
+    password_hash = CryptContext(schemes=["pbkdf2_sha256"]).hash(BENCH_PASSWORD)
+    batches = defaultdict(list)
+    counts = defaultdict(int)
+    refcounts = defaultdict(int)
+    legacy_pending = defaultdict(set)
+
+    async def flush(collection=None):
+        for name in ([collection] if collection else list(batches)):
+            if batches[name]:
+                await db[name].insert_many(batches[name], ordered=False)
+                counts[name] += len(batches[name])
+                batches[name] = []
+
+    def add(collection, doc):
+        batches[collection].append(doc)
+
+    for collection, doc in generate(args.employees, args.months, args.seed, args.receipts,
+                                    (args.min_entries, args.max_entries), receipt_ids):
+        add(collection, doc)
+        if collection == "Employee_details":
+            add("user", {"employee_code": doc["EmpID"], "password": password_hash})
+        elif collection in ("OPE_data", "Temp_OPE_data"):
+            for data_item in doc["Data"]:
+                for entries in data_item.values():
+                    for e in entries:
+                        if e.get("ticket_pdf"):
+                            refcounts[e["ticket_pdf"]] += 1
+            if collection == "OPE_data":
+                rows = main.build_ope_entry_rows(doc)
+                for row in rows:
+                    add("OPE_entries", row)
+                for rollup in main.build_rollup_docs(rows):
+                    add("OPE_rollups", rollup)
+        elif collection == "Status":
+            for item in main.build_approval_queue_items(doc):
+                add("Approval_queue", item)
+                if args.legacy_pending:
+                    legacy_pending[item["approver_code"]].add(doc["employeeId"])
+        if len(batches[collection]) >= BATCH_SIZE:
+            await flush(collection)
+        if collection == "OPE_data" and counts["OPE_data"] and counts["OPE_data"] % 5000 == 0:
+            print(f"➡️ {counts['OPE_data']} employees with history written")
+    await flush()
+    # HR (JHS729) is not an employee but must be able to log in
+    await db["user"].insert_one({"employee_code": HR_CODE, "password": password_hash})
+    counts["user"] += 1
+
+    if refcounts:
+        await db["Ticket_blobs"].insert_many([
+            {"_id": receipt_digests[file_id][0], "file_id": file_id, "refcount": n,
+             "length": receipt_digests[file_id][1], "created_at": datetime.utcnow(), "updated_at": datetime.utcnow()}
+            for file_id, n in refcounts.items()
+        ])
+        counts["Ticket_blobs"] = len(refcounts)
+
+    if args.legacy_pending:
+        for approver, codes in legacy_pending.items():
+            name = "HR_Pending" if approver == HR_CODE else "Pending"
+            await db[name].insert_one({"ReportingEmpCode": approver, "EmployeesCodes": sorted(codes)})
+            counts[name] += 1
+
+    await main.apply_managed_indexes()
+    return counts
+
+
+async def main_async():
+    parser = argparse.ArgumentParser(description="Generate a synthetic OPE dataset")
+    parser.add_argument("--employees", type=int, default=1000)
+    parser.add_argument("--months", type=int, default=24, help="payroll months of history per employee")
+    parser.add_argument("--min-entries", type=int, default=2, help="entries per employee-month (min)")
+    parser.add_argument("--max-entries", type=int, default=12, help="entries per employee-month (max)")
+    parser.add_argument("--receipts", type=int, default=200, help="distinct GridFS receipts to upload")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", default="OPE_bench")
+    parser.add_argument("--drop", action="store_true", help="drop every collection in --db first")
+    parser.add_argument("--legacy-pending", action="store_true", help="also write Pending / HR_Pending")
+    parser.add_argument("--force", action="store_true", help="allow writing into the app's MONGO_DB")
+    args = parser.parse_args()
+
+    load_dotenv()
+    if args.db == os.getenv("MONGO_DB") and not args.force:
+        sys.exit(f"❌ {args.db} is the application database - pick another --db or pass --force")
+    os.environ["MONGO_DB"] = args.db
+
+    import main
+
+    print("\n" + "#"*60)
+    print(f"# Synthetic dataset → {args.db}")
+    print(f"# {args.employees} employees, {args.months} months, seed {args.seed}")
+    print(f"# Started: {datetime.utcnow().isoformat()}")
+    print("#"*60)
+
+    try:
+        counts = await write_dataset(main.db, args)
+        print("\n📊 DONE")
+        for name in sorted(counts):
+            print(f"   {name:<20} {counts[name]}")
+        print(f"\n# Finished: {datetime.utcnow().isoformat()}")
+    finally:
+        main.client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main_async())
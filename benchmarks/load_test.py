@@ -0,0 +1,434 @@
+"""
+load_test.py
+────────────
+End-to-end month-end load test: boots a throwaway mongod (or uses
+--mongo-uri), seeds it with generate_dataset.py, starts the app under
+uvicorn against it and replays a month-end traffic mix with real JWTs:
+
+  employees  save-temp (x1-5) → temp-history → submit-final → status
+  managers   manager/pending
+  HR         manager/pending (as HR) → hr/pending-employees
+  admins     admin/dashboard → admin/client-analysis → export/client-wise
+
+Every virtual user is a closed loop with a short think time. At the end
+p50 / p95 / p99 latency and throughput are reported per route, and the
+run fails (exit code 1) when a route exceeds its latency budget or any
+request fails with a 5xx / transport error. 4xx responses are counted
+but do not fail the run (e.g. an OPE limit rejection is a valid answer).
+
+The app runs with QUERY_BUDGET_MODE=log, so the mean MongoDB round trips
+per route (X-Mongo-Round-Trips) are reported alongside the latencies.
+
+Budgets default to LATENCY_BUDGETS_MS; --budgets takes a JSON file of
+{"route": {"p95": ms, "p99": ms}} overrides.
+
+Usage:
+    python benchmarks/load_test.py                                 # mongod from PATH
+    python benchmarks/load_test.py --users 200 --duration 120 --employees 5000
+    python benchmarks/load_test.py --mongo-uri mongodb://localhost:27017 --db OPE_load --skip-seed
+    python benchmarks/load_test.py --budgets budgets.json --json results.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from jose import jwt
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import generate_dataset
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# p95 / p99 per route template, in milliseconds
+LATENCY_BUDGETS_MS = {
+    "POST /api/ope/save-temp": {"p95": 300, "p99": 600},
+    "POST /api/ope/submit-final": {"p95": 800, "p99": 1500},
+    "GET /api/ope/temp-history/{employee_code}": {"p95": 200, "p99": 400},
+    "GET /api/ope/status/{employee_code}": {"p95": 200, "p99": 400},
+    "GET /api/ope/manager/pending": {"p95": 500, "p99": 1000},
+    "GET /api/ope/hr/pending-employees": {"p95": 800, "p99": 1500},
+    "GET /api/admin/dashboard": {"p95": 1500, "p99": 3000},
+    "GET /api/admin/client-analysis": {"p95": 2000, "p99": 4000},
+    "GET /api/admin/export/client-wise": {"p95": 5000, "p99": 8000},
+}
+DEFAULT_MIX = "employee:85,manager:10,hr:2,admin:3"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+# ---------- Infrastructure ----------
+def start_mongod(binary: str, replset: bool):
+    """Start a throwaway mongod on a free port; returns (process, uri, dbpath)."""
+    from pymongo import MongoClient
+
+    dbpath = tempfile.mkdtemp(prefix="ope_load_mongod_")
+    port = free_port()
+    cmd = [binary, "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"]
+    if replset:
+        # Single-node replica set, so the multi-document transaction paths run as in production
+        cmd += ["--replSet", "rs0"]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+
+    uri = f"mongodb://127.0.0.1:{port}/?directConnection=true"
+    admin = MongoClient(uri, serverSelectionTimeoutMS=20000)
+    admin.admin.command("ping")
+    if replset:
+        admin.admin.command("replSetInitiate", {"_id": "rs0", "members": [{"_id": 0, "host": f"127.0.0.1:{port}"}]})
+        deadline = time.monotonic() + 30
+        while not admin.admin.command("hello").get("isWritablePrimary"):
+            if time.monotonic() > deadline:
+                raise RuntimeError("mongod did not become primary")
+            time.sleep(0.2)
+    admin.close()
+    print(f"🍃 mongod started on port {port} ({dbpath})")
+    return proc, uri, dbpath
+
+
+def seed(env: dict, args):
+    cmd = [sys.executable, os.path.join(REPO_ROOT, "benchmarks", "generate_dataset.py"),
+           "--db", args.db, "--drop", "--employees", str(args.employees), "--months", str(args.months),
+           "--seed", str(args.seed), "--receipts", str(args.receipts)]
+    # generate_dataset.py compares --db with the MONGO_DB from .env, so don't override it here
+    seed_env = {k: v for k, v in env.items() if k != "MONGO_DB"}
+    subprocess.run(cmd, env=seed_env, cwd=REPO_ROOT, check=True)
+
+
+def start_app(env: dict, port: int, workers: int):
+    cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(workers), "--no-access-log", "--log-level", "warning"]
+    return subprocess.Popen(cmd, env=env, cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=None)
+
+
+async def wait_until_up(http, proc, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {proc.returncode}")
+        try:
+            if (await http.get("/openapi.json")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.25)
+    raise RuntimeError("app did not come up in time")
+
+
+def stop(proc, name: str):
+    if proc and proc.poll() is None:
+        proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        print(f"🛑 {name} stopped")
+
+
+# ---------- Traffic ----------
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.round_trips = defaultdict(list)
+        self.failures = defaultdict(int)
+        self.recording = False
+
+    async def call(self, http, route: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await http.request(method, url, **kwargs)
+        except Exception:
+            if self.recording:
+                self.failures[route] += 1
+            return None
+        elapsed = time.perf_counter() - started
+        if self.recording:
+            self.latencies[route].append(elapsed * 1000)
+            self.statuses[route][response.status_code] += 1
+            if response.status_code >= 500:
+                self.failures[route] += 1
+            if "X-Mongo-Round-Trips" in response.headers:
+                self.round_trips[route].append(int(response.headers["X-Mongo-Round-Trips"]))
+        return response
+
+
+class Scenario:
+    """Month-end traffic for one seeded org, with tokens minted like /api/login does."""
+
+    def __init__(self, args, secret: str, algorithm: str):
+        org = generate_dataset.build_org(random.Random(args.seed), args.employees)
+        self.employees = [p["code"] for p in org["people"]]
+        self.managers = [m["code"] for m in org["managers"]]
+        self.admins = [generate_dataset.HR_CODE, self.employees[0]]
+        self.catalogue = generate_dataset.build_catalogue(random.Random(args.seed))
+        last = generate_dataset.payroll_months(args.months)[-1]
+        draft_month = generate_dataset.payroll_months(1, generate_dataset.next_month(last))[0]
+        name, year = draft_month.split()
+        self.draft_month = draft_month
+        self.month_range = f"{name.lower()}-{year}"
+        self.think = args.think / 1000
+        self.secret, self.algorithm = secret, algorithm
+        self.tokens = {}
+
+    def headers(self, code: str) -> dict:
+        if code not in self.tokens:
+            expire = datetime.utcnow() + timedelta(hours=12)
+            self.tokens[code] = jwt.encode({"sub": code, "exp": expire}, self.secret, algorithm=self.algorithm)
+        return {"Authorization": f"Bearer {self.tokens[code]}"}
+
+    async def pause(self, rng):
+        await asyncio.sleep(rng.expovariate(1 / self.think) if self.think else 0)
+
+    async def employee(self, http, rec, rng):
+        code = rng.choice(self.employees)
+        headers = self.headers(code)
+        name, year = self.draft_month.split()
+        month_no = generate_dataset.MONTH_NAMES.index(name) + 1
+        for _ in range(rng.randint(1, 5)):
+            project = rng.choice(self.catalogue)
+            origin, destination = rng.sample(generate_dataset.CITIES, 2)
+            form = {
+                "date": f"{year}-{month_no:02d}-{rng.randint(1, 28):02d}",
+                "client": project["client"],
+                "project_id": project["project_id"],
+                "project_name": project["project_name"],
+                "project_type": project["project_type"],
+                "location_from": origin,
+                "location_to": destination,
+                "travel_mode": rng.choice(generate_dataset.TRAVEL_MODES),
+                "amount": f"{rng.uniform(40, 400):.2f}",
+                "remarks": f"load test {rng.getrandbits(32):08x}",
+                "month_range": self.month_range,
+            }
+            await rec.call(http, "POST /api/ope/save-temp", "POST", "/api/ope/save-temp", data=form, headers=headers)
+            await self.pause(rng)
+        await rec.call(http, "GET /api/ope/temp-history/{employee_code}", "GET",
+                       f"/api/ope/temp-history/{code}", headers=headers)
+        await self.pause(rng)
+        await rec.call(http, "POST /api/ope/submit-final", "POST", "/api/ope/submit-final",
+                       json={"month_range": self.month_range}, headers=headers)
+        await self.pause(rng)
+        await rec.call(http, "GET /api/ope/status/{employee_code}", "GET",
+                       f"/api/ope/status/{code}", headers=headers)
+
+    async def manager(self, http, rec, rng):
+        await rec.call(http, "GET /api/ope/manager/pending", "GET", "/api/ope/manager/pending",
+                       headers=self.headers(rng.choice(self.managers)))
+
+    async def hr(self, http, rec, rng):
+        headers = self.headers(generate_dataset.HR_CODE)
+        await rec.call(http, "GET /api/ope/manager/pending", "GET", "/api/ope/manager/pending", headers=headers)
+        await self.pause(rng)
+        await rec.call(http, "GET /api/ope/hr/pending-employees", "GET", "/api/ope/hr/pending-employees",
+                       headers=headers)
+
+    async def admin(self, http, rec, rng):
+        headers = self.headers(rng.choice(self.admins))
+        await rec.call(http, "GET /api/admin/dashboard", "GET", "/api/admin/dashboard", headers=headers)
+        await self.pause(rng)
+        await rec.call(http, "GET /api/admin/client-analysis", "GET", "/api/admin/client-analysis", headers=headers)
+        await self.pause(rng)
+        await rec.call(http, "GET /api/admin/export/client-wise", "GET", "/api/admin/export/client-wise",
+                       headers=headers)
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        role, weight = part.split(":")
+        if role not in ("employee", "manager", "hr", "admin"):
+            raise SystemExit(f"❌ Unknown role in --mix: {role}")
+        weights[role] = float(weight)
+    return weights
+
+
+async def run_traffic(base_url: str, scenario: Scenario, args) -> tuple:
+    import httpx
+
+    rec = Recorder()
+    weights = parse_mix(args.mix)
+    roles, role_weights = list(weights), list(weights.values())
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as http:
+        stop_at = None
+
+        async def virtual_user(n: int):
+            rng = random.Random(args.seed * 100003 + n)
+            while stop_at is None or time.monotonic() < stop_at:
+                role = rng.choices(roles, role_weights)[0]
+                await getattr(scenario, role)(http, rec, rng)
+                await scenario.pause(rng)
+
+        users = []
+        for n in range(args.users):
+            users.append(asyncio.create_task(virtual_user(n)))
+            await asyncio.sleep(args.ramp_up / args.users)
+        await asyncio.sleep(args.warmup)
+        rec.recording = True
+        started = time.monotonic()
+        stop_at = started + args.duration
+        print(f"⏱️ Measuring {args.duration}s with {args.users} users (mix {args.mix})")
+        await asyncio.gather(*users)
+        elapsed = time.monotonic() - started
+    return rec, elapsed
+
+
+# ---------- Report ----------
+def summarize(rec: Recorder, elapsed: float, budgets: dict) -> dict:
+    routes = {}
+    for route in sorted(set(rec.latencies) | set(rec.failures)):
+        values = sorted(rec.latencies[route])
+        trips = rec.round_trips[route]
+        routes[route] = {
+            "count": len(values),
+            "rps": len(values) / elapsed,
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": values[-1] if values else 0.0,
+            "statuses": dict(rec.statuses[route]),
+            "failures": rec.failures[route],
+            "mongo_round_trips": sum(trips) / len(trips) if trips else None,
+            "budget": budgets.get(route),
+            "violations": [],
+        }
+        for key, limit in (budgets.get(route) or {}).items():
+            if routes[route][key] > limit:
+                routes[route]["violations"].append(f"{key} {routes[route][key]:.0f}ms > {limit}ms")
+        if rec.failures[route]:
+            routes[route]["violations"].append(f"{rec.failures[route]} failed requests")
+    total = sum(r["count"] for r in routes.values())
+    return {"elapsed": elapsed, "requests": total, "rps": total / elapsed if elapsed else 0.0, "routes": routes}
+
+
+def print_report(summary: dict):
+    print(f"\n{'route':<46} {'count':>7} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'trips':>6} {'4xx':>5} {'fail':>5}")
+    for route, r in summary["routes"].items():
+        client_errors = sum(n for code, n in r["statuses"].items() if 400 <= code < 500)
+        trips = f"{r['mongo_round_trips']:6.1f}" if r["mongo_round_trips"] is not None else f"{'':>6}"
+        flag = "  ❌" if r["violations"] else ""
+        print(f"{route:<46} {r['count']:7d} {r['rps']:7.1f} {r['p50']:8.1f} {r['p95']:8.1f} {r['p99']:8.1f} "
+              f"{r['max']:8.1f} {trips} {client_errors:5d} {r['failures']:5d}{flag}")
+    print(f"\n📈 {summary['requests']} requests in {summary['elapsed']:.1f}s → {summary['rps']:.1f} req/s (latencies in ms)")
+
+
+async def main_async():
+    parser = argparse.ArgumentParser(description="Month-end end-to-end load test")
+    parser.add_argument("--mongo-uri", help="use this MongoDB instead of starting a throwaway mongod")
+    parser.add_argument("--mongod", default="mongod", help="mongod binary for the throwaway server")
+    parser.add_argument("--no-replset", action="store_true", help="start mongod standalone (no transactions)")
+    parser.add_argument("--db", default="OPE_load")
+    parser.add_argument("--skip-seed", action="store_true", help="reuse an already seeded --db")
+    parser.add_argument("--employees", type=int, default=2000)
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--receipts", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--users", type=int, default=100, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=60, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=10, help="unmeasured seconds after ramp-up")
+    parser.add_argument("--ramp-up", type=float, default=10, help="seconds to start all users")
+    parser.add_argument("--think", type=float, default=500, help="mean think time between requests (ms)")
+    parser.add_argument("--timeout", type=float, default=60, help="per-request timeout (s)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="role weights, e.g. employee:85,manager:10,hr:2,admin:3")
+    parser.add_argument("--budgets", help="JSON file of per-route latency budget overrides")
+    parser.add_argument("--json", help="write the summary to this file")
+    args = parser.parse_args()
+
+    try:
+        import httpx
+    except ImportError:
+        sys.exit("❌ load_test.py needs httpx: pip install httpx")
+
+    load_dotenv(os.path.join(REPO_ROOT, ".env"))
+    if args.mongo_uri and args.db == os.getenv("MONGO_DB") and not args.skip_seed:
+        sys.exit(f"❌ {args.db} is the application database - pick another --db")
+
+    budgets = dict(LATENCY_BUDGETS_MS)
+    if args.budgets:
+        with open(args.budgets) as f:
+            budgets.update(json.load(f))
+
+    secret = os.getenv("JWT_SECRET") or os.urandom(32).hex()
+    algorithm = os.getenv("JWT_ALGORITHM") or "HS256"
+    app_port = free_port()
+    mongod = app = None
+    dbpath = None
+
+    print("\n" + "#"*60)
+    print("# OPE month-end load test")
+    print(f"# Started: {datetime.utcnow().isoformat()}")
+    print("#"*60)
+
+    try:
+        if args.mongo_uri:
+            uri = args.mongo_uri
+        else:
+            if not shutil.which(args.mongod):
+                sys.exit(f"❌ {args.mongod} not found - install MongoDB or pass --mongo-uri")
+            mongod, uri, dbpath = start_mongod(args.mongod, replset=not args.no_replset)
+
+        env = {**os.environ, "MONGO_URI": uri, "MONGO_DB": args.db, "JWT_SECRET": secret,
+               "JWT_ALGORITHM": algorithm, "LOG_LEVEL": "WARNING", "QUERY_BUDGET_MODE": "log"}
+        if not args.skip_seed:
+            seed(env, args)
+
+        app = start_app(env, app_port, args.workers)
+        base_url = f"http://127.0.0.1:{app_port}"
+        async with httpx.AsyncClient(base_url=base_url) as probe:
+            await wait_until_up(probe, app)
+        print(f"🚀 App up at {base_url} ({args.workers} worker(s))")
+
+        scenario = Scenario(args, secret, algorithm)
+        rec, elapsed = await run_traffic(base_url, scenario, args)
+    finally:
+        stop(app, "uvicorn")
+        stop(mongod, "mongod")
+        if dbpath:
+            shutil.rmtree(dbpath, ignore_errors=True)
+
+    summary = summarize(rec, elapsed, budgets)
+    print_report(summary)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"params": vars(args), **summary}, f, indent=2)
+        print(f"💾 Saved to {args.json}")
+
+    violations = {route: r["violations"] for route, r in summary["routes"].items() if r["violations"]}
+    if violations:
+        print("\n❌ Latency budgets exceeded:")
+        for route, problems in violations.items():
+            print(f"   {route}: {', '.join(problems)}")
+        sys.exit(1)
+    print("\n✅ All routes within budget")
+
+
+if __name__ == "__main__":
+    asyncio.run(main_async())
@@ -0,0 +1,489 @@
+"""
+excel_reports.py
+────────────────
+Constant-memory XLSX renderers for the /api/admin/export/* endpoints.
+
+Every renderer takes an iterable of already-built rows and a writable
+file object. Workbooks are opened in openpyxl write-only mode, so rows are
+spooled to disk as they arrive instead of being kept as cell objects, and
+all formatting goes through a handful of shared named styles instead of a
+PatternFill/Border per cell. The output file object may be unseekable,
+which lets the caller forward the zip to the client chunk by chunk.
+
+This module only depends on openpyxl so the API can hand rendering to a
+process pool (render_to_file) without the workers importing the FastAPI
+app.
+"""
+
+import pickle
+from collections import defaultdict
+from datetime import datetime
+
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.cell_range import CellRange
+
+
+# ---------- Shared styles ----------
+THIN_BORDER = Border(
+    left=Side(style="thin", color="CCCCCC"),
+    right=Side(style="thin", color="CCCCCC"),
+    top=Side(style="thin", color="CCCCCC"),
+    bottom=Side(style="thin", color="CCCCCC"),
+)
+
+PARTNER_COLORS = ["EBF3FF", "FFF3E0", "E8F5E9", "FCE4EC", "F3E5F5", "E0F7FA"]
+
+
+class StyleBook:
+    """Registers named styles on a workbook on first use and hands out their names."""
+
+    def __init__(self, wb):
+        self.wb = wb
+        self.names = set()
+
+    def _register(self, name, **attrs):
+        if name not in self.names:
+            style = NamedStyle(name=name)
+            for key, value in attrs.items():
+                setattr(style, key, value)
+            self.wb.add_named_style(style)
+            self.names.add(name)
+        return name
+
+    def header(self, color="1E3A5F", size=11, boxed=True):
+        """White bold header text on a solid fill."""
+        attrs = {
+            "font": Font(color="FFFFFF", bold=True, size=size),
+            "fill": PatternFill("solid", fgColor=color),
+        }
+        if boxed:
+            attrs["alignment"] = Alignment(horizontal="center", vertical="center", wrap_text=True)
+            attrs["border"] = THIN_BORDER
+        return self._register(f"ope_header_{color}_{size}_{int(boxed)}", **attrs)
+
+    def cell(self, fill="FFFFFF", align="center", number_format=None):
+        """Bordered body cell with a solid fill."""
+        attrs = {
+            "fill": PatternFill("solid", fgColor=fill),
+            "alignment": Alignment(horizontal=align, vertical="center"),
+            "border": THIN_BORDER,
+        }
+        if number_format:
+            attrs["number_format"] = number_format
+        return self._register(f"ope_cell_{fill}_{align}_{number_format or 'general'}", **attrs)
+
+    def text(self, name, **font):
+        """Plain text style (title, labels, notes)."""
+        return self._register(f"ope_text_{name}", font=Font(**font))
+
+    def banner(self, name, fill, **font):
+        """Bold text on a solid fill (report titles, route separators)."""
+        return self._register(
+            f"ope_banner_{name}", font=Font(**font), fill=PatternFill("solid", fgColor=fill)
+        )
+
+
+def styled(ws, value, style):
+    cell = WriteOnlyCell(ws, value=value)
+    cell.style = style
+    return cell
+
+
+def new_workbook():
+    wb = openpyxl.Workbook(write_only=True)
+    return wb, StyleBook(wb)
+
+
+def set_widths(ws, widths):
+    for ci, width in enumerate(widths, 1):
+        ws.column_dimensions[get_column_letter(ci)].width = width
+
+
+def write_header(ws, headers, style, height=None, row=1):
+    if height:
+        ws.row_dimensions[row].height = height
+    ws.append([styled(ws, h, style) for h in headers])
+
+
+def _chain_first(first, rest):
+    yield first
+    yield from rest
+
+
+# ---------- Client-wise claims ----------
+CLIENT_WISE_HEADERS = [
+    "Employee ID", "Employee Name", "Partner", "Payroll Month", "Client",
+    "Project ID", "Project Name", "Project Type", "Date", "Travel From",
+    "Travel To", "Travel Mode", "Amount (₹)", "Remarks", "Status",
+]
+CLIENT_WISE_WIDTHS = [15, 24, 22, 17, 30, 15, 30, 16, 14, 24, 24, 15, 14, 40, 12]
+
+
+def render_client_wise(rows, out):
+    """One row per entry, zebra striped."""
+    wb, styles = new_workbook()
+    ws = wb.create_sheet("Client Wise Claims")
+
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        ws.append(["No data found"])
+        wb.save(out)
+        return
+
+    set_widths(ws, CLIENT_WISE_WIDTHS)
+    ws.freeze_panes = "A2"
+    write_header(ws, CLIENT_WISE_HEADERS, styles.header(), height=30)
+
+    plain = styles.cell("FFFFFF")
+    alt = styles.cell("EBF3FF")
+    for ri, row in enumerate(_chain_first(first, rows), 2):
+        style = alt if ri % 2 == 0 else plain
+        ws.append([styled(ws, row[h], style) for h in CLIENT_WISE_HEADERS])
+
+    wb.save(out)
+
+
+# ---------- Partner-wise claims ----------
+PARTNER_WISE_HEADERS = [
+    "Partner", "Employee ID", "Employee Name", "Payroll Month", "Total Amount (₹)",
+    "OPE Limit (₹)", "OPE Label", "Overall Status", "Current Level", "Total Levels",
+]
+PARTNER_WISE_WIDTHS = [24, 15, 24, 17, 20, 17, 13, 18, 17, 16]
+
+
+def render_partner_wise(rows, out):
+    """Rows arrive sorted by partner; each partner gets its own band colour."""
+    wb, styles = new_workbook()
+    ws = wb.create_sheet("Partner Wise Claims")
+
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        ws.append(["No data found"])
+        wb.save(out)
+        return
+
+    set_widths(ws, PARTNER_WISE_WIDTHS)
+    ws.freeze_panes = "A2"
+    write_header(ws, PARTNER_WISE_HEADERS, styles.header(), height=30)
+
+    partner_styles = {}
+    for row in _chain_first(first, rows):
+        partner = row["Partner"]
+        if partner not in partner_styles:
+            color = PARTNER_COLORS[len(partner_styles) % len(PARTNER_COLORS)]
+            partner_styles[partner] = styles.cell(color)
+        style = partner_styles[partner]
+        ws.append([styled(ws, row[h], style) for h in PARTNER_WISE_HEADERS])
+
+    wb.save(out)
+
+
+# ---------- Audit report ----------
+CRITICAL_FLAGS = ["DUPLICATE_CLAIM", "DUPLICATE_RECEIPT", "NO_SUPPORTING_DOCUMENT"]
+
+FLAG_HEADERS = ["Sr.No", "Flag Type", "Employee ID", "Name", "Date", "From", "To",
+                "Travel Mode", "Amount (₹)", "Status", "Flag Detail"]
+
+EMPLOYEE_SUMMARY_HEADERS = ["Employee ID", "Name", "Designation", "Total Claims", "Total Amount (₹)",
+                            "Approved (₹)", "Pending (₹)", "Rejected (₹)", "No Supporting",
+                            "Weekend Claims", "Total Flags"]
+
+ORIGINAL_DATA_HEADERS = ["Employee ID", "Name", "Designation", "Partner", "Reporting Manager",
+                         "Payroll Month", "Date", "Client", "Project ID", "Project Name", "Project Type",
+                         "From", "To", "Travel Mode", "Amount (₹)", "Original Amount (₹)",
+                         "Status", "HR Approved", "Approved By", "Approved Date", "Has Supporting"]
+
+
+def _flag_row(sr_no, flag, entry):
+    return [sr_no, flag, entry["employee_id"], entry["employee_name"], entry["date"],
+            entry["location_from"], entry["location_to"], entry["travel_mode"],
+            f"₹{entry['amount']:,.2f}", entry["status"], entry["flag_detail"]]
+
+
+def render_audit_report(entries, out):
+    """
+    Five sheets: Summary Dashboard, Employee Summary, All Flags - Detailed,
+    Critical Flags, Original Data. The detail sheets are written while
+    entries stream in; the two summary sheets are filled at the end from
+    per-employee counters.
+    """
+    wb, styles = new_workbook()
+    ws1 = wb.create_sheet("Summary Dashboard")
+    ws2 = wb.create_sheet("Employee Summary")
+    ws3 = wb.create_sheet("All Flags - Detailed")
+    ws4 = wb.create_sheet("Critical Flags")
+    ws5 = wb.create_sheet("Original Data")
+
+    set_widths(ws1, [30, 20])
+    set_widths(ws2, [18] * len(EMPLOYEE_SUMMARY_HEADERS))
+    set_widths(ws3, [16] * len(FLAG_HEADERS))
+    set_widths(ws4, [16] * len(FLAG_HEADERS))
+    set_widths(ws5, [14] * len(ORIGINAL_DATA_HEADERS))
+    for ws in (ws2, ws3, ws4, ws5):
+        ws.freeze_panes = "A2"
+
+    write_header(ws2, EMPLOYEE_SUMMARY_HEADERS, styles.header(size=11, boxed=False))
+    write_header(ws3, FLAG_HEADERS, styles.header("D97706", boxed=False))
+    write_header(ws4, FLAG_HEADERS, styles.header("EF4444", boxed=False))
+    write_header(ws5, ORIGINAL_DATA_HEADERS, styles.header("1E40AF", size=10, boxed=False))
+
+    totals = {"entries": 0, "amount": 0.0, "approved": 0.0, "pending": 0.0,
+              "flagged": 0, "weekend": 0, "no_supporting": 0, "critical": 0}
+    emp_summary = defaultdict(lambda: {
+        "name": "", "designation": "", "total_claims": 0, "total_amount": 0.0,
+        "approved_amt": 0.0, "pending_amt": 0.0, "rejected_amt": 0.0,
+        "no_supporting": 0, "weekend_claims": 0, "total_flags": 0,
+    })
+    flag_sr = 1
+    critical_sr = 1
+
+    for entry in entries:
+        amount = entry["amount"]
+        status = entry["status"].lower()
+        flags = entry["flags"]
+
+        totals["entries"] += 1
+        totals["amount"] += amount
+        if status == "approved":
+            totals["approved"] += amount
+        elif status == "pending":
+            totals["pending"] += amount
+        if flags:
+            totals["flagged"] += 1
+        if "WEEKEND_CLAIM" in flags:
+            totals["weekend"] += 1
+        if "NO_SUPPORTING_DOCUMENT" in flags:
+            totals["no_supporting"] += 1
+
+        emp = emp_summary[entry["employee_id"]]
+        emp["name"] = entry["employee_name"]
+        emp["designation"] = entry["designation"]
+        emp["total_claims"] += 1
+        emp["total_amount"] += amount
+        if status == "approved":
+            emp["approved_amt"] += amount
+        elif status == "pending":
+            emp["pending_amt"] += amount
+        else:
+            emp["rejected_amt"] += amount
+        if "NO_SUPPORTING_DOCUMENT" in flags:
+            emp["no_supporting"] += 1
+        if "WEEKEND_CLAIM" in flags:
+            emp["weekend_claims"] += 1
+        emp["total_flags"] += len(flags)
+
+        for flag in flags:
+            ws3.append(_flag_row(flag_sr, flag, entry))
+            flag_sr += 1
+
+        critical_only = [f for f in flags if f in CRITICAL_FLAGS]
+        if critical_only:
+            totals["critical"] += 1
+        for flag in critical_only:
+            ws4.append(_flag_row(critical_sr, flag, entry))
+            critical_sr += 1
+
+        ws5.append([
+            entry["employee_id"], entry["employee_name"], entry["designation"], entry["partner"],
+            entry["reporting_manager"], entry["payroll_month"], entry["date"], entry["client"],
+            entry["project_id"], entry["project_name"], entry["project_type"],
+            entry["location_from"], entry["location_to"], entry["travel_mode"],
+            f"₹{amount:,.2f}", f"₹{entry['original_amount']:,.2f}", entry["status"],
+            "Yes" if entry["hr_approved"] else "No", entry["approved_by"], entry["approved_date"],
+            "Yes" if entry["has_supporting"] else "No",
+        ])
+
+    # ─ SHEET 1: SUMMARY DASHBOARD ─
+    ws1.append([styled(ws1, "AUDIT REPORT SUMMARY", styles.banner("audit_title", "1E3A5F", bold=True, size=14, color="FFFFFF"))])
+    ws1.append([])
+    label = styles.text("label", bold=True)
+    value = styles.text("value", size=11)
+    for text, val in [
+        ("Total Entries", totals["entries"]),
+        ("Total Employees", len(emp_summary)),
+        ("Total Amount (₹)", f"₹{totals['amount']:,.2f}"),
+        ("Approved Amount (₹)", f"₹{totals['approved']:,.2f}"),
+        ("Pending Amount (₹)", f"₹{totals['pending']:,.2f}"),
+        ("Total Flags", totals["flagged"]),
+        ("Weekend Claims", totals["weekend"]),
+        ("No Supporting Docs", totals["no_supporting"]),
+        ("Critical Flags", totals["critical"]),
+    ]:
+        ws1.append([styled(ws1, text, label), styled(ws1, val, value)])
+
+    # ─ SHEET 2: EMPLOYEE SUMMARY ─
+    for emp_id in sorted(emp_summary.keys()):
+        data = emp_summary[emp_id]
+        ws2.append([
+            emp_id, data["name"], data["designation"], data["total_claims"],
+            f"₹{data['total_amount']:,.2f}", f"₹{data['approved_amt']:,.2f}",
+            f"₹{data['pending_amt']:,.2f}", f"₹{data['rejected_amt']:,.2f}",
+            data["no_supporting"], data["weekend_claims"], data["total_flags"],
+        ])
+
+    wb.save(out)
+
+
+# ---------- Duplicate location claims ----------
+DUPLICATE_SUMMARY_HEADERS = ["#", "Route (From → To)", "Total Claims", "Unique Employees",
+                             "Duplicate Claims", "Avg Amount (₹)", "Amount Spread (₹)"]
+
+DUPLICATE_DETAIL_HEADERS = ["#", "Route (From → To)", "Employee ID", "Employee Name",
+                            "Designation", "Partner", "Payroll Month", "Date",
+                            "Client", "Project Name", "Travel Mode",
+                            "Amount (₹)", "Status", "Claim Type", "% of Route Avg"]
+
+DUPLICATE_EMPLOYEE_HEADERS = ["Employee ID", "Name", "Designation", "Partner",
+                              "Total Claims", "Total Amount (₹)", "Unique Routes",
+                              "Short Claims", "Excess Claims"]
+
+
+def render_duplicate_claims(route_groups, out, payroll_month=None):
+    """
+    route_groups yields (route, claims) pairs, most-claimed route first.
+    Only one route's claims are held at a time; per-employee counters are
+    written to the Employee Analysis sheet at the end.
+    """
+    wb, styles = new_workbook()
+    ws_sum = wb.create_sheet("Summary")
+    ws_det = wb.create_sheet("Detailed Claims")
+    ws_emp = wb.create_sheet("Employee Analysis")
+
+    set_widths(ws_sum, [5, 45, 14, 16, 16, 18, 18])
+    set_widths(ws_det, [5, 35, 12, 20, 18, 15, 18, 12, 25, 25, 15, 14, 10, 10, 12])
+    set_widths(ws_emp, [12, 22, 18, 18, 14, 18, 15, 14, 14])
+    ws_sum.freeze_panes = "A6"
+    ws_det.freeze_panes = "A2"
+    ws_emp.freeze_panes = "A2"
+
+    header = styles.header()
+    note = styles.text("note", italic=True, size=10, color="666666")
+
+    # Title
+    ws_sum.append([styled(ws_sum, "DUPLICATE LOCATION CLAIMS REPORT",
+                          styles.banner("dup_title", "991B1B", bold=True, size=14, color="FFFFFF"))])
+    ws_sum.merged_cells.add(CellRange("A1:G1"))
+    ws_sum.append([styled(ws_sum, f"Generated: {datetime.now().strftime('%d %b %Y %H:%M')}", note)])
+    ws_sum.append([styled(ws_sum, f"Filter: Payroll Month = {payroll_month}", note)] if payroll_month else [])
+    ws_sum.append([])
+    write_header(ws_sum, DUPLICATE_SUMMARY_HEADERS, header, height=30, row=5)
+    write_header(ws_det, DUPLICATE_DETAIL_HEADERS, header, height=30)
+    write_header(ws_emp, DUPLICATE_EMPLOYEE_HEADERS, header, height=30)
+
+    route_sep = styles.banner("route_sep", "EFF6FF", bold=True, size=11, color="1E3A5F")
+    claim_fills = {"short": "FEE2E2", "excess": "FEF3C7", "normal": "FFFFFF"}
+    left_cols = {2, 4, 5, 6, 9, 10}
+
+    emp_dup_stats = defaultdict(lambda: {
+        "name": "", "designation": "", "partner": "",
+        "total_claims": 0, "total_amount": 0.0,
+        "routes": set(), "short_claims": 0, "excess_claims": 0,
+    })
+
+    det_row = 2
+    sr_no = 1
+    for idx, (route, claims) in enumerate(route_groups, 1):
+        amounts = [c["amount"] for c in claims]
+        unique_emps = len(set(c["employee_id"] for c in claims))
+        avg_amt = sum(amounts) / len(amounts) if amounts else 0
+        spread = max(amounts) - min(amounts) if amounts else 0
+        dup_count = len(claims) - unique_emps
+
+        # Summary row
+        fill = "FFF3F3" if dup_count > 5 else "FFFFFF"
+        vals = [idx, route, len(claims), unique_emps, dup_count, round(avg_amt, 2), round(spread, 2)]
+        ws_sum.append([
+            styled(ws_sum, v, styles.cell(fill, "left" if ci == 2 else "center"))
+            for ci, v in enumerate(vals, 1)
+        ])
+
+        # Route separator row
+        ws_det.append([styled(ws_det, f"▶ {route}  |  {len(claims)} claims  |  Avg ₹{avg_amt:,.2f}", route_sep)])
+        ws_det.merged_cells.add(CellRange(f"A{det_row}:O{det_row}"))
+        det_row += 1
+
+        for claim in sorted(claims, key=lambda x: x["amount"], reverse=True):
+            amt = claim["amount"]
+            pct = (amt / avg_amt * 100) if avg_amt > 0 else 0
+
+            if pct < 80:
+                claim_type, kind = "⬇ SHORT", "short"
+            elif pct > 120:
+                claim_type, kind = "⬆ EXCESS", "excess"
+            else:
+                claim_type, kind = "✓ NORMAL", "normal"
+
+            vals = [sr_no, route, claim["employee_id"], claim["employee_name"],
+                    claim["designation"], claim["partner"], claim["payroll_month"],
+                    claim["date"], claim["client"], claim["project_name"],
+                    claim["travel_mode"], amt, claim["status"],
+                    claim_type, f"{pct:.1f}%"]
+            ws_det.append([
+                styled(ws_det, v, styles.cell(
+                    claim_fills[kind],
+                    "left" if ci in left_cols else "center",
+                    "#,##0.00" if ci == 12 else None,
+                ))
+                for ci, v in enumerate(vals, 1)
+            ])
+            det_row += 1
+            sr_no += 1
+
+            stats = emp_dup_stats[claim["employee_id"]]
+            stats["name"] = claim["employee_name"]
+            stats["designation"] = claim["designation"]
+            stats["partner"] = claim["partner"]
+            stats["total_claims"] += 1
+            stats["total_amount"] += amt
+            stats["routes"].add(route)
+            emp_pct = pct if avg_amt > 0 else 100
+            if emp_pct < 80:
+                stats["short_claims"] += 1
+            elif emp_pct > 120:
+                stats["excess_claims"] += 1
+
+    # ─ SHEET 3: EMPLOYEE SUMMARY ─
+    for eid, stats in sorted(emp_dup_stats.items(), key=lambda x: x[1]["total_claims"], reverse=True):
+        has_issue = stats["short_claims"] > 0 or stats["excess_claims"] > 0
+        fill = "FEF3C7" if has_issue else "FFFFFF"
+        vals = [eid, stats["name"], stats["designation"], stats["partner"],
+                stats["total_claims"], round(stats["total_amount"], 2),
+                len(stats["routes"]), stats["short_claims"], stats["excess_claims"]]
+        ws_emp.append([
+            styled(ws_emp, v, styles.cell(fill, "left" if ci in (2, 3, 4) else "center"))
+            for ci, v in enumerate(vals, 1)
+        ])
+
+    wb.save(out)
+
+
+# ---------- Process-pool entry point ----------
+def spooled_rows(path):
+    """Rows from a file of pickled row batches written by the API process."""
+    with open(path, "rb") as f:
+        while True:
+            try:
+                batch = pickle.load(f)
+            except EOFError:
+                return
+            yield from batch
+
+
+def render_to_file(render, rows_path, out_path, params):
+    """Render a spooled row file into out_path; runs inside a worker process."""
+    with open(out_path, "wb") as out:
+        render(spooled_rows(rows_path), out, **params)
+    return out_path
+
+
+RENDERERS = {
+    "client_wise": render_client_wise,
+    "partner_wise": render_partner_wise,
+    "audit_report": render_audit_report,
+    "duplicate_claims": render_duplicate_claims,
+}
@@ -1,24 +1,54 @@
 from fastapi.security import OAuth2PasswordBearer  
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse, Response
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from pymongo import ReplaceOne, UpdateOne, DeleteOne, DeleteMany, monitoring
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
+from pymongo.read_concern import ReadConcern
+from pymongo.write_concern import WriteConcern
 from pydantic import BaseModel
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import calendar
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from typing import Optional
 from dotenv import load_dotenv
 import os
+import re
+import asyncio
 import io
+import hashlib
 import math
-from bson import ObjectId
-from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Form, Body, Request
+import time
+import logging
+import logging.handlers
+import atexit
+import contextlib
+import contextvars
+import multiprocessing
+import pickle
+import queue
+import random
+import sys
+import tempfile
+import threading
+import uuid
+import hmac
+import base64
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from starlette.background import BackgroundTask
+from bson import ObjectId, json_util
+from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Form, Body, Request, Query
 from starlette.requests import Request
 from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
 import json
 
+import excel_reports
+
 # Load env vars
 load_dotenv()
 
@@ -30,19 +60,145 @@ JWT_EXPIRE_MINUTES = 14400
 
 pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 
+# Responses are encoded in a single pass by the C json encoder: ObjectId /
+# datetime values go through _json_default instead of a pre-walk, and
+# NaN / ±Infinity are written as 0.0 by patching the (rare) bare tokens in
+# the output rather than rebuilding every dict and list up front.
+_NON_FINITE_TOKENS = ("NaN", "Infinity")
+
+
+def _json_default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return jsonable_encoder(obj)
+
+
+_json_encoder = json.JSONEncoder(ensure_ascii=False, allow_nan=True, separators=(",", ":"),
+                                 default=_json_default)
+
+
+def _zero_non_finite(body: str) -> str:
+    """
+    Replace bare NaN / Infinity tokens with 0.0, leaving string contents
+    alone. A token is inside a string when an odd number of unescaped quotes
+    precede it; the encoder escapes every backslash as \\\\ and quote as \\",
+    so dropping the \\\\ pairs first makes the remaining \\" the escaped quotes.
+    """
+    hits = []
+    for token in _NON_FINITE_TOKENS:
+        i = body.find(token)
+        while i != -1:
+            hits.append((i, token))
+            i = body.find(token, i + len(token))
+    hits.sort()
+
+    parts = []
+    pos = scanned = 0
+    quotes = 0
+    for i, token in hits:
+        segment = body[scanned:i].replace("\\\\", "")
+        quotes += segment.count('"') - segment.count('\\"')
+        scanned = i
+        if quotes % 2:
+            continue
+        start = i - 1 if body[i - 1] == "-" else i
+        parts.append(body[pos:start])
+        parts.append("0.0")
+        pos = i + len(token)
+    parts.append(body[pos:])
+    return "".join(parts)
+
+
+def render_json(content) -> bytes:
+    body = _json_encoder.encode(content)
+    if "NaN" in body or "Infinity" in body:
+        body = _zero_non_finite(body)
+    return body.encode("utf-8")
+
+
 class SafeJSONResponse(JSONResponse):
     def render(self, content) -> bytes:
-        def sanitize(obj):
-            if isinstance(obj, float):
-                if math.isnan(obj) or math.isinf(obj):
-                    return 0.0
-                return obj
-            if isinstance(obj, dict):
-                return {k: sanitize(v) for k, v in obj.items()}
-            if isinstance(obj, list):
-                return [sanitize(i) for i in obj]
-            return obj
-        return json.dumps(sanitize(content), ensure_ascii=False).encode("utf-8")
+        return render_json(content)
+
+# ---------- Logging ----------
+# Records go onto an in-memory queue and a background thread writes them to
+# stdout, so handlers never block the event loop on I/O. Every line carries
+# the request's correlation id (X-Request-ID, echoed on the response).
+#
+# DEBUG diagnostics are dropped at the logger unless LOG_LEVEL=DEBUG or the
+# request was picked by LOG_DEBUG_SAMPLE_RATE (0..1, whole requests are
+# sampled so a trace is never partial). With the defaults (INFO, rate 0)
+# logger.debug() returns before formatting anything. Use %-style arguments,
+# not f-strings, so skipped lines cost nothing.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")   # "text" or "json"
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0"))
+REQUEST_ID_HEADER = "X-Request-ID"
+
+request_id_var = contextvars.ContextVar("request_id", default="-")
+debug_sampled_var = contextvars.ContextVar("debug_sampled", default=False)
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamp the correlation id and drop DEBUG records of unsampled requests."""
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return record.levelno > logging.DEBUG or LOG_LEVEL == "DEBUG" or debug_sampled_var.get()
+
+
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record):
+        doc = {
+            "ts": datetime.utcfromtimestamp(record.created).isoformat() + "Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            doc["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(doc, ensure_ascii=False, default=str)
+
+
+def setup_logging():
+    log = logging.getLogger("ope")
+    if LOG_LEVEL == "DEBUG" or LOG_DEBUG_SAMPLE_RATE > 0:
+        log.setLevel(logging.DEBUG)
+    else:
+        log.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    log.propagate = False
+    log.addFilter(RequestContextFilter())
+
+    # Formatting happens in QueueHandler.prepare (caller side), so the
+    # writer thread only does the I/O
+    queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    if LOG_FORMAT == "json":
+        queue_handler.setFormatter(JsonLogFormatter())
+    else:
+        queue_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(message)s"))
+    log.addHandler(queue_handler)
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter("%(message)s"))
+    listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return log
+
+
+logger = setup_logging()
+
+
+def new_request_id(incoming: Optional[str]) -> str:
+    """Reuse a caller-supplied correlation id if it is sane, else mint one."""
+    if incoming and len(incoming) <= 64 and re.fullmatch(r"[A-Za-z0-9._:-]+", incoming):
+        return incoming
+    return uuid.uuid4().hex[:16]
+
 
 # ---------- FastAPI app ----------
 app = FastAPI(default_response_class=SafeJSONResponse)
@@ -54,31 +210,650 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[REQUEST_ID_HEADER],
 )
 
+
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    request_id = new_request_id(request.headers.get(REQUEST_ID_HEADER))
+    id_token = request_id_var.set(request_id)
+    sampled_token = debug_sampled_var.set(
+        LOG_DEBUG_SAMPLE_RATE > 0 and random.random() < LOG_DEBUG_SAMPLE_RATE
+    )
+    try:
+        response = await call_next(request)
+    finally:
+        debug_sampled_var.reset(sampled_token)
+        request_id_var.reset(id_token)
+    response.headers[REQUEST_ID_HEADER] = request_id
+    return response
+
+# ---------- Metrics ----------
+# Prometheus text-format metrics, kept in process (no client library):
+# request latency / size per route template, in-flight requests, MongoDB
+# command latency per collection and command (PyMongo command monitoring)
+# and connection-pool usage. Served on the admin-guarded GET /metrics.
+# Observations come from the event loop and from PyMongo's threads, so every
+# metric takes a lock.
+HTTP_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+MONGO_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+RESPONSE_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+METRICS_REGISTRY = []
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        METRICS_REGISTRY.append(self)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=HTTP_LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # per-bucket (non-cumulative) counts, then sum and count
+                state = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted((labels, (list(s[0]), s[1], s[2])) for labels, s in self._values.items())
+        for labels, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in METRICS_REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+http_requests_total = Counter(
+    "ope_http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status"))
+http_request_duration = Histogram(
+    "ope_http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route"))
+http_requests_in_flight = Gauge(
+    "ope_http_requests_in_flight", "HTTP requests currently being served.", ("method",))
+http_response_size = Histogram(
+    "ope_http_response_size_bytes", "Response body size (Content-Length) by route template.",
+    ("method", "route"), buckets=RESPONSE_SIZE_BUCKETS)
+mongo_command_duration = Histogram(
+    "ope_mongo_command_duration_seconds", "MongoDB command latency by collection and command.",
+    ("collection", "command"), buckets=MONGO_LATENCY_BUCKETS)
+mongo_command_failures = Counter(
+    "ope_mongo_command_failures_total", "Failed MongoDB commands by collection and command.", ("collection", "command"))
+mongo_pool_connections = Gauge(
+    "ope_mongo_pool_connections", "Open connections in the MongoDB pool.", ("address",))
+mongo_pool_checked_out = Gauge(
+    "ope_mongo_pool_checked_out", "Connections currently checked out of the MongoDB pool.", ("address",))
+mongo_pool_checkout_failures = Counter(
+    "ope_mongo_pool_checkout_failures_total", "Failed connection checkouts.", ("address", "reason"))
+
+
+def route_template(request: Request) -> str:
+    """Matched route path (/api/ope/status/{employee_code}), never the raw URL."""
+    route = request.scope.get("route")
+    path = getattr(route, "path", None)
+    if path is None:
+        return "unmatched"
+    return path or "/"
+
+
+@app.middleware("http")
+async def record_http_metrics(request: Request, call_next):
+    method = request.method
+    http_requests_in_flight.inc(method)
+    started = time.perf_counter()
+    status_code = 500
+    response = None
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        http_requests_in_flight.dec(method)
+        route = route_template(request)
+        http_requests_total.inc(method, route, str(status_code))
+        http_request_duration.observe(elapsed, method, route)
+        content_length = response.headers.get("content-length") if response is not None else None
+        if content_length and content_length.isdigit():
+            http_response_size.observe(int(content_length), method, route)
+
+
+# Commands whose first field names the collection ({"find": "OPE_data", ...})
+_COLLECTION_FIELD = {"getMore": "collection"}
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        field = _COLLECTION_FIELD.get(event.command_name, event.command_name)
+        collection = event.command.get(field)
+        if not isinstance(collection, str):
+            collection = "-"
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event):
+        with self._lock:
+            return self._pending.pop((event.connection_id, event.request_id), "-")
+
+    def succeeded(self, event):
+        collection = self._finish(event)
+        mongo_command_duration.observe(event.duration_micros / 1e6, collection, event.command_name)
+
+    def failed(self, event):
+        collection = self._finish(event)
+        mongo_command_duration.observe(event.duration_micros / 1e6, collection, event.command_name)
+        mongo_command_failures.inc(collection, event.command_name)
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        address = f"{event.address[0]}:{event.address[1]}"
+        mongo_pool_connections.set(0, address)
+        mongo_pool_checked_out.set(0, address)
+
+    def connection_created(self, event):
+        mongo_pool_connections.inc(f"{event.address[0]}:{event.address[1]}")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        mongo_pool_connections.dec(f"{event.address[0]}:{event.address[1]}")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        mongo_pool_checkout_failures.inc(f"{event.address[0]}:{event.address[1]}", str(event.reason))
+
+    def connection_checked_out(self, event):
+        mongo_pool_checked_out.inc(f"{event.address[0]}:{event.address[1]}")
+
+    def connection_checked_in(self, event):
+        mongo_pool_checked_out.dec(f"{event.address[0]}:{event.address[1]}")
+
+
+# ---------- Query Budget ----------
+# Development / staging aid. With QUERY_BUDGET_MODE=log every request counts
+# its MongoDB round trips (X-Mongo-Round-Trips response header), warns when
+# it goes over its budget, flags the same query shape repeated
+# QUERY_REPEAT_THRESHOLD+ times (an N+1 loop), and logs commands slower than
+# SLOW_COMMAND_MS with their explain plan. QUERY_BUDGET_MODE=strict turns an
+# exceeded budget or N+1 into a 500 so CI runs fail. "off" (the default)
+# installs nothing on the request path.
+#
+# Tests and scripts can assert a budget directly:
+#     async with query_budget(3) as stats:
+#         await get_manager_pending_employees(current_user=...)
+QUERY_BUDGET_MODE = os.getenv("QUERY_BUDGET_MODE", "off").lower()
+QUERY_BUDGET_DEFAULT = int(os.getenv("QUERY_BUDGET_DEFAULT", "25"))
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "5"))
+SLOW_COMMAND_MS = float(os.getenv("SLOW_COMMAND_MS", "100"))
+
+# Per-route overrides of QUERY_BUDGET_DEFAULT, keyed by route template
+QUERY_BUDGETS = {
+    "/api/ope/manager/pending": 10,
+    "/api/ope/hr/pending-employees": 10,
+    "/api/ope/partner/pending": 10,
+    "/api/ope/status/{employee_code}": 5,
+}
+
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+# Session / transport fields PyMongo adds that explain must not carry
+_COMMAND_TRANSPORT_FIELDS = {"$db", "lsid", "$clusterTime", "txnNumber", "$readPreference", "readConcern",
+                             "writeConcern", "startTransaction", "autocommit", "$readConcern"}
+
+query_stats_var = contextvars.ContextVar("query_stats", default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_shape(command_name: str, command: dict):
+    """The filter of a command with every value replaced by '?', as a stable string."""
+    def strip(value):
+        if isinstance(value, dict):
+            return {k: strip(v) for k, v in value.items()}
+        if isinstance(value, list) and value and all(isinstance(v, dict) for v in value):
+            return [strip(v) for v in value]
+        return "?"
+
+    if command_name in ("find", "count", "distinct"):
+        spec = command.get("filter", command.get("query", {}))
+    elif command_name == "findAndModify":
+        spec = command.get("query", {})
+    elif command_name in ("update", "delete"):
+        ops = command.get("updates") or command.get("deletes") or [{}]
+        spec = ops[0].get("q", {})
+    elif command_name == "aggregate":
+        spec = (command.get("pipeline") or [{}])[0]
+    else:
+        spec = {}
+    return json.dumps(strip(spec), sort_keys=True, default=str)
+
+
+class RequestQueryStats:
+    """Round trips seen while one request (or one query_budget block) was active."""
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.round_trips = 0
+        self.mongo_seconds = 0.0
+        self.shapes = defaultdict(int)
+        self.slow = []
+        self.loop = None
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def started(self, event, collection: str):
+        shape = (event.command_name, collection, query_shape(event.command_name, event.command))
+        explain_doc = None
+        if event.command_name in EXPLAINABLE_COMMANDS:
+            explain_doc = {k: v for k, v in event.command.items() if k not in _COMMAND_TRANSPORT_FIELDS}
+        with self._lock:
+            self.round_trips += 1
+            self.shapes[shape] += 1
+            self._inflight[(event.connection_id, event.request_id)] = (collection, explain_doc)
+
+    def finished(self, event):
+        with self._lock:
+            collection, explain_doc = self._inflight.pop((event.connection_id, event.request_id), ("-", None))
+            self.mongo_seconds += event.duration_micros / 1e6
+        elapsed_ms = event.duration_micros / 1000
+        if elapsed_ms < SLOW_COMMAND_MS:
+            return
+        self.slow.append((event.command_name, collection, elapsed_ms))
+        if explain_doc is not None and self.loop is not None:
+            # Explain on the event loop, outside this request's accounting
+            # but still tagged with its correlation id
+            context = contextvars.Context()
+            context.run(request_id_var.set, request_id_var.get())
+            self.loop.call_soon_threadsafe(
+                lambda: asyncio.ensure_future(log_slow_command(event.command_name, collection, elapsed_ms, explain_doc)),
+                context=context
+            )
+
+    def repeated(self, threshold: int = QUERY_REPEAT_THRESHOLD) -> list:
+        with self._lock:
+            return [(shape, n) for shape, n in self.shapes.items() if n >= threshold]
+
+    def problems(self, repeat_threshold: int = QUERY_REPEAT_THRESHOLD) -> list:
+        found = []
+        if self.round_trips > self.budget:
+            found.append(f"{self.round_trips} MongoDB round trips (budget {self.budget})")
+        for (command_name, collection, shape), n in self.repeated(repeat_threshold):
+            found.append(f"N+1 suspected: {n} x {command_name} {collection} {shape}")
+        return found
+
+
+class QueryBudgetListener(monitoring.CommandListener):
+    def started(self, event):
+        stats = query_stats_var.get()
+        if stats is not None:
+            field = _COLLECTION_FIELD.get(event.command_name, event.command_name)
+            collection = event.command.get(field)
+            stats.started(event, collection if isinstance(collection, str) else "-")
+
+    def succeeded(self, event):
+        stats = query_stats_var.get()
+        if stats is not None:
+            stats.finished(event)
+
+    def failed(self, event):
+        stats = query_stats_var.get()
+        if stats is not None:
+            stats.finished(event)
+
+
+def summarize_plan(plan: dict) -> str:
+    """'FETCH <- IXSCAN {employeeId: 1}' style chain of a winning plan."""
+    stages = []
+    while isinstance(plan, dict):
+        stage = plan.get("stage", "?")
+        if plan.get("indexName"):
+            stage += f" {plan['indexName']}"
+        stages.append(stage)
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return " <- ".join(stages)
+
+
+def find_winning_plan(explain: dict):
+    if isinstance(explain, dict):
+        if "winningPlan" in explain:
+            plan = explain["winningPlan"]
+            return plan.get("queryPlan", plan)   # SBE engine nests it once more
+        for value in explain.values():
+            found = find_winning_plan(value)
+            if found:
+                return found
+    if isinstance(explain, list):
+        for value in explain:
+            found = find_winning_plan(value)
+            if found:
+                return found
+    return None
+
+
+async def log_slow_command(command_name: str, collection: str, elapsed_ms: float, command: dict):
+    try:
+        explain = await db.command({"explain": command, "verbosity": "queryPlanner"})
+        plan = summarize_plan(find_winning_plan(explain)) or "no plan"
+    except Exception as e:
+        plan = f"explain failed: {e}"
+    logger.warning("🐢 Slow %s on %s: %.1f ms | plan: %s", command_name, collection, elapsed_ms, plan)
+
+
+@contextlib.asynccontextmanager
+async def query_budget(max_round_trips: int, repeat_threshold: int = QUERY_REPEAT_THRESHOLD):
+    """Raise QueryBudgetExceeded if the block goes over max_round_trips or repeats a query shape."""
+    stats = RequestQueryStats(max_round_trips)
+    stats.loop = asyncio.get_running_loop()
+    token = query_stats_var.set(stats)
+    try:
+        yield stats
+    finally:
+        query_stats_var.reset(token)
+    problems = stats.problems(repeat_threshold)
+    if problems:
+        raise QueryBudgetExceeded("; ".join(problems))
+
+
+async def track_query_budget(request: Request, call_next):
+    stats = RequestQueryStats(QUERY_BUDGET_DEFAULT)
+    stats.loop = asyncio.get_running_loop()
+    token = query_stats_var.set(stats)
+    try:
+        response = await call_next(request)
+    finally:
+        query_stats_var.reset(token)
+
+    route = route_template(request)
+    stats.budget = QUERY_BUDGETS.get(route, QUERY_BUDGET_DEFAULT)
+    problems = stats.problems()
+    for problem in problems:
+        logger.warning("📉 %s %s: %s", request.method, route, problem)
+    if problems and QUERY_BUDGET_MODE == "strict":
+        response = JSONResponse(status_code=500, content={"detail": "Query budget exceeded", "problems": problems})
+    response.headers["X-Mongo-Round-Trips"] = str(stats.round_trips)
+    return response
+
+
+if QUERY_BUDGET_MODE in ("log", "strict"):
+    app.middleware("http")(track_query_budget)
+
+
 # ---------- Mongo Connection ----------
-client = AsyncIOMotorClient(MONGO_URI)
+client = AsyncIOMotorClient(
+    MONGO_URI,
+    event_listeners=[MongoCommandMetrics(), MongoPoolMetrics(), QueryBudgetListener()]
+)
 db = client[MONGO_DB]
-user_collection = db["user"]   
+user_collection = db["user"]
 
 
-# ---------- GridFS Helpers ----------
-async def upload_to_gridfs(file_content: bytes, filename: str) -> str:
-    """Upload a file to GridFS and return the file_id as string."""
-    bucket = AsyncIOMotorGridFSBucket(db)
-    file_id = await bucket.upload_from_stream(filename, io.BytesIO(file_content))
-    return str(file_id)
+# ---------- Mongo Transactions ----------
+# Multi-document writes that must land together run through
+# run_in_transaction(). The callback receives the session and must pass it to
+# every read and write; it may be re-run from the top on transient errors
+# (write conflicts, primary step-downs), so it must not have side effects
+# outside the database.
+TXN_MAX_ATTEMPTS = int(os.getenv("TXN_MAX_ATTEMPTS", "5"))
+TXN_RETRY_BACKOFF = float(os.getenv("TXN_RETRY_BACKOFF", "0.05"))
+transactions_supported = True
+
+
+async def run_in_transaction(callback, max_attempts: int = TXN_MAX_ATTEMPTS):
+    """
+    Run `await callback(session)` inside a snapshot/majority transaction and
+    return its result. Retries the whole transaction on
+    TransientTransactionError and the commit on UnknownTransactionCommitResult.
+    On a standalone mongod (no transactions) the callback runs once with
+    session=None.
+    """
+    global transactions_supported
 
+    if not transactions_supported:
+        return await callback(None)
 
+    async with await client.start_session() as session:
+        for attempt in range(1, max_attempts + 1):
+            try:
+                session.start_transaction(
+                    read_concern=ReadConcern("snapshot"),
+                    write_concern=WriteConcern("majority")
+                )
+                result = await callback(session)
+            except BaseException as e:
+                if session.in_transaction:
+                    await session.abort_transaction()
+                if isinstance(e, OperationFailure) and e.code == 20:
+                    # IllegalOperation: "Transaction numbers are only allowed on a replica set member or mongos"
+                    logger.warning("⚠️ MongoDB deployment does not support transactions; running without")
+                    transactions_supported = False
+                    return await callback(None)
+                if (isinstance(e, PyMongoError) and e.has_error_label("TransientTransactionError")
+                        and attempt < max_attempts):
+                    logger.warning("🔁 Transient transaction error (attempt %s/%s): %s", attempt, max_attempts, e)
+                    await asyncio.sleep(TXN_RETRY_BACKOFF * attempt)
+                    continue
+                raise
+
+            for commit_attempt in range(1, max_attempts + 1):
+                try:
+                    await session.commit_transaction()
+                    return result
+                except PyMongoError as e:
+                    if e.has_error_label("UnknownTransactionCommitResult") and commit_attempt < max_attempts:
+                        logger.warning("🔁 Retrying commit: %s", e)
+                        continue
+                    if e.has_error_label("TransientTransactionError") and attempt < max_attempts:
+                        logger.warning("🔁 Transient commit error (attempt %s/%s): %s", attempt, max_attempts, e)
+                        await asyncio.sleep(TXN_RETRY_BACKOFF * attempt)
+                        break
+                    raise
+
+
+# ---------- GridFS Helpers ----------
 async def delete_from_gridfs(file_id: str):
-    """Delete a file from GridFS by its file_id string."""
+    """
+    Drop one reference to a GridFS file. Content-addressed receipts are only
+    removed when their last reference goes; files without a Ticket_blobs
+    record (pre-dedup uploads) are deleted straight away as before.
+    """
     try:
+        blob = await db["Ticket_blobs"].find_one_and_update(
+            {"file_id": file_id},
+            {"$inc": {"refcount": -1}, "$set": {"updated_at": datetime.utcnow()}},
+            return_document=True
+        )
+        if blob is not None:
+            if blob["refcount"] > 0:
+                logger.debug("📎 Receipt %s still referenced %s time(s)", file_id, blob["refcount"])
+                return
+            # A concurrent upload of the same receipt may have re-claimed it
+            removed = await db["Ticket_blobs"].delete_one({"_id": blob["_id"], "refcount": {"$lte": 0}})
+            if not removed.deleted_count:
+                return
         bucket = AsyncIOMotorGridFSBucket(db)
         await bucket.delete(ObjectId(file_id))
     except Exception:
         pass
 
 
+# Ticket PDFs are piped from the UploadFile into GridFS one chunk at a time,
+# so an upload never sits in memory whole. The first chunk must carry the
+# %PDF header, the size cap is enforced while streaming, and the SHA-256 is
+# computed on the way through and stored on the GridFS file document.
+#
+# Receipts are content-addressed: Ticket_blobs maps each SHA-256 to one
+# GridFS file plus a refcount of the OPE_data / Temp_OPE_data entries that
+# point at it. Re-attaching a ticket already on file reuses that file and
+# the fresh copy is dropped. Run backfill_ticket_blobs.py once to register
+# (and de-duplicate) receipts uploaded before this.
+TICKET_BLOB_INDEXES = [
+    ([("file_id", 1)], {"unique": True}),
+]
+TICKET_PDF_MAX_BYTES = int(os.getenv("TICKET_PDF_MAX_MB", "10")) * 1024 * 1024
+PDF_UPLOAD_CHUNK_SIZE = 256 * 1024
+PDF_MAGIC = b"%PDF"
+PDF_MAGIC_SEARCH_BYTES = 1024   # the spec tolerates junk before the header
+
+
+async def upload_pdf_to_gridfs(upload: UploadFile, filename: str, max_bytes: int = TICKET_PDF_MAX_BYTES) -> str:
+    """Stream an uploaded PDF into GridFS and return the file_id as string."""
+    first_chunk = await upload.read(PDF_UPLOAD_CHUNK_SIZE)
+    if PDF_MAGIC not in first_chunk[:PDF_MAGIC_SEARCH_BYTES]:
+        raise HTTPException(status_code=400, detail="Ticket must be a PDF file")
+
+    bucket = AsyncIOMotorGridFSBucket(db)
+    grid_in = bucket.open_upload_stream(filename, metadata={"content_type": "application/pdf"})
+    hasher = hashlib.sha256()
+    size = 0
+    chunk = first_chunk
+    try:
+        while chunk:
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Ticket PDF exceeds the {max_bytes // (1024 * 1024)} MB limit"
+                )
+            hasher.update(chunk)
+            await grid_in.write(chunk)
+            chunk = await upload.read(PDF_UPLOAD_CHUNK_SIZE)
+
+        digest = hasher.hexdigest()
+        await grid_in.set("sha256", digest)
+        await grid_in.close()
+    except BaseException:
+        await grid_in.abort()
+        raise
+
+    file_id = str(grid_in._id)
+    canonical_id = await claim_ticket_blob(digest, file_id, size)
+    if canonical_id != file_id:
+        logger.info("📎 Duplicate receipt %s… - reusing %s", digest[:12], canonical_id)
+        await bucket.delete(grid_in._id)
+    return canonical_id
+
+
+async def claim_ticket_blob(digest: str, file_id: str, length: int) -> str:
+    """Add one reference to the receipt with this hash; return the file_id that holds it."""
+    now = datetime.utcnow()
+    try:
+        blob = await db["Ticket_blobs"].find_one_and_update(
+            {"_id": digest},
+            {
+                "$inc": {"refcount": 1},
+                "$set": {"updated_at": now},
+                "$setOnInsert": {"file_id": file_id, "length": length, "created_at": now},
+            },
+            upsert=True,
+            return_document=True
+        )
+    except DuplicateKeyError:
+        # Lost the race to insert the first copy - count against the winner
+        blob = await db["Ticket_blobs"].find_one_and_update(
+            {"_id": digest},
+            {"$inc": {"refcount": 1}, "$set": {"updated_at": now}},
+            return_document=True
+        )
+    return blob["file_id"]
+
+
+async def ensure_ticket_blob_indexes():
+    for keys, options in TICKET_BLOB_INDEXES:
+        await db["Ticket_blobs"].create_index(keys, **options)
+
+
 def is_gridfs_id(value: str) -> bool:
     """Check if a string is a valid GridFS ObjectId (24 hex chars)."""
     if not value:
@@ -90,6 +865,836 @@ def is_gridfs_id(value: str) -> bool:
         return False
 
 
+# ---------- OPE Entry Store ----------
+# OPE_entries holds one document per submitted entry, mirrored from the
+# nested OPE_data.Data[{month_range: [entries]}] layout. OPE_data stays the
+# source of truth; every write path re-projects the entries it touched in
+# the same transaction (update_ope_data), so the flat store can be filtered
+# on indexes (month, status, client, project ...).
+OPE_ENTRY_INDEXES = [
+    [("employee_id", 1), ("payroll_month", 1)],
+    [("employee_id", 1), ("data_index", 1), ("entry_index", 1)],
+    [("employee_id", 1), ("status", 1), ("data_index", 1), ("entry_index", 1)],
+    [("payroll_month", 1), ("status", 1)],
+    [("status", 1), ("client", 1), ("payroll_month", 1)],
+    [("client", 1), ("project_id", 1), ("payroll_month", 1)],
+    [("partner", 1), ("payroll_month", 1)],
+    [("status", 1), ("route", 1), ("payroll_month", 1)],
+    [("payroll_month", 1), ("synced_at", -1)],
+    [("synced_at", -1)],
+    [("ticket_pdf", 1)],
+]
+
+
+def build_ope_entry_rows(ope_doc: dict) -> list:
+    """Flatten one OPE_data document into OPE_entries rows."""
+    rows = []
+
+    # Legacy /api/ope/submit stored one flat document per entry
+    if "Data" not in ope_doc and ope_doc.get("employee_id"):
+        month_range = ope_doc.get("month_range", "")
+        sources = [(month_range, ope_doc, None, None)]
+        employee_id = ope_doc.get("employee_id")
+    else:
+        sources = [
+            (month_range, entry, data_index, entry_index)
+            for data_index, data_item in enumerate(ope_doc.get("Data", []))
+            for month_range, entries in data_item.items()
+            for entry_index, entry in enumerate(entries)
+        ]
+        employee_id = ope_doc.get("employeeId")
+
+    for month_range, entry, data_index, entry_index in sources:
+        if not isinstance(entry, dict) or not entry.get("_id"):
+            continue
+        row = dict(entry)
+        location_from = entry.get("location_from", "Unknown")
+        location_to = entry.get("location_to", "Unknown")
+        row.update({
+            "_id": entry["_id"],
+            "employee_id": employee_id,
+            "employee_name": ope_doc.get("employeeName") or entry.get("employee_name", ""),
+            "designation": ope_doc.get("designation", ""),
+            "partner": ope_doc.get("partner", ""),
+            "reporting_manager": ope_doc.get("reportingManager", ""),
+            "month_range": month_range,
+            "payroll_month": entry.get("payroll_month") or month_range,
+            "status": (entry.get("status") or "").lower(),
+            "route": f"{location_from} → {location_to}",
+            "amount": safe_float(entry.get("amount", 0)),
+            "entered_amount": entry.get("amount"),
+            # Filing position in OPE_data.Data - the order the screens list entries in
+            "data_index": data_index,
+            "entry_index": entry_index,
+        })
+        rows.append(row)
+    return rows
+
+
+def entry_object_id(entry_id):
+    """Entry _ids are ObjectIds; handlers often hold them as strings."""
+    if isinstance(entry_id, str) and ObjectId.is_valid(entry_id):
+        return ObjectId(entry_id)
+    return entry_id
+
+
+async def load_entry_rows(employee_id: str, entry_ids: list, session=None) -> list:
+    """OPE_entries rows for just the given entries, built from their current OPE_data state."""
+    pipeline = [
+        {"$match": {"employeeId": employee_id}},
+        {"$unwind": {"path": "$Data", "includeArrayIndex": "data_index"}},
+        {"$project": {
+            "employeeId": 1, "employeeName": 1, "designation": 1, "partner": 1, "reportingManager": 1,
+            "data_index": 1, "months": {"$objectToArray": "$Data"},
+        }},
+        {"$unwind": "$months"},
+        {"$unwind": {"path": "$months.v", "includeArrayIndex": "entry_index"}},
+        {"$match": {"months.v._id": {"$in": entry_ids}}},
+    ]
+    rows = []
+    async for found in db["OPE_data"].aggregate(pipeline, session=session):
+        months = found.pop("months")
+        position = {"data_index": found.pop("data_index"), "entry_index": found.pop("entry_index")}
+        for row in build_ope_entry_rows({**found, "Data": [{months["k"]: [months["v"]]}]}):
+            rows.append({**row, **position})
+    # Legacy /api/ope/submit documents are the entry itself
+    async for flat_doc in db["OPE_data"].find({"employee_id": employee_id, "_id": {"$in": entry_ids}}, session=session):
+        rows += build_ope_entry_rows(flat_doc)
+    return rows
+
+
+async def sync_ope_entries(employee_id: str, entry_ids=None, session=None):
+    """
+    Mirror the OPE_data entries a write touched into OPE_entries and move
+    them between OPE_rollups groups. Pass the session of the OPE_data write
+    (see update_ope_data) so source, mirror and rollups commit or fail
+    together. entry_ids=None re-projects the employee's whole history (repairs
+    and backfills only).
+
+    Errors propagate. Without a transaction the OPE_data write has already
+    landed, so the employee is first recorded in OPE_entries_stale for
+    backfill_ope_entries.py --stale to repair.
+    """
+    try:
+        if entry_ids is None:
+            return await resync_employee_entries(employee_id, session=session)
+
+        ids = list({entry_object_id(entry_id) for entry_id in entry_ids})
+        if not ids:
+            return 0
+        new_rows = await load_entry_rows(employee_id, ids, session=session)
+        old_rows = await db["OPE_entries"].find({"_id": {"$in": ids}}, session=session).to_list(length=None)
+
+        synced_at = datetime.utcnow().isoformat()
+        operations = []
+        for row in new_rows:
+            row["synced_at"] = synced_at
+            operations.append(ReplaceOne({"_id": row["_id"]}, row, upsert=True))
+        gone = [_id for _id in ids if _id not in {row["_id"] for row in new_rows}]
+        if gone:
+            operations.append(DeleteMany({"_id": {"$in": gone}}))
+        if operations:
+            await db["OPE_entries"].bulk_write(operations, ordered=False, session=session)
+        await close_entry_gaps(employee_id, [row for row in old_rows if row["_id"] in gone], session=session)
+        await apply_rollup_changes(employee_id, old_rows, new_rows, session=session)
+        return len(new_rows)
+    except Exception as e:
+        if session is None:
+            await mark_ope_entries_stale(employee_id, e)
+        raise
+
+
+async def close_entry_gaps(employee_id: str, removed_rows: list, session=None):
+    """
+    Shift the filing positions of the rows after removed entries, as the
+    $pull on OPE_data.Data did: a month that lost all its rows was pulled
+    whole, otherwise only the entries behind each removed one move up.
+    """
+    by_month = defaultdict(list)
+    for row in removed_rows:
+        if row.get("data_index") is not None:
+            by_month[row["data_index"]].append(row["entry_index"])
+
+    entries_collection = db["OPE_entries"]
+    for data_index in sorted(by_month, reverse=True):
+        month_left = await entries_collection.count_documents(
+            {"employee_id": employee_id, "data_index": data_index}, limit=1, session=session
+        )
+        if not month_left:
+            await entries_collection.update_many(
+                {"employee_id": employee_id, "data_index": {"$gt": data_index}},
+                {"$inc": {"data_index": -1}},
+                session=session
+            )
+            continue
+        for entry_index in sorted(by_month[data_index], reverse=True):
+            await entries_collection.update_many(
+                {"employee_id": employee_id, "data_index": data_index, "entry_index": {"$gt": entry_index}},
+                {"$inc": {"entry_index": -1}},
+                session=session
+            )
+
+
+async def resync_employee_entries(employee_id: str, session=None) -> int:
+    """Re-project every OPE_data entry of one employee and rebuild their rollups."""
+    ope_docs = await db["OPE_data"].find(
+        {"$or": [{"employeeId": employee_id}, {"employee_id": employee_id}]},
+        session=session
+    ).to_list(length=None)
+
+    synced_at = datetime.utcnow().isoformat()
+    rows = [row for ope_doc in ope_docs for row in build_ope_entry_rows(ope_doc)]
+    entry_ids = [row["_id"] for row in rows]
+    operations = []
+    for row in rows:
+        row["synced_at"] = synced_at
+        operations.append(ReplaceOne({"_id": row["_id"]}, row, upsert=True))
+
+    operations.append(DeleteMany({"employee_id": employee_id, "_id": {"$nin": entry_ids}}))
+    await db["OPE_entries"].bulk_write(operations, ordered=False, session=session)
+    await write_employee_rollups(employee_id, build_rollup_docs(rows), session=session)
+    return len(entry_ids)
+
+
+async def mark_ope_entries_stale(employee_id: str, error: Exception):
+    try:
+        await db["OPE_entries_stale"].update_one(
+            {"_id": employee_id},
+            {"$set": {"error": str(error), "failed_at": datetime.utcnow()}},
+            upsert=True
+        )
+        logger.error("❌ OPE_entries sync failed for %s (marked stale): %s", employee_id, error)
+    except Exception as e:
+        logger.error("❌ OPE_entries sync failed for %s and could not be marked stale: %s / %s", employee_id, error, e)
+
+
+async def update_ope_data(employee_id: str, entry_ids, query: dict, update: dict, **kwargs):
+    """Apply one OPE_data update and mirror the entries it touched in one transaction."""
+    async def apply(session):
+        result = await db["OPE_data"].update_one(query, update, session=session, **kwargs)
+        await sync_ope_entries(employee_id, entry_ids, session=session)
+        return result
+
+    return await run_in_transaction(apply)
+
+
+# ---------- OPE Monthly Rollups ----------
+# OPE_rollups keeps one document per
+# (payroll_month, client, project_id, partner, employee_id, status) with the
+# sums and counts the admin analysis screens need. Every sync moves the
+# touched entries between groups in the same transaction, so writes cost
+# O(changed entries) and reads cost O(groups) instead of O(all entries ever
+# filed). rebuild_ope_rollups.py recreates it in full.
+OPE_ROLLUP_INDEXES = [
+    [("employee_id", 1), ("payroll_month", 1)],
+    [("payroll_month", 1), ("status", 1)],
+    [("status", 1), ("client", 1), ("payroll_month", 1)],
+    [("project_id", 1), ("payroll_month", 1)],
+    [("partner", 1), ("payroll_month", 1)],
+]
+
+PASS_TRAVEL_MODES = ("pass", "rail", "bus")
+
+
+def rollup_key(row: dict) -> dict:
+    """The OPE_rollups group an OPE_entries row counts towards."""
+    return {
+        "payroll_month": row.get("payroll_month") or "",
+        "client": str(row.get("client") or "Unknown").strip(),
+        "project_id": row.get("project_id") or "",
+        "partner": row.get("partner") or "",
+        "employee_id": row.get("employee_id") or "",
+        "status": row.get("status") or "",
+    }
+
+
+def rollup_contribution(row: dict) -> tuple:
+    return (tuple(rollup_key(row).values()), safe_float(row.get("amount", 0)), (row.get("travel_mode") or "").lower())
+
+
+def build_rollup_docs(entry_rows: list) -> list:
+    """Group OPE_entries rows of one employee into OPE_rollups documents."""
+    groups = {}
+    for row in entry_rows:
+        key = rollup_key(row)
+        group_id = tuple(key.values())
+        amount = safe_float(row.get("amount", 0))
+        travel_mode = (row.get("travel_mode") or "").lower()
+
+        group = groups.get(group_id)
+        if group is None:
+            group = groups[group_id] = {
+                "_id": key,
+                **key,
+                "employee_name": row.get("employee_name", ""),
+                "project_name": row.get("project_name") or "",
+                "project_type": row.get("project_type") or "",
+                "total_amount": 0.0,
+                "entry_count": 0,
+                "min_amount": amount,
+                "max_amount": amount,
+                "pass_count": 0,
+                "ticket_count": 0,
+                "travel_modes": [],
+            }
+
+        group["total_amount"] += amount
+        group["entry_count"] += 1
+        group["min_amount"] = min(group["min_amount"], amount)
+        group["max_amount"] = max(group["max_amount"], amount)
+        if any(t in travel_mode for t in PASS_TRAVEL_MODES):
+            group["pass_count"] += 1
+        else:
+            group["ticket_count"] += 1
+        if travel_mode not in group["travel_modes"]:
+            group["travel_modes"].append(travel_mode)
+
+    return list(groups.values())
+
+
+async def write_employee_rollups(employee_id: str, rollup_docs: list, session=None):
+    """Replace one employee's OPE_rollups groups with freshly built ones."""
+    updated_at = datetime.utcnow().isoformat()
+    operations = []
+    for doc in rollup_docs:
+        doc["updated_at"] = updated_at
+        operations.append(ReplaceOne({"_id": doc["_id"]}, doc, upsert=True))
+    operations.append(DeleteMany({
+        "employee_id": employee_id,
+        "_id": {"$nin": [doc["_id"] for doc in rollup_docs]},
+    }))
+    await db["OPE_rollups"].bulk_write(operations, ordered=False, session=session)
+
+
+async def apply_rollup_changes(employee_id: str, old_rows: list, new_rows: list, session=None):
+    """
+    Move changed OPE_entries rows between OPE_rollups groups. Groups that only
+    gain rows are bumped with $inc/$min/$max; min_amount, max_amount and
+    travel_modes cannot be decremented, so a group that loses a row is
+    rebuilt from that employee-month's rows (already written in this session).
+    """
+    old_by_id = {row["_id"]: row for row in old_rows}
+    added = []
+    shrunk = {}
+    for row in new_rows:
+        old_row = old_by_id.pop(row["_id"], None)
+        if old_row is not None and rollup_contribution(old_row) == rollup_contribution(row):
+            continue
+        added.append(row)
+        if old_row is not None:
+            shrunk[rollup_contribution(old_row)[0]] = rollup_key(old_row)
+    for old_row in old_by_id.values():
+        shrunk[rollup_contribution(old_row)[0]] = rollup_key(old_row)
+
+    updated_at = datetime.utcnow().isoformat()
+    operations = []
+    for doc in build_rollup_docs([row for row in added if rollup_contribution(row)[0] not in shrunk]):
+        key = doc["_id"]
+        operations.append(UpdateOne(
+            {"_id": key},
+            {
+                "$inc": {
+                    "total_amount": doc["total_amount"],
+                    "entry_count": doc["entry_count"],
+                    "pass_count": doc["pass_count"],
+                    "ticket_count": doc["ticket_count"],
+                },
+                "$min": {"min_amount": doc["min_amount"]},
+                "$max": {"max_amount": doc["max_amount"]},
+                "$addToSet": {"travel_modes": {"$each": doc["travel_modes"]}},
+                "$set": {"updated_at": updated_at},
+                "$setOnInsert": {
+                    **key,
+                    "employee_name": doc["employee_name"],
+                    "project_name": doc["project_name"],
+                    "project_type": doc["project_type"],
+                },
+            },
+            upsert=True
+        ))
+
+    if shrunk:
+        months = list({key["payroll_month"] for key in shrunk.values()})
+        month_rows = await db["OPE_entries"].find(
+            {"employee_id": employee_id, "payroll_month": {"$in": months}},
+            session=session
+        ).to_list(length=None)
+        rebuilt = {
+            tuple(doc["_id"].values()): doc
+            for doc in build_rollup_docs([row for row in month_rows if tuple(rollup_key(row).values()) in shrunk])
+        }
+        for group_id, key in shrunk.items():
+            doc = rebuilt.get(group_id)
+            if doc is None:
+                operations.append(DeleteOne({"_id": key}))
+            else:
+                doc["updated_at"] = updated_at
+                operations.append(ReplaceOne({"_id": key}, doc, upsert=True))
+
+    if operations:
+        await db["OPE_rollups"].bulk_write(operations, ordered=False, session=session)
+
+
+async def ensure_ope_entry_indexes():
+    """Create the OPE_entries / OPE_rollups indexes (no-op when they exist)."""
+    for keys in OPE_ENTRY_INDEXES:
+        await db["OPE_entries"].create_index(keys)
+    for keys in OPE_ROLLUP_INDEXES:
+        await db["OPE_rollups"].create_index(keys)
+
+
+@app.on_event("startup")
+async def init_ope_entry_store():
+    try:
+        if not await db["OPE_entries"].find_one({}, {"_id": 1}) and await db["OPE_data"].find_one({}, {"_id": 1}):
+            logger.warning("⚠️ OPE_entries is empty - run backfill_ope_entries.py to build it from OPE_data")
+        elif not await db["OPE_rollups"].find_one({}, {"_id": 1}) and await db["OPE_entries"].find_one({}, {"_id": 1}):
+            logger.warning("⚠️ OPE_rollups is empty - run rebuild_ope_rollups.py to build it from OPE_entries")
+        oldest = await db["OPE_entries"].find_one({}, {"data_index": 1}, sort=[("synced_at", 1)])
+        if oldest and "data_index" not in oldest:
+            logger.warning("⚠️ OPE_entries rows predate filing positions - run backfill_ope_entries.py")
+        stale = await db["OPE_entries_stale"].count_documents({})
+        if stale:
+            logger.warning("⚠️ %d employee(s) have a stale OPE_entries mirror - run backfill_ope_entries.py --stale", stale)
+    except Exception as e:
+        logger.warning("⚠️ Could not initialise OPE_entries: %s", e)
+
+
+# ---------- Approval Queue ----------
+# Approval_queue holds one document per (approver, employee, payroll_month,
+# level) that is waiting on someone. It is derived from Status: every Status
+# write re-derives that employee's items in the same transaction, so the
+# pending screens are one indexed range read on approver_code instead of a
+# Status rescan, and no shared document is rewritten by every approval.
+# backfill_approval_queue.py rebuilds it from Status.
+APPROVAL_QUEUE_INDEXES = [
+    [("approver_code", 1), ("level", 1), ("queued_at", 1)],
+    [("employee_id", 1)],
+]
+
+
+def approval_months(status_doc: dict) -> list:
+    """approval_status as a list (older Status docs hold a single dict)."""
+    approval_status = status_doc.get("approval_status")
+    if isinstance(approval_status, list):
+        return approval_status
+    if isinstance(approval_status, dict):
+        return [approval_status]
+    return []
+
+
+def build_approval_queue_items(status_doc: dict) -> list:
+    """Queue items for every month of one Status doc still waiting on an approver."""
+    employee_id = status_doc.get("employeeId")
+    items = []
+    for ps in approval_months(status_doc):
+        if ps.get("overall_status", "pending") != "pending":
+            continue
+        payroll_month = (ps.get("payroll_month") or ps.get("month_range")
+                         or status_doc.get("payroll_month") or status_doc.get("month_range"))
+        level = ps.get("current_level", "L1")
+        level_info = ps.get(level)
+        if not payroll_month or not isinstance(level_info, dict):
+            continue
+        approver_code = str(level_info.get("approver_code") or "").strip().upper()
+        if not approver_code:
+            continue
+        items.append({
+            "_id": f"{approver_code}|{employee_id}|{payroll_month}|{level}",
+            "approver_code": approver_code,
+            "level": level,
+            "employee_id": employee_id,
+            "employee_name": status_doc.get("employeeName") or status_doc.get("employee_name", ""),
+            "payroll_month": payroll_month,
+            "total_levels": ps.get("total_levels", 2),
+            "submitter_type": ps.get("submitter_type", "Employee"),
+            "status_doc_id": str(status_doc["_id"]),
+            "approval": ps,
+            "queued_at": ps.get("submission_date") or status_doc.get("submission_date"),
+        })
+    return items
+
+
+def approval_queue_item_hash(item: dict) -> str:
+    """Fingerprint of a queue item's content (everything but sync bookkeeping)."""
+    content = {k: v for k, v in item.items() if k not in ("synced_at", "content_hash")}
+    return hashlib.sha256(json_util.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+async def sync_approval_queue(employee_id: str, session=None):
+    """Re-derive one employee's Approval_queue items from their Status docs."""
+    status_docs = await db["Status"].find(
+        {"employeeId": employee_id}, session=session
+    ).to_list(length=None)
+
+    synced_at = datetime.utcnow().isoformat()
+    items = {}
+    for status_doc in status_docs:
+        for item in build_approval_queue_items(status_doc):
+            item["content_hash"] = approval_queue_item_hash(item)
+            item["synced_at"] = synced_at
+            items.setdefault(item["_id"], item)
+
+    # Only items whose content changed are written, so the change stream
+    # (and every approver's event feed) carries real deltas, not one
+    # replace per queued month on every sync
+    stored = {doc["_id"]: doc.get("content_hash") async for doc in db["Approval_queue"].find(
+        {"employee_id": employee_id}, {"content_hash": 1}, session=session)}
+    changed = [item for _id, item in items.items() if stored.get(_id) != item["content_hash"]]
+    removed_ids = [_id for _id in stored if _id not in items]
+
+    operations = [ReplaceOne({"_id": item["_id"]}, item, upsert=True) for item in changed]
+    if removed_ids:
+        operations.append(DeleteMany({"employee_id": employee_id, "_id": {"$nin": list(items)}}))
+    if operations:
+        await db["Approval_queue"].bulk_write(operations, ordered=False, session=session)
+
+    # Without change streams (standalone mongod, so also no transaction to
+    # roll back) live subscribers are told about the delta from here
+    if session is None and queue_events.source == "local":
+        for item in changed:
+            queue_events.publish_item(item)
+        for item_id in removed_ids:
+            queue_events.publish_removal(item_id)
+    return len(items)
+
+
+async def update_status_and_queue(employee_id: str, status_filter: dict, update: dict, upsert: bool = False):
+    """Apply one Status update and the matching Approval_queue changes in one transaction."""
+    async def apply(session):
+        result = await db["Status"].update_one(status_filter, update, upsert=upsert, session=session)
+        await sync_approval_queue(employee_id, session=session)
+        return result
+
+    return await run_in_transaction(apply)
+
+
+async def get_approval_queue(approver_code: str, levels=None) -> list:
+    """Everything waiting on one approver, oldest first (single indexed range read)."""
+    query = {"approver_code": approver_code.strip().upper()}
+    if levels:
+        query["level"] = {"$in": list(levels)}
+    return await db["Approval_queue"].find(query).sort(
+        [("approver_code", 1), ("level", 1), ("queued_at", 1)]
+    ).to_list(length=None)
+
+
+def queued_employee_codes(queue_items: list) -> list:
+    """Distinct employee codes of queue items, in queue order."""
+    return list(dict.fromkeys(item["employee_id"] for item in queue_items))
+
+
+def group_queue_by_employee(queue_items: list) -> dict:
+    """Queue items grouped per employee, both in queue order."""
+    grouped = {}
+    for item in queue_items:
+        grouped.setdefault(item["employee_id"], []).append(item)
+    return grouped
+
+
+async def ensure_approval_queue_indexes():
+    for keys in APPROVAL_QUEUE_INDEXES:
+        await db["Approval_queue"].create_index(keys)
+
+
+@app.on_event("startup")
+async def init_approval_queue():
+    try:
+        if not await db["Approval_queue"].find_one({}, {"_id": 1}) and await db["Status"].find_one({"approval_status.overall_status": "pending"}, {"_id": 1}):
+            logger.warning("⚠️ Approval_queue is empty - run backfill_approval_queue.py to build it from Status")
+    except Exception as e:
+        logger.warning("⚠️ Could not initialise Approval_queue: %s", e)
+
+
+# ---------- Approval Queue Events ----------
+# GET /api/ope/queue/events is a Server-Sent Events stream per user. Every
+# Approval_queue change is pushed to the approver it belongs to ("queue")
+# and to the employee whose claim it is ("status"), so dashboards refresh
+# when something actually changed instead of re-running the pending-screen
+# queries on every visit. Events come from a change stream on
+# Approval_queue (every worker sees every change); on a standalone mongod
+# sync_approval_queue() publishes them itself, which only reaches clients
+# of the same worker. A "resync" event means deltas may have been missed
+# (slow client, stream reconnect) and the client should reload.
+QUEUE_EVENTS_KEEPALIVE_SECONDS = 15
+QUEUE_EVENTS_BUFFER = 100
+QUEUE_EVENTS_RETRY_MS = 5000
+QUEUE_EVENTS_RETRY_SECONDS = 30
+
+queue_event_subscribers = Gauge(
+    "ope_queue_event_subscribers", "Open approval-queue event streams.")
+
+
+class QueueEventHub:
+    """Fan-out of approval-queue deltas to the open event streams of each user."""
+
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.source = "starting"   # → "change_stream" or "local"
+
+    def subscribe(self, code: str) -> asyncio.Queue:
+        subscription = asyncio.Queue(maxsize=QUEUE_EVENTS_BUFFER)
+        self.subscribers[code].add(subscription)
+        queue_event_subscribers.inc()
+        return subscription
+
+    def unsubscribe(self, code: str, subscription: asyncio.Queue):
+        self.subscribers[code].discard(subscription)
+        if not self.subscribers[code]:
+            del self.subscribers[code]
+        queue_event_subscribers.dec()
+
+    def send(self, code: str, event: dict):
+        for subscription in self.subscribers.get(code, ()):
+            try:
+                subscription.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too far behind for deltas to be useful - have it reload instead
+                while not subscription.empty():
+                    subscription.get_nowait()
+                subscription.put_nowait({"type": "resync"})
+
+    def resync_all(self, event: dict = None):
+        for code in list(self.subscribers):
+            self.send(code, event or {"type": "resync"})
+
+    def publish_item(self, item: dict):
+        approval = item.get("approval") or {}
+        delta = {
+            "op": "upsert",
+            "id": item["_id"],
+            "employee_id": item.get("employee_id"),
+            "employee_name": item.get("employee_name"),
+            "payroll_month": item.get("payroll_month"),
+            "level": item.get("level"),
+            "total_levels": item.get("total_levels"),
+            "total_amount": approval.get("total_amount"),
+            "queued_at": item.get("queued_at"),
+        }
+        self.send(item.get("approver_code"), {"type": "queue", **delta})
+        self.send(item.get("employee_id"), {"type": "status", **delta})
+
+    def publish_removal(self, item_id: str):
+        # _id is "approver|employee|payroll_month|level"
+        parts = str(item_id).split("|")
+        if len(parts) != 4:
+            return
+        approver_code, employee_id, payroll_month, level = parts
+        delta = {"op": "remove", "id": item_id, "employee_id": employee_id,
+                 "payroll_month": payroll_month, "level": level}
+        self.send(approver_code, {"type": "queue", **delta})
+        self.send(employee_id, {"type": "status", **delta})
+
+    def publish_change(self, change: dict):
+        operation = change.get("operationType")
+        if operation in ("insert", "update", "replace"):
+            if change.get("fullDocument"):
+                self.publish_item(change["fullDocument"])
+            else:
+                self.publish_removal(change["documentKey"]["_id"])
+        elif operation == "delete":
+            self.publish_removal(change["documentKey"]["_id"])
+        else:
+            self.resync_all()
+
+
+queue_events = QueueEventHub()
+queue_event_tasks = set()
+
+
+def sse_message(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {render_json(data).decode('utf-8')}\n\n"
+
+
+async def watch_approval_queue():
+    while True:
+        try:
+            async with db["Approval_queue"].watch(full_document="updateLookup") as stream:
+                if queue_events.source == "change_stream":
+                    queue_events.resync_all()   # reconnected: changes may have been missed
+                queue_events.source = "change_stream"
+                logger.info("👀 Watching Approval_queue for live dashboard updates")
+                async for change in stream:
+                    queue_events.publish_change(change)
+        except asyncio.CancelledError:
+            raise
+        except OperationFailure as e:
+            if e.code == 40573:   # standalone server: no change streams
+                queue_events.source = "local"
+                logger.info("ℹ️ Change streams unavailable - queue events are published in-process")
+                if int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+                    logger.warning("⚠️ In-process queue events only reach clients of the worker that made the "
+                                   "change - run MongoDB as a replica set when serving with several workers")
+                return
+            logger.warning("⚠️ Approval_queue change stream failed: %s", e)
+        except PyMongoError as e:
+            logger.warning("⚠️ Approval_queue change stream failed: %s", e)
+        await asyncio.sleep(QUEUE_EVENTS_RETRY_SECONDS)
+
+
+@app.on_event("startup")
+async def init_queue_events():
+    task = asyncio.create_task(watch_approval_queue())
+    queue_event_tasks.add(task)
+    task.add_done_callback(queue_event_tasks.discard)
+
+
+@app.on_event("shutdown")
+async def close_queue_events():
+    # Ends every open stream so the server can stop
+    queue_events.resync_all({"type": "shutdown"})
+
+
+# ---------- Index Registry ----------
+# Every index the app's queries depend on, keyed by (database, collection);
+# database None is MONGO_DB. Unique indexes encode the one-document-per-
+# employee assumption the handlers make with find_one(). The registry is
+# applied at startup (INDEX_SYNC_ON_STARTUP=0 skips it): present indexes are
+# left alone and missing ones are built, so a fresh environment or restored
+# backup comes up indexed. Nothing is ever dropped here - an index that
+# exists with other options (e.g. a non-unique EmpID_1 from older builds)
+# is reported as a conflict, and a unique index that can't be built because
+# of duplicate keys falls back to a plain index on the same keys so queries
+# still avoid collection scans. verify_indexes.py reports and fixes both,
+# lists unused indexes and checks the hot queries with explain().
+INDEX_SYNC_ON_STARTUP = os.getenv("INDEX_SYNC_ON_STARTUP", "1") == "1"
+INDEX_OPTIONS_COMPARED = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+def unique_where_present(field: str) -> dict:
+    """
+    Unique only among documents that have the field. A plain unique index
+    treats every document missing it as a duplicate null key.
+    """
+    return {"unique": True, "partialFilterExpression": {field: {"$exists": True}}}
+
+
+# user and Ticket_blobs rows are only ever written with their key, so those
+# stay plainly unique. The master-data collections are loaded from outside
+# the app and may carry rows without the key; OPE_data also holds the flat
+# one-entry documents /api/ope/submit writes (employee_id, no employeeId).
+MANAGED_INDEXES = {
+    (None, "user"): [([("employee_code", 1)], {"unique": True})],
+    (None, "Employee_details"): [([("EmpID", 1)], unique_where_present("EmpID"))],
+    (None, "Employee"): [([("EmployeeId", 1)], unique_where_present("EmployeeId"))],
+    (None, "Partner"): [([("PartnerEmpCode", 1)], unique_where_present("PartnerEmpCode"))],
+    (None, "Reporting_managers"): [([("ReportingEmpCode", 1)], unique_where_present("ReportingEmpCode"))],
+    (None, "Reporting_Managers"): [([("EmployeeId", 1)], {})],
+    (None, "OPE_data"): [
+        ([("employeeId", 1)], unique_where_present("employeeId")),
+        ([("employee_id", 1)], {"partialFilterExpression": {"employee_id": {"$exists": True}}}),
+    ],
+    (None, "Temp_OPE_data"): [([("employeeId", 1)], unique_where_present("employeeId"))],
+    # Older Status layouts hold one document per employee-month, so employeeId is not unique
+    (None, "Status"): [
+        ([("employeeId", 1)], {}),
+        ([("approval_status.payroll_month", 1)], {}),
+        ([("approval_status.month_range", 1)], {}),
+    ],
+    (None, "Approved"): [([("ReportingEmpCode", 1)], {})],
+    (None, "Rejected"): [([("ReportingEmpCode", 1)], {})],
+    (None, "OPE_entries"): [(keys, {}) for keys in OPE_ENTRY_INDEXES],
+    (None, "OPE_rollups"): [(keys, {}) for keys in OPE_ROLLUP_INDEXES],
+    (None, "Approval_queue"): [(keys, {}) for keys in APPROVAL_QUEUE_INDEXES],
+    (None, "Ticket_blobs"): TICKET_BLOB_INDEXES,
+    (None, "Report_jobs"): [
+        ([("job_key", 1)], {"unique": True, "partialFilterExpression": {"dedupe": True}}),
+        ([("expires_at", 1)], {}),
+    ],
+    ("Timesheets", "Projects"): [([("partner_emp_code", 1)], {})],
+}
+
+mongo_index_problems = Gauge(
+    "ope_mongo_index_problems", "Managed indexes that are conflicting, degraded or failed to build.", ("kind",))
+
+
+def managed_collection(database, collection):
+    return (client[database] if database else db)[collection]
+
+
+def collection_label(database, collection) -> str:
+    return f"{database}.{collection}" if database else collection
+
+
+def index_key(keys) -> tuple:
+    """Comparable form of an index key pattern (list of pairs or a key document)."""
+    items = keys.items() if hasattr(keys, "items") else keys
+    return tuple((field, int(direction) if isinstance(direction, (int, float)) else direction)
+                 for field, direction in items)
+
+
+def index_options_match(info: dict, options: dict) -> bool:
+    for option in INDEX_OPTIONS_COMPARED:
+        if option == "unique":
+            if bool(info.get("unique")) != bool(options.get("unique")):
+                return False
+        elif info.get(option) != options.get(option):
+            return False
+    return True
+
+
+async def existing_indexes(coll) -> dict:
+    return {index_key(info["key"]): info async for info in coll.list_indexes()}
+
+
+async def apply_managed_indexes() -> dict:
+    """
+    Build every missing MANAGED_INDEXES entry. Returns lists of
+    "Collection keys" labels under created / present / conflicts /
+    fallbacks (unique build failed on duplicates) / errors.
+    """
+    report = defaultdict(list)
+    for (database, collection), specs in MANAGED_INDEXES.items():
+        coll = managed_collection(database, collection)
+        label = collection_label(database, collection)
+        try:
+            existing = await existing_indexes(coll)
+        except PyMongoError as e:
+            report["errors"].append(f"{label}: {e}")
+            continue
+
+        for keys, options in specs:
+            name = f"{label} {dict(keys)}"
+            current = existing.get(index_key(keys))
+            if current is not None:
+                report["present" if index_options_match(current, options) else "conflicts"].append(name)
+                continue
+            try:
+                await coll.create_index(keys, **options)
+                report["created"].append(name)
+            except OperationFailure as e:
+                if e.code != 11000 or not options.get("unique"):
+                    report["errors"].append(f"{name}: {e}")
+                    continue
+                # Duplicate keys: keep the queries indexed until the data is cleaned up
+                await coll.create_index(keys, **{k: v for k, v in options.items() if k != "unique"})
+                report["fallbacks"].append(name)
+            except PyMongoError as e:
+                report["errors"].append(f"{name}: {e}")
+    return report
+
+
+@app.on_event("startup")
+async def sync_managed_indexes():
+    if not INDEX_SYNC_ON_STARTUP:
+        return
+    try:
+        report = await apply_managed_indexes()
+    except Exception as e:
+        logger.error("❌ Could not apply managed indexes: %s", e)
+        return
+
+    if report["created"]:
+        logger.info("🗂️ Built %d missing indexes: %s", len(report["created"]), "; ".join(report["created"]))
+    for name in report["conflicts"]:
+        logger.error("❌ Index %s exists with different options - run verify_indexes.py --rebuild", name)
+    for name in report["fallbacks"]:
+        logger.error("❌ Unique index %s not built: duplicate keys (plain index used) - run verify_indexes.py --rebuild", name)
+    for problem in report["errors"]:
+        logger.error("❌ Index build failed: %s", problem)
+    for kind in ("conflicts", "fallbacks", "errors"):
+        mongo_index_problems.set(len(report[kind]), kind)
+
+
 # ---------- Models ----------
 class UserCreate(BaseModel):
     employee_code: str
@@ -145,6 +1750,360 @@ async def get_user_by_employee_code(employee_code: str):
     return await user_collection.find_one({"employee_code": employee_code})
 
 
+# ---------- Identity / Role Cache ----------
+# Who the caller is (user doc) and what they are (Partner, Reporting manager,
+# Admin, HR) is read on nearly every request but changes rarely, so it is
+# kept in small in-process TTL/LRU caches. Misses are cached too: most
+# callers are *not* partners or managers, and that answer must also be free.
+# Master-data loads should call invalidate_identity_cache() (or hit
+# POST /api/admin/cache/invalidate); otherwise entries age out after
+# IDENTITY_CACHE_TTL_SECONDS.
+IDENTITY_CACHE_TTL_SECONDS = float(os.getenv("IDENTITY_CACHE_TTL_SECONDS", "300"))
+IDENTITY_CACHE_MAX_ENTRIES = int(os.getenv("IDENTITY_CACHE_MAX_ENTRIES", "5000"))
+HR_EMP_CODE = "JHS729"
+
+_CACHE_MISS = object()
+
+
+class TTLCache:
+    """Least-recently-used dict whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        item = self.entries.get(key)
+        if item is None:
+            return _CACHE_MISS
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return _CACHE_MISS
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def pop(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+
+user_cache = TTLCache(IDENTITY_CACHE_TTL_SECONDS, IDENTITY_CACHE_MAX_ENTRIES)
+partner_cache = TTLCache(IDENTITY_CACHE_TTL_SECONDS, IDENTITY_CACHE_MAX_ENTRIES)
+manager_cache = TTLCache(IDENTITY_CACHE_TTL_SECONDS, IDENTITY_CACHE_MAX_ENTRIES)
+admin_codes_cache = TTLCache(IDENTITY_CACHE_TTL_SECONDS, 1)
+
+
+async def _cached_lookup(cache: TTLCache, key: str, load):
+    value = cache.get(key)
+    if value is _CACHE_MISS:
+        value = await load()
+        cache.set(key, value)
+    # Callers get their own copy; the cached document stays pristine
+    return dict(value) if isinstance(value, dict) else value
+
+
+async def get_cached_user(employee_code: str):
+    """User doc for an authenticated employee code. Unknown codes are not cached."""
+    user = user_cache.get(employee_code)
+    if user is _CACHE_MISS:
+        user = await get_user_by_employee_code(employee_code)
+        if user is None:
+            return None
+        user_cache.set(employee_code, user)
+    return dict(user)
+
+
+async def get_partner(emp_code: str):
+    """Partner document for emp_code, or None if they are not a partner."""
+    emp_code = emp_code.strip().upper()
+    return await _cached_lookup(
+        partner_cache, emp_code,
+        lambda: db["Partner"].find_one({"PartnerEmpCode": emp_code})
+    )
+
+
+async def get_reporting_manager(emp_code: str):
+    """Reporting_managers document for emp_code, or None if they manage nobody."""
+    emp_code = emp_code.strip().upper()
+    return await _cached_lookup(
+        manager_cache, emp_code,
+        lambda: db["Reporting_managers"].find_one({"ReportingEmpCode": emp_code})
+    )
+
+
+async def get_admin_codes() -> frozenset:
+    """Upper-cased employee codes listed in the single Admin document."""
+    async def load():
+        admin_doc = await db["Admin"].find_one({})
+        if not admin_doc:
+            return frozenset()
+        return frozenset(c.strip().upper() for c in admin_doc.get("employee_codes", []))
+
+    return await _cached_lookup(admin_codes_cache, "admin", load)
+
+
+async def get_user_roles(emp_code: str) -> dict:
+    """Resolve every role of emp_code; costs no DB round trips once cached."""
+    emp_code = emp_code.strip().upper()
+    partner, manager, admin_codes = await asyncio.gather(
+        get_partner(emp_code), get_reporting_manager(emp_code), get_admin_codes()
+    )
+    return {
+        "employee_code": emp_code,
+        "is_hr": emp_code == HR_EMP_CODE,
+        "is_admin": emp_code in admin_codes,
+        "partner": partner,
+        "manager": manager,
+        "is_partner": partner is not None,
+        "is_manager": manager is not None,
+    }
+
+
+def invalidate_identity_cache(employee_code: Optional[str] = None):
+    """
+    Drop cached identity/roles for one employee, or everything when no code
+    is given. The Admin list is shared, so it is always dropped.
+    """
+    admin_codes_cache.clear()
+    if employee_code is None:
+        user_cache.clear()
+        partner_cache.clear()
+        manager_cache.clear()
+        logger.info("🧹 Identity cache cleared")
+        return
+    user_cache.pop(employee_code)
+    code = employee_code.strip().upper()
+    user_cache.pop(code)
+    partner_cache.pop(code)
+    manager_cache.pop(code)
+    logger.info("🧹 Identity cache cleared for %s", code)
+
+
+# ---------- Employee Directory ----------
+# Employee_details and Employee are master data: thousands of rows that
+# change a few times a month but are read on almost every request (limits,
+# reporting lines, names for the pending screens, partner names for the
+# exports). Each is held in memory as EmployeeDirectory - code → compact
+# record with just the fields the handlers read - loaded at startup and kept
+# current by a change stream. Without a replica set new documents are picked
+# up every EMPLOYEE_DIRECTORY_POLL_SECONDS by _id, and the snapshot is
+# reloaded in full every EMPLOYEE_DIRECTORY_RELOAD_SECONDS (the master data
+# has no updated-at field, so edits are only seen by a full reload).
+# A code that is not in the snapshot is looked up once in MongoDB, so a new
+# joiner is never turned away, and until the first load succeeds every
+# lookup goes to MongoDB as before. Records are shared: treat them as
+# read-only (get() hands out copies).
+EMPLOYEE_DIRECTORY_POLL_SECONDS = float(os.getenv("EMPLOYEE_DIRECTORY_POLL_SECONDS", "60"))
+EMPLOYEE_DIRECTORY_RELOAD_SECONDS = float(os.getenv("EMPLOYEE_DIRECTORY_RELOAD_SECONDS", "3600"))
+EMPLOYEE_DIRECTORY_RETRY_SECONDS = 30
+
+employee_directory_records = Gauge(
+    "ope_employee_directory_records", "Employees held in the in-memory directory.", ("collection",))
+employee_directory_version = Gauge(
+    "ope_employee_directory_version", "Changes applied to the in-memory directory since start.", ("collection",))
+
+
+class EmployeeDirectory:
+    """Upper-cased employee code → compact record of one master-data collection."""
+
+    def __init__(self, collection: str, key_field: str, fields: tuple):
+        self.collection = collection
+        self.key_field = key_field
+        self.fields = tuple(fields)
+        self.projection = {field: 1 for field in self.fields}
+        self.records = {}
+        self.codes_by_id = {}
+        self.last_id = None
+        self.loaded = False
+        self.version = 0
+
+    def compact(self, doc: dict) -> dict:
+        # Names, partners and designations repeat across thousands of rows
+        return {field: sys.intern(doc[field]) if isinstance(doc[field], str) else doc[field]
+                for field in self.fields if field in doc}
+
+    def code_of(self, doc: dict) -> str:
+        return str(doc.get(self.key_field) or "").strip().upper()
+
+    def put(self, doc: dict):
+        code = self.code_of(doc)
+        old_code = self.codes_by_id.get(doc["_id"])
+        if old_code and old_code != code:
+            self.records.pop(old_code, None)
+        if code:
+            self.records[code] = self.compact(doc)
+            self.codes_by_id[doc["_id"]] = code
+        if self.last_id is None or doc["_id"] > self.last_id:
+            self.last_id = doc["_id"]
+        self.changed()
+
+    def remove(self, doc_id):
+        code = self.codes_by_id.pop(doc_id, None)
+        if code:
+            self.records.pop(code, None)
+            self.changed()
+
+    def changed(self):
+        self.version += 1
+        employee_directory_records.set(len(self.records), self.collection)
+        employee_directory_version.set(self.version, self.collection)
+
+    async def reload(self):
+        """Load the whole collection and swap it in at once."""
+        records, codes_by_id, last_id = {}, {}, None
+        async for doc in db[self.collection].find({}, self.projection, batch_size=1000):
+            code = self.code_of(doc)
+            if code and code not in records:   # first document wins, like find_one()
+                records[code] = self.compact(doc)
+                codes_by_id[doc["_id"]] = code
+            if last_id is None or doc["_id"] > last_id:
+                last_id = doc["_id"]
+        self.records, self.codes_by_id, self.last_id = records, codes_by_id, last_id
+        self.loaded = True
+        self.changed()
+        logger.info("📇 %s directory loaded: %d employees", self.collection, len(records))
+
+    async def load_new(self):
+        """Pick up documents inserted since the last load (ObjectIds grow over time)."""
+        query = {"_id": {"$gt": self.last_id}} if self.last_id is not None else {}
+        async for doc in db[self.collection].find(query, self.projection):
+            self.put(doc)
+
+    async def get(self, code: str):
+        """Copy of the record for code, or None when there is no such employee."""
+        code = str(code or "").strip().upper()
+        record = self.records.get(code) if self.loaded else None
+        if record is None:
+            doc = await db[self.collection].find_one({self.key_field: code}, self.projection)
+            if doc is None:
+                return None
+            record = self.compact(doc)
+            if self.loaded:
+                self.put(doc)
+        return dict(record)
+
+    async def get_many(self, codes) -> dict:
+        """code → record for the codes that exist (shared records, read-only)."""
+        codes = {str(code or "").strip().upper() for code in codes}
+        found = {code: self.records[code] for code in codes if code in self.records} if self.loaded else {}
+        missing = [code for code in codes if code not in found]
+        if missing:
+            async for doc in db[self.collection].find({self.key_field: {"$in": missing}}, self.projection):
+                code = self.code_of(doc)
+                if code not in found:
+                    found[code] = self.compact(doc)
+                    if self.loaded:
+                        self.put(doc)
+        return found
+
+    async def refresh(self, code: str):
+        """Re-read one employee (after an out-of-band edit)."""
+        code = str(code or "").strip().upper()
+        doc = await db[self.collection].find_one({self.key_field: code}, self.projection)
+        if doc is not None:
+            self.put(doc)
+        elif self.records.pop(code, None) is not None:
+            self.codes_by_id = {doc_id: c for doc_id, c in self.codes_by_id.items() if c != code}
+            self.changed()
+
+    async def all_records(self) -> dict:
+        """The whole directory (shared, read-only); loads it first if needed."""
+        if not self.loaded:
+            await self.reload()
+        return self.records
+
+    def apply_change(self, change: dict):
+        operation = change.get("operationType")
+        if operation in ("insert", "update", "replace") and change.get("fullDocument"):
+            self.put(change["fullDocument"])
+        elif operation == "delete":
+            self.remove(change["documentKey"]["_id"])
+        elif operation in ("update", "replace"):
+            # Deleted again before the lookup - drop it like a delete
+            self.remove(change["documentKey"]["_id"])
+        else:
+            return False   # drop / rename / invalidate: the stream is over
+        return True
+
+    async def keep_current(self):
+        """Follow the change stream; poll by _id (plus full reloads) where there is none."""
+        reconnect = False
+        while True:
+            try:
+                pipeline = [{"$project": {"operationType": 1, "documentKey": 1, **{
+                    f"fullDocument.{field}": 1 for field in ("_id",) + self.fields}}}]
+                async with db[self.collection].watch(pipeline, full_document="updateLookup") as stream:
+                    # Changes missed while the stream was down are covered by a reload
+                    if reconnect or not self.loaded:
+                        await self.reload()
+                    reconnect = True
+                    async for change in stream:
+                        if not self.apply_change(change):
+                            break
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code == 40573:   # standalone server: no change streams
+                    logger.info("ℹ️ Change streams unavailable - polling %s every %ss",
+                                self.collection, int(EMPLOYEE_DIRECTORY_POLL_SECONDS))
+                    await self.poll()
+                    return
+                logger.warning("⚠️ %s directory change stream failed: %s", self.collection, e)
+            except PyMongoError as e:
+                logger.warning("⚠️ %s directory change stream failed: %s", self.collection, e)
+            await asyncio.sleep(EMPLOYEE_DIRECTORY_RETRY_SECONDS)
+
+    async def poll(self):
+        reloaded_at = time.monotonic()
+        while True:
+            await asyncio.sleep(EMPLOYEE_DIRECTORY_POLL_SECONDS)
+            try:
+                if time.monotonic() - reloaded_at >= EMPLOYEE_DIRECTORY_RELOAD_SECONDS:
+                    await self.reload()
+                    reloaded_at = time.monotonic()
+                else:
+                    await self.load_new()
+            except PyMongoError as e:
+                logger.warning("⚠️ %s directory refresh failed: %s", self.collection, e)
+
+
+employee_directory = EmployeeDirectory("Employee_details", "EmpID", (
+    "EmpID", "Emp Name", "EmpName", "Designation Name", "Gender", "Partner", "PartnerEmpCode",
+    "ReportingEmpName", "ReportingEmpCode", "OPE LIMIT", "OPE Limit",
+))
+employee_master = EmployeeDirectory("Employee", "EmployeeId", (
+    "EmployeeId", "EmployeeName", "Designation", "Department", "Reporting_Manager", "ReportingEmpCode",
+    "Partner", "PartnerEmpCode", "OPE_limit",
+))
+employee_directory_tasks = set()
+
+
+async def reload_employee_directories():
+    await asyncio.gather(employee_directory.reload(), employee_master.reload())
+
+
+@app.on_event("startup")
+async def init_employee_directories():
+    try:
+        await reload_employee_directories()
+    except Exception as e:
+        logger.warning("⚠️ Could not load the employee directory - using MongoDB lookups: %s", e)
+    for directory in (employee_directory, employee_master):
+        task = asyncio.create_task(directory.keep_current())
+        employee_directory_tasks.add(task)
+        task.add_done_callback(employee_directory_tasks.discard)
+
+
 # ---------- JWT dependency ----------
 from fastapi.security import OAuth2PasswordBearer
 
@@ -166,7 +2125,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
 
-    user = await get_user_by_employee_code(token_data.employee_code)
+    user = await get_cached_user(token_data.employee_code)
     if user is None:
         raise credentials_exception
     return user
@@ -177,38 +2136,394 @@ async def is_valid_employee(employee_code: str) -> bool:
     return emp is not None
 
 
+# ---------- Pagination ----------
+# The history, approved/rejected and dashboard list endpoints share one
+# contract:
+#   ?limit=&cursor=&sort=   plus the filters month, status, client,
+#                           date_from and date_to (ISO dates, inclusive)
+# Without limit or cursor the whole filtered list is returned, as before.
+# Every response carries "page": {limit, sort, total, next_cursor}; send
+# next_cursor back with the same sort and filters for the following page.
+# Cursors are keyset positions (the sort values of the last row served), so
+# a page never skips or repeats rows when earlier ones are added or
+# removed, and they carry the total counted for the first page. The
+# exception is the filing-order position of an entry (data_index /
+# entry_index), which moves up when an earlier entry is deleted.
+PAGE_SIZE_DEFAULT = 100
+PAGE_SIZE_MAX = 500
+
+
+def encode_cursor(state: dict) -> str:
+    raw = json_util.dumps(state, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        state = json_util.loads(raw)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(state, dict) or not isinstance(state.get("k"), list):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return state
+
+
+def keyset_filter(spec: list, after: list) -> dict:
+    """
+    Mongo filter for the rows that sort after `after` under `spec`
+    [(field, direction), ...]. Nulls sort first, like MongoDB does; the last
+    field must be unique (normally _id).
+    """
+    clauses = []
+    for i, (field, direction) in enumerate(spec):
+        prefix = {f: v for (f, _), v in zip(spec[:i], after[:i])}
+        value = after[i]
+        if value is None:
+            if direction == 1:
+                clauses.append({**prefix, field: {"$ne": None}})
+        else:
+            clauses.append({**prefix, field: {"$gt" if direction == 1 else "$lt": value}})
+            if direction == -1:
+                clauses.append({**prefix, field: None})
+    return {"$or": clauses}
+
+
+def sort_position(values: list) -> tuple:
+    """Python ordering of sort values matching MongoDB's: null < numbers < strings < other."""
+    position = []
+    for value in values:
+        if value is None:
+            position.append((0, 0))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            position.append((1, value))
+        elif isinstance(value, str):
+            position.append((2, value))
+        else:
+            position.append((3, str(value)))
+    return tuple(position)
+
+
+class PageRequest:
+    """The ?limit / cursor / sort and filter parameters of one list request."""
+
+    def __init__(self, limit: Optional[int], cursor: Optional[str], sort: Optional[str], filters: dict):
+        self.limit = limit
+        self.cursor = cursor
+        self.sort = sort
+        self.filters = {k: v.strip() for k, v in filters.items() if v and v.strip()}
+        self.spec = []
+        self.after = None
+        self.total = None
+
+    @property
+    def paginated(self) -> bool:
+        return self.limit is not None or self.cursor is not None
+
+    @property
+    def page_size(self) -> int:
+        return self.limit or PAGE_SIZE_DEFAULT
+
+    @property
+    def fetch_limit(self) -> int:
+        """Rows to read: one past the page tells whether another page exists (0 = all)."""
+        return self.page_size + 1 if self.paginated else 0
+
+    def resolve(self, sorts: dict, default_sort: str, filters: tuple = ()) -> list:
+        """
+        Check the request against what one endpoint supports and unpack the
+        cursor. `sorts` maps a sort name to its ascending [(field, 1), ...]
+        spec; "-name" sorts descending.
+        """
+        unsupported = sorted(set(self.filters) - set(filters))
+        if unsupported:
+            raise HTTPException(status_code=400, detail=f"Unsupported filter(s): {', '.join(unsupported)}")
+
+        self.sort = self.sort or default_sort
+        spec = sorts.get(self.sort.lstrip("-"))
+        if spec is None:
+            raise HTTPException(status_code=400, detail=f"Invalid sort. Use one of: {', '.join(sorts)} (prefix - for descending)")
+        self.spec = [(field, -1) for field, _ in spec] if self.sort.startswith("-") else list(spec)
+
+        if self.cursor:
+            state = decode_cursor(self.cursor)
+            if state.get("s") != self.sort or state.get("f") != self.filters or len(state["k"]) != len(self.spec):
+                raise HTTPException(status_code=400, detail="Cursor does not match this sort and filter")
+            self.after = state["k"]
+            self.total = state.get("t")
+        return self.spec
+
+    def mongo_query(self, query: dict) -> dict:
+        """`query` narrowed to the rows after the cursor."""
+        if self.after is None:
+            return query
+        return {"$and": [query, keyset_filter(self.spec, self.after)]}
+
+    def entry_query(self, query: dict, month_field: str = "payroll_month") -> dict:
+        """Add the month / status / client / date filters to an entry query."""
+        if "month" in self.filters:
+            query[month_field] = self.filters["month"]
+        if "status" in self.filters:
+            query["status"] = self.filters["status"].lower()
+        if "client" in self.filters:
+            query["client"] = self.filters["client"]
+        date_range = {}
+        if "date_from" in self.filters:
+            date_range["$gte"] = self.filters["date_from"]
+        if "date_to" in self.filters:
+            date_range["$lte"] = self.filters["date_to"]
+        if date_range:
+            query["date"] = date_range
+        return query
+
+    def matches(self, row: dict, month_field: str = "payroll_month") -> bool:
+        """In-memory equivalent of entry_query() for single-document sources."""
+        f = self.filters
+        if "month" in f and row.get(month_field) != f["month"]:
+            return False
+        if "status" in f and str(row.get("status") or "").lower() != f["status"].lower():
+            return False
+        if "client" in f and row.get("client") != f["client"]:
+            return False
+        date_value = row.get("date") or ""
+        if "date_from" in f and date_value < f["date_from"]:
+            return False
+        if "date_to" in f and date_value > f["date_to"]:
+            return False
+        return True
+
+    def finish(self, rows: list) -> tuple:
+        """
+        Trim rows read with fetch_limit to one page; returns (rows, page).
+        The next cursor is taken from the raw row, before any reformatting.
+        """
+        if not self.paginated:
+            return rows, {"limit": None, "sort": self.sort, "total": len(rows), "next_cursor": None}
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        next_cursor = None
+        if has_more:
+            next_cursor = encode_cursor({
+                "s": self.sort,
+                "f": self.filters,
+                "k": [rows[-1].get(field) for field, _ in self.spec],
+                "t": self.total,
+            })
+        return rows, {"limit": self.page_size, "sort": self.sort, "total": self.total, "next_cursor": next_cursor}
+
+    def slice(self, rows: list) -> tuple:
+        """Sort, cursor-skip and trim an in-memory list of dicts; returns (rows, page)."""
+        descending = bool(self.spec) and self.spec[0][1] == -1
+        position = lambda row: sort_position([row.get(field) for field, _ in self.spec])
+        rows = sorted(rows, key=position, reverse=descending)
+        if self.paginated and self.total is None:
+            self.total = len(rows)
+        if self.after is not None:
+            after = sort_position(self.after)
+            rows = [row for row in rows if (position(row) < after if descending else position(row) > after)]
+        return self.finish(rows[:self.fetch_limit] if self.fetch_limit else rows)
+
+
+def page_request(
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = Query(None),
+    sort: Optional[str] = Query(None),
+    month: Optional[str] = Query(None),
+    status_filter: Optional[str] = Query(None, alias="status"),
+    client_filter: Optional[str] = Query(None, alias="client"),
+    date_from: Optional[str] = Query(None),
+    date_to: Optional[str] = Query(None),
+) -> PageRequest:
+    return PageRequest(limit, cursor, sort, {
+        "month": month,
+        "status": status_filter,
+        "client": client_filter,
+        "date_from": date_from,
+        "date_to": date_to,
+    })
+
+
+# Sorts for OPE_entries rows. "filed" (the default) is the order the entries
+# sit in OPE_data.Data, as the screens always listed them.
+ENTRY_SORTS = {
+    "filed": [("data_index", 1), ("entry_index", 1)],
+    "date": [("date", 1), ("data_index", 1), ("entry_index", 1)],
+    "amount": [("amount", 1), ("data_index", 1), ("entry_index", 1)],
+    "month": [("month_range", 1), ("date", 1), ("data_index", 1), ("entry_index", 1)],
+}
+ENTRY_FILTERS = ("month", "status", "client", "date_from", "date_to")
+STATUS_LIST_FILTERS = ("month", "client", "date_from", "date_to")
+
+# The same sorts for drafts, which are paged in memory: position is the
+# filing order and amount_value the amount as a number
+TEMP_ENTRY_SORTS = {
+    "filed": [("position", 1)],
+    "date": [("date", 1), ("position", 1)],
+    "amount": [("amount_value", 1), ("position", 1)],
+    "month": [("month_range", 1), ("date", 1), ("position", 1)],
+}
+
+
+async def read_entry_page(query: dict, page: PageRequest, filters: tuple = ENTRY_FILTERS) -> tuple:
+    """
+    One page of one employee's OPE_entries rows for `query`; returns
+    (rows, page). Only rows with a filing position are read - legacy flat
+    submissions never appeared in these lists. The first page counts the
+    total on the same indexed filter; later pages reuse it from the cursor.
+    """
+    page.resolve(ENTRY_SORTS, "filed", filters)
+    query = page.entry_query({**query, "data_index": {"$ne": None}}, month_field="month_range")
+    if page.paginated and page.total is None:
+        page.total = await db["OPE_entries"].count_documents(query)
+    rows = await db["OPE_entries"].find(page.mongo_query(query)).sort(page.spec).limit(page.fetch_limit).to_list(length=None)
+    return page.finish(rows)
+
+
+def page_draft_rows(rows: list, page: PageRequest) -> tuple:
+    """Filter, sort and page draft rows in memory; returns (rows, page)."""
+    page.resolve(TEMP_ENTRY_SORTS, "filed", ENTRY_FILTERS)
+    rows, page_info = page.slice([
+        {**row, "position": position, "amount_value": safe_float(row.get("amount"))}
+        for position, row in enumerate(rows) if page.matches(row, month_field="month_range")
+    ])
+    for row in rows:
+        del row["position"], row["amount_value"]
+    return rows, page_info
+
+
+async def read_code_page(collection: str, query: dict, page: PageRequest) -> tuple:
+    """One page of the EmployeesCodes array in a per-approver list document."""
+    page.resolve({"code": [("code", 1)]}, "code")
+    doc = await db[collection].find_one(query, {"EmployeesCodes": 1})
+    rows, page_info = page.slice([{"code": code} for code in (doc or {}).get("EmployeesCodes", [])])
+    return [row["code"] for row in rows], page_info
+
+
 # ---------- PDF Serve Endpoint ----------
+# Receipts are streamed chunk by chunk straight from GridFS (never buffered
+# whole), with single-range requests for the browser PDF viewer and
+# ETag/If-None-Match so re-opening a receipt costs a 304. GridFS files are
+# immutable, so the ETag only has to identify the stored file.
+PDF_CACHE_CONTROL = "private, max-age=3600"
+
+
+def gridfs_etag(grid_out) -> str:
+    upload_ms = int(grid_out.upload_date.timestamp() * 1000) if grid_out.upload_date else 0
+    return f'"{grid_out._id}-{upload_ms}-{grid_out.length}"'
+
+
+def etag_matches(header_value: Optional[str], etag: str) -> bool:
+    """If-None-Match / If-Range comparison (weak comparison, '*' matches anything)."""
+    if not header_value:
+        return False
+    candidates = [tag.strip() for tag in header_value.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def parse_byte_range(range_header: str, length: int):
+    """
+    Parse a single 'bytes=start-end' / 'bytes=start-' / 'bytes=-suffix' range.
+    Returns (start, end) inclusive, None to ignore the header (multi-range or
+    malformed), or raises ValueError when the range cannot be satisfied.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_text, sep, end_text = spec.strip().partition("-")
+    if not sep or not (start_text or end_text):
+        return None
+    try:
+        start = int(start_text) if start_text else None
+        end = int(end_text) if end_text else None
+    except ValueError:
+        return None
+    if start is None:
+        # Suffix range: the last `end` bytes
+        if end == 0:
+            raise ValueError("empty suffix range")
+        return max(length - end, 0), length - 1
+    if end is None:
+        end = length - 1
+    if start >= length or end < start:
+        raise ValueError("range not satisfiable")
+    return start, min(end, length - 1)
+
+
+async def iter_gridfs_range(grid_out, start: int, end: int):
+    """Yield bytes start..end (inclusive) of a GridFS file, one chunk at a time."""
+    if start:
+        grid_out.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        chunk = await grid_out.readchunk()
+        if not chunk:
+            break
+        if len(chunk) > remaining:
+            chunk = chunk[:remaining]
+        remaining -= len(chunk)
+        yield chunk
+
+
 @app.get("/api/ope/pdf/{file_id}")
-async def serve_pdf(file_id: str, current_user=Depends(get_current_user)):
+async def serve_pdf(file_id: str, request: Request, current_user=Depends(get_current_user)):
     """
     Serve a PDF stored in GridFS by its file_id.
-    Requires authentication.
+    Requires authentication. Supports Range (206) and If-None-Match (304).
     """
     try:
         bucket = AsyncIOMotorGridFSBucket(db)
-        stream = await bucket.open_download_stream(ObjectId(file_id))
-        content = await stream.read()
-        return StreamingResponse(
-            io.BytesIO(content),
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"inline; filename=ticket_{file_id}.pdf",
-                "Cache-Control": "private, max-age=3600"
-            }
-        )
+        grid_out = await bucket.open_download_stream(ObjectId(file_id))
     except Exception as e:
-        print(f"❌ PDF serve error for {file_id}: {str(e)}")
+        logger.exception("❌ PDF serve error for %s: %s", file_id, e)
         raise HTTPException(status_code=404, detail="PDF not found")
 
+    length = grid_out.length
+    etag = gridfs_etag(grid_out)
+    headers = {
+        "Content-Disposition": f"inline; filename=ticket_{file_id}.pdf",
+        "Cache-Control": PDF_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+    }
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    start, end = 0, length - 1
+    status_code = 200
+    range_header = request.headers.get("range")
+    if range_header and length and (
+        "if-range" not in request.headers or etag_matches(request.headers.get("if-range"), etag)
+    ):
+        try:
+            byte_range = parse_byte_range(range_header, length)
+        except ValueError:
+            return Response(
+                status_code=416,
+                headers={**headers, "Content-Range": f"bytes */{length}"}
+            )
+        if byte_range:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+
+    headers["Content-Length"] = str(max(end - start + 1, 0))
+    return StreamingResponse(
+        iter_gridfs_range(grid_out, start, end),
+        status_code=status_code,
+        media_type="application/pdf",
+        headers=headers
+    )
+
 
 # ---------- Auth endpoints ----------
 
 @app.post("/api/register")
 async def register(user: UserCreate):
-    print("📌 Incoming register data:", user.employee_code)
+    logger.debug("📌 Incoming register data: %s", user.employee_code)
 
     existing = await user_collection.find_one({"employee_code": user.employee_code})
-    print("📌 Existing user:", existing)
+    logger.debug("📌 Existing user: %s", existing)
 
     if existing:
         raise HTTPException(
@@ -217,7 +2532,7 @@ async def register(user: UserCreate):
         )
 
     hashed_password = get_password_hash(user.password)
-    print("📌 Password hashed")
+    logger.debug("📌 Password hashed")
 
     doc = {
         "employee_code": user.employee_code,
@@ -226,7 +2541,8 @@ async def register(user: UserCreate):
     }
 
     result = await user_collection.insert_one(doc)
-    print("📌 Insert result:", result.inserted_id)
+    logger.debug("📌 Insert result: %s", result.inserted_id)
+    invalidate_identity_cache(user.employee_code)
 
     return {"message": "Registered successfully"}
 
@@ -259,7 +2575,7 @@ async def read_current_user(current_user=Depends(get_current_user)):
 @app.get("/api/employee/{employee_code}")
 async def get_employee_details(employee_code: str, current_user=Depends(get_current_user)):
 
-    emp = await db["Employee_details"].find_one({"EmpID": employee_code})
+    emp = await employee_directory.get(employee_code)
 
     if not emp:
         raise HTTPException(status_code=404, detail="Employee not found")
@@ -296,17 +2612,15 @@ async def submit_ope_entry(
     try:
         emp_code = current_user.get("employee_code")
         
-        print(f"\n{'='*60}")
-        print(f"📝 OPE SUBMISSION REQUEST")
-        print(f"Submitter: {emp_code}")
-        print(f"Amount: ₹{amount}")
-        print(f"Month: {month_range}")
-        print(f"{'='*60}\n")
+        logger.debug("📝 OPE SUBMISSION REQUEST")
+        logger.debug("Submitter: %s", emp_code)
+        logger.debug("Amount: ₹%s", amount)
+        logger.debug("Month: %s", month_range)
         
         # ============================================
         # ✅ STEP 1: GET EMPLOYEE DETAILS
         # ============================================
-        employee = await db["Employee"].find_one({"EmployeeId": emp_code})
+        employee = await employee_master.get(emp_code)
         
         if not employee:
             raise HTTPException(status_code=404, detail="Employee not found")
@@ -318,34 +2632,33 @@ async def submit_ope_entry(
         ope_limit = employee.get("OPE_limit", 5000)
         employee_name = employee.get("EmployeeName")
         
-        print(f"👤 Employee Details:")
-        print(f"   Name: {employee_name}")
-        print(f"   Employee ID: {emp_code}")
-        print(f"   Reporting Manager: {reporting_manager_name} ({reporting_manager_code})")
-        print(f"   Partner: {partner_name} ({partner_code})")
-        print(f"   OPE Limit: ₹{ope_limit}")
+        logger.debug("👤 Employee Details:")
+        logger.debug("   Name: %s", employee_name)
+        logger.debug("   Employee ID: %s", emp_code)
+        logger.debug("   Reporting Manager: %s (%s)", reporting_manager_name, reporting_manager_code)
+        logger.debug("   Partner: %s (%s)", partner_name, partner_code)
+        logger.debug("   OPE Limit: ₹%s", ope_limit)
         
         # ============================================
         # ✅ STEP 2: CHECK COLLECTIONS
         # ============================================
         
         is_rm_in_collection = await db["Reporting_Managers"].find_one({"EmployeeId": emp_code})
-        is_partner_in_collection = await db["Partner"].find_one({"PartnerEmpCode": emp_code})
+        is_partner_in_collection = await get_partner(emp_code)
         
-        print(f"\n🔍 Collection Checks:")
-        print(f"   Is in Reporting_Managers: {bool(is_rm_in_collection)}")
-        print(f"   Is in Partner: {bool(is_partner_in_collection)}")
-        print(f"   ReportingEmpCode == PartnerEmpCode: {reporting_manager_code == partner_code}")
+        logger.debug("🔍 Collection Checks:")
+        logger.debug("   Is in Reporting_Managers: %s", bool(is_rm_in_collection))
+        logger.debug("   Is in Partner: %s", bool(is_partner_in_collection))
+        logger.debug("   ReportingEmpCode == PartnerEmpCode: %s", reporting_manager_code == partner_code)
         
         # ============================================
         # ✅ STEP 3: HANDLE PDF - GridFS Upload
         # ============================================
         ticket_pdf_id = None
         if ticket_pdf:
-            pdf_content = await ticket_pdf.read()
             pdf_filename = f"ope_{emp_code}_{datetime.utcnow().timestamp()}.pdf"
-            ticket_pdf_id = await upload_to_gridfs(pdf_content, pdf_filename)
-            print(f"✅ PDF uploaded to GridFS: {ticket_pdf_id}")
+            ticket_pdf_id = await upload_pdf_to_gridfs(ticket_pdf, pdf_filename)
+            logger.debug("✅ PDF uploaded to GridFS: %s", ticket_pdf_id)
         
         # ============================================
         # ✅ STEP 4: CREATE OPE ENTRY
@@ -371,28 +2684,37 @@ async def submit_ope_entry(
             "L2_approved": {"status": False}
         }
         
-        result = await db["OPE_data"].insert_one(entry_data)
+        async def insert_entry(session):
+            result = await db["OPE_data"].insert_one(entry_data, session=session)
+            await sync_ope_entries(emp_code, [result.inserted_id], session=session)
+            return result
+
+        try:
+            result = await run_in_transaction(insert_entry)
+        except BaseException:
+            # The entry never landed - give back the receipt reference it claimed
+            if ticket_pdf_id:
+                await delete_from_gridfs(ticket_pdf_id)
+            raise
         entry_id = str(result.inserted_id)
         
-        print(f"✅ Entry created: {entry_id}")
+        logger.info("✅ Entry created: %s", entry_id)
         
         # ============================================
         # ✅ STEP 5: ROUTING LOGIC - DECISION TREE
         # ============================================
         
         if is_rm_in_collection:
-            print(f"\n{'🔥'*30}")
-            print(f"🔥 REPORTING MANAGER SELF-SUBMISSION")
-            print(f"{'🔥'*30}")
-            print(f"   RM Code: {emp_code}")
-            print(f"   RM Name: {employee_name}")
+            logger.debug("🔥 REPORTING MANAGER SELF-SUBMISSION")
+            logger.debug("   RM Code: %s", emp_code)
+            logger.debug("   RM Name: %s", employee_name)
             
             total_levels = 2
             
             if reporting_manager_code == partner_code:
-                print(f"\n   📌 SCENARIO 1: RM Reports to Self (Partner Role)")
+                logger.debug("   📌 SCENARIO 1: RM Reports to Self (Partner Role)")
                 
-                partner_entry = await db["Partner"].find_one({"PartnerEmpCode": partner_code})
+                partner_entry = await get_partner(partner_code)
                 
                 if not partner_entry:
                     raise HTTPException(
@@ -405,9 +2727,9 @@ async def submit_ope_entry(
                 pending_queue_code = partner_code
                 
             elif is_partner_in_collection:
-                print(f"\n   📌 SCENARIO 2: RM is ALSO Partner, reports to different Partner")
+                logger.debug("   📌 SCENARIO 2: RM is ALSO Partner, reports to different Partner")
                 
-                partner_entry = await db["Partner"].find_one({"PartnerEmpCode": partner_code})
+                partner_entry = await get_partner(partner_code)
                 
                 if not partner_entry:
                     raise HTTPException(
@@ -420,9 +2742,9 @@ async def submit_ope_entry(
                 pending_queue_code = partner_code
                 
             else:
-                print(f"\n   📌 SCENARIO 3: Regular RM (not a Partner)")
+                logger.debug("   📌 SCENARIO 3: Regular RM (not a Partner)")
                 
-                partner_entry = await db["Partner"].find_one({"PartnerEmpCode": partner_code})
+                partner_entry = await get_partner(partner_code)
                 
                 if not partner_entry:
                     raise HTTPException(
@@ -462,28 +2784,18 @@ async def submit_ope_entry(
                 }
             }
             
-            await db["Status"].update_one(
+            await update_status_and_queue(
+                emp_code,
                 {"employeeId": emp_code, "month_range": month_range},
                 {"$set": status_doc},
                 upsert=True
             )
             
-            await db["Pending"].update_one(
-                {"ReportingEmpCode": pending_queue_code},
-                {
-                    "$addToSet": {"EmployeesCodes": emp_code},
-                    "$set": {"last_updated": datetime.utcnow()}
-                },
-                upsert=True
-            )
-            
-            print(f"\n{'='*60}")
-            print(f"✅ RM SUBMISSION COMPLETE")
-            print(f"   Total Levels: 2 (ALWAYS)")
-            print(f"   L1: Partner - {l1_approver_name} ({l1_approver_code})")
-            print(f"   L2: HR (JHS729)")
-            print(f"   Added to: {pending_queue_code}'s Pending")
-            print(f"{'='*60}\n")
+            logger.debug("✅ RM SUBMISSION COMPLETE")
+            logger.debug("   Total Levels: 2 (ALWAYS)")
+            logger.debug("   L1: Partner - %s (%s)", l1_approver_name, l1_approver_code)
+            logger.debug("   L2: HR (JHS729)")
+            logger.debug("   Queued for: %s", pending_queue_code)
             
             return {
                 "message": "RM entry submitted successfully",
@@ -496,20 +2808,18 @@ async def submit_ope_entry(
             }
         
         else:
-            print(f"\n{'='*60}")
-            print(f"👤 REGULAR EMPLOYEE SUBMISSION")
-            print(f"{'='*60}")
-            print(f"   Employee: {emp_code} - {employee_name}")
-            print(f"   Reports to RM: {reporting_manager_code} - {reporting_manager_name}")
-            print(f"   Partner: {partner_code} - {partner_name}")
+            logger.debug("👤 REGULAR EMPLOYEE SUBMISSION")
+            logger.debug("   Employee: %s - %s", emp_code, employee_name)
+            logger.debug("   Reports to RM: %s - %s", reporting_manager_code, reporting_manager_name)
+            logger.debug("   Partner: %s - %s", partner_code, partner_name)
             
             if amount > ope_limit:
                 total_levels = 3
                 
-                print(f"\n   📌 SCENARIO 4: Employee Amount EXCEEDS Limit")
-                print(f"      Amount: ₹{amount}")
-                print(f"      Limit: ₹{ope_limit}")
-                print(f"      ✅ Using 3-LEVEL approval")
+                logger.debug("   📌 SCENARIO 4: Employee Amount EXCEEDS Limit")
+                logger.debug("      Amount: ₹%s", amount)
+                logger.debug("      Limit: ₹%s", ope_limit)
+                logger.debug("      ✅ Using 3-LEVEL approval")
                 
                 status_doc = {
                     "employeeId": emp_code,
@@ -545,24 +2855,15 @@ async def submit_ope_entry(
                     }
                 }
                 
-                await db["Pending"].update_one(
-                    {"ReportingEmpCode": reporting_manager_code},
-                    {
-                        "$addToSet": {"EmployeesCodes": emp_code},
-                        "$set": {"last_updated": datetime.utcnow()}
-                    },
-                    upsert=True
-                )
-                
                 scenario_name = "Employee_Amount_Exceeds_Limit"
                 
             else:
                 total_levels = 2
                 
-                print(f"\n   📌 SCENARIO 5: Employee Amount WITHIN Limit")
-                print(f"      Amount: ₹{amount}")
-                print(f"      Limit: ₹{ope_limit}")
-                print(f"      ✅ Using 2-LEVEL approval")
+                logger.debug("   📌 SCENARIO 5: Employee Amount WITHIN Limit")
+                logger.debug("      Amount: ₹%s", amount)
+                logger.debug("      Limit: ₹%s", ope_limit)
+                logger.debug("      ✅ Using 2-LEVEL approval")
                 
                 status_doc = {
                     "employeeId": emp_code,
@@ -592,29 +2893,19 @@ async def submit_ope_entry(
                     }
                 }
                 
-                await db["Pending"].update_one(
-                    {"ReportingEmpCode": reporting_manager_code},
-                    {
-                        "$addToSet": {"EmployeesCodes": emp_code},
-                        "$set": {"last_updated": datetime.utcnow()}
-                    },
-                    upsert=True
-                )
-                
                 scenario_name = "Employee_Amount_Within_Limit"
             
-            await db["Status"].update_one(
+            await update_status_and_queue(
+                emp_code,
                 {"employeeId": emp_code, "month_range": month_range},
                 {"$set": status_doc},
                 upsert=True
             )
             
-            print(f"\n{'='*60}")
-            print(f"✅ EMPLOYEE SUBMISSION COMPLETE")
-            print(f"   Scenario: {scenario_name}")
-            print(f"   Total Levels: {total_levels}")
-            print(f"   First Approver: RM - {reporting_manager_name}")
-            print(f"{'='*60}\n")
+            logger.debug("✅ EMPLOYEE SUBMISSION COMPLETE")
+            logger.debug("   Scenario: %s", scenario_name)
+            logger.debug("   Total Levels: %s", total_levels)
+            logger.debug("   First Approver: RM - %s", reporting_manager_name)
             
             return {
                 "message": "Entry submitted successfully",
@@ -629,55 +2920,54 @@ async def submit_ope_entry(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Submission error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Submission error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
     
 # ---------- GET HISTORY ----------
 @app.get("/api/ope/history/{employee_code}")
-async def get_ope_history(employee_code: str, current_user=Depends(get_current_user)):
+async def get_ope_history(
+    employee_code: str,
+    page: PageRequest = Depends(page_request),
+    current_user=Depends(get_current_user)
+):
     try:
-        print(f"📌 Fetching history for: {employee_code}")
+        logger.debug("📌 Fetching history for: %s", employee_code)
         
         if current_user["employee_code"] != employee_code:
             raise HTTPException(status_code=403, detail="Access denied")
         
-        ope_doc = await db["OPE_data"].find_one({"employeeId": employee_code})
-        
-        if not ope_doc:
-            return {"history": []}
+        # Read from the OPE_entries mirror (kept in step with OPE_data in the
+        # same transaction) so pages and filters use its indexes
+        entries, page_info = await read_entry_page({"employee_id": employee_code}, page)
         
         history = []
-        data_array = ope_doc.get("Data", [])
-        
-        for data_item in data_array:
-            for month_range, entries in data_item.items():
-                for entry in entries:
-                    history.append({
-                        "_id": str(entry.get("_id", "")),
-                        "month_range": month_range,
-                        "date": entry.get("date"),
-                        "client": entry.get("client"),
-                        "project_id": entry.get("project_id"),
-                        "project_name": entry.get("project_name"),
-                        "project_type": entry.get("project_type", "N/A"), 
-                        "location_from": entry.get("location_from"),
-                        "location_to": entry.get("location_to"),
-                        "travel_mode": entry.get("travel_mode"),
-                        "amount": entry.get("amount"),
-                        "remarks": entry.get("remarks"),
-                        "ticket_pdf": entry.get("ticket_pdf"),   # GridFS ID or None
-                        "created_time": entry.get("created_time"),
-                        "updated_time": entry.get("updated_time")
-                    })
+        for entry in entries:
+            history.append({
+                "_id": str(entry.get("_id", "")),
+                "month_range": entry.get("month_range"),
+                "date": entry.get("date"),
+                "client": entry.get("client"),
+                "project_id": entry.get("project_id"),
+                "project_name": entry.get("project_name"),
+                "project_type": entry.get("project_type", "N/A"), 
+                "location_from": entry.get("location_from"),
+                "location_to": entry.get("location_to"),
+                "travel_mode": entry.get("travel_mode"),
+                "amount": entry.get("entered_amount"),
+                "remarks": entry.get("remarks"),
+                "ticket_pdf": entry.get("ticket_pdf"),   # GridFS ID or None
+                "created_time": entry.get("created_time"),
+                "updated_time": entry.get("updated_time")
+            })
         
-        print(f"✅ Found {len(history)} entries")
-        return {"history": history}
+        logger.debug("✅ Found %s entries", len(history))
+        return {"history": history, "page": page_info}
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Error fetching history: {str(e)}")
+        logger.exception("❌ Error fetching history: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -690,7 +2980,7 @@ async def update_ope_entry(
 ):
     try:
         employee_code = current_user["employee_code"]
-        print(f"📌 Updating entry {entry_id} for: {employee_code}")
+        logger.debug("📌 Updating entry %s for: %s", entry_id, employee_code)
         
         month_range = update_data.get("month_range")
         if not month_range:
@@ -722,7 +3012,8 @@ async def update_ope_entry(
                             f"Data.{i}.{month_range}.{j}.updated_time": datetime.utcnow().isoformat()
                         }
                         
-                        await db["OPE_data"].update_one(
+                        await update_ope_data(
+                            employee_code, [entry.get("_id")],
                             {"employeeId": employee_code},
                             {"$set": update_fields}
                         )
@@ -734,11 +3025,11 @@ async def update_ope_entry(
         if not updated:
             raise HTTPException(status_code=404, detail="Entry not found")
         
-        print(f"✅ Entry updated successfully")
+        logger.info("✅ Entry updated successfully")
         return {"message": "Entry updated successfully"}
         
     except Exception as e:
-        print(f"❌ Error updating entry: {str(e)}")
+        logger.exception("❌ Error updating entry: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 # ---------- DELETE ENTRY ----------
@@ -750,7 +3041,7 @@ async def delete_ope_entry(
 ):
     try:
         employee_code = current_user["employee_code"]
-        print(f"📌 Deleting entry {entry_id} for: {employee_code}")
+        logger.debug("📌 Deleting entry %s for: %s", entry_id, employee_code)
         
         if not entry_id or entry_id == "dummy":
             raise HTTPException(status_code=400, detail="Invalid entry ID")
@@ -759,7 +3050,7 @@ async def delete_ope_entry(
         if not month_range:
             raise HTTPException(status_code=400, detail="month_range required")
         
-        print(f"📌 Month range: {month_range}")
+        logger.debug("📌 Month range: %s", month_range)
         
         ope_doc = await db["OPE_data"].find_one({"employeeId": employee_code})
         
@@ -775,27 +3066,25 @@ async def delete_ope_entry(
                 
                 for j, entry in enumerate(entries):
                     if str(entry.get("_id")) == entry_id:
-                        print(f"✅ Found entry at Data.{i}.{month_range}.{j}")
-                        
-                        # Delete PDF from GridFS if exists
-                        pdf_id = entry.get("ticket_pdf")
-                        if pdf_id and is_gridfs_id(pdf_id):
-                            await delete_from_gridfs(pdf_id)
-                            print(f"✅ PDF deleted from GridFS: {pdf_id}")
                         
                         if len(entries) == 1:
-                            print(f"🗑️ Removing entire month range: {month_range}")
-                            await db["OPE_data"].update_one(
+                            await update_ope_data(
+                                employee_code, [entry.get("_id")],
                                 {"employeeId": employee_code},
                                 {"$pull": {"Data": {month_range: {"$exists": True}}}}
                             )
                         else:
-                            print(f"🗑️ Removing single entry from month range")
-                            await db["OPE_data"].update_one(
+                            await update_ope_data(
+                                employee_code, [entry.get("_id")],
                                 {"employeeId": employee_code},
                                 {"$pull": {f"Data.{i}.{month_range}": {"_id": ObjectId(entry_id)}}}
                             )
                         
+                        # Release the receipt only once the entry is gone
+                        pdf_id = entry.get("ticket_pdf")
+                        if pdf_id and is_gridfs_id(pdf_id):
+                            await delete_from_gridfs(pdf_id)
+                        
                         deleted = True
                         break
             
@@ -805,7 +3094,7 @@ async def delete_ope_entry(
         if not deleted:
             raise HTTPException(status_code=404, detail="Entry not found")
         
-        print(f"✅ Entry deleted successfully")
+        logger.info("✅ Entry %s deleted for %s", entry_id, employee_code)
         return {
             "message": "Entry deleted successfully",
             "entry_id": entry_id,
@@ -815,9 +3104,7 @@ async def delete_ope_entry(
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error deleting entry: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error deleting entry: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/api/check-role/{employee_code}")
@@ -830,10 +3117,10 @@ async def check_user_role(employee_code: str, current_user=Depends(get_current_u
         
         is_hr = (emp_code == "JHS729")
         
-        partner = await db["Partner"].find_one({"PartnerEmpCode": emp_code})
+        partner = await get_partner(emp_code)
         is_partner = partner is not None
         
-        manager = await db["Reporting_managers"].find_one({"ReportingEmpCode": emp_code})
+        manager = await get_reporting_manager(emp_code)
         is_manager = manager is not None
         
         return {
@@ -853,19 +3140,19 @@ async def check_if_manager(employee_code: str, current_user=Depends(get_current_
     try:
         emp_code = employee_code.strip().upper()
         
-        print(f"🔍 Checking if {emp_code} is a manager...")
+        logger.debug("🔍 Checking if %s is a manager...", emp_code)
         
         if current_user["employee_code"].upper() != emp_code:
             raise HTTPException(status_code=403, detail="Access denied")
         
-        manager = await db["Reporting_managers"].find_one({"ReportingEmpCode": emp_code})
+        manager = await get_reporting_manager(emp_code)
         
         is_manager = manager is not None
         
         if is_manager:
-            print(f"✅ {emp_code} IS a reporting manager")
+            logger.debug("✅ %s IS a reporting manager", emp_code)
         else:
-            print(f"❌ {emp_code} is NOT a reporting manager")
+            logger.debug("❌ %s is NOT a reporting manager", emp_code)
         
         return {
             "employee_code": emp_code,
@@ -875,7 +3162,7 @@ async def check_if_manager(employee_code: str, current_user=Depends(get_current_
         }
         
     except Exception as e:
-        print(f"❌ Error checking manager role: {str(e)}")
+        logger.exception("❌ Error checking manager role: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -887,15 +3174,15 @@ async def get_employees_by_status(
     try:
         reporting_emp_code = current_user["employee_code"].strip().upper()
         
-        print(f"🔍 Fetching {status} employees for manager: {reporting_emp_code}")
+        logger.debug("🔍 Fetching %s employees for manager: %s", status, reporting_emp_code)
         
-        manager = await db["Reporting_managers"].find_one({"ReportingEmpCode": reporting_emp_code})
+        manager = await get_reporting_manager(reporting_emp_code)
         if not manager:
             raise HTTPException(status_code=403, detail="You are not a reporting manager")
         
         status_lower = status.lower()
         if status_lower == "pending":
-            collection_name = "Pending"
+            collection_name = "Approval_queue"
         elif status_lower == "approved":
             collection_name = "Approved"
         elif status_lower == "rejected":
@@ -903,10 +3190,14 @@ async def get_employees_by_status(
         else:
             raise HTTPException(status_code=400, detail="Invalid status. Use: pending, approved, or rejected")
         
-        status_collection = db[collection_name]
-        status_doc = await status_collection.find_one({"ReportingEmpCode": reporting_emp_code})
+        if status_lower == "pending":
+            queue_items = await get_approval_queue(reporting_emp_code)
+            status_doc = {"EmployeesCodes": queued_employee_codes(queue_items)} if queue_items else None
+        else:
+            status_collection = db[collection_name]
+            status_doc = await status_collection.find_one({"ReportingEmpCode": reporting_emp_code})
         
-        print(f"📄 Status doc found: {status_doc is not None}")
+        logger.debug("📄 Status doc found: %s", status_doc is not None)
         
         if not status_doc:
             return {
@@ -916,7 +3207,7 @@ async def get_employees_by_status(
             }
         
         employee_codes = status_doc.get("EmployeesCodes", [])
-        print(f"👥 Employee codes: {employee_codes}")
+        logger.debug("👥 Employee codes: %s", employee_codes)
         
         employees_data = []
         
@@ -926,7 +3217,6 @@ async def get_employees_by_status(
                 {"_id": 0}
             )
             
-            print(f"📊 OPE data for {emp_code}: {ope_data is not None}")
             
             if ope_data:
                 employees_data.append({
@@ -943,7 +3233,7 @@ async def get_employees_by_status(
                     "opeData": None
                 })
         
-        print(f"✅ Returning {len(employees_data)} employees")
+        logger.debug("✅ Returning %s employees", len(employees_data))
         
         return {
             "reporting_manager": reporting_emp_code,
@@ -955,87 +3245,134 @@ async def get_employees_by_status(
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error fetching employees: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error fetching employees: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def get_ope_docs_by_employee(employee_codes, projection=None) -> dict:
+    """One $in query for many employees' OPE_data docs, keyed by employeeId (first doc wins)."""
+    ope_docs = {}
+    if not employee_codes:
+        return ope_docs
+    cursor = db["OPE_data"].find({"employeeId": {"$in": list(employee_codes)}}, projection)
+    async for ope_doc in cursor:
+        ope_docs.setdefault(ope_doc.get("employeeId"), ope_doc)
+    return ope_docs
+
+
+# ── Live approval-queue events (see "Approval Queue Events") ──
+@app.get("/api/ope/queue/events")
+async def approval_queue_events(request: Request, current_user=Depends(get_current_user)):
+    """
+    Server-Sent Events: "queue" deltas for items waiting on the caller,
+    "status" deltas for the caller's own claims, and "resync" when the
+    client should reload. Comment lines keep the connection alive.
+    """
+    code = current_user["employee_code"].strip().upper()
+    subscription = queue_events.subscribe(code)
+
+    async def stream():
+        try:
+            yield f"retry: {QUEUE_EVENTS_RETRY_MS}\n\n"
+            yield sse_message("ready", {"employee_code": code, "source": queue_events.source})
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=QUEUE_EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event["type"] == "shutdown":
+                    break
+                yield sse_message(event["type"], event)
+        finally:
+            queue_events.unsubscribe(code, subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/api/ope/manager/pending")
 async def get_manager_pending_employees(current_user=Depends(get_current_user)):
     try:
         current_emp_code = current_user["employee_code"].strip().upper()
         
-        print(f"\n{'='*60}")
-        print(f"🔍 PENDING REQUEST FROM: {current_emp_code}")
-        print(f"{'='*60}\n")
+        logger.debug("🔍 PENDING REQUEST FROM: %s", current_emp_code)
         
         is_hr = (current_emp_code == "JHS729")
         
         if is_hr:
-            print(f"👔 USER IS HR - Fetching L1/L2 approved entries")
+            logger.debug("👔 USER IS HR - Fetching L1/L2 approved entries")
             
-            all_status_docs = await db["Status"].find({}).to_list(length=None)
-            print(f"📊 Total Status documents in DB: {len(all_status_docs)}")
+            # HR's queue items, then all their OPE_data in one $in query:
+            # two round trips whatever the headcount
+            queue_by_employee = group_queue_by_employee(await get_approval_queue(current_emp_code))
+            logger.debug("📊 Employees in HR queue: %s", len(queue_by_employee))
+            
+            ope_docs = await get_ope_docs_by_employee(
+                queue_by_employee.keys(),
+                {"employeeId": 1, "designation": 1, "Data": 1}
+            )
             
             pending_employees = []
             
-            for status_doc in all_status_docs:
-                employee_id = status_doc.get("employeeId")
-                employee_name = status_doc.get("employeeName", "Unknown")
-                approval_status = status_doc.get("approval_status", [])
+            for employee_id, queue_items in queue_by_employee.items():
+                employee_name = queue_items[0].get("employee_name") or "Unknown"
                 
-                print(f"\n📋 Checking Employee: {employee_id} ({employee_name})")
-                print(f"   Total payroll months: {len(approval_status)}")
+                logger.debug("📋 Checking Employee: %s (%s)", employee_id, employee_name)
+                logger.debug("   Queued payroll months: %s", len(queue_items))
                 
-                ope_doc = await db["OPE_data"].find_one({"employeeId": employee_id})
+                ope_doc = ope_docs.get(employee_id)
                 if not ope_doc:
-                    print(f"   ⚠️ No OPE_data found - skipping")
+                    logger.debug("   ⚠️ No OPE_data found - skipping")
                     continue
                 
                 pending_entries = []
                 
-                for ps_index, ps in enumerate(approval_status):
-                    payroll_month = ps.get("payroll_month")
+                for queue_item in queue_items:
+                    ps = queue_item["approval"]
+                    payroll_month = queue_item["payroll_month"]
                     total_levels = ps.get("total_levels", 2)
                     current_level = ps.get("current_level", "L1")
                     overall_status = ps.get("overall_status", "pending")
                     L1 = ps.get("L1", {})
                     L2 = ps.get("L2", {})
                     
-                    print(f"\n   📅 Payroll: {payroll_month}")
-                    print(f"      Total Levels: {total_levels}")
-                    print(f"      Current Level: {current_level}")
-                    print(f"      Overall Status: {overall_status}")
-                    print(f"      L1 Status: {L1.get('status')}")
-                    print(f"      L2 Status: {L2.get('status')}")
+                    logger.debug("   📅 Payroll: %s", payroll_month)
+                    logger.debug("      Total Levels: %s", total_levels)
+                    logger.debug("      Current Level: %s", current_level)
+                    logger.debug("      Overall Status: %s", overall_status)
+                    logger.debug("      L1 Status: %s", L1.get('status'))
+                    logger.debug("      L2 Status: %s", L2.get('status'))
                     
                     should_show_to_hr = False
                     
                     if total_levels == 2:
                         if L1.get("status") == True and current_level == "L2" and overall_status == "pending":
                             should_show_to_hr = True
-                            print(f"      ✅ MATCH: 2-level pending at HR (L1 approved)")
+                            logger.debug("      ✅ MATCH: 2-level pending at HR (L1 approved)")
                     
                     elif total_levels == 3:
                         L3 = ps.get("L3", {})
-                        print(f"      L3 Status: {L3.get('status')}")
+                        logger.debug("      L3 Status: %s", L3.get('status'))
                         if (L1.get("status") == True and 
                             L2.get("status") == True and 
                             current_level == "L3" and 
                             overall_status == "pending"):
                             should_show_to_hr = True
-                            print(f"      ✅ MATCH: 3-level pending at HR (L1+L2 approved)")
+                            logger.debug("      ✅ MATCH: 3-level pending at HR (L1+L2 approved)")
                     
                     if not should_show_to_hr:
-                        print(f"      ❌ NOT for HR - skipping")
+                        logger.debug("      ❌ NOT for HR - skipping")
                         continue
                     
                     data_array = ope_doc.get("Data", [])
                     for data_item in data_array:
                         if payroll_month in data_item:
                             entries = data_item[payroll_month]
-                            print(f"      📦 Found {len(entries)} entries in OPE_data")
+                            logger.debug("      📦 Found %s entries in OPE_data", len(entries))
                             for entry in entries:
                                 entry_status = entry.get("status", "").lower()
                                 if entry_status == "approved":
@@ -1056,9 +3393,9 @@ async def get_manager_pending_employees(current_user=Depends(get_current_user)):
                                         "total_levels": total_levels,
                                         "current_level": current_level
                                     })
-                                    print(f"         ✅ Entry added: {entry.get('date')} - ₹{entry.get('amount')}")
+                                    logger.debug("         ✅ Entry added: %s - ₹%s", entry.get('date'), entry.get('amount'))
                                 else:
-                                    print(f"         ⚠️ Entry skipped - status: {entry_status}")
+                                    logger.debug("         ⚠️ Entry skipped - status: %s", entry_status)
                             break
                 
                 if pending_entries:
@@ -1069,13 +3406,11 @@ async def get_manager_pending_employees(current_user=Depends(get_current_user)):
                         "pendingCount": len(pending_entries),
                         "entries": pending_entries
                     })
-                    print(f"\n   ✅ ADDED: {employee_name} with {len(pending_entries)} pending entries")
+                    logger.debug("   ✅ ADDED: %s with %s pending entries", employee_name, len(pending_entries))
                 else:
-                    print(f"   ❌ No pending entries for HR")
+                    logger.debug("   ❌ No pending entries for HR")
             
-            print(f"\n{'='*60}")
-            print(f"✅ FINAL RESULT: {len(pending_employees)} employees pending for HR")
-            print(f"{'='*60}\n")
+            logger.info("✅ FINAL RESULT: %s employees pending for HR", len(pending_employees))
             
             return {
                 "reporting_manager": current_emp_code,
@@ -1086,92 +3421,70 @@ async def get_manager_pending_employees(current_user=Depends(get_current_user)):
 
         else:
             # ✅ CHECK PARTNER FIRST
-            is_partner = await db["Partner"].find_one({"PartnerEmpCode": current_emp_code})
+            is_partner = await get_partner(current_emp_code)
 
             if is_partner:
-                print(f"🤝 USER IS PARTNER")
+                logger.debug("🤝 USER IS PARTNER")
 
-                partner_pending = await db["Pending"].find_one({"ReportingEmpCode": current_emp_code})
-                if not partner_pending or not partner_pending.get("EmployeesCodes"):
-                    print(f"✅ No pending employees found for partner")
+                queue_by_employee = group_queue_by_employee(
+                    await get_approval_queue(current_emp_code, levels=["L1", "L2"])
+                )
+                if not queue_by_employee:
+                    logger.debug("✅ No pending employees found for partner")
                     return {"reporting_manager": current_emp_code, "is_hr": False, "is_partner": True, "total_employees": 0, "employees": []}
 
-                pending_emp_codes = partner_pending.get("EmployeesCodes", [])
-                print(f"👥 Found {len(pending_emp_codes)} employees under partner")
+                logger.debug("👥 Found %s employees in partner's queue", len(queue_by_employee))
                 pending_employees = []
 
-                for emp_code in pending_emp_codes:
-                    status_docs = await db["Status"].find({"employeeId": emp_code}).to_list(length=None)
-                    if not status_docs:
-                        continue
+                # OPE_data / Employee_details for the whole queue in one $in query each
+                ope_docs = await get_ope_docs_by_employee(
+                    queue_by_employee.keys(),
+                    {"employeeId": 1, "employeeName": 1, "designation": 1, "Data": 1}
+                )
+                emp_infos = await employee_directory.get_many(ope_docs) if ope_docs else {}
 
-                    ope_doc = await db["OPE_data"].find_one({"employeeId": emp_code})
+                for emp_code, queue_items in queue_by_employee.items():
+                    ope_doc = ope_docs.get(emp_code)
                     if not ope_doc:
                         continue
 
                     pending_entries = []
 
-                    for status_doc in status_docs:
-                        approval_status_raw = status_doc.get("approval_status")
-                        if isinstance(approval_status_raw, list):
-                            approval_status_array = approval_status_raw
-                        elif isinstance(approval_status_raw, dict):
-                            approval_status_array = [approval_status_raw]
-                        else:
-                            continue
-
-                        for approval_status in approval_status_array:
-                            month_range = approval_status.get("payroll_month") or approval_status.get("month_range")
-                            total_levels = approval_status.get("total_levels", 2)
-                            current_level = approval_status.get("current_level", "L1")
-                            overall_status = approval_status.get("overall_status", "pending")
-                            submitter_type = approval_status.get("submitter_type", "Employee")
-
-                            if overall_status != "pending" or not month_range:
-                                continue
-
-                            partner_is_approver = False
-                            if current_level == "L1":
-                                L1 = approval_status.get("L1", {})
-                                if L1.get("approver_code") == current_emp_code:
-                                    partner_is_approver = True
-                            elif current_level == "L2":
-                                L2 = approval_status.get("L2", {})
-                                if L2.get("approver_code") == current_emp_code:
-                                    partner_is_approver = True
-
-                            if not partner_is_approver:
-                                continue
-
-                            print(f"   ✅ Partner is approver for {emp_code} - {month_range} (Level: {current_level})")
-
-                            for data_item in ope_doc.get("Data", []):
-                                if month_range in data_item:
-                                    target_status = "pending" if submitter_type == "Reporting_Manager" else "approved"
-                                    for entry in data_item[month_range]:
-                                        e_status = entry.get("status", "").lower()
-                                        if e_status in [target_status, "approved", "pending"]:
-                                            pending_entries.append({
-                                                "_id": str(entry.get("_id", "")),
-                                                "month_range": month_range,
-                                                "date": entry.get("date"),
-                                                "client": entry.get("client"),
-                                                "project_id": entry.get("project_id"),
-                                                "project_name": entry.get("project_name"),
-                                                "project_type": entry.get("project_type", "N/A"),
-                                                "location_from": entry.get("location_from"),
-                                                "location_to": entry.get("location_to"),
-                                                "travel_mode": entry.get("travel_mode"),
-                                                "amount": entry.get("amount"),
-                                                "remarks": entry.get("remarks"),
-                                                "ticket_pdf": entry.get("ticket_pdf"),   # GridFS ID
-                                                "total_levels": total_levels,
-                                                "current_level": current_level
-                                            })
-                                    break
+                    for queue_item in queue_items:
+                        month_range = queue_item["payroll_month"]
+                        total_levels = queue_item["total_levels"]
+                        current_level = queue_item["level"]
+                        submitter_type = queue_item["submitter_type"]
+
+                        logger.debug("   ✅ Partner is approver for %s - %s (Level: %s)", emp_code, month_range, current_level)
+
+                        for data_item in ope_doc.get("Data", []):
+                            if month_range in data_item:
+                                target_status = "pending" if submitter_type == "Reporting_Manager" else "approved"
+                                for entry in data_item[month_range]:
+                                    e_status = entry.get("status", "").lower()
+                                    if e_status in [target_status, "approved", "pending"]:
+                                        pending_entries.append({
+                                            "_id": str(entry.get("_id", "")),
+                                            "month_range": month_range,
+                                            "date": entry.get("date"),
+                                            "client": entry.get("client"),
+                                            "project_id": entry.get("project_id"),
+                                            "project_name": entry.get("project_name"),
+                                            "project_type": entry.get("project_type", "N/A"),
+                                            "location_from": entry.get("location_from"),
+                                            "location_to": entry.get("location_to"),
+                                            "travel_mode": entry.get("travel_mode"),
+                                            "amount": entry.get("amount"),
+                                            "remarks": entry.get("remarks"),
+                                            "ticket_pdf": entry.get("ticket_pdf"),   # GridFS ID
+                                            "total_levels": total_levels,
+                                            "current_level": current_level
+                                        })
+                                break
 
                     if pending_entries:
-                        emp_info = await db["Employee_details"].find_one({"EmpID": emp_code}) or {}
+                        emp_info = emp_infos.get(emp_code, {})
                         pending_employees.append({
                             "employeeId": emp_code,
                             "employeeName": emp_info.get("Emp Name", ope_doc.get("employeeName", emp_code)),
@@ -1180,7 +3493,7 @@ async def get_manager_pending_employees(current_user=Depends(get_current_user)):
                             "entries": pending_entries
                         })
 
-                print(f"✅ Returning {len(pending_employees)} employees for partner")
+                logger.info("✅ Returning %s employees for partner", len(pending_employees))
                 return {
                     "reporting_manager": current_emp_code,
                     "is_hr": False,
@@ -1190,31 +3503,38 @@ async def get_manager_pending_employees(current_user=Depends(get_current_user)):
                 }
 
             # ✅ REPORTING MANAGER LOGIC
-            print(f"👔 USER IS REPORTING MANAGER")
+            logger.debug("👔 USER IS REPORTING MANAGER")
 
-            manager = await db["Reporting_managers"].find_one({"ReportingEmpCode": current_emp_code})
+            manager = await get_reporting_manager(current_emp_code)
             if not manager:
                 raise HTTPException(status_code=403, detail="You are not a reporting manager")
 
-            employees = await db["Employee_details"].find(
-                {"ReportingEmpCode": current_emp_code}
-            ).to_list(length=None)
+            queue_by_employee = group_queue_by_employee(await get_approval_queue(current_emp_code))
+
+            logger.debug("👥 Found %s employees in manager's queue", len(queue_by_employee))
 
-            print(f"👥 Found {len(employees)} employees under manager")
+            ope_docs = await get_ope_docs_by_employee(
+                queue_by_employee.keys(),
+                {"employeeId": 1, "Data": 1}
+            )
+            employees = await employee_directory.get_many(ope_docs) if ope_docs else {}
 
             pending_employees = []
 
-            for emp in employees:
-                emp_code = emp.get("EmpID")
-                emp_name = emp.get("Emp Name")
+            for emp_code, queue_items in queue_by_employee.items():
+                emp = employees.get(emp_code, {})
+                emp_name = emp.get("Emp Name", queue_items[0].get("employee_name"))
+                queued_months = {queue_item["payroll_month"] for queue_item in queue_items}
 
-                ope_doc = await db["OPE_data"].find_one({"employeeId": emp_code})
+                ope_doc = ope_docs.get(emp_code)
                 if ope_doc:
                     pending_entries = []
                     data_array = ope_doc.get("Data", [])
 
                     for data_item in data_array:
                         for month_range, entries in data_item.items():
+                            if month_range not in queued_months:
+                                continue
                             for entry in entries:
                                 entry_status = entry.get("status", "pending").lower()
                                 if entry_status == "pending":
@@ -1243,7 +3563,7 @@ async def get_manager_pending_employees(current_user=Depends(get_current_user)):
                             "entries": pending_entries
                         })
 
-            print(f"✅ Returning {len(pending_employees)} employees for manager")
+            logger.info("✅ Returning %s employees for manager", len(pending_employees))
 
             return {
                 "reporting_manager": current_emp_code,
@@ -1255,189 +3575,145 @@ async def get_manager_pending_employees(current_user=Depends(get_current_user)):
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Pending queue error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
     
 
 @app.get("/api/ope/approved/{employee_code}")
 async def get_employee_approved(
     employee_code: str, 
+    page: PageRequest = Depends(page_request),
     current_user=Depends(get_current_user)
 ):
     try:
         employee_code = employee_code.strip().upper()
         current_emp_code = current_user["employee_code"].strip().upper()
         
-        print(f"\n{'='*60}")
-        print(f"📊 GET APPROVED ENTRIES")
-        print(f"   Employee: {employee_code}")
-        print(f"   Current user: {current_emp_code}")
-        print(f"{'='*60}\n")
+        logger.debug("📊 GET APPROVED ENTRIES")
+        logger.debug("   Employee: %s", employee_code)
+        logger.debug("   Current user: %s", current_emp_code)
         
         is_hr = (current_emp_code == "JHS729")
         is_own_data = (current_emp_code == employee_code)
-        is_manager = await db["Reporting_managers"].find_one(
-            {"ReportingEmpCode": current_emp_code}
-        )
+        is_manager = await get_reporting_manager(current_emp_code)
         
         if not (is_hr or is_own_data or is_manager):
-            print(f"❌ Access denied - Not HR, not own data, and not a manager")
+            logger.warning("❌ Access denied - Not HR, not own data, and not a manager")
             raise HTTPException(status_code=403, detail="Access denied")
         
-        print(f"✅ Access granted - Fetching OPE data")
+        logger.debug("✅ Access granted - Fetching OPE data")
         
-        ope_doc = await db["OPE_data"].find_one({"employeeId": employee_code})
-        
-        if not ope_doc:
-            print(f"📭 No OPE data found for {employee_code}")
-            return {"approved": []}
-        
-        print(f"✅ OPE document found")
+        # Read from the OPE_entries mirror (kept in step with OPE_data in the
+        # same transaction) so pages and filters use its indexes
+        entries, page_info = await read_entry_page(
+            {"employee_id": employee_code, "status": "approved"}, page, filters=STATUS_LIST_FILTERS
+        )
         
         approved_entries = []
-        data_array = ope_doc.get("Data", [])
-        
-        print(f"📊 Total data items: {len(data_array)}")
-        
-        for data_item in data_array:
-            for month_range, entries in data_item.items():
-                print(f"   📅 Month: {month_range}, Entries: {len(entries)}")
-                
-                for entry in entries:
-                    entry_status = entry.get("status", "").lower()
-                    print(f"      Entry ID: {entry.get('_id')}, Status: '{entry_status}'")
-                    
-                    if entry_status == "approved":
-                        approval_remark = entry.get("approval_remark") or entry.get("remark") or ""
-                        
-                        approved_entries.append({
-                            "_id": str(entry.get("_id", "")),
-                            "employee_id": employee_code,
-                            "employee_name": ope_doc.get("employeeName", ""),
-                            "designation": ope_doc.get("designation", ""),
-                            "month_range": month_range,
-                            "date": entry.get("date"),
-                            "client": entry.get("client"),
-                            "project_id": entry.get("project_id"),
-                            "project_name": entry.get("project_name"),
-                            "project_type": entry.get("project_type", "N/A"),
-                            "location_from": entry.get("location_from"),
-                            "location_to": entry.get("location_to"),
-                            "travel_mode": entry.get("travel_mode"),
-                            "amount": entry.get("amount"),
-                            "remarks": entry.get("remarks"),
-                            "ticket_pdf": entry.get("ticket_pdf"),    # GridFS ID
-                            "approved_by": entry.get("approved_by"),
-                            "approver_name": entry.get("approver_name"),
-                            "approval_remark": approval_remark,
-                            "approved_date": entry.get("approved_date"),
-                            "created_time": entry.get("created_time"),
-                            "L1_approved": entry.get("L1_approved"),
-                            "L1_approver_code": entry.get("L1_approver_code"),
-                            "L1_approver_name": entry.get("L1_approver_name")
-                        })
-                        print(f"      ✅ APPROVED entry added with remark: {approval_remark}")
+        for entry in entries:
+            approval_remark = entry.get("approval_remark") or entry.get("remark") or ""
+            
+            approved_entries.append({
+                "_id": str(entry.get("_id", "")),
+                "employee_id": employee_code,
+                "employee_name": entry.get("employee_name", ""),
+                "designation": entry.get("designation", ""),
+                "month_range": entry.get("month_range"),
+                "date": entry.get("date"),
+                "client": entry.get("client"),
+                "project_id": entry.get("project_id"),
+                "project_name": entry.get("project_name"),
+                "project_type": entry.get("project_type", "N/A"),
+                "location_from": entry.get("location_from"),
+                "location_to": entry.get("location_to"),
+                "travel_mode": entry.get("travel_mode"),
+                "amount": entry.get("entered_amount"),
+                "remarks": entry.get("remarks"),
+                "ticket_pdf": entry.get("ticket_pdf"),    # GridFS ID
+                "approved_by": entry.get("approved_by"),
+                "approver_name": entry.get("approver_name"),
+                "approval_remark": approval_remark,
+                "approved_date": entry.get("approved_date"),
+                "created_time": entry.get("created_time"),
+                "L1_approved": entry.get("L1_approved"),
+                "L1_approver_code": entry.get("L1_approver_code"),
+                "L1_approver_name": entry.get("L1_approver_name")
+            })
         
-        print(f"\n✅ Total approved entries found: {len(approved_entries)}\n")
+        logger.debug("✅ Total approved entries found: %s", len(approved_entries))
         
-        return {"approved": approved_entries}
+        return {"approved": approved_entries, "page": page_info}
         
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"\n❌❌ ERROR fetching approved:")
-        print(f"   {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error fetching approved entries: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/ope/rejected/{employee_code}")
 async def get_employee_rejected(
     employee_code: str, 
+    page: PageRequest = Depends(page_request),
     current_user=Depends(get_current_user)
 ):
     try:
         employee_code = employee_code.strip().upper()
         current_emp_code = current_user["employee_code"].strip().upper()
         
-        print(f"\n{'='*60}")
-        print(f"❌ GET REJECTED ENTRIES")
-        print(f"   Employee: {employee_code}")
-        print(f"   Current user: {current_emp_code}")
-        print(f"{'='*60}\n")
+        logger.debug("❌ GET REJECTED ENTRIES")
+        logger.debug("   Employee: %s", employee_code)
+        logger.debug("   Current user: %s", current_emp_code)
         
         is_hr = (current_emp_code == "JHS729")
         is_own_data = (current_emp_code == employee_code)
-        is_manager = await db["Reporting_managers"].find_one(
-            {"ReportingEmpCode": current_emp_code}
-        )
+        is_manager = await get_reporting_manager(current_emp_code)
         
         if not (is_hr or is_own_data or is_manager):
-            print(f"❌ Access denied")
+            logger.warning("❌ Access denied")
             raise HTTPException(status_code=403, detail="Access denied")
         
-        print(f"✅ Access granted - Fetching OPE data")
-        
-        ope_doc = await db["OPE_data"].find_one({"employeeId": employee_code})
+        logger.debug("✅ Access granted - Fetching OPE data")
         
-        if not ope_doc:
-            print(f"📭 No OPE data found for {employee_code}")
-            return {"rejected": []}
-        
-        print(f"✅ OPE document found")
+        # Read from the OPE_entries mirror (kept in step with OPE_data in the
+        # same transaction) so pages and filters use its indexes
+        entries, page_info = await read_entry_page(
+            {"employee_id": employee_code, "status": "rejected"}, page, filters=STATUS_LIST_FILTERS
+        )
         
         rejected_entries = []
-        data_array = ope_doc.get("Data", [])
-        
-        print(f"📊 Total data items: {len(data_array)}")
-        
-        for data_item in data_array:
-            for month_range, entries in data_item.items():
-                print(f"   📅 Month: {month_range}, Entries: {len(entries)}")
-                
-                for entry in entries:
-                    entry_status = entry.get("status", "").lower()
-                    print(f"      Entry ID: {entry.get('_id')}, Status: '{entry_status}'")
-                    
-                    if entry_status == "rejected":
-                        rejected_entries.append({
-                            "_id": str(entry.get("_id", "")),
-                            "employee_id": employee_code,
-                            "employee_name": ope_doc.get("employeeName", ""),
-                            "designation": ope_doc.get("designation", ""),
-                            "month_range": month_range,
-                            "date": entry.get("date"),
-                            "client": entry.get("client"),
-                            "project_id": entry.get("project_id"),
-                            "project_name": entry.get("project_name"),
-                            "project_type": entry.get("project_type", "N/A"),
-                            "location_from": entry.get("location_from"),
-                            "location_to": entry.get("location_to"),
-                            "travel_mode": entry.get("travel_mode"),
-                            "amount": entry.get("amount"),
-                            "remarks": entry.get("remarks"),
-                            "ticket_pdf": entry.get("ticket_pdf"),    # GridFS ID
-                            "rejected_by": entry.get("rejected_by"),
-                            "rejector_name": entry.get("rejector_name"),
-                            "rejected_date": entry.get("rejected_date"),
-                            "rejection_reason": entry.get("rejection_reason"),
-                            "rejected_level": entry.get("rejected_level"),
-                            "created_time": entry.get("created_time")
-                        })
-                        print(f"      ✅ REJECTED entry added")
+        for entry in entries:
+            rejected_entries.append({
+                "_id": str(entry.get("_id", "")),
+                "employee_id": employee_code,
+                "employee_name": entry.get("employee_name", ""),
+                "designation": entry.get("designation", ""),
+                "month_range": entry.get("month_range"),
+                "date": entry.get("date"),
+                "client": entry.get("client"),
+                "project_id": entry.get("project_id"),
+                "project_name": entry.get("project_name"),
+                "project_type": entry.get("project_type", "N/A"),
+                "location_from": entry.get("location_from"),
+                "location_to": entry.get("location_to"),
+                "travel_mode": entry.get("travel_mode"),
+                "amount": entry.get("entered_amount"),
+                "remarks": entry.get("remarks"),
+                "ticket_pdf": entry.get("ticket_pdf"),    # GridFS ID
+                "rejected_by": entry.get("rejected_by"),
+                "rejector_name": entry.get("rejector_name"),
+                "rejected_date": entry.get("rejected_date"),
+                "rejection_reason": entry.get("rejection_reason"),
+                "rejected_level": entry.get("rejected_level"),
+                "created_time": entry.get("created_time")
+            })
         
-        print(f"\n✅ Total rejected entries found: {len(rejected_entries)}\n")
-        return {"rejected": rejected_entries}
+        logger.debug("✅ Total rejected entries found: %s", len(rejected_entries))
+        return {"rejected": rejected_entries, "page": page_info}
         
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"\n❌❌ ERROR fetching rejected:")
-        print(f"   {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error fetching rejected entries: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -1572,25 +3848,21 @@ async def reject_employee_entries(
         body = await request.json()
         rejection_reason = body.get("reason", "No reason provided")
         
-        print(f"\n{'='*60}")
-        print(f"❌ REJECTING EMPLOYEE")
-        print(f"Manager: {reporting_emp_code}")
-        print(f"Employee: {employee_code}")
-        print(f"Reason: {rejection_reason}")
-        print(f"{'='*60}\n")
+        logger.debug("❌ REJECTING EMPLOYEE")
+        logger.debug("Manager: %s", reporting_emp_code)
+        logger.debug("Employee: %s", employee_code)
+        logger.debug("Reason: %s", rejection_reason)
         
-        manager = await db["Reporting_managers"].find_one({"ReportingEmpCode": reporting_emp_code})
+        manager = await get_reporting_manager(reporting_emp_code)
         if not manager:
             raise HTTPException(status_code=403, detail="You are not a reporting manager")
         
         manager_name = manager.get("ReportingEmpName", reporting_emp_code)
         
-        emp = await db["Employee_details"].find_one({"EmpID": employee_code})
+        emp = await employee_directory.get(employee_code)
         if not emp:
             raise HTTPException(status_code=404, detail="Employee not found")
         
-        emp_reporting_manager_code = emp.get("ReportingEmpCode", "").strip().upper()
-        
         ope_doc = await db["OPE_data"].find_one({"employeeId": employee_code})
         if not ope_doc:
             raise HTTPException(status_code=404, detail="No data found")
@@ -1601,95 +3873,88 @@ async def reject_employee_entries(
         
         # ✅ Track which payroll months had pending entries
         rejected_payroll_months = set()
+        # All entry changes go out as one $set on the employee document
+        entry_updates = {}
+        touched_ids = []
         
         for i, data_item in enumerate(data_array):
             for month_range, entries in data_item.items():
                 for j, entry in enumerate(entries):
                     if entry.get("status", "").lower() == "pending":
-                        await db["OPE_data"].update_one(
-                            {"employeeId": employee_code},
-                            {"$set": {
-                                f"Data.{i}.{month_range}.{j}.status": "rejected",
-                                f"Data.{i}.{month_range}.{j}.rejected_by": reporting_emp_code,
-                                f"Data.{i}.{month_range}.{j}.rejector_name": manager_name,
-                                f"Data.{i}.{month_range}.{j}.rejected_date": current_time,
-                                f"Data.{i}.{month_range}.{j}.rejection_reason": rejection_reason,
-                                f"Data.{i}.{month_range}.{j}.rejected_level": "L1"
-                            }}
-                        )
+                        entry_updates.update({
+                            f"Data.{i}.{month_range}.{j}.status": "rejected",
+                            f"Data.{i}.{month_range}.{j}.rejected_by": reporting_emp_code,
+                            f"Data.{i}.{month_range}.{j}.rejector_name": manager_name,
+                            f"Data.{i}.{month_range}.{j}.rejected_date": current_time,
+                            f"Data.{i}.{month_range}.{j}.rejection_reason": rejection_reason,
+                            f"Data.{i}.{month_range}.{j}.rejected_level": "L1"
+                        })
+                        touched_ids.append(entry.get("_id"))
                         rejected_payroll_months.add(month_range)
                         rejected_count += 1
-                        print(f"✅ Rejected entry {j + 1} in month {month_range}")
         
         if rejected_count == 0:
             raise HTTPException(status_code=404, detail="No pending entries found")
-        
-        print(f"\n✅ Total entries rejected: {rejected_count}")
-        print(f"📅 Affected payroll months: {rejected_payroll_months}")
+
+        await update_ope_data(
+            employee_code, touched_ids,
+            {"employeeId": employee_code},
+            {"$set": entry_updates}
+        )
+
+        logger.info("✅ Total entries rejected: %s", rejected_count)
+        logger.debug("📅 Affected payroll months: %s", rejected_payroll_months)
         
         # ✅ FIXED: Update Status collection properly
         status_doc = await db["Status"].find_one({"employeeId": employee_code})
         
         if status_doc:
             approval_status_array = status_doc.get("approval_status", [])
+            status_updates = {}
             
             for i, ps in enumerate(approval_status_array):
                 payroll_month = ps.get("payroll_month") or ps.get("month_range")
                 
                 if payroll_month in rejected_payroll_months:
-                    print(f"📊 Updating Status for month: {payroll_month}")
                     
-                    await db["Status"].update_one(
-                        {"employeeId": employee_code},
-                        {"$set": {
-                            # ✅ L1 rejection details
-                            f"approval_status.{i}.L1.status": False,
-                            f"approval_status.{i}.L1.rejected": True,
-                            f"approval_status.{i}.L1.rejected_by": reporting_emp_code,
-                            f"approval_status.{i}.L1.rejector_name": manager_name,
-                            f"approval_status.{i}.L1.rejected_date": current_time,
-                            f"approval_status.{i}.L1.rejection_reason": rejection_reason,
-                            # ✅ Overall status
-                            f"approval_status.{i}.overall_status": "rejected",
-                            f"approval_status.{i}.current_level": "L1",
-                            # ✅ Top-level rejection fields for easy access
-                            f"approval_status.{i}.is_rejected": True,
-                            f"approval_status.{i}.rejected_level": "L1",
-                            f"approval_status.{i}.rejected_by": reporting_emp_code,
-                            f"approval_status.{i}.rejected_by_name": manager_name,
-                            f"approval_status.{i}.rejected_date": current_time,
-                            f"approval_status.{i}.rejection_reason": rejection_reason,
-                        }}
-                    )
-                    print(f"✅ Status updated for month: {payroll_month}")
+                    status_updates.update({
+                        # ✅ L1 rejection details
+                        f"approval_status.{i}.L1.status": False,
+                        f"approval_status.{i}.L1.rejected": True,
+                        f"approval_status.{i}.L1.rejected_by": reporting_emp_code,
+                        f"approval_status.{i}.L1.rejector_name": manager_name,
+                        f"approval_status.{i}.L1.rejected_date": current_time,
+                        f"approval_status.{i}.L1.rejection_reason": rejection_reason,
+                        # ✅ Overall status
+                        f"approval_status.{i}.overall_status": "rejected",
+                        f"approval_status.{i}.current_level": "L1",
+                        # ✅ Top-level rejection fields for easy access
+                        f"approval_status.{i}.is_rejected": True,
+                        f"approval_status.{i}.rejected_level": "L1",
+                        f"approval_status.{i}.rejected_by": reporting_emp_code,
+                        f"approval_status.{i}.rejected_by_name": manager_name,
+                        f"approval_status.{i}.rejected_date": current_time,
+                        f"approval_status.{i}.rejection_reason": rejection_reason,
+                    })
+
+            if status_updates:
+                await update_status_and_queue(
+                    employee_code,
+                    {"employeeId": employee_code},
+                    {"$set": status_updates}
+                )
+                logger.debug("✅ Status updated for months: %s", rejected_payroll_months)
         else:
-            print(f"⚠️ No Status document found for {employee_code}")
-        
-        # ✅ Remove from Pending collection
-        await db["Pending"].update_one(
-            {"ReportingEmpCode": emp_reporting_manager_code},
-            {"$pull": {"EmployeesCodes": employee_code}}
-        )
-        print(f"✅ Removed from Pending collection")
+            logger.warning("⚠️ No Status document found for %s", employee_code)
         
         # ✅ Add to Rejected collection
-        rejected_doc = await db["Rejected"].find_one({"ReportingEmpCode": reporting_emp_code})
-        
-        if not rejected_doc:
-            await db["Rejected"].insert_one({
-                "ReportingEmpCode": reporting_emp_code,
-                "EmployeesCodes": [employee_code]
-            })
-            print(f"✅ Created NEW Rejected document")
-        else:
-            if employee_code not in rejected_doc.get("EmployeesCodes", []):
-                await db["Rejected"].update_one(
-                    {"ReportingEmpCode": reporting_emp_code},
-                    {"$addToSet": {"EmployeesCodes": employee_code}}
-                )
-                print(f"✅ Added to Rejected collection")
+        await db["Rejected"].update_one(
+            {"ReportingEmpCode": reporting_emp_code},
+            {"$addToSet": {"EmployeesCodes": employee_code}},
+            upsert=True
+        )
+        logger.debug("✅ Added to Rejected collection")
         
-        print(f"{'='*60}\n")
         
         return {
             "message": f"Rejected {rejected_count} entries",
@@ -1702,9 +3967,7 @@ async def reject_employee_entries(
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error in reject_employee_entries: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
         
@@ -1721,17 +3984,15 @@ async def edit_total_amount(
         month_range = body.get("month_range")
         new_total = body.get("new_total")
         
-        print(f"\n{'='*60}")
-        print(f"💰💰 EDIT TOTAL AMOUNT REQUEST")
-        print(f"   User: {user_emp_code}")
-        print(f"   Employee: {employee_id}")
-        print(f"   Month: {month_range}")
-        print(f"   New Total: ₹{new_total}")
-        print(f"{'='*60}\n")
+        logger.debug("💰💰 EDIT TOTAL AMOUNT REQUEST")
+        logger.debug("   User: %s", user_emp_code)
+        logger.debug("   Employee: %s", employee_id)
+        logger.debug("   Month: %s", month_range)
+        logger.debug("   New Total: ₹%s", new_total)
         
-        is_manager = await db["Reporting_managers"].find_one({"ReportingEmpCode": user_emp_code})
+        is_manager = await get_reporting_manager(user_emp_code)
         is_hr = (user_emp_code == "JHS729")
-        is_partner = await db["Partner"].find_one({"PartnerEmpCode": user_emp_code})
+        is_partner = await get_partner(user_emp_code)
         
         if not (is_manager or is_hr or is_partner):
             raise HTTPException(status_code=403, detail="Only managers, partners, and HR can edit amounts")
@@ -1740,11 +4001,11 @@ async def edit_total_amount(
             user_role = "HR"
             user_name = "HR Department"
         elif is_partner:
-            partner = await db["Partner"].find_one({"PartnerEmpCode": user_emp_code})
+            partner = await get_partner(user_emp_code)
             user_role = "Partner"
             user_name = partner.get("Partner_Name", user_emp_code) if partner else user_emp_code
         else:
-            manager = await db["Reporting_managers"].find_one({"ReportingEmpCode": user_emp_code})
+            manager = await get_reporting_manager(user_emp_code)
             user_role = "Manager"
             user_name = manager.get("ReportingEmpName", user_emp_code) if manager else user_emp_code
         
@@ -1780,7 +4041,8 @@ async def edit_total_amount(
                     "entries_updated": 0
                 })
                 
-                await db["Status"].update_one(
+                await update_status_and_queue(
+                    employee_id,
                     {"employeeId": employee_id},
                     {"$set": {
                         f"approval_status.{i}.total_amount": new_total,
@@ -1793,7 +4055,6 @@ async def edit_total_amount(
                     }}
                 )
                 found = True
-                print(f"✅ Updated Status total: ₹{old_total} → ₹{new_total}")
                 break
         
         if not found:
@@ -1816,9 +4077,7 @@ async def edit_total_amount(
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error editing total amount: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error editing total amount: %s", e)
         raise HTTPException(status_code=500, detail=str(e))    
 
 
@@ -1835,27 +4094,25 @@ async def edit_entry_amount(
         employee_id = body.get("employee_id")
         new_amount = body.get("new_amount")
         
-        print(f"\n{'='*60}")
-        print(f"💰 EDIT SINGLE AMOUNT REQUEST")
-        print(f"   User: {user_emp_code}")
-        print(f"   Employee: {employee_id}")
-        print(f"   Entry ID: {entry_id}")
-        print(f"   New Amount: {new_amount}")
-        print(f"{'='*60}\n")
+        logger.debug("💰 EDIT SINGLE AMOUNT REQUEST")
+        logger.debug("   User: %s", user_emp_code)
+        logger.debug("   Employee: %s", employee_id)
+        logger.debug("   Entry ID: %s", entry_id)
+        logger.debug("   New Amount: %s", new_amount)
         
-        is_manager = await db["Reporting_managers"].find_one({"ReportingEmpCode": user_emp_code})
+        is_manager = await get_reporting_manager(user_emp_code)
         is_hr = (user_emp_code == "JHS729")
         
         if not is_manager and not is_hr:
             error_msg = "Only managers and HR can edit amounts"
-            print(f"❌ Authorization failed: {error_msg}")
+            logger.debug("❌ Authorization failed: %s", error_msg)
             raise HTTPException(
                 status_code=403,
                 detail=error_msg
             )
         
         user_role = "HR" if is_hr else "Manager"
-        print(f"✅ User role: {user_role}")
+        logger.debug("✅ User role: %s", user_role)
         
         if not entry_id or not employee_id or new_amount is None:
             raise HTTPException(status_code=400, detail="Missing required fields")
@@ -1863,7 +4120,7 @@ async def edit_entry_amount(
         if new_amount <= 0:
             raise HTTPException(status_code=400, detail="Amount must be greater than 0")
         
-        emp = await db["Employee_details"].find_one({"EmpID": employee_id})
+        emp = await employee_directory.get(employee_id)
         if not emp:
             raise HTTPException(status_code=404, detail="Employee not found")
         
@@ -1885,7 +4142,8 @@ async def edit_entry_amount(
                         old_amount = entry.get("amount", 0)
                         payroll_month = month_range
                         
-                        await db["OPE_data"].update_one(
+                        await update_ope_data(
+                            employee_id, [entry.get("_id")],
                             {"employeeId": employee_id},
                             {"$set": {
                                 f"Data.{i}.{month_range}.{j}.amount": new_amount,
@@ -1897,14 +4155,13 @@ async def edit_entry_amount(
                         )
                         
                         updated = True
-                        print(f"✅ Amount updated: ₹{old_amount} → ₹{new_amount}")
                         break
             if updated:
                 break
         
         if not updated:
             raise HTTPException(status_code=404, detail="Entry not found")
-        
+
         if payroll_month:
             status_doc = await db["Status"].find_one({"employeeId": employee_id})
             
@@ -1920,16 +4177,15 @@ async def edit_entry_amount(
                 
                 for i, ps in enumerate(approval_status):
                     if ps.get("payroll_month") == payroll_month:
-                        await db["Status"].update_one(
+                        await update_status_and_queue(
+                            employee_id,
                             {"employeeId": employee_id},
                             {"$set": {
                                 f"approval_status.{i}.total_amount": new_total
                             }}
                         )
-                        print(f"✅ Updated Status total_amount to: ₹{new_total}")
                         break
         
-        print(f"{'='*60}\n")
         
         return {
             "success": True,
@@ -1943,9 +4199,7 @@ async def edit_entry_amount(
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error editing amount: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error editing amount: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -1972,13 +4226,11 @@ async def save_temp_entry(
     try:
         employee_code = current_user["employee_code"]
         
-        print(f"\n{'='*60}")
-        print(f"💾 SAVING TEMPORARY ENTRY")
-        print(f"Employee: {employee_code}")
-        print(f"Amount: ₹{amount}")
-        print(f"{'='*60}\n")
+        logger.debug("💾 SAVING TEMPORARY ENTRY")
+        logger.debug("Employee: %s", employee_code)
+        logger.debug("Amount: ₹%s", amount)
         
-        emp = await db["Employee_details"].find_one({"EmpID": employee_code})
+        emp = await employee_directory.get(employee_code)
         
         if not emp:
             raise HTTPException(status_code=404, detail="Employee not found")
@@ -1986,12 +4238,12 @@ async def save_temp_entry(
         actual_ope_limit = emp.get("OPE LIMIT")
         
         if actual_ope_limit is None:
-            print(f"⚠️ OPE Limit not found in database, using default")
+            logger.warning("⚠️ OPE Limit not found in database, using default")
             actual_ope_limit = 5000
         else:
             actual_ope_limit = float(actual_ope_limit)
         
-        print(f"✅ Employee's Actual OPE Limit: ₹{actual_ope_limit}")
+        logger.debug("✅ Employee's Actual OPE Limit: ₹%s", actual_ope_limit)
         
         def format_month_range(month_str):
             try:
@@ -2049,12 +4301,12 @@ async def save_temp_entry(
         
         new_total = existing_month_total + submitted_month_total + amount
         
-        print(f"\n💰 AMOUNT CALCULATION:")
-        print(f"   Existing Temp Entries: ₹{existing_month_total}")
-        print(f"   Submitted Entries: ₹{submitted_month_total}")
-        print(f"   New Entry: +₹{amount}")
-        print(f"   New Total: ₹{new_total}")
-        print(f"   OPE Limit: ₹{actual_ope_limit}")
+        logger.debug("💰 AMOUNT CALCULATION:")
+        logger.debug("   Existing Temp Entries: ₹%s", existing_month_total)
+        logger.debug("   Submitted Entries: ₹%s", submitted_month_total)
+        logger.debug("   New Entry: +₹%s", amount)
+        logger.debug("   New Total: ₹%s", new_total)
+        logger.debug("   OPE Limit: ₹%s", actual_ope_limit)
         
         # Check for duplicate entry
         if temp_doc:
@@ -2083,10 +4335,9 @@ async def save_temp_entry(
         # ============================================
         ticket_pdf_id = None
         if ticket_pdf:
-            pdf_content = await ticket_pdf.read()
             pdf_filename = f"temp_ope_{employee_code}_{datetime.utcnow().timestamp()}.pdf"
-            ticket_pdf_id = await upload_to_gridfs(pdf_content, pdf_filename)
-            print(f"✅ PDF uploaded to GridFS: {ticket_pdf_id}")
+            ticket_pdf_id = await upload_pdf_to_gridfs(ticket_pdf, pdf_filename)
+            logger.debug("✅ PDF uploaded to GridFS: %s", ticket_pdf_id)
         
         # Create entry
         entry_doc = {
@@ -2107,54 +4358,58 @@ async def save_temp_entry(
             "status": "saved"
         }
         
-        if not temp_doc:
-            new_doc = {
-                "employeeId": employee_code,
-                "employeeName": emp.get("Emp Name", ""),
-                "designation": emp.get("Designation Name", ""),
-                "gender": emp.get("Gender", ""),
-                "partner": emp.get("Partner", ""),
-                "reportingManager": emp.get("ReportingEmpName", ""),
-                "department": "",
-                "Data": [
-                    {
-                        formatted_month_range: [entry_doc]
-                    }
-                ]
-            }
-            await db["Temp_OPE_data"].insert_one(new_doc)
-            print(f"✅ NEW temp document created")
-        else:
-            month_exists = False
-            data_array = temp_doc.get("Data", [])
+        try:
+            if not temp_doc:
+                new_doc = {
+                    "employeeId": employee_code,
+                    "employeeName": emp.get("Emp Name", ""),
+                    "designation": emp.get("Designation Name", ""),
+                    "gender": emp.get("Gender", ""),
+                    "partner": emp.get("Partner", ""),
+                    "reportingManager": emp.get("ReportingEmpName", ""),
+                    "department": "",
+                    "Data": [
+                        {
+                            formatted_month_range: [entry_doc]
+                        }
+                    ]
+                }
+                await db["Temp_OPE_data"].insert_one(new_doc)
+                logger.debug("✅ NEW temp document created")
+            else:
+                month_exists = False
+                data_array = temp_doc.get("Data", [])
             
-            for i, data_item in enumerate(data_array):
-                if formatted_month_range in data_item:
+                for i, data_item in enumerate(data_array):
+                    if formatted_month_range in data_item:
+                        await db["Temp_OPE_data"].update_one(
+                            {"employeeId": employee_code},
+                            {"$push": {f"Data.{i}.{formatted_month_range}": entry_doc}}
+                        )
+                        month_exists = True
+                        break
+            
+                if not month_exists:
                     await db["Temp_OPE_data"].update_one(
                         {"employeeId": employee_code},
-                        {"$push": {f"Data.{i}.{formatted_month_range}": entry_doc}}
+                        {"$push": {"Data": {formatted_month_range: [entry_doc]}}}
                     )
-                    month_exists = True
-                    break
-            
-            if not month_exists:
-                await db["Temp_OPE_data"].update_one(
-                    {"employeeId": employee_code},
-                    {"$push": {"Data": {formatted_month_range: [entry_doc]}}}
-                )
+        except BaseException:
+            # The draft never landed - give back the receipt reference it claimed
+            if ticket_pdf_id:
+                await delete_from_gridfs(ticket_pdf_id)
+            raise
         
         if new_total > actual_ope_limit:
             approval_levels = 3
             within_limit = False
-            print(f"📊 New total (₹{new_total}) EXCEEDS limit → 3-level approval")
+            logger.debug("📊 New total (₹%s) EXCEEDS limit → 3-level approval", new_total)
         else:
             approval_levels = 2
             within_limit = True
-            print(f"📊 New total (₹{new_total}) WITHIN limit → 2-level approval")
+            logger.debug("📊 New total (₹%s) WITHIN limit → 2-level approval", new_total)
         
-        print(f"\n{'='*60}")
-        print(f"✅ ENTRY SAVED SUCCESSFULLY")
-        print(f"{'='*60}\n")
+        logger.info("✅ ENTRY SAVED SUCCESSFULLY")
         
         return {
             "message": f"Entry saved successfully! {('✅ Within limit!' if within_limit else '⚠️ Exceeds limit!')}",
@@ -2169,9 +4424,7 @@ async def save_temp_entry(
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error saving temp entry: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error saving temp entry: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -2179,18 +4432,24 @@ async def save_temp_entry(
 # GET TEMPORARY HISTORY
 # =========================
 @app.get("/api/ope/temp-history/{employee_code}")
-async def get_temp_history(employee_code: str, current_user=Depends(get_current_user)):
+async def get_temp_history(
+    employee_code: str,
+    page: PageRequest = Depends(page_request),
+    current_user=Depends(get_current_user)
+):
     try:
-        print(f"📌 Fetching temp history for: {employee_code}")
+        logger.debug("📌 Fetching temp history for: %s", employee_code)
         
         if current_user["employee_code"] != employee_code:
             raise HTTPException(status_code=403, detail="Access denied")
         
+        # Drafts live in one document per employee - paged in memory
         temp_doc = await db["Temp_OPE_data"].find_one({"employeeId": employee_code})
         
         if not temp_doc:
-            print(f"📭 No temp data found")
-            return {"history": []}
+            logger.debug("📭 No temp data found")
+            history, page_info = page_draft_rows([], page)
+            return {"history": history, "page": page_info}
         
         history = []
         data_array = temp_doc.get("Data", [])
@@ -2215,11 +4474,15 @@ async def get_temp_history(employee_code: str, current_user=Depends(get_current_
                         "status": "saved"
                     })
         
-        print(f"✅ Found {len(history)} temp entries")
-        return {"history": history}
+        history, page_info = page_draft_rows(history, page)
+        
+        logger.debug("✅ Found %s temp entries", len(history))
+        return {"history": history, "page": page_info}
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Error fetching temp history: {str(e)}")
+        logger.exception("❌ Error fetching temp history: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -2236,7 +4499,7 @@ async def update_temp_entry(
         employee_code = current_user["employee_code"]
         month_range = update_data.get("month_range")
         
-        print(f"📝 Updating temp entry {entry_id} for: {employee_code}")
+        logger.debug("📝 Updating temp entry %s for: %s", entry_id, employee_code)
         
         if not month_range:
             raise HTTPException(status_code=400, detail="month_range required")
@@ -2272,7 +4535,7 @@ async def update_temp_entry(
                             {"$set": update_fields}
                         )
                         updated = True
-                        print(f"✅ Entry updated successfully")
+                        logger.info("✅ Entry updated successfully")
                         break
             if updated:
                 break
@@ -2283,7 +4546,7 @@ async def update_temp_entry(
         return {"message": "Entry updated successfully"}
         
     except Exception as e:
-        print(f"❌ Error updating temp entry: {str(e)}")
+        logger.exception("❌ Error updating temp entry: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -2300,7 +4563,7 @@ async def delete_temp_entry(
         employee_code = current_user["employee_code"]
         month_range = delete_data.get("month_range")
         
-        print(f"🗑️ Deleting temp entry {entry_id} for: {employee_code}")
+        logger.debug("🗑️ Deleting temp entry %s for: %s", entry_id, employee_code)
         
         if not entry_id or entry_id == "dummy":
             raise HTTPException(status_code=400, detail="Invalid entry ID")
@@ -2321,27 +4584,23 @@ async def delete_temp_entry(
                 
                 for j, entry in enumerate(entries):
                     if str(entry.get("_id")) == entry_id:
-                        print(f"✅ Found entry at Data.{i}.{month_range}.{j}")
-                        
-                        # Delete PDF from GridFS if exists
-                        pdf_id = entry.get("ticket_pdf")
-                        if pdf_id and is_gridfs_id(pdf_id):
-                            await delete_from_gridfs(pdf_id)
-                            print(f"✅ PDF deleted from GridFS: {pdf_id}")
                         
                         if len(entries) == 1:
-                            print(f"🗑️ Removing entire month range")
                             await db["Temp_OPE_data"].update_one(
                                 {"employeeId": employee_code},
                                 {"$pull": {"Data": {month_range: {"$exists": True}}}}
                             )
                         else:
-                            print(f"🗑️ Removing single entry")
                             await db["Temp_OPE_data"].update_one(
                                 {"employeeId": employee_code},
                                 {"$pull": {f"Data.{i}.{month_range}": {"_id": ObjectId(entry_id)}}}
                             )
                         
+                        # Release the receipt only once the entry is gone
+                        pdf_id = entry.get("ticket_pdf")
+                        if pdf_id and is_gridfs_id(pdf_id):
+                            await delete_from_gridfs(pdf_id)
+                        
                         deleted = True
                         break
             
@@ -2351,7 +4610,7 @@ async def delete_temp_entry(
         if not deleted:
             raise HTTPException(status_code=404, detail="Entry not found in temp data")
         
-        print(f"✅ Entry deleted successfully")
+        logger.info("✅ Entry %s deleted for %s", entry_id, employee_code)
         return {
             "message": "Entry deleted successfully",
             "entry_id": entry_id
@@ -2360,9 +4619,7 @@ async def delete_temp_entry(
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error deleting temp entry: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error deleting temp entry: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
             
@@ -2380,7 +4637,7 @@ async def submit_final_entries(
         body = await request.json()
         month_range = body.get("month_range")
         
-        print(f"🚀 SUBMIT FINAL: Employee {employee_code}, Month {month_range}")
+        logger.debug("🚀 SUBMIT FINAL: Employee %s, Month %s", employee_code, month_range)
         
         if not month_range:
             raise HTTPException(status_code=400, detail="month_range required")
@@ -2409,345 +4666,353 @@ async def submit_final_entries(
                 return month_str
         
         formatted_month_range = format_month_range(month_range)
-        print(f"📅 Formatted month range: {formatted_month_range}")
-        
-        temp_doc = await db["Temp_OPE_data"].find_one({"employeeId": employee_code})
-        
-        if not temp_doc:
-            raise HTTPException(status_code=404, detail="No temporary data found to submit")
-        
-        entries_to_submit = []
-        data_array = temp_doc.get("Data", [])
+        logger.debug("📅 Formatted month range: %s", formatted_month_range)
         
-        for data_item in data_array:
-            if formatted_month_range in data_item:
-                entries_to_submit = data_item[formatted_month_range]
-                break
-        
-        if not entries_to_submit:
-            raise HTTPException(status_code=404, detail=f"No entries found for {formatted_month_range}")
-        
-        print(f"📦 Found {len(entries_to_submit)} entries to submit")
-        
-        emp = await db["Employee_details"].find_one({"EmpID": employee_code})
+        # Employee master data is not touched by the submission, so it is
+        # read once outside the transaction (and not re-read on retries)
+        emp = await employee_directory.get(employee_code)
         if not emp:
             raise HTTPException(status_code=404, detail="Employee details not found")
         
         # Check if submitter is a Reporting Manager
-        is_reporting_manager = await db["Reporting_managers"].find_one({"ReportingEmpCode": employee_code})
+        is_reporting_manager = await get_reporting_manager(employee_code)
         
         reporting_manager_code = emp.get("ReportingEmpCode", "").strip().upper()
         reporting_manager_name = emp.get("ReportingEmpName", "")
         partner_code = emp.get("PartnerEmpCode", "").strip().upper()
         partner_name = emp.get("Partner", "")
         
-        new_entries_amount = sum(float(entry.get("amount", 0)) for entry in entries_to_submit)
-        
-        status_doc = await db["Status"].find_one({"employeeId": employee_code})
-        
-        existing_total = 0
-        month_exists = False
-        existing_month_index = -1
+        if is_reporting_manager and not partner_code:
+            raise HTTPException(status_code=400, detail="No Partner assigned to this Reporting Manager")
+        if not is_reporting_manager and not reporting_manager_code:
+            raise HTTPException(status_code=400, detail="No reporting manager assigned")
         
-        if status_doc:
-            approval_status = status_doc.get("approval_status", [])
-            for i, ps in enumerate(approval_status):
-                if ps.get("payroll_month") == formatted_month_range:
-                    existing_total = ps.get("total_amount", 0)
-                    month_exists = True
-                    existing_month_index = i
-                    print(f"📊 Found existing month entry with total: ₹{existing_total}")
-                    break
-        
-        cumulative_total = existing_total + new_entries_amount
-        
-        current_time = datetime.utcnow().isoformat()
-        
-        # ============================================
-        # APPROVAL FLOW LOGIC BASED ON SUBMITTER TYPE
-        # ============================================
-        if is_reporting_manager:
-            print(f"\n{'='*60}")
-            print(f"👔 SUBMITTER IS A REPORTING MANAGER")
-            print(f"   Employee Code: {employee_code}")
-            print(f"   Partner: {partner_code} ({partner_name})")
-            print(f"{'='*60}\n")
-            
-            if not partner_code:
-                raise HTTPException(status_code=400, detail="No Partner assigned to this Reporting Manager")
-            
-            total_levels = 2
-            ope_label = "Reporting_Manager"
+        ope_limit = 0
+        if not is_reporting_manager:
+            ope_limit = emp.get("OPE LIMIT")
+            if ope_limit is None:
+                ope_limit = 1500
+                logger.warning("⚠️ OPE Limit not found in Employee_details, using default: ₹%s", ope_limit)
+            else:
+                ope_limit = float(ope_limit)
+                logger.debug("✅ OPE Limit from Employee_details: ₹%s", ope_limit)
+        
+        async def submit_in_transaction(session):
+            """
+            Move the month from Temp_OPE_data to OPE_data, Status and Pending.
+            Claiming the Temp_OPE_data month is the first write, so a second
+            submit of the same month (double click, second tab) either
+            conflicts and is retried, or finds nothing left to submit.
+            """
+            # Claim: pull the month out of Temp_OPE_data and get the
+            # pre-image in the same round trip
+            temp_doc = await db["Temp_OPE_data"].find_one_and_update(
+                {"employeeId": employee_code, f"Data.{formatted_month_range}": {"$exists": True}},
+                {"$pull": {"Data": {formatted_month_range: {"$exists": True}}}},
+                session=session
+            )
             
-            payroll_entry = {
-                "payroll_month": formatted_month_range,
-                "ope_label": ope_label,
-                "submitter_type": "Reporting_Manager",
-                "total_levels": total_levels,
-                "limit": 0,
-                "total_amount": cumulative_total,
-                "L1": {
-                    "status": False,
-                    "approver_name": partner_name,
-                    "approver_code": partner_code,
-                    "approved_date": None,
-                    "level_name": "Partner"
-                },
-                "L2": {
-                    "status": False,
-                    "approver_name": "HR",
-                    "approver_code": "JHS729",
-                    "approved_date": None,
-                    "level_name": "HR"
-                },
-                "current_level": "L1",
-                "overall_status": "pending",
-                "submission_date": current_time
-            }
+            if not temp_doc:
+                has_temp = await db["Temp_OPE_data"].count_documents(
+                    {"employeeId": employee_code}, limit=1, session=session
+                )
+                if not has_temp:
+                    raise HTTPException(status_code=404, detail="No temporary data found to submit")
+                raise HTTPException(status_code=404, detail=f"No entries found for {formatted_month_range}")
             
-            pending_approver_code = partner_code
+            entries_to_submit = []
+            data_array = temp_doc.get("Data", [])
             
-        else:
-            print(f"\n{'='*60}")
-            print(f"👤 SUBMITTER IS A REGULAR EMPLOYEE")
-            print(f"   Employee Code: {employee_code}")
-            print(f"   Reporting Manager: {reporting_manager_code} ({reporting_manager_name})")
-            print(f"{'='*60}\n")
+            for data_item in data_array:
+                if formatted_month_range in data_item:
+                    entries_to_submit = data_item[formatted_month_range]
+                    break
             
-            if not reporting_manager_code:
-                raise HTTPException(status_code=400, detail="No reporting manager assigned")
+            if not entries_to_submit:
+                raise HTTPException(status_code=404, detail=f"No entries found for {formatted_month_range}")
             
-            ope_limit = emp.get("OPE LIMIT")
+            logger.debug("📦 Found %s entries to submit", len(entries_to_submit))
             
-            if ope_limit is None:
-                ope_limit = 1500
-                print(f"⚠️ OPE Limit not found in Employee_details, using default: ₹{ope_limit}")
+            if len(data_array) == 1:
+                await db["Temp_OPE_data"].delete_one(
+                    {"employeeId": employee_code, "Data": {"$size": 0}},
+                    session=session
+                )
+                logger.debug("✅ Deleted empty Temp_OPE_data document")
             else:
-                ope_limit = float(ope_limit)
-                print(f"✅ OPE Limit from Employee_details: ₹{ope_limit}")
+                logger.debug("✅ Removed from Temp_OPE_data")
             
-            print(f"\n{'='*60}")
-            print(f"💰 AMOUNT CALCULATION:")
-            print(f"   Previous Total: ₹{existing_total}")
-            print(f"   New Entries: +₹{new_entries_amount}")
-            print(f"   Cumulative Total: ₹{cumulative_total}")
-            print(f"   OPE Limit: ₹{ope_limit}")
-            print(f"{'='*60}\n")
+            new_entries_amount = sum(float(entry.get("amount", 0)) for entry in entries_to_submit)
             
-            if cumulative_total > ope_limit:
-                ope_label = "Greater"
-                total_levels = 3
-                print(f"📊 Cumulative amount (₹{cumulative_total}) EXCEEDS limit (₹{ope_limit}) → 3-level approval required")
-            else:
-                ope_label = "Less"
-                total_levels = 2
-                print(f"📊 Cumulative amount (₹{cumulative_total}) WITHIN limit (₹{ope_limit}) → 2-level approval required")
+            status_doc = await db["Status"].find_one({"employeeId": employee_code}, session=session)
             
-            payroll_entry = {
-                "payroll_month": formatted_month_range,
-                "ope_label": ope_label,
-                "submitter_type": "Employee",
-                "total_levels": total_levels,
-                "limit": ope_limit,
-                "total_amount": cumulative_total,
-                "L1": {
-                    "status": False,
-                    "approver_name": reporting_manager_name,
-                    "approver_code": reporting_manager_code,
-                    "approved_date": None,
-                    "level_name": "Reporting Manager"
-                },
-                "L2": {
-                    "status": False,
-                    "approver_name": "HR" if total_levels == 2 else partner_name,
-                    "approver_code": "JHS729" if total_levels == 2 else partner_code,
-                    "approved_date": None,
-                    "level_name": "HR" if total_levels == 2 else "Partner"
-                },
-                "current_level": "L1",
-                "overall_status": "pending",
-                "submission_date": current_time
-            }
+            existing_total = 0
+            month_exists = False
+            existing_month_index = -1
             
-            if total_levels == 3:
-                payroll_entry["L3"] = {
-                    "status": False,
-                    "approver_name": "HR",
-                    "approver_code": "JHS729",
-                    "approved_date": None,
-                    "level_name": "HR"
-                }
-                print(f"✅ Added L3 (HR) level for approval")
+            if status_doc:
+                approval_status = status_doc.get("approval_status", [])
+                for i, ps in enumerate(approval_status):
+                    if ps.get("payroll_month") == formatted_month_range:
+                        existing_total = ps.get("total_amount", 0)
+                        month_exists = True
+                        existing_month_index = i
+                        break
             
-            pending_approver_code = reporting_manager_code
-        
-        # ============================================
-        # CREATE OR UPDATE STATUS DOCUMENT
-        # ============================================
-        if not status_doc:
-            new_status_doc = {
-                "employeeId": employee_code,
-                "employeeName": emp.get("Emp Name", ""),
-                "ReportingEmpCode": reporting_manager_code, 
-                "PartnerEmpCode": partner_code,  
-                "HREmpCode": "JHS729", 
-                "approval_status": [payroll_entry]
-            }
-            result = await db["Status"].insert_one(new_status_doc)
-            status_doc_id = str(result.inserted_id)
+            cumulative_total = existing_total + new_entries_amount
             
-        else:
-            status_doc_id = str(status_doc["_id"])
+            current_time = datetime.utcnow().isoformat()
             
-            if month_exists:
-                print(f"🔄 Updating existing month entry at index {existing_month_index}")
+            # ============================================
+            # APPROVAL FLOW LOGIC BASED ON SUBMITTER TYPE
+            # ============================================
+            if is_reporting_manager:
+                logger.debug("👔 SUBMITTER IS A REPORTING MANAGER")
+                logger.debug("   Employee Code: %s", employee_code)
+                logger.debug("   Partner: %s (%s)", partner_code, partner_name)
+                
+                total_levels = 2
+                ope_label = "Reporting_Manager"
                 
-                update_fields = {
-                    f"approval_status.{existing_month_index}.total_amount": cumulative_total,
-                    f"approval_status.{existing_month_index}.ope_label": ope_label,
-                    f"approval_status.{existing_month_index}.total_levels": total_levels,
-                    f"approval_status.{existing_month_index}.submitter_type": payroll_entry["submitter_type"],
-                    f"approval_status.{existing_month_index}.submission_date": current_time
+                payroll_entry = {
+                    "payroll_month": formatted_month_range,
+                    "ope_label": ope_label,
+                    "submitter_type": "Reporting_Manager",
+                    "total_levels": total_levels,
+                    "limit": 0,
+                    "total_amount": cumulative_total,
+                    "L1": {
+                        "status": False,
+                        "approver_name": partner_name,
+                        "approver_code": partner_code,
+                        "approved_date": None,
+                        "level_name": "Partner"
+                    },
+                    "L2": {
+                        "status": False,
+                        "approver_name": "HR",
+                        "approver_code": "JHS729",
+                        "approved_date": None,
+                        "level_name": "HR"
+                    },
+                    "current_level": "L1",
+                    "overall_status": "pending",
+                    "submission_date": current_time
                 }
                 
-                if is_reporting_manager:
-                    update_fields[f"approval_status.{existing_month_index}.limit"] = 0
+                pending_approver_code = partner_code
+                
+            else:
+                logger.debug("👤 SUBMITTER IS A REGULAR EMPLOYEE")
+                logger.debug("   Employee Code: %s", employee_code)
+                logger.debug("   Reporting Manager: %s (%s)", reporting_manager_code, reporting_manager_name)
+                
+                logger.debug("💰 AMOUNT CALCULATION:")
+                logger.debug("   Previous Total: ₹%s", existing_total)
+                logger.debug("   New Entries: +₹%s", new_entries_amount)
+                logger.debug("   Cumulative Total: ₹%s", cumulative_total)
+                logger.debug("   OPE Limit: ₹%s", ope_limit)
+                
+                if cumulative_total > ope_limit:
+                    ope_label = "Greater"
+                    total_levels = 3
+                    logger.debug("📊 Cumulative amount (₹%s) EXCEEDS limit (₹%s) → 3-level approval required", cumulative_total, ope_limit)
                 else:
-                    update_fields[f"approval_status.{existing_month_index}.limit"] = ope_limit
+                    ope_label = "Less"
+                    total_levels = 2
+                    logger.debug("📊 Cumulative amount (₹%s) WITHIN limit (₹%s) → 2-level approval required", cumulative_total, ope_limit)
+                
+                payroll_entry = {
+                    "payroll_month": formatted_month_range,
+                    "ope_label": ope_label,
+                    "submitter_type": "Employee",
+                    "total_levels": total_levels,
+                    "limit": ope_limit,
+                    "total_amount": cumulative_total,
+                    "L1": {
+                        "status": False,
+                        "approver_name": reporting_manager_name,
+                        "approver_code": reporting_manager_code,
+                        "approved_date": None,
+                        "level_name": "Reporting Manager"
+                    },
+                    "L2": {
+                        "status": False,
+                        "approver_name": "HR" if total_levels == 2 else partner_name,
+                        "approver_code": "JHS729" if total_levels == 2 else partner_code,
+                        "approved_date": None,
+                        "level_name": "HR" if total_levels == 2 else "Partner"
+                    },
+                    "current_level": "L1",
+                    "overall_status": "pending",
+                    "submission_date": current_time
+                }
                 
                 if total_levels == 3:
-                    update_fields[f"approval_status.{existing_month_index}.L3"] = {
+                    payroll_entry["L3"] = {
                         "status": False,
                         "approver_name": "HR",
                         "approver_code": "JHS729",
                         "approved_date": None,
                         "level_name": "HR"
                     }
-                    update_fields[f"approval_status.{existing_month_index}.L2.approver_name"] = partner_name
-                    update_fields[f"approval_status.{existing_month_index}.L2.approver_code"] = partner_code
-                    update_fields[f"approval_status.{existing_month_index}.L2.level_name"] = "Partner"
-                else:
-                    if is_reporting_manager:
-                        update_fields[f"approval_status.{existing_month_index}.L2.approver_name"] = "HR"
-                        update_fields[f"approval_status.{existing_month_index}.L2.approver_code"] = "JHS729"
-                        update_fields[f"approval_status.{existing_month_index}.L2.level_name"] = "HR"
+                    logger.debug("✅ Added L3 (HR) level for approval")
+                
+                pending_approver_code = reporting_manager_code
+            
+            # ============================================
+            # CREATE OR UPDATE STATUS DOCUMENT
+            # ============================================
+            if not status_doc:
+                new_status_doc = {
+                    "employeeId": employee_code,
+                    "employeeName": emp.get("Emp Name", ""),
+                    "ReportingEmpCode": reporting_manager_code, 
+                    "PartnerEmpCode": partner_code,  
+                    "HREmpCode": "JHS729", 
+                    "approval_status": [payroll_entry]
+                }
+                result = await db["Status"].insert_one(new_status_doc, session=session)
+                status_doc_id = str(result.inserted_id)
+                
+            else:
+                status_doc_id = str(status_doc["_id"])
+                
+                if month_exists:
+                    logger.debug("🔄 Updating existing month entry at index %s", existing_month_index)
+                    
+                    update_fields = {
+                        f"approval_status.{existing_month_index}.total_amount": cumulative_total,
+                        f"approval_status.{existing_month_index}.ope_label": ope_label,
+                        f"approval_status.{existing_month_index}.total_levels": total_levels,
+                        f"approval_status.{existing_month_index}.submitter_type": payroll_entry["submitter_type"],
+                        f"approval_status.{existing_month_index}.submission_date": current_time,
+                        f"approval_status.{existing_month_index}.limit": ope_limit
+                    }
+                    
+                    if total_levels == 3:
+                        update_fields[f"approval_status.{existing_month_index}.L3"] = {
+                            "status": False,
+                            "approver_name": "HR",
+                            "approver_code": "JHS729",
+                            "approved_date": None,
+                            "level_name": "HR"
+                        }
+                        update_fields[f"approval_status.{existing_month_index}.L2.approver_name"] = partner_name
+                        update_fields[f"approval_status.{existing_month_index}.L2.approver_code"] = partner_code
+                        update_fields[f"approval_status.{existing_month_index}.L2.level_name"] = "Partner"
                     else:
                         update_fields[f"approval_status.{existing_month_index}.L2.approver_name"] = "HR"
                         update_fields[f"approval_status.{existing_month_index}.L2.approver_code"] = "JHS729"
                         update_fields[f"approval_status.{existing_month_index}.L2.level_name"] = "HR"
-                
-                await db["Status"].update_one(
-                    {"employeeId": employee_code},
-                    {"$set": update_fields}
-                )
-                
-                print(f"✅ Updated existing payroll month with cumulative total: ₹{cumulative_total}")
-                
+                    
+                    await db["Status"].update_one(
+                        {"_id": status_doc["_id"]},
+                        {"$set": update_fields},
+                        session=session
+                    )
+                    
+                    logger.debug("✅ Updated existing payroll month with cumulative total: ₹%s", cumulative_total)
+                    
+                else:
+                    await db["Status"].update_one(
+                        {"_id": status_doc["_id"]},
+                        {"$push": {"approval_status": payroll_entry}},
+                        session=session
+                    )
+                    logger.debug("✅ Added new payroll month: %s", formatted_month_range)
+            
+            # Update each entry with status reference
+            for entry in entries_to_submit:
+                entry["status"] = "pending"
+                entry["submitted_time"] = current_time
+                entry["status_doc_id"] = status_doc_id
+                entry["payroll_month"] = formatted_month_range
+                entry["approved_by"] = None
+                entry["approved_date"] = None
+                entry["rejected_by"] = None
+                entry["rejected_date"] = None
+                entry["rejection_reason"] = None
+            
+            # Move to OPE_data collection: one write for the whole batch
+            ope_doc = await db["OPE_data"].find_one(
+                {"employeeId": employee_code}, {"Data": 1}, session=session
+            )
+            
+            if not ope_doc:
+                new_doc = {
+                    "employeeId": employee_code,
+                    "employeeName": emp.get("Emp Name", ""),
+                    "designation": emp.get("Designation Name", ""),
+                    "gender": emp.get("Gender", ""),
+                    "partner": emp.get("Partner", ""),
+                    "reportingManager": emp.get("ReportingEmpName", ""),
+                    "department": "",
+                    "Data": [
+                        {
+                            formatted_month_range: entries_to_submit
+                        }
+                    ]
+                }
+                await db["OPE_data"].insert_one(new_doc, session=session)
+                logger.debug("✅ Created new OPE_data document")
             else:
-                await db["Status"].update_one(
-                    {"employeeId": employee_code},
-                    {"$push": {"approval_status": payroll_entry}}
+                month_index = next(
+                    (i for i, data_item in enumerate(ope_doc.get("Data", [])) if formatted_month_range in data_item),
+                    None
                 )
-                print(f"✅ Added new payroll month: {formatted_month_range}")
-        
-        # Update each entry with status reference
-        for entry in entries_to_submit:
-            entry["status"] = "pending"
-            entry["submitted_time"] = current_time
-            entry["status_doc_id"] = status_doc_id
-            entry["payroll_month"] = formatted_month_range
-            entry["approved_by"] = None
-            entry["approved_date"] = None
-            entry["rejected_by"] = None
-            entry["rejected_date"] = None
-            entry["rejection_reason"] = None
-        
-        # Move to OPE_data collection
-        ope_doc = await db["OPE_data"].find_one({"employeeId": employee_code})
-        
-        if not ope_doc:
-            new_doc = {
-                "employeeId": employee_code,
-                "employeeName": emp.get("Emp Name", ""),
-                "designation": emp.get("Designation Name", ""),
-                "gender": emp.get("Gender", ""),
-                "partner": emp.get("Partner", ""),
-                "reportingManager": emp.get("ReportingEmpName", ""),
-                "department": "",
-                "Data": [
-                    {
-                        formatted_month_range: entries_to_submit
-                    }
-                ]
-            }
-            await db["OPE_data"].insert_one(new_doc)
-            print(f"✅ Created new OPE_data document")
-        else:
-            month_exists_in_ope = False
-            ope_data_array = ope_doc.get("Data", [])
+                
+                if month_index is not None:
+                    await db["OPE_data"].update_one(
+                        {"_id": ope_doc["_id"]},
+                        {"$push": {f"Data.{month_index}.{formatted_month_range}": {"$each": entries_to_submit}}},
+                        session=session
+                    )
+                    logger.debug("✅ Appended to existing month in OPE_data")
+                else:
+                    await db["OPE_data"].update_one(
+                        {"_id": ope_doc["_id"]},
+                        {"$push": {"Data": {formatted_month_range: entries_to_submit}}},
+                        session=session
+                    )
+                    logger.debug("✅ Added new month range to OPE_data")
             
-            for i, data_item in enumerate(ope_data_array):
-                if formatted_month_range in data_item:
-                    for entry in entries_to_submit:
-                        await db["OPE_data"].update_one(
-                            {"employeeId": employee_code},
-                            {"$push": {f"Data.{i}.{formatted_month_range}": entry}}
-                        )
-                    month_exists_in_ope = True
-                    print(f"✅ Appended to existing month in OPE_data")
-                    break
+            await sync_ope_entries(
+                employee_code, [entry.get("_id") for entry in entries_to_submit], session=session
+            )
             
-            if not month_exists_in_ope:
-                await db["OPE_data"].update_one(
-                    {"employeeId": employee_code},
-                    {"$push": {"Data": {formatted_month_range: entries_to_submit}}}
-                )
-                print(f"✅ Added new month range to OPE_data")
-        
-        # Add to PENDING collection
-        pending_doc = await db["Pending"].find_one({"ReportingEmpCode": pending_approver_code})
-        
-        if not pending_doc:
-            await db["Pending"].insert_one({
-                "ReportingEmpCode": pending_approver_code,
-                "EmployeesCodes": [employee_code]
-            })
-            print(f"✅ Created NEW Pending document for approver {pending_approver_code}")
-        else:
-            if employee_code not in pending_doc.get("EmployeesCodes", []):
-                await db["Pending"].update_one(
-                    {"ReportingEmpCode": pending_approver_code},
-                    {"$addToSet": {"EmployeesCodes": employee_code}}
-                )
-                print(f"✅ Added employee to Pending list under {pending_approver_code}")
-        
-        # Delete from Temp_OPE_data
-        temp_data_array = temp_doc.get("Data", [])
-        
-        for i, data_item in enumerate(temp_data_array):
-            if formatted_month_range in data_item:
-                await db["Temp_OPE_data"].update_one(
-                    {"employeeId": employee_code},
-                    {"$pull": {"Data": {formatted_month_range: {"$exists": True}}}}
-                )
-                print(f"✅ Removed from Temp_OPE_data")
-                break
+            # Queue the month for its first approver
+            await sync_approval_queue(employee_code, session=session)
+            logger.debug("✅ Queued for approver %s", pending_approver_code)
+            
+            return {
+                "entries_to_submit": entries_to_submit,
+                "existing_total": existing_total,
+                "new_entries_amount": new_entries_amount,
+                "cumulative_total": cumulative_total,
+                "ope_label": ope_label,
+                "total_levels": total_levels,
+                "pending_approver_code": pending_approver_code
+            }
         
-        updated_temp = await db["Temp_OPE_data"].find_one({"employeeId": employee_code})
-        if updated_temp and len(updated_temp.get("Data", [])) == 0:
-            await db["Temp_OPE_data"].delete_one({"employeeId": employee_code})
-            print(f"✅ Deleted empty Temp_OPE_data document")
-        
-        print(f"\n{'='*60}")
-        print(f"✅✅ SUBMISSION COMPLETE ✅✅")
-        print(f"   Submitter Type: {'REPORTING MANAGER' if is_reporting_manager else 'EMPLOYEE'}")
-        print(f"   Employee: {employee_code}")
-        print(f"   Previous Total: ₹{existing_total}")
-        print(f"   New Entries: +₹{new_entries_amount}")
-        print(f"   Cumulative Total: ₹{cumulative_total}")
-        print(f"   Approval Levels: {total_levels}")
-        print(f"   First Approver: {pending_approver_code}")
-        print(f"{'='*60}\n")
+        outcome = await run_in_transaction(submit_in_transaction)
+        
+        entries_to_submit = outcome["entries_to_submit"]
+        existing_total = outcome["existing_total"]
+        new_entries_amount = outcome["new_entries_amount"]
+        cumulative_total = outcome["cumulative_total"]
+        ope_label = outcome["ope_label"]
+        total_levels = outcome["total_levels"]
+        pending_approver_code = outcome["pending_approver_code"]
+        
+        logger.info("✅✅ SUBMISSION COMPLETE ✅✅")
+        logger.debug("   Submitter Type: %s", 'REPORTING MANAGER' if is_reporting_manager else 'EMPLOYEE')
+        logger.debug("   Employee: %s", employee_code)
+        logger.debug("   Previous Total: ₹%s", existing_total)
+        logger.debug("   New Entries: +₹%s", new_entries_amount)
+        logger.debug("   Cumulative Total: ₹%s", cumulative_total)
+        logger.debug("   Approval Levels: %s", total_levels)
+        logger.debug("   First Approver: %s", pending_approver_code)
         
         return {
             "message": "Entries submitted successfully for approval",
@@ -2767,9 +5032,7 @@ async def submit_final_entries(
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error submitting final: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error submitting final: %s", e)
         raise HTTPException(status_code=500, detail=str(e))    
 
 
@@ -2786,25 +5049,21 @@ async def approve_employee_entries(
         body = await request.json()
         approval_remark = body.get("remark", "Approved without remark")
         
-        print(f"\n{'='*60}")
-        print(f"✅ MANAGER APPROVAL REQUEST")
-        print(f"Manager: {reporting_emp_code}")
-        print(f"Employee: {employee_code}")
-        print(f"Remark: {approval_remark}")
-        print(f"{'='*60}\n")
+        logger.debug("✅ MANAGER APPROVAL REQUEST")
+        logger.debug("Manager: %s", reporting_emp_code)
+        logger.debug("Employee: %s", employee_code)
+        logger.debug("Remark: %s", approval_remark)
         
-        manager = await db["Reporting_managers"].find_one({"ReportingEmpCode": reporting_emp_code})
+        manager = await get_reporting_manager(reporting_emp_code)
         if not manager:
             raise HTTPException(status_code=403, detail="You are not a reporting manager")
         
         manager_name = manager.get("ReportingEmpName", reporting_emp_code)
         
-        emp = await db["Employee_details"].find_one({"EmpID": employee_code})
+        emp = await employee_directory.get(employee_code)
         if not emp:
             raise HTTPException(status_code=404, detail="Employee not found")
         
-        emp_reporting_manager_code = emp.get("ReportingEmpCode", "").strip().upper()
-        
         ope_doc = await db["OPE_data"].find_one({"employeeId": employee_code})
         if not ope_doc:
             raise HTTPException(status_code=404, detail="No OPE data found for employee")
@@ -2814,6 +5073,9 @@ async def approve_employee_entries(
         
         data_array = ope_doc.get("Data", [])
         payroll_months_approved = set()
+        # All entry changes go out as one $set on the employee document
+        entry_updates = {}
+        touched_ids = []
         
         for i, data_item in enumerate(data_array):
             for month_range, entries in data_item.items():
@@ -2823,29 +5085,34 @@ async def approve_employee_entries(
                     if entry_status != "pending":
                         continue
                     
-                    await db["OPE_data"].update_one(
-                        {"employeeId": employee_code},
-                        {"$set": {
-                            f"Data.{i}.{month_range}.{j}.status": "approved",
-                            f"Data.{i}.{month_range}.{j}.approved_date": current_time,
-                            f"Data.{i}.{month_range}.{j}.approved_by": reporting_emp_code,
-                            f"Data.{i}.{month_range}.{j}.approver_name": manager_name,
-                            f"Data.{i}.{month_range}.{j}.approval_remark": approval_remark,
-                            f"Data.{i}.{month_range}.{j}.L1_approved": True,
-                            f"Data.{i}.{month_range}.{j}.L1_approver_code": reporting_emp_code,
-                            f"Data.{i}.{month_range}.{j}.L1_approver_name": manager_name
-                        }}
-                    )
+                    entry_updates.update({
+                        f"Data.{i}.{month_range}.{j}.status": "approved",
+                        f"Data.{i}.{month_range}.{j}.approved_date": current_time,
+                        f"Data.{i}.{month_range}.{j}.approved_by": reporting_emp_code,
+                        f"Data.{i}.{month_range}.{j}.approver_name": manager_name,
+                        f"Data.{i}.{month_range}.{j}.approval_remark": approval_remark,
+                        f"Data.{i}.{month_range}.{j}.L1_approved": True,
+                        f"Data.{i}.{month_range}.{j}.L1_approver_code": reporting_emp_code,
+                        f"Data.{i}.{month_range}.{j}.L1_approver_name": manager_name
+                    })
+                    touched_ids.append(entry.get("_id"))
                     
                     payroll_months_approved.add(month_range)
                     approved_count += 1
         
         if approved_count == 0:
             raise HTTPException(status_code=404, detail="No pending entries found")
-        
+
+        await update_ope_data(
+            employee_code, touched_ids,
+            {"employeeId": employee_code},
+            {"$set": entry_updates}
+        )
+
         status_doc = await db["Status"].find_one({"employeeId": employee_code})
-        
+
         partner_code = None
+        status_updates = {}
         
         if status_doc:
             approval_status = status_doc.get("approval_status", [])
@@ -2853,26 +5120,17 @@ async def approve_employee_entries(
             for i, ps in enumerate(approval_status):
                 if ps.get("payroll_month") in payroll_months_approved:
                     total_levels = ps.get("total_levels", 2)
-                    submitter_type = ps.get("submitter_type", "Employee")
-                    
-                    print(f"\n📊 Processing payroll: {ps.get('payroll_month')}")
-                    print(f"   Total Levels: {total_levels}")
-                    print(f"   Submitter Type: {submitter_type}")
                     
                     if total_levels == 2:
-                        await db["Status"].update_one(
-                            {"employeeId": employee_code},
-                            {"$set": {
-                                f"approval_status.{i}.L1.status": True,
-                                f"approval_status.{i}.L1.approver_code": reporting_emp_code,
-                                f"approval_status.{i}.L1.approver_name": manager_name,
-                                f"approval_status.{i}.L1.approved_date": current_time,
-                                f"approval_status.{i}.L1.approval_remark": approval_remark,
-                                f"approval_status.{i}.overall_status": "pending",
-                                f"approval_status.{i}.current_level": "L2"
-                            }}
-                        )
-                        print(f"   ✅ 2-level: L1 approved → L2 (HR) pending")
+                        status_updates.update({
+                            f"approval_status.{i}.L1.status": True,
+                            f"approval_status.{i}.L1.approver_code": reporting_emp_code,
+                            f"approval_status.{i}.L1.approver_name": manager_name,
+                            f"approval_status.{i}.L1.approved_date": current_time,
+                            f"approval_status.{i}.L1.approval_remark": approval_remark,
+                            f"approval_status.{i}.overall_status": "pending",
+                            f"approval_status.{i}.current_level": "L2"
+                        })
                         
                     elif total_levels == 3:
                         partner_code = ps.get("L2", {}).get("approver_code")
@@ -2880,89 +5138,41 @@ async def approve_employee_entries(
                         if not partner_code:
                             partner_code = emp.get("PartnerEmpCode", "").strip().upper()
                         
-                        print(f"   🔥 3-level: L1 approved → L2 (Partner: {partner_code}) pending")
                         
-                        await db["Status"].update_one(
-                            {"employeeId": employee_code},
-                            {"$set": {
-                                f"approval_status.{i}.L1.status": True,
-                                f"approval_status.{i}.L1.approver_code": reporting_emp_code,
-                                f"approval_status.{i}.L1.approver_name": manager_name,
-                                f"approval_status.{i}.L1.approved_date": current_time,
-                                f"approval_status.{i}.L1.approval_remark": approval_remark,
-                                f"approval_status.{i}.overall_status": "pending",
-                                f"approval_status.{i}.current_level": "L2"
-                            }}
-                        )
+                        status_updates.update({
+                            f"approval_status.{i}.L1.status": True,
+                            f"approval_status.{i}.L1.approver_code": reporting_emp_code,
+                            f"approval_status.{i}.L1.approver_name": manager_name,
+                            f"approval_status.{i}.L1.approved_date": current_time,
+                            f"approval_status.{i}.L1.approval_remark": approval_remark,
+                            f"approval_status.{i}.overall_status": "pending",
+                            f"approval_status.{i}.current_level": "L2"
+                        })
+
+        if status_updates:
+            await update_status_and_queue(
+                employee_code,
+                {"employeeId": employee_code},
+                {"$set": status_updates}
+            )
         
-        await db["Pending"].update_one(
-            {"ReportingEmpCode": emp_reporting_manager_code},
-            {"$pull": {"EmployeesCodes": employee_code}}
+        await db["Approved"].update_one(
+            {"ReportingEmpCode": reporting_emp_code},
+            {"$addToSet": {"EmployeesCodes": employee_code}},
+            upsert=True
         )
-        print(f"✅ Removed from Manager's Pending")
-        
-        approved_doc = await db["Approved"].find_one({"ReportingEmpCode": reporting_emp_code})
-        if not approved_doc:
-            await db["Approved"].insert_one({
-                "ReportingEmpCode": reporting_emp_code,
-                "EmployeesCodes": [employee_code]
-            })
-            print(f"✅ Created NEW Approved document")
-        else:
-            if employee_code not in approved_doc.get("EmployeesCodes", []):
-                await db["Approved"].update_one(
-                    {"ReportingEmpCode": reporting_emp_code},
-                    {"$addToSet": {"EmployeesCodes": employee_code}}
-                )
-                print(f"✅ Added to Manager's Approved collection")
+        logger.debug("✅ Added to Manager's Approved collection")
         
+        # Approval_queue already moved the months to their next approver
         if partner_code:
-            print(f"\n🔥 ROUTING TO PARTNER: {partner_code}")
-            
-            partner_pending_doc = await db["Pending"].find_one({"ReportingEmpCode": partner_code})
-            
-            if not partner_pending_doc:
-                await db["Pending"].insert_one({
-                    "ReportingEmpCode": partner_code,
-                    "EmployeesCodes": [employee_code]
-                })
-                print(f"   ✅ Created NEW Pending document for Partner {partner_code}")
-            else:
-                if employee_code not in partner_pending_doc.get("EmployeesCodes", []):
-                    await db["Pending"].update_one(
-                        {"ReportingEmpCode": partner_code},
-                        {"$addToSet": {"EmployeesCodes": employee_code}}
-                    )
-                    print(f"   ✅ Added to Partner's Pending collection")
+            logger.debug("🔥 ROUTED TO PARTNER: %s", partner_code)
         else:
-            # 2-level approval: RM approved → Add to HR_Pending
-            print(f"\n🏥 ROUTING TO HR PENDING")
-            
-            hr_pending_doc = await db["HR_Pending"].find_one({"HR_Code": "JHS729"})
-            
-            if not hr_pending_doc:
-                await db["HR_Pending"].insert_one({
-                    "HR_Code": "JHS729",
-                    "EmployeesCodes": [employee_code],
-                    "last_updated": datetime.utcnow()
-                })
-                print(f"   ✅ Created NEW HR_Pending document")
-            else:
-                if employee_code not in hr_pending_doc.get("EmployeesCodes", []):
-                    await db["HR_Pending"].update_one(
-                        {"HR_Code": "JHS729"},
-                        {
-                            "$addToSet": {"EmployeesCodes": employee_code},
-                            "$set": {"last_updated": datetime.utcnow()}
-                        }
-                    )
-                    print(f"   ✅ Added to HR_Pending collection")
+            logger.debug("🏥 ROUTED TO HR")
         
-        print(f"\n✅✅ APPROVAL COMPLETE")
-        print(f"   Total approved: {approved_count}")
-        print(f"   Approval Remark: {approval_remark}")
-        print(f"   Next level: {'L2 (Partner)' if partner_code else 'L2 (HR)'}")
-        print(f"{'='*60}\n")
+        logger.info("✅✅ APPROVAL COMPLETE")
+        logger.debug("   Total approved: %s", approved_count)
+        logger.debug("   Approval Remark: %s", approval_remark)
+        logger.debug("   Next level: %s", 'L2 (Partner)' if partner_code else 'L2 (HR)')
         
         return {
             "message": f"Approved {approved_count} entries",
@@ -2976,73 +5186,71 @@ async def approve_employee_entries(
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"\n❌❌ ERROR:")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Manager approval failed: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/ope/manager/approved-list")
-async def get_approved_employees_list(current_user=Depends(get_current_user)):
+async def get_approved_employees_list(
+    page: PageRequest = Depends(page_request),
+    current_user=Depends(get_current_user)
+):
     try:
         reporting_emp_code = current_user["employee_code"].strip().upper()
         
-        print(f"📋 Fetching approved list for manager: {reporting_emp_code}")
+        logger.debug("📋 Fetching approved list for manager: %s", reporting_emp_code)
         
-        manager = await db["Reporting_managers"].find_one({"ReportingEmpCode": reporting_emp_code})
+        manager = await get_reporting_manager(reporting_emp_code)
         if not manager:
             raise HTTPException(status_code=403, detail="You are not a reporting manager")
         
-        approved_doc = await db["Approved"].find_one({"ReportingEmpCode": reporting_emp_code})
-        
-        employee_codes = []
-        if approved_doc:
-            employee_codes = approved_doc.get("EmployeesCodes", [])
+        employee_codes, page_info = await read_code_page("Approved", {"ReportingEmpCode": reporting_emp_code}, page)
         
-        print(f"✅ Found {len(employee_codes)} approved employees")
+        logger.debug("✅ Found %s approved employees", len(employee_codes))
         
         return {
             "reporting_manager": reporting_emp_code,
             "employee_codes": employee_codes,
-            "count": len(employee_codes)
+            "count": len(employee_codes),
+            "page": page_info
         }
         
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error: {str(e)}")
+        logger.exception("❌ Error in get_approved_employees_list: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/ope/manager/rejected-list")
-async def get_rejected_employees_list(current_user=Depends(get_current_user)):
+async def get_rejected_employees_list(
+    page: PageRequest = Depends(page_request),
+    current_user=Depends(get_current_user)
+):
     try:
         reporting_emp_code = current_user["employee_code"].strip().upper()
         
-        print(f"📋 Fetching rejected list for manager: {reporting_emp_code}")
+        logger.debug("📋 Fetching rejected list for manager: %s", reporting_emp_code)
         
-        manager = await db["Reporting_managers"].find_one({"ReportingEmpCode": reporting_emp_code})
+        manager = await get_reporting_manager(reporting_emp_code)
         if not manager:
             raise HTTPException(status_code=403, detail="You are not a reporting manager")
         
-        rejected_doc = await db["Rejected"].find_one({"ReportingEmpCode": reporting_emp_code})
+        employee_codes, page_info = await read_code_page("Rejected", {"ReportingEmpCode": reporting_emp_code}, page)
         
-        employee_codes = []
-        if rejected_doc:
-            employee_codes = rejected_doc.get("EmployeesCodes", [])
-        
-        print(f"✅ Found {len(employee_codes)} rejected employees")
+        logger.debug("✅ Found %s rejected employees", len(employee_codes))
         
         return {
             "reporting_manager": reporting_emp_code,
             "employee_codes": employee_codes,
-            "count": len(employee_codes)
+            "count": len(employee_codes),
+            "page": page_info
         }
         
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error: {str(e)}")
+        logger.exception("❌ Error in get_rejected_employees_list: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -3059,9 +5267,9 @@ async def reject_single_entry(
         employee_id = body.get("employee_id")
         reason = body.get("reason", "No reason provided")
         
-        print(f"❌ Rejecting entry {entry_id} for employee {employee_id}")
+        logger.debug("❌ Rejecting entry %s for employee %s", entry_id, employee_id)
         
-        manager = await db["Reporting_managers"].find_one({"ReportingEmpCode": reporting_emp_code})
+        manager = await get_reporting_manager(reporting_emp_code)
         if not manager:
             raise HTTPException(status_code=403, detail="You are not a reporting manager")
         
@@ -3079,7 +5287,8 @@ async def reject_single_entry(
             for month_range, entries in data_item.items():
                 for j, entry in enumerate(entries):
                     if str(entry.get("_id")) == entry_id and entry.get("status") == "approved":
-                        await db["OPE_data"].update_one(
+                        await update_ope_data(
+                            employee_id, [entry.get("_id")],
                             {"employeeId": employee_id},
                             {"$set": {
                                 f"Data.{i}.{month_range}.{j}.status": "rejected",
@@ -3092,7 +5301,8 @@ async def reject_single_entry(
                         
                         status_id = entry.get("status_id")
                         if status_id:
-                            await db["Status"].update_one(
+                            await update_status_and_queue(
+                                employee_id,
                                 {"_id": ObjectId(status_id)},
                                 {"$set": {
                                     "overall_status": "rejected",
@@ -3109,7 +5319,7 @@ async def reject_single_entry(
         
         if not updated:
             raise HTTPException(status_code=404, detail="Entry not found or not approved")
-        
+
         all_rejected = True
         for i, data_item in enumerate(data_array):
             for month_range, entries in data_item.items():
@@ -3119,13 +5329,13 @@ async def reject_single_entry(
                         break
         
         if all_rejected:
-            print(f"🔄 Moving employee from Approved → Rejected")
+            logger.debug("🔄 Moving employee from Approved → Rejected")
             
             await db["Approved"].update_one(
                 {"ReportingEmpCode": reporting_emp_code},
                 {"$pull": {"EmployeesCodes": employee_id}}
             )
-            print(f"✅ Removed from Approved")
+            logger.debug("✅ Removed from Approved")
             
             rejected_doc = await db["Rejected"].find_one({"ReportingEmpCode": reporting_emp_code})
             if not rejected_doc:
@@ -3133,23 +5343,21 @@ async def reject_single_entry(
                     "ReportingEmpCode": reporting_emp_code,
                     "EmployeesCodes": [employee_id]
                 })
-                print(f"✅ Created NEW Rejected document")
+                logger.debug("✅ Created NEW Rejected document")
             else:
                 if employee_id not in rejected_doc.get("EmployeesCodes", []):
                     await db["Rejected"].update_one(
                         {"ReportingEmpCode": reporting_emp_code},
                         {"$addToSet": {"EmployeesCodes": employee_id}}
                     )
-                    print(f"✅ Added to Rejected collection")
+                    logger.debug("✅ Added to Rejected collection")
         
         return {"message": "Entry rejected successfully"}
         
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error in reject_single_entry: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
     
 
@@ -3165,14 +5373,12 @@ async def approve_single_entry(
         entry_id = body.get("entry_id")
         employee_id = body.get("employee_id")
         
-        print(f"\n{'='*60}")
-        print(f"✅ APPROVING REJECTED ENTRY")
-        print(f"Manager: {reporting_emp_code}")
-        print(f"Employee: {employee_id}")
-        print(f"Entry ID: {entry_id}")
-        print(f"{'='*60}\n")
+        logger.debug("✅ APPROVING REJECTED ENTRY")
+        logger.debug("Manager: %s", reporting_emp_code)
+        logger.debug("Employee: %s", employee_id)
+        logger.debug("Entry ID: %s", entry_id)
         
-        manager = await db["Reporting_managers"].find_one({"ReportingEmpCode": reporting_emp_code})
+        manager = await get_reporting_manager(reporting_emp_code)
         if not manager:
             raise HTTPException(status_code=403, detail="You are not a reporting manager")
         
@@ -3190,7 +5396,8 @@ async def approve_single_entry(
             for month_range, entries in data_item.items():
                 for j, entry in enumerate(entries):
                     if str(entry.get("_id")) == entry_id and entry.get("status") == "rejected":
-                        await db["OPE_data"].update_one(
+                        await update_ope_data(
+                            employee_id, [entry.get("_id")],
                             {"employeeId": employee_id},
                             {"$set": {
                                 f"Data.{i}.{month_range}.{j}.status": "approved",
@@ -3206,7 +5413,8 @@ async def approve_single_entry(
                         
                         status_id = entry.get("status_id")
                         if status_id:
-                            await db["Status"].update_one(
+                            await update_status_and_queue(
+                                employee_id,
                                 {"_id": ObjectId(status_id)},
                                 {"$set": {
                                     "overall_status": "approved",
@@ -3220,14 +5428,13 @@ async def approve_single_entry(
                             )
                         
                         updated = True
-                        print(f"✅ Entry updated to approved")
                         break
             if updated:
                 break
         
         if not updated:
             raise HTTPException(status_code=404, detail="Entry not found or not rejected")
-        
+
         all_approved = True
         any_rejected = False
         
@@ -3243,18 +5450,18 @@ async def approve_single_entry(
                         elif entry_status != "approved":
                             all_approved = False
         
-        print(f"📊 Status check:")
-        print(f"   All approved: {all_approved}")
-        print(f"   Any rejected: {any_rejected}")
+        logger.debug("📊 Status check:")
+        logger.debug("   All approved: %s", all_approved)
+        logger.debug("   Any rejected: %s", any_rejected)
         
         if not any_rejected:
-            print(f"🔄 Moving employee from Rejected → Approved")
+            logger.debug("🔄 Moving employee from Rejected → Approved")
             
             await db["Rejected"].update_one(
                 {"ReportingEmpCode": reporting_emp_code},
                 {"$pull": {"EmployeesCodes": employee_id}}
             )
-            print(f"✅ Removed from Rejected collection")
+            logger.debug("✅ Removed from Rejected collection")
             
             approved_doc = await db["Approved"].find_one({"ReportingEmpCode": reporting_emp_code})
             if not approved_doc:
@@ -3262,29 +5469,26 @@ async def approve_single_entry(
                     "ReportingEmpCode": reporting_emp_code,
                     "EmployeesCodes": [employee_id]
                 })
-                print(f"✅ Created NEW Approved document")
+                logger.debug("✅ Created NEW Approved document")
             else:
                 if employee_id not in approved_doc.get("EmployeesCodes", []):
                     await db["Approved"].update_one(
                         {"ReportingEmpCode": reporting_emp_code},
                         {"$addToSet": {"EmployeesCodes": employee_id}}
                     )
-                    print(f"✅ Added to Approved collection")
+                    logger.debug("✅ Added to Approved collection")
                 else:
-                    print(f"⚠️ Employee already in Approved collection")
+                    logger.warning("⚠️ Employee already in Approved collection")
         else:
-            print(f"⚠️ Employee still has rejected entries, not moving collections")
+            logger.warning("⚠️ Employee still has rejected entries, not moving collections")
         
-        print(f"{'='*60}\n")
         
         return {"message": "Entry approved successfully"}
         
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error in approve_single_entry: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
         
 @app.get("/api/ope/status/{employee_code}")
@@ -3293,13 +5497,11 @@ async def get_employee_status(employee_code: str, current_user=Depends(get_curre
         employee_code = employee_code.strip().upper()
         current_emp_code = current_user["employee_code"].strip().upper()
         
-        print(f"\n{'='*60}")
-        print(f"📊 FETCHING STATUS FOR: {employee_code}")
-        print(f"{'='*60}\n")
+        logger.debug("📊 FETCHING STATUS FOR: %s", employee_code)
 
         is_hr = (current_emp_code == "JHS729")
-        is_manager = await db["Reporting_managers"].find_one({"ReportingEmpCode": current_emp_code})
-        is_partner = await db["Partner"].find_one({"PartnerEmpCode": current_emp_code})
+        is_manager = await get_reporting_manager(current_emp_code)
+        is_partner = await get_partner(current_emp_code)
 
         if current_emp_code != employee_code and not is_hr and not is_manager and not is_partner:
             raise HTTPException(status_code=403, detail="Access denied")
@@ -3307,19 +5509,17 @@ async def get_employee_status(employee_code: str, current_user=Depends(get_curre
         status_doc = await db["Status"].find_one({"employeeId": employee_code})
         
         if not status_doc:
-            print(f"📭 No status document found for {employee_code}")
+            logger.debug("📭 No status document found for %s", employee_code)
             return {"status_entries": []}
         
         approval_status = status_doc.get("approval_status", [])
         
-        print(f"✅ Found {len(approval_status)} payroll months")
+        logger.debug("✅ Found %s payroll months", len(approval_status))
         
         status_entries = []
         
         for ps_index, ps in enumerate(approval_status):
-            print(f"\n{'─'*40}")
-            print(f"📅 Processing payroll: {ps.get('payroll_month')}")
-            print(f"{'─'*40}")
+            logger.debug("📅 Processing payroll: %s", ps.get('payroll_month'))
             
             L1 = ps.get("L1", {})
             L2 = ps.get("L2", {})
@@ -3345,7 +5545,7 @@ async def get_employee_status(employee_code: str, current_user=Depends(get_curre
                 rejected_date = L1.get("rejected_date")
                 rejection_reason = L1.get("rejection_reason")
                 overall_status = "rejected"
-                print(f"   ❌ L1 REJECTED")
+                logger.debug("   ❌ L1 REJECTED")
             
             elif L2.get("rejected", False) or L2.get("rejected_by"):
                 is_rejected = True
@@ -3355,7 +5555,7 @@ async def get_employee_status(employee_code: str, current_user=Depends(get_curre
                 rejected_date = L2.get("rejected_date")
                 rejection_reason = L2.get("rejection_reason")
                 overall_status = "rejected"
-                print(f"   ❌ L2 REJECTED")
+                logger.debug("   ❌ L2 REJECTED")
             
             elif L3 and (L3.get("rejected", False) or L3.get("rejected_by")):
                 is_rejected = True
@@ -3365,7 +5565,7 @@ async def get_employee_status(employee_code: str, current_user=Depends(get_curre
                 rejected_date = L3.get("rejected_date")
                 rejection_reason = L3.get("rejection_reason")
                 overall_status = "rejected"
-                print(f"   ❌ L3 REJECTED")
+                logger.debug("   ❌ L3 REJECTED")
             
             entry = {
                 "employeeId": employee_code,
@@ -3436,23 +5636,18 @@ async def get_employee_status(employee_code: str, current_user=Depends(get_curre
             status_entries.append(entry)
             
             if is_rejected:
-                print(f"\n   🚨 FINAL: REJECTED at {rejected_level}")
+                logger.debug("   🚨 FINAL: REJECTED at %s", rejected_level)
                 if rejection_reason:
-                    print(f"      Reason: {rejection_reason[:50]}...")
+                    logger.debug("      Reason: %s...", rejection_reason[:50])
             else:
-                print(f"\n   ✅ FINAL: {overall_status.upper()}")
+                logger.debug("   ✅ FINAL: %s", overall_status.upper())
         
-        print(f"\n{'='*60}")
-        print(f"✅ Returning {len(status_entries)} status entries")
-        print(f"{'='*60}\n")
+        logger.info("✅ Returning %s status entries", len(status_entries))
         
         return {"status_entries": status_entries}
         
     except Exception as e:
-        print(f"\n❌❌ ERROR fetching status:")
-        print(f"   {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌❌ ERROR fetching status: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
         
 # HR API
@@ -3470,12 +5665,10 @@ async def hr_approve_employee(
         body = await request.json()
         approval_remark = body.get("remark", "Approved without remark")
         
-        print(f"\n{'='*60}")
-        print(f"✅ HR APPROVAL REQUEST")
-        print(f"HR: {hr_emp_code}")
-        print(f"Employee: {employee_code}")
-        print(f"Remark: {approval_remark}")
-        print(f"{'='*60}\n")
+        logger.debug("✅ HR APPROVAL REQUEST")
+        logger.debug("HR: %s", hr_emp_code)
+        logger.debug("Employee: %s", employee_code)
+        logger.debug("Remark: %s", approval_remark)
         
         if hr_emp_code != "JHS729":
             raise HTTPException(status_code=403, detail="Only HR can perform this action")
@@ -3490,6 +5683,9 @@ async def hr_approve_employee(
         
         data_array = ope_doc.get("Data", [])
         payroll_months_approved = set()
+        # All entry changes go out as one $set on the employee document
+        entry_updates = {}
+        touched_ids = []
         
         for i, data_item in enumerate(data_array):
             for month_range, entries in data_item.items():
@@ -3497,95 +5693,86 @@ async def hr_approve_employee(
                     entry_status = entry.get("status", "").lower()
                     
                     if entry_status in ["approved", "rejected"]:
-                        await db["OPE_data"].update_one(
-                            {"employeeId": employee_code},
-                            {"$set": {
-                                f"Data.{i}.{month_range}.{j}.status": "approved",
-                                f"Data.{i}.{month_range}.{j}.hr_approved": True,
-                                f"Data.{i}.{month_range}.{j}.hr_approved_by": hr_emp_code,
-                                f"Data.{i}.{month_range}.{j}.hr_approved_date": current_time,
-                                f"Data.{i}.{month_range}.{j}.approved_by": hr_emp_code,
-                                f"Data.{i}.{month_range}.{j}.approver_name": "HR",
-                                f"Data.{i}.{month_range}.{j}.approved_date": current_time,
-                                f"Data.{i}.{month_range}.{j}.approval_remark": approval_remark,
-                                f"Data.{i}.{month_range}.{j}.rejected_by": None,
-                                f"Data.{i}.{month_range}.{j}.rejector_name": None,
-                                f"Data.{i}.{month_range}.{j}.rejected_date": None,
-                                f"Data.{i}.{month_range}.{j}.rejection_reason": None,
-                                f"Data.{i}.{month_range}.{j}.rejected_level": None
-                            }}
-                        )
+                        entry_updates.update({
+                            f"Data.{i}.{month_range}.{j}.status": "approved",
+                            f"Data.{i}.{month_range}.{j}.hr_approved": True,
+                            f"Data.{i}.{month_range}.{j}.hr_approved_by": hr_emp_code,
+                            f"Data.{i}.{month_range}.{j}.hr_approved_date": current_time,
+                            f"Data.{i}.{month_range}.{j}.approved_by": hr_emp_code,
+                            f"Data.{i}.{month_range}.{j}.approver_name": "HR",
+                            f"Data.{i}.{month_range}.{j}.approved_date": current_time,
+                            f"Data.{i}.{month_range}.{j}.approval_remark": approval_remark,
+                            f"Data.{i}.{month_range}.{j}.rejected_by": None,
+                            f"Data.{i}.{month_range}.{j}.rejector_name": None,
+                            f"Data.{i}.{month_range}.{j}.rejected_date": None,
+                            f"Data.{i}.{month_range}.{j}.rejection_reason": None,
+                            f"Data.{i}.{month_range}.{j}.rejected_level": None
+                        })
+                        touched_ids.append(entry.get("_id"))
                         
                         payroll_months_approved.add(month_range)
                         approved_count += 1
         
         if approved_count == 0:
             raise HTTPException(status_code=404, detail="No entries found for HR approval")
-        
+
+        await update_ope_data(
+            employee_code, touched_ids,
+            {"employeeId": employee_code},
+            {"$set": entry_updates}
+        )
+
         status_doc = await db["Status"].find_one({"employeeId": employee_code})
         
         if status_doc:
             approval_status = status_doc.get("approval_status", [])
+            status_updates = {}
             
             for i, ps in enumerate(approval_status):
                 if ps.get("payroll_month") in payroll_months_approved:
                     total_levels = ps.get("total_levels", 2)
                     
                     if total_levels == 2:
-                        await db["Status"].update_one(
-                            {"employeeId": employee_code},
-                            {"$set": {
-                                f"approval_status.{i}.L2.status": True,
-                                f"approval_status.{i}.L2.approver_code": hr_emp_code,
-                                f"approval_status.{i}.L2.approver_name": "HR",
-                                f"approval_status.{i}.L2.approved_date": current_time,
-                                f"approval_status.{i}.L2.approval_remark": approval_remark,
-                                f"approval_status.{i}.overall_status": "approved",
-                                f"approval_status.{i}.current_level": "Completed"
-                            }}
-                        )
+                        status_updates.update({
+                            f"approval_status.{i}.L2.status": True,
+                            f"approval_status.{i}.L2.approver_code": hr_emp_code,
+                            f"approval_status.{i}.L2.approver_name": "HR",
+                            f"approval_status.{i}.L2.approved_date": current_time,
+                            f"approval_status.{i}.L2.approval_remark": approval_remark,
+                            f"approval_status.{i}.overall_status": "approved",
+                            f"approval_status.{i}.current_level": "Completed"
+                        })
                     elif total_levels == 3:
-                        await db["Status"].update_one(
-                            {"employeeId": employee_code},
-                            {"$set": {
-                                f"approval_status.{i}.L3.status": True,
-                                f"approval_status.{i}.L3.approver_code": hr_emp_code,
-                                f"approval_status.{i}.L3.approver_name": "HR",
-                                f"approval_status.{i}.L3.approved_date": current_time,
-                                f"approval_status.{i}.L3.approval_remark": approval_remark,
-                                f"approval_status.{i}.overall_status": "approved",
-                                f"approval_status.{i}.current_level": "Completed"
-                            }}
-                        )
-        
-        hr_approved_doc = await db["HR_Approved"].find_one({"HR_Code": hr_emp_code})
-        
-        if not hr_approved_doc:
-            await db["HR_Approved"].insert_one({
-                "HR_Code": hr_emp_code,
-                "EmployeesCodes": [employee_code]
-            })
-        else:
-            if employee_code not in hr_approved_doc.get("EmployeesCodes", []):
-                await db["HR_Approved"].update_one(
-                    {"HR_Code": hr_emp_code},
-                    {"$addToSet": {"EmployeesCodes": employee_code}}
+                        status_updates.update({
+                            f"approval_status.{i}.L3.status": True,
+                            f"approval_status.{i}.L3.approver_code": hr_emp_code,
+                            f"approval_status.{i}.L3.approver_name": "HR",
+                            f"approval_status.{i}.L3.approved_date": current_time,
+                            f"approval_status.{i}.L3.approval_remark": approval_remark,
+                            f"approval_status.{i}.overall_status": "approved",
+                            f"approval_status.{i}.current_level": "Completed"
+                        })
+
+            if status_updates:
+                await update_status_and_queue(
+                    employee_code,
+                    {"employeeId": employee_code},
+                    {"$set": status_updates}
                 )
         
-        await db["HR_Rejected"].update_one(
+        await db["HR_Approved"].update_one(
             {"HR_Code": hr_emp_code},
-            {"$pull": {"EmployeesCodes": employee_code}}
+            {"$addToSet": {"EmployeesCodes": employee_code}},
+            upsert=True
         )
         
-        # Remove from HR_Pending
-        await db["HR_Pending"].update_one(
-            {"HR_Code": "JHS729"},
+        await db["HR_Rejected"].update_one(
+            {"HR_Code": hr_emp_code},
             {"$pull": {"EmployeesCodes": employee_code}}
         )
-        print(f"✅ Removed from HR_Pending")
         
-        print(f"✅ HR approved {approved_count} entries")
-        print(f"   Approval Remark: {approval_remark}")
+        logger.info("✅ HR approved %s entries for %s", approved_count, employee_code)
+        logger.debug("   Approval Remark: %s", approval_remark)
         
         return {
             "message": f"HR approved {approved_count} entries",
@@ -3596,9 +5783,7 @@ async def hr_approve_employee(
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error in hr_approve_employee: %s", e)
         raise HTTPException(status_code=500, detail=str(e))        
 
 @app.post("/api/ope/hr/reject/{employee_code}")
@@ -3614,11 +5799,9 @@ async def hr_reject_employee(
         body = await request.json()
         rejection_reason = body.get("reason", "No reason provided")
         
-        print(f"\n{'='*60}")
-        print(f"❌ HR REJECTION REQUEST")
-        print(f"HR: {hr_emp_code}")
-        print(f"Employee: {employee_code}")
-        print(f"{'='*60}\n")
+        logger.debug("❌ HR REJECTION REQUEST")
+        logger.debug("HR: %s", hr_emp_code)
+        logger.debug("Employee: %s", employee_code)
         
         if hr_emp_code != "JHS729":
             raise HTTPException(status_code=403, detail="Only HR can perform this action")
@@ -3633,6 +5816,9 @@ async def hr_reject_employee(
         
         data_array = ope_doc.get("Data", [])
         payroll_months_rejected = set()
+        # All entry changes go out as one $set on the employee document
+        entry_updates = {}
+        touched_ids = []
         
         for i, data_item in enumerate(data_array):
             for month_range, entries in data_item.items():
@@ -3640,86 +5826,77 @@ async def hr_reject_employee(
                     entry_status = entry.get("status", "").lower()
                     
                     if entry_status == "approved":
-                        await db["OPE_data"].update_one(
-                            {"employeeId": employee_code},
-                            {"$set": {
-                                f"Data.{i}.{month_range}.{j}.status": "rejected",
-                                f"Data.{i}.{month_range}.{j}.rejected_by": hr_emp_code,
-                                f"Data.{i}.{month_range}.{j}.rejector_name": "HR",
-                                f"Data.{i}.{month_range}.{j}.rejected_date": current_time,
-                                f"Data.{i}.{month_range}.{j}.rejection_reason": rejection_reason,
-                                f"Data.{i}.{month_range}.{j}.rejected_level": "L2",
-                                f"Data.{i}.{month_range}.{j}.hr_approved": False,
-                                f"Data.{i}.{month_range}.{j}.hr_approved_by": None,
-                                f"Data.{i}.{month_range}.{j}.hr_approved_date": None
-                            }}
-                        )
+                        entry_updates.update({
+                            f"Data.{i}.{month_range}.{j}.status": "rejected",
+                            f"Data.{i}.{month_range}.{j}.rejected_by": hr_emp_code,
+                            f"Data.{i}.{month_range}.{j}.rejector_name": "HR",
+                            f"Data.{i}.{month_range}.{j}.rejected_date": current_time,
+                            f"Data.{i}.{month_range}.{j}.rejection_reason": rejection_reason,
+                            f"Data.{i}.{month_range}.{j}.rejected_level": "L2",
+                            f"Data.{i}.{month_range}.{j}.hr_approved": False,
+                            f"Data.{i}.{month_range}.{j}.hr_approved_by": None,
+                            f"Data.{i}.{month_range}.{j}.hr_approved_date": None
+                        })
+                        touched_ids.append(entry.get("_id"))
                         
                         payroll_months_rejected.add(month_range)
                         rejected_count += 1
         
         if rejected_count == 0:
             raise HTTPException(status_code=404, detail="No entries found for HR rejection")
-        
+
+        await update_ope_data(
+            employee_code, touched_ids,
+            {"employeeId": employee_code},
+            {"$set": entry_updates}
+        )
+
         status_doc = await db["Status"].find_one({"employeeId": employee_code})
         
         if status_doc:
             approval_status = status_doc.get("approval_status", [])
+            status_updates = {}
             
             for i, ps in enumerate(approval_status):
                 if ps.get("payroll_month") in payroll_months_rejected:
                     total_levels = ps.get("total_levels", 2)
                     
                     if total_levels == 2:
-                        await db["Status"].update_one(
-                            {"employeeId": employee_code},
-                            {"$set": {
-                                f"approval_status.{i}.L2.status": False,
-                                f"approval_status.{i}.L2.rejected_by": hr_emp_code,
-                                f"approval_status.{i}.L2.rejected_date": current_time,
-                                f"approval_status.{i}.overall_status": "rejected",
-                                f"approval_status.{i}.rejection_reason": rejection_reason
-                            }}
-                        )
+                        status_updates.update({
+                            f"approval_status.{i}.L2.status": False,
+                            f"approval_status.{i}.L2.rejected_by": hr_emp_code,
+                            f"approval_status.{i}.L2.rejected_date": current_time,
+                            f"approval_status.{i}.overall_status": "rejected",
+                            f"approval_status.{i}.rejection_reason": rejection_reason
+                        })
                     elif total_levels == 3:
-                        await db["Status"].update_one(
-                            {"employeeId": employee_code},
-                            {"$set": {
-                                f"approval_status.{i}.L3.status": False,
-                                f"approval_status.{i}.L3.rejected_by": hr_emp_code,
-                                f"approval_status.{i}.L3.rejected_date": current_time,
-                                f"approval_status.{i}.overall_status": "rejected",
-                                f"approval_status.{i}.rejection_reason": rejection_reason
-                            }}
-                        )
-        
-        hr_rejected_doc = await db["HR_Rejected"].find_one({"HR_Code": hr_emp_code})
-        
-        if not hr_rejected_doc:
-            await db["HR_Rejected"].insert_one({
-                "HR_Code": hr_emp_code,
-                "EmployeesCodes": [employee_code]
-            })
-        else:
-            if employee_code not in hr_rejected_doc.get("EmployeesCodes", []):
-                await db["HR_Rejected"].update_one(
-                    {"HR_Code": hr_emp_code},
-                    {"$addToSet": {"EmployeesCodes": employee_code}}
+                        status_updates.update({
+                            f"approval_status.{i}.L3.status": False,
+                            f"approval_status.{i}.L3.rejected_by": hr_emp_code,
+                            f"approval_status.{i}.L3.rejected_date": current_time,
+                            f"approval_status.{i}.overall_status": "rejected",
+                            f"approval_status.{i}.rejection_reason": rejection_reason
+                        })
+
+            if status_updates:
+                await update_status_and_queue(
+                    employee_code,
+                    {"employeeId": employee_code},
+                    {"$set": status_updates}
                 )
         
-        await db["HR_Approved"].update_one(
+        await db["HR_Rejected"].update_one(
             {"HR_Code": hr_emp_code},
-            {"$pull": {"EmployeesCodes": employee_code}}
+            {"$addToSet": {"EmployeesCodes": employee_code}},
+            upsert=True
         )
         
-        # Remove from HR_Pending
-        await db["HR_Pending"].update_one(
-            {"HR_Code": "JHS729"},
+        await db["HR_Approved"].update_one(
+            {"HR_Code": hr_emp_code},
             {"$pull": {"EmployeesCodes": employee_code}}
         )
-        print(f"✅ Removed from HR_Pending")
         
-        print(f"✅ HR rejected {rejected_count} entries")
+        logger.info("✅ HR rejected %s entries for %s", rejected_count, employee_code)
         
         return {
             "message": f"HR rejected {rejected_count} entries",
@@ -3729,9 +5906,7 @@ async def hr_reject_employee(
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error in hr_reject_employee: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
     
 
@@ -3757,79 +5932,69 @@ async def get_hr_pending_employees(current_user=Depends(get_current_user)):
         if hr_emp_code != "JHS729":
             raise HTTPException(status_code=403, detail="Only HR can access this endpoint")
         
-        print(f"\n{'='*60}")
-        print(f"📋 HR PENDING EMPLOYEES REQUEST")
-        print(f"HR: {hr_emp_code}")
-        print(f"{'='*60}\n")
+        logger.debug("📋 HR PENDING EMPLOYEES REQUEST")
+        logger.debug("HR: %s", hr_emp_code)
         
-        # Get HR_Pending collection
-        hr_pending_doc = await db["HR_Pending"].find_one({"HR_Code": "JHS729"})
+        # HR's queue items carry the Status month they stand for
+        queue_by_employee = group_queue_by_employee(
+            await get_approval_queue("JHS729", levels=["L2", "L3"])
+        )
         
-        employee_codes = []
-        if hr_pending_doc:
-            employee_codes = hr_pending_doc.get("EmployeesCodes", [])
+        logger.debug("📊 Found %s employees in HR queue", len(queue_by_employee))
         
-        print(f"📊 Found {len(employee_codes)} employees in HR_Pending")
+        emp_docs = await employee_directory.get_many(queue_by_employee) if queue_by_employee else {}
         
         employees_data = []
         
-        for emp_code in employee_codes:
-            print(f"\n👤 Processing employee: {emp_code}")
+        for emp_code, queue_items in queue_by_employee.items():
             
             # Get employee details
-            emp_doc = await db["Employee_details"].find_one({"EmpID": emp_code})
+            emp_doc = emp_docs.get(emp_code)
             emp_name = emp_doc.get("EmpName", "Unknown") if emp_doc else "Unknown"
             
-            # Get status information
-            status_doc = await db["Status"].find_one({"employeeId": emp_code})
-            
-            if status_doc:
-                approval_status = status_doc.get("approval_status", [])
+            for queue_item in queue_items:
+                ps = queue_item["approval"]
+                overall_status = ps.get("overall_status", "pending")
+                current_level = ps.get("current_level", "L1")
                 
-                for ps in approval_status:
-                    overall_status = ps.get("overall_status", "pending")
-                    current_level = ps.get("current_level", "L1")
+                # Only include entries that are pending HR approval
+                if overall_status == "pending" and current_level in ["L2", "L3"]:
+                    total_levels = ps.get("total_levels", 2)
                     
-                    # Only include entries that are pending HR approval
-                    if overall_status == "pending" and current_level in ["L2", "L3"]:
-                        total_levels = ps.get("total_levels", 2)
-                        
-                        # Determine if this is ready for HR approval
-                        is_ready_for_hr = False
-                        
-                        if total_levels == 2 and current_level == "L2":
-                            # 2-level: L1 approved, now at L2 (HR)
-                            L1 = ps.get("L1", {})
-                            if L1.get("status", False):
-                                is_ready_for_hr = True
-                        
-                        elif total_levels == 3 and current_level == "L3":
-                            # 3-level: L1 and L2 approved, now at L3 (HR)
-                            L1 = ps.get("L1", {})
-                            L2 = ps.get("L2", {})
-                            if L1.get("status", False) and L2.get("status", False):
-                                is_ready_for_hr = True
+                    # Determine if this is ready for HR approval
+                    is_ready_for_hr = False
+                    
+                    if total_levels == 2 and current_level == "L2":
+                        # 2-level: L1 approved, now at L2 (HR)
+                        L1 = ps.get("L1", {})
+                        if L1.get("status", False):
+                            is_ready_for_hr = True
+                    
+                    elif total_levels == 3 and current_level == "L3":
+                        # 3-level: L1 and L2 approved, now at L3 (HR)
+                        L1 = ps.get("L1", {})
+                        L2 = ps.get("L2", {})
+                        if L1.get("status", False) and L2.get("status", False):
+                            is_ready_for_hr = True
+                    
+                    if is_ready_for_hr:
+                        employees_data.append({
+                            "employeeId": emp_code,
+                            "employeeName": emp_name,
+                            "payroll_month": ps.get("payroll_month"),
+                            "ope_label": ps.get("ope_label"),
+                            "total_amount": ps.get("total_amount"),
+                            "total_levels": total_levels,
+                            "current_level": current_level,
+                            "overall_status": overall_status,
+                            "submission_date": ps.get("submission_date"),
+                            "L1": ps.get("L1", {}),
+                            "L2": ps.get("L2", {}) if total_levels == 3 else {},
+                            "limit": ps.get("limit")
+                        })
                         
-                        if is_ready_for_hr:
-                            employees_data.append({
-                                "employeeId": emp_code,
-                                "employeeName": emp_name,
-                                "payroll_month": ps.get("payroll_month"),
-                                "ope_label": ps.get("ope_label"),
-                                "total_amount": ps.get("total_amount"),
-                                "total_levels": total_levels,
-                                "current_level": current_level,
-                                "overall_status": overall_status,
-                                "submission_date": ps.get("submission_date"),
-                                "L1": ps.get("L1", {}),
-                                "L2": ps.get("L2", {}) if total_levels == 3 else {},
-                                "limit": ps.get("limit")
-                            })
-                            
-                            print(f"   ✅ Added to pending list: {ps.get('payroll_month')} - ₹{ps.get('total_amount')}")
         
-        print(f"\n✅ Returning {len(employees_data)} pending entries for HR approval")
-        print(f"{'='*60}\n")
+        logger.debug("✅ Returning %s pending entries for HR approval", len(employees_data))
         
         return {
             "pending_employees": employees_data,
@@ -3839,72 +6004,66 @@ async def get_hr_pending_employees(current_user=Depends(get_current_user)):
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error in get_hr_pending_employees: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/ope/hr/approved-employees")
-async def get_hr_approved_employees(current_user=Depends(get_current_user)):
+async def get_hr_approved_employees(
+    page: PageRequest = Depends(page_request),
+    current_user=Depends(get_current_user)
+):
     try:
         hr_emp_code = current_user["employee_code"].strip().upper()
         
         if hr_emp_code != "JHS729":
             raise HTTPException(status_code=403, detail="Only HR can access this")
         
-        print(f"📋 Fetching HR approved employees")
-        
-        hr_approved_doc = await db["HR_Approved"].find_one({"HR_Code": hr_emp_code})
+        logger.debug("📋 Fetching HR approved employees")
         
-        employee_codes = []
-        if hr_approved_doc:
-            employee_codes = hr_approved_doc.get("EmployeesCodes", [])
+        employee_codes, page_info = await read_code_page("HR_Approved", {"HR_Code": hr_emp_code}, page)
         
-        print(f"✅ Found {len(employee_codes)} HR approved employees")
+        logger.debug("✅ Found %s HR approved employees", len(employee_codes))
         
         return {
             "employee_codes": employee_codes,
-            "count": len(employee_codes)
+            "count": len(employee_codes),
+            "page": page_info
         }
         
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error in get_hr_approved_employees: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/ope/hr/rejected-employees")
-async def get_hr_rejected_employees(current_user=Depends(get_current_user)):
+async def get_hr_rejected_employees(
+    page: PageRequest = Depends(page_request),
+    current_user=Depends(get_current_user)
+):
     try:
         hr_emp_code = current_user["employee_code"].strip().upper()
         
         if hr_emp_code != "JHS729":
             raise HTTPException(status_code=403, detail="Only HR can access this")
         
-        print(f"📋 Fetching HR rejected employees")
+        logger.debug("📋 Fetching HR rejected employees")
         
-        hr_rejected_doc = await db["HR_Rejected"].find_one({"HR_Code": hr_emp_code})
+        employee_codes, page_info = await read_code_page("HR_Rejected", {"HR_Code": hr_emp_code}, page)
         
-        employee_codes = []
-        if hr_rejected_doc:
-            employee_codes = hr_rejected_doc.get("EmployeesCodes", [])
-        
-        print(f"✅ Found {len(employee_codes)} HR rejected employees")
+        logger.debug("✅ Found %s HR rejected employees", len(employee_codes))
         
         return {
             "employee_codes": employee_codes,
-            "count": len(employee_codes)
+            "count": len(employee_codes),
+            "page": page_info
         }
         
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error in get_hr_rejected_employees: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
         
 @app.get("/api/check-partner/{employee_code}")
@@ -3912,19 +6071,19 @@ async def check_if_partner(employee_code: str, current_user=Depends(get_current_
     try:
         emp_code = employee_code.strip().upper()
         
-        print(f"🔍 Checking if {emp_code} is a Partner...")
+        logger.debug("🔍 Checking if %s is a Partner...", emp_code)
         
         if current_user["employee_code"].upper() != emp_code:
             raise HTTPException(status_code=403, detail="Access denied")
         
-        partner = await db["Partner"].find_one({"PartnerEmpCode": emp_code})
+        partner = await get_partner(emp_code)
         
         is_partner = partner is not None
         
         if is_partner:
-            print(f"✅ {emp_code} IS a Partner")
+            logger.debug("✅ %s IS a Partner", emp_code)
         else:
-            print(f"❌ {emp_code} is NOT a Partner")
+            logger.debug("❌ %s is NOT a Partner", emp_code)
         
         return {
             "employee_code": emp_code,
@@ -3933,7 +6092,7 @@ async def check_if_partner(employee_code: str, current_user=Depends(get_current_
         }
         
     except Exception as e:
-        print(f"❌ Error checking partner role: {str(e)}")
+        logger.exception("❌ Error checking partner role: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
     
 
@@ -3942,211 +6101,137 @@ async def get_partner_pending(current_user: dict = Depends(get_current_user)):
     try:
         partner_code = current_user.get("employee_code")
         
-        print(f"\n{'='*60}")
-        print(f"🔍 PARTNER PENDING REQUEST FROM: {partner_code}")
-        print(f"{'='*60}\n")
+        logger.debug("🔍 PARTNER PENDING REQUEST FROM: %s", partner_code)
         
-        partner_pending = await db["Pending"].find_one({"ReportingEmpCode": partner_code})
+        partner_code = partner_code.strip().upper()
+        queue_by_employee = group_queue_by_employee(
+            await get_approval_queue(partner_code, levels=["L1", "L2"])
+        )
         
-        if not partner_pending or not partner_pending.get("EmployeesCodes"):
-            print("📭 No pending employees")
+        if not queue_by_employee:
+            logger.debug("📭 No pending employees")
             return {"employees": []}
         
-        pending_emp_codes = partner_pending.get("EmployeesCodes", [])
-        print(f"📊 Found {len(pending_emp_codes)} employees in Pending")
-        print(f"   Codes: {pending_emp_codes}")
+        pending_emp_codes = list(queue_by_employee)
+        logger.debug("📊 Found %s employees in partner's queue", len(pending_emp_codes))
+        logger.debug("   Codes: %s", pending_emp_codes)
+        
+        # Employee / OPE_data for the whole queue in one $in query each
+        employees = await employee_master.get_many(pending_emp_codes)
+        ope_docs = await get_ope_docs_by_employee(pending_emp_codes)
         
         employees_list = []
         
-        for emp_code in pending_emp_codes:
-            print(f"\n{'='*40}")
-            print(f"✅ Processing: {emp_code}")
-            print(f"{'='*40}")
-            
-            status_docs = await db["Status"].find({
-                "employeeId": emp_code
-            }).to_list(length=None)
+        for emp_code, queue_items in queue_by_employee.items():
             
-            print(f"   📋 Found {len(status_docs)} Status docs")
-            
-            if not status_docs:
-                print(f"   ❌ No Status - SKIP")
-                continue
-            
-            employee = await db["Employee"].find_one({"EmployeeId": emp_code})
+            employee = employees.get(emp_code)
             
             if not employee:
-                print(f"   ⚠️ Employee not found - using fallback")
                 employee = {
                     "EmployeeId": emp_code,
-                    "EmployeeName": status_docs[0].get("employeeName", emp_code),
+                    "EmployeeName": queue_items[0].get("employee_name") or emp_code,
                     "Designation": "N/A",
                     "Department": "N/A",
                     "OPE_limit": 5000
                 }
             
-            print(f"   👤 Name: {employee.get('EmployeeName')}")
             
-            ope_doc = await db["OPE_data"].find_one({"employeeId": emp_code})
+            ope_doc = ope_docs.get(emp_code)
             
             if not ope_doc:
-                print(f"   ❌ No OPE_data document - SKIP")
                 continue
             
-            print(f"   ✅ OPE_data document found")
             
-            for status_doc in status_docs:
-                approval_status_raw = status_doc.get("approval_status")
+            for queue_item in queue_items:
+                approval_status = queue_item["approval"]
+                month_range = queue_item["payroll_month"]
+                total_levels = queue_item["total_levels"]
+                current_level = queue_item["level"]
+                submitter_type = queue_item["submitter_type"]
+                
                 
-                print(f"\n   📄 Status Document")
-                print(f"      Type: {type(approval_status_raw).__name__}")
+                l1_approver = "N/A"
+                l1_approved_date = None
                 
-                if isinstance(approval_status_raw, list):
-                    approval_status_array = approval_status_raw
-                elif isinstance(approval_status_raw, dict):
-                    approval_status_array = [approval_status_raw]
+                if current_level == "L1":
+                    l1_approver = "Self (RM)" if submitter_type == "Reporting_Manager" else "Pending"
                 else:
-                    print(f"      ❌ Unknown format - SKIP")
-                    continue
+                    L1 = approval_status.get("L1", {})
+                    l1_approver = L1.get("approver_name", "Unknown")
+                    l1_approved_date = L1.get("approved_date")
                 
-                for idx, approval_status in enumerate(approval_status_array):
-                    print(f"\n   📋 Processing approval_status[{idx}]")
-                    
-                    month_range = approval_status.get("payroll_month") or approval_status.get("month_range")
-                    total_levels = approval_status.get("total_levels", 2)
-                    current_level = approval_status.get("current_level", "L1")
-                    overall_status = approval_status.get("overall_status", "pending")
-                    submitter_type = approval_status.get("submitter_type", "Employee")
-                    
-                    print(f"      Month: {month_range}")
-                    print(f"      Total Levels: {total_levels}")
-                    print(f"      Current Level: {current_level}")
-                    print(f"      Overall Status: {overall_status}")
-                    
-                    if overall_status != "pending":
-                        print(f"      ⚠️ Not pending - SKIP")
-                        continue
-                    
-                    if not month_range:
-                        print(f"      ⚠️ No month_range - SKIP")
-                        continue
-                    
-                    partner_is_approver = False
-                    l1_approver = "N/A"
-                    l1_approved_date = None
-                    
-                    if current_level == "L1":
-                        L1 = approval_status.get("L1", {})
-                        l1_approver_code = L1.get("approver_code")
-                        
-                        print(f"      L1 Approver: {l1_approver_code}")
-                        
-                        if l1_approver_code == partner_code:
-                            partner_is_approver = True
-                            l1_approver = "Self (RM)" if submitter_type == "Reporting_Manager" else "Pending"
-                            print(f"      ✅ MATCH! Partner is L1 approver")
-                    
-                    elif current_level == "L2":
-                        L2 = approval_status.get("L2", {})
-                        l2_approver_code = L2.get("approver_code")
+                
+                entries = []
+                data_array = ope_doc.get("Data", [])
+                
+                
+                for data_item in data_array:
+                    if month_range in data_item:
+                        month_entries = data_item[month_range]
                         
-                        print(f"      L2 Approver: {l2_approver_code}")
+                        entry_status = "pending" if submitter_type == "Reporting_Manager" else "approved"
                         
-                        if l2_approver_code == partner_code:
-                            partner_is_approver = True
-                            L1 = approval_status.get("L1", {})
-                            l1_approver = L1.get("approver_name", "Unknown")
-                            l1_approved_date = L1.get("approved_date")
-                            print(f"      ✅ MATCH! Partner is L2 approver")
-                    
-                    if not partner_is_approver:
-                        print(f"      ❌ Partner NOT approver - SKIP")
-                        continue
-                    
-                    print(f"      🔍 Looking for entries in nested Data structure")
-                    
-                    entries = []
-                    data_array = ope_doc.get("Data", [])
-                    
-                    print(f"      📦 OPE_data.Data has {len(data_array)} items")
-                    
-                    for data_item in data_array:
-                        if month_range in data_item:
-                            month_entries = data_item[month_range]
-                            print(f"      ✅ Found month '{month_range}' with {len(month_entries)} entries")
-                            
-                            entry_status = "pending" if submitter_type == "Reporting_Manager" else "approved"
+                        for entry in month_entries:
+                            e_status = entry.get("status", "").lower()
                             
-                            for entry in month_entries:
-                                e_status = entry.get("status", "").lower()
-                                
-                                if e_status == entry_status or entry_status == "approved":
-                                    entries.append(entry)
-                                    print(f"         ✅ Entry: {entry.get('date')} | ₹{entry.get('amount')} | status={e_status}")
-                            
-                            break
-                    
-                    print(f"      📦 Total entries found: {len(entries)}")
-                    
-                    if not entries:
-                        print(f"      ❌ No entries - SKIP")
-                        continue
-                    
-                    total_amount = sum(float(e.get("amount", 0)) for e in entries)
-                    
-                    formatted_entries = []
-                    for entry in entries:
-                        formatted_entries.append({
-                            "_id": str(entry.get("_id", "")),
-                            "date": entry.get("date"),
-                            "client": entry.get("client"),
-                            "project_id": entry.get("project_id"),
-                            "project_name": entry.get("project_name"),
-                            "project_type": entry.get("project_type"),
-                            "location_from": entry.get("location_from"),
-                            "location_to": entry.get("location_to"),
-                            "travel_mode": entry.get("travel_mode"),
-                            "amount": entry.get("amount"),
-                            "remarks": entry.get("remarks"),
-                            "ticket_pdf": entry.get("ticket_pdf"),    # GridFS ID
-                            "month_range": month_range,
-                            "total_levels": total_levels,
-                            "current_level": current_level,
-                            "submitter_type": submitter_type
-                        })
-                    
-                    employees_list.append({
-                        "employeeId": emp_code,
-                        "employeeName": employee.get("EmployeeName"),
-                        "designation": employee.get("Designation", "N/A"),
-                        "department": employee.get("Department", "N/A"),
-                        "reportingManager": employee.get("Reporting_Manager", "N/A"),
-                        "payroll_month": month_range,
-                        "total_amount": total_amount,
-                        "limit": employee.get("OPE_limit", 5000),
-                        "pending_entries": len(entries),
+                            if e_status == entry_status or entry_status == "approved":
+                                entries.append(entry)
+                        
+                        break
+                
+                
+                if not entries:
+                    continue
+                
+                total_amount = sum(float(e.get("amount", 0)) for e in entries)
+                
+                formatted_entries = []
+                for entry in entries:
+                    formatted_entries.append({
+                        "_id": str(entry.get("_id", "")),
+                        "date": entry.get("date"),
+                        "client": entry.get("client"),
+                        "project_id": entry.get("project_id"),
+                        "project_name": entry.get("project_name"),
+                        "project_type": entry.get("project_type"),
+                        "location_from": entry.get("location_from"),
+                        "location_to": entry.get("location_to"),
+                        "travel_mode": entry.get("travel_mode"),
+                        "amount": entry.get("amount"),
+                        "remarks": entry.get("remarks"),
+                        "ticket_pdf": entry.get("ticket_pdf"),    # GridFS ID
+                        "month_range": month_range,
                         "total_levels": total_levels,
                         "current_level": current_level,
-                        "L1_approver": l1_approver,
-                        "L1_approved_date": l1_approved_date,
-                        "submission_date": approval_status.get("submission_date"),
-                        "submitter_type": submitter_type,
-                        "entries": formatted_entries
+                        "submitter_type": submitter_type
                     })
-                    
-                    print(f"      ✅ Added to response")
-                    print(f"         Entries: {len(entries)}, Amount: ₹{total_amount}")
+                
+                employees_list.append({
+                    "employeeId": emp_code,
+                    "employeeName": employee.get("EmployeeName"),
+                    "designation": employee.get("Designation", "N/A"),
+                    "department": employee.get("Department", "N/A"),
+                    "reportingManager": employee.get("Reporting_Manager", "N/A"),
+                    "payroll_month": month_range,
+                    "total_amount": total_amount,
+                    "limit": employee.get("OPE_limit", 5000),
+                    "pending_entries": len(entries),
+                    "total_levels": total_levels,
+                    "current_level": current_level,
+                    "L1_approver": l1_approver,
+                    "L1_approved_date": l1_approved_date,
+                    "submission_date": approval_status.get("submission_date"),
+                    "submitter_type": submitter_type,
+                    "entries": formatted_entries
+                })
+                
         
-        print(f"\n{'='*60}")
-        print(f"✅ FINAL: Returning {len(employees_list)} employees")
-        print(f"{'='*60}\n")
+        logger.debug("✅ FINAL: Returning %s employees", len(employees_list))
         
         return {"employees": employees_list}
         
     except Exception as e:
-        print(f"❌ Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error in get_partner_pending: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -4163,14 +6248,12 @@ async def partner_approve_employee(
         body = await request.json()
         approval_remark = body.get("remark", "Approved without remark")
         
-        print(f"\n{'='*60}")
-        print(f"✅ PARTNER APPROVAL REQUEST")
-        print(f"Partner: {partner_emp_code}")
-        print(f"Employee: {employee_code}")
-        print(f"Remark: {approval_remark}")
-        print(f"{'='*60}\n")
+        logger.debug("✅ PARTNER APPROVAL REQUEST")
+        logger.debug("Partner: %s", partner_emp_code)
+        logger.debug("Employee: %s", employee_code)
+        logger.debug("Remark: %s", approval_remark)
         
-        partner = await db["Partner"].find_one({"PartnerEmpCode": partner_emp_code})
+        partner = await get_partner(partner_emp_code)
         if not partner:
             raise HTTPException(status_code=403, detail="You are not a Partner")
         
@@ -4186,51 +6269,56 @@ async def partner_approve_employee(
         
         data_array = ope_doc.get("Data", [])
         payroll_months_approved = set()
+        # All entry changes go out as one $set on the employee document
+        entry_updates = {}
+        touched_ids = []
         
-        print(f"📦 OPE_data.Data has {len(data_array)} items")
+        logger.debug("📦 OPE_data.Data has %s items", len(data_array))
         
         for i, data_item in enumerate(data_array):
             for month_range, entries in data_item.items():
-                print(f"\n📅 Processing month: {month_range}")
-                print(f"   Entries: {len(entries)}")
                 
                 for j, entry in enumerate(entries):
                     entry_status = entry.get("status", "").lower()
                     
                     if entry_status in ["pending", "approved"]:
-                        await db["OPE_data"].update_one(
-                            {"employeeId": employee_code},
-                            {"$set": {
-                                f"Data.{i}.{month_range}.{j}.status": "approved",
-                                f"Data.{i}.{month_range}.{j}.partner_approved": True,
-                                f"Data.{i}.{month_range}.{j}.partner_approved_by": partner_emp_code,
-                                f"Data.{i}.{month_range}.{j}.partner_approved_date": current_time,
-                                f"Data.{i}.{month_range}.{j}.partner_name": partner_name,
-                                f"Data.{i}.{month_range}.{j}.approval_remark": approval_remark,
-                                f"Data.{i}.{month_range}.{j}.L2_approved": True,
-                                f"Data.{i}.{month_range}.{j}.L2_approver_code": partner_emp_code,
-                                f"Data.{i}.{month_range}.{j}.L2_approver_name": partner_name
-                            }}
-                        )
+                        entry_updates.update({
+                            f"Data.{i}.{month_range}.{j}.status": "approved",
+                            f"Data.{i}.{month_range}.{j}.partner_approved": True,
+                            f"Data.{i}.{month_range}.{j}.partner_approved_by": partner_emp_code,
+                            f"Data.{i}.{month_range}.{j}.partner_approved_date": current_time,
+                            f"Data.{i}.{month_range}.{j}.partner_name": partner_name,
+                            f"Data.{i}.{month_range}.{j}.approval_remark": approval_remark,
+                            f"Data.{i}.{month_range}.{j}.L2_approved": True,
+                            f"Data.{i}.{month_range}.{j}.L2_approver_code": partner_emp_code,
+                            f"Data.{i}.{month_range}.{j}.L2_approver_name": partner_name
+                        })
+                        touched_ids.append(entry.get("_id"))
                         
                         payroll_months_approved.add(month_range)
                         approved_count += 1
-                        print(f"   ✅ Approved entry {j+1}: {entry.get('date')} | ₹{entry.get('amount')}")
         
         if approved_count == 0:
             raise HTTPException(status_code=404, detail="No pending entries found for approval")
-        
-        print(f"\n✅ Total entries approved: {approved_count}")
+
+        await update_ope_data(
+            employee_code, touched_ids,
+            {"employeeId": employee_code},
+            {"$set": entry_updates}
+        )
+
+        logger.info("✅ Total entries approved: %s", approved_count)
         
         status_doc = await db["Status"].find_one({"employeeId": employee_code})
         
         if status_doc:
             approval_status_array = status_doc.get("approval_status", [])
             
-            print(f"\n📊 Updating Status collection...")
+            logger.debug("📊 Updating Status collection...")
             
             if isinstance(approval_status_array, dict):
                 approval_status_array = [approval_status_array]
+            status_updates = {}
             
             for i, approval_status in enumerate(approval_status_array):
                 payroll_month = approval_status.get("payroll_month") or approval_status.get("month_range")
@@ -4239,107 +6327,60 @@ async def partner_approve_employee(
                     total_levels = approval_status.get("total_levels", 2)
                     submitter_type = approval_status.get("submitter_type", "Employee")
                     
-                    print(f"   📋 Month: {payroll_month}")
-                    print(f"      Total Levels: {total_levels}")
-                    print(f"      Submitter: {submitter_type}")
                     
                     if submitter_type == "Reporting_Manager":
-                        await db["Status"].update_one(
-                            {"employeeId": employee_code},
-                            {"$set": {
-                                f"approval_status.{i}.L1.status": True,
-                                f"approval_status.{i}.L1.approver_code": partner_emp_code,
-                                f"approval_status.{i}.L1.approver_name": partner_name,
-                                f"approval_status.{i}.L1.approved_date": current_time,
-                                f"approval_status.{i}.L1.approval_remark": approval_remark,
-                                f"approval_status.{i}.current_level": "L2",
-                                f"approval_status.{i}.overall_status": "pending"
-                            }}
-                        )
-                        print(f"      ✅ RM: L1 approved → L2 (HR) pending")
+                        status_updates.update({
+                            f"approval_status.{i}.L1.status": True,
+                            f"approval_status.{i}.L1.approver_code": partner_emp_code,
+                            f"approval_status.{i}.L1.approver_name": partner_name,
+                            f"approval_status.{i}.L1.approved_date": current_time,
+                            f"approval_status.{i}.L1.approval_remark": approval_remark,
+                            f"approval_status.{i}.current_level": "L2",
+                            f"approval_status.{i}.overall_status": "pending"
+                        })
                     
                     elif total_levels == 3:
-                        await db["Status"].update_one(
-                            {"employeeId": employee_code},
-                            {"$set": {
-                                f"approval_status.{i}.L2.status": True,
-                                f"approval_status.{i}.L2.approver_code": partner_emp_code,
-                                f"approval_status.{i}.L2.approver_name": partner_name,
-                                f"approval_status.{i}.L2.approved_date": current_time,
-                                f"approval_status.{i}.L2.approval_remark": approval_remark,
-                                f"approval_status.{i}.current_level": "L3",
-                                f"approval_status.{i}.overall_status": "pending"
-                            }}
-                        )
-                        print(f"      ✅ 3-level: L2 approved → L3 (HR) pending")
+                        status_updates.update({
+                            f"approval_status.{i}.L2.status": True,
+                            f"approval_status.{i}.L2.approver_code": partner_emp_code,
+                            f"approval_status.{i}.L2.approver_name": partner_name,
+                            f"approval_status.{i}.L2.approved_date": current_time,
+                            f"approval_status.{i}.L2.approval_remark": approval_remark,
+                            f"approval_status.{i}.current_level": "L3",
+                            f"approval_status.{i}.overall_status": "pending"
+                        })
                     
                     elif total_levels == 2:
-                        await db["Status"].update_one(
-                            {"employeeId": employee_code},
-                            {"$set": {
-                                f"approval_status.{i}.L1.status": True,
-                                f"approval_status.{i}.L1.approver_code": partner_emp_code,
-                                f"approval_status.{i}.L1.approver_name": partner_name,
-                                f"approval_status.{i}.L1.approved_date": current_time,
-                                f"approval_status.{i}.L1.approval_remark": approval_remark,
-                                f"approval_status.{i}.current_level": "L2",
-                                f"approval_status.{i}.overall_status": "pending"
-                            }}
-                        )
-                        print(f"      ✅ 2-level: L1 approved → L2 (HR) pending")
-        
-        await db["Pending"].update_one(
-            {"ReportingEmpCode": partner_emp_code},
-            {"$pull": {"EmployeesCodes": employee_code}}
-        )
-        print(f"\n✅ Removed from Partner's Pending")
-        
-        partner_approved_doc = await db["Partner_Approved"].find_one(
-            {"PartnerEmpCode": partner_emp_code}
-        )
-        
-        if not partner_approved_doc:
-            await db["Partner_Approved"].insert_one({
-                "PartnerEmpCode": partner_emp_code,
-                "EmployeesCodes": [employee_code]
-            })
-            print(f"✅ Created NEW Partner_Approved document")
-        else:
-            if employee_code not in partner_approved_doc.get("EmployeesCodes", []):
-                await db["Partner_Approved"].update_one(
-                    {"PartnerEmpCode": partner_emp_code},
-                    {"$addToSet": {"EmployeesCodes": employee_code}}
+                        status_updates.update({
+                            f"approval_status.{i}.L1.status": True,
+                            f"approval_status.{i}.L1.approver_code": partner_emp_code,
+                            f"approval_status.{i}.L1.approver_name": partner_name,
+                            f"approval_status.{i}.L1.approved_date": current_time,
+                            f"approval_status.{i}.L1.approval_remark": approval_remark,
+                            f"approval_status.{i}.current_level": "L2",
+                            f"approval_status.{i}.overall_status": "pending"
+                        })
+
+            if status_updates:
+                await update_status_and_queue(
+                    employee_code,
+                    {"employeeId": employee_code},
+                    {"$set": status_updates}
                 )
-                print(f"✅ Added to Partner_Approved collection")
-        
-        # Add to HR_Pending for final approval
-        print(f"\n🏥 ROUTING TO HR PENDING")
         
-        hr_pending_doc = await db["HR_Pending"].find_one({"HR_Code": "JHS729"})
+        await db["Partner_Approved"].update_one(
+            {"PartnerEmpCode": partner_emp_code},
+            {"$addToSet": {"EmployeesCodes": employee_code}},
+            upsert=True
+        )
+        logger.debug("✅ Added to Partner_Approved collection")
         
-        if not hr_pending_doc:
-            await db["HR_Pending"].insert_one({
-                "HR_Code": "JHS729",
-                "EmployeesCodes": [employee_code],
-                "last_updated": datetime.utcnow()
-            })
-            print(f"   ✅ Created NEW HR_Pending document")
-        else:
-            if employee_code not in hr_pending_doc.get("EmployeesCodes", []):
-                await db["HR_Pending"].update_one(
-                    {"HR_Code": "JHS729"},
-                    {
-                        "$addToSet": {"EmployeesCodes": employee_code},
-                        "$set": {"last_updated": datetime.utcnow()}
-                    }
-                )
-                print(f"   ✅ Added to HR_Pending collection")
+        # Approval_queue already moved the months on to HR
+        logger.debug("🏥 ROUTED TO HR")
         
-        print(f"\n{'='*60}")
-        print(f"✅ Partner approved {approved_count} entries for {employee_code}")
-        print(f"   Approval Remark: {approval_remark}")
-        print(f"   Next Level: HR")
-        print(f"{'='*60}\n")
+        logger.info("✅ Partner approved %s entries for %s", approved_count, employee_code)
+        logger.debug("   Approval Remark: %s", approval_remark)
+        logger.debug("   Next Level: HR")
         
         return {
             "message": f"Successfully approved {approved_count} entries",
@@ -4351,9 +6392,7 @@ async def partner_approve_employee(
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error in partner approve: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error in partner approve: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
     
 
@@ -4361,8 +6400,7 @@ async def partner_approve_employee(
 async def debug_partner_pending(partner_code: str):
     partner_code = partner_code.strip().upper()
     
-    pending = await db["Pending"].find_one({"ReportingEmpCode": partner_code})
-    emp_codes = pending.get("EmployeesCodes", []) if pending else []
+    emp_codes = queued_employee_codes(await get_approval_queue(partner_code))
     
     result = {"pending_employees": emp_codes, "status_details": []}
     
@@ -4402,14 +6440,12 @@ async def partner_reject_employee(
         body = await request.json()
         rejection_reason = body.get("reason", "No reason provided")
         
-        print(f"\n{'='*60}")
-        print(f"❌ PARTNER REJECTION REQUEST")
-        print(f"Partner: {partner_emp_code}")
-        print(f"Employee: {employee_code}")
-        print(f"Reason: {rejection_reason}")
-        print(f"{'='*60}\n")
+        logger.debug("❌ PARTNER REJECTION REQUEST")
+        logger.debug("Partner: %s", partner_emp_code)
+        logger.debug("Employee: %s", employee_code)
+        logger.debug("Reason: %s", rejection_reason)
         
-        partner = await db["Partner"].find_one({"PartnerEmpCode": partner_emp_code})
+        partner = await get_partner(partner_emp_code)
         if not partner:
             raise HTTPException(status_code=403, detail="You are not a Partner")
         
@@ -4425,48 +6461,53 @@ async def partner_reject_employee(
         
         data_array = ope_doc.get("Data", [])
         payroll_months_rejected = set()
+        # All entry changes go out as one $set on the employee document
+        entry_updates = {}
+        touched_ids = []
         
-        print(f"📦 OPE_data.Data has {len(data_array)} items")
+        logger.debug("📦 OPE_data.Data has %s items", len(data_array))
         
         for i, data_item in enumerate(data_array):
             for month_range, entries in data_item.items():
-                print(f"\n📅 Processing month: {month_range}")
-                print(f"   Entries: {len(entries)}")
                 
                 for j, entry in enumerate(entries):
                     entry_status = entry.get("status", "").lower()
                     
                     if entry_status in ["pending", "approved"]:
-                        await db["OPE_data"].update_one(
-                            {"employeeId": employee_code},
-                            {"$set": {
-                                f"Data.{i}.{month_range}.{j}.status": "rejected",
-                                f"Data.{i}.{month_range}.{j}.rejected_by": partner_emp_code,
-                                f"Data.{i}.{month_range}.{j}.rejector_name": partner_name,
-                                f"Data.{i}.{month_range}.{j}.rejected_date": current_time,
-                                f"Data.{i}.{month_range}.{j}.rejection_reason": rejection_reason,
-                                f"Data.{i}.{month_range}.{j}.rejected_level": "L2"
-                            }}
-                        )
+                        entry_updates.update({
+                            f"Data.{i}.{month_range}.{j}.status": "rejected",
+                            f"Data.{i}.{month_range}.{j}.rejected_by": partner_emp_code,
+                            f"Data.{i}.{month_range}.{j}.rejector_name": partner_name,
+                            f"Data.{i}.{month_range}.{j}.rejected_date": current_time,
+                            f"Data.{i}.{month_range}.{j}.rejection_reason": rejection_reason,
+                            f"Data.{i}.{month_range}.{j}.rejected_level": "L2"
+                        })
+                        touched_ids.append(entry.get("_id"))
                         
                         payroll_months_rejected.add(month_range)
                         rejected_count += 1
-                        print(f"   ❌ Rejected entry {j+1}: {entry.get('date')} | ₹{entry.get('amount')}")
         
         if rejected_count == 0:
             raise HTTPException(status_code=404, detail="No pending entries found for rejection")
-        
-        print(f"\n❌ Total entries rejected: {rejected_count}")
+
+        await update_ope_data(
+            employee_code, touched_ids,
+            {"employeeId": employee_code},
+            {"$set": entry_updates}
+        )
+
+        logger.info("❌ Total entries rejected: %s", rejected_count)
         
         status_doc = await db["Status"].find_one({"employeeId": employee_code})
         
         if status_doc:
             approval_status_array = status_doc.get("approval_status", [])
             
-            print(f"\n📊 Updating Status collection...")
+            logger.debug("📊 Updating Status collection...")
             
             if isinstance(approval_status_array, dict):
                 approval_status_array = [approval_status_array]
+            status_updates = {}
             
             for i, approval_status in enumerate(approval_status_array):
                 payroll_month = approval_status.get("payroll_month") or approval_status.get("month_range")
@@ -4475,79 +6516,52 @@ async def partner_reject_employee(
                     total_levels = approval_status.get("total_levels", 2)
                     submitter_type = approval_status.get("submitter_type", "Employee")
                     
-                    print(f"   📋 Month: {payroll_month}")
-                    print(f"      Total Levels: {total_levels}")
-                    print(f"      Submitter: {submitter_type}")
                     
                     if submitter_type == "Reporting_Manager":
-                        await db["Status"].update_one(
-                            {"employeeId": employee_code},
-                            {"$set": {
-                                f"approval_status.{i}.L1.status": False,
-                                f"approval_status.{i}.L1.rejected_by": partner_emp_code,
-                                f"approval_status.{i}.L1.rejected_date": current_time,
-                                f"approval_status.{i}.overall_status": "rejected",
-                                f"approval_status.{i}.rejection_reason": rejection_reason,
-                                f"approval_status.{i}.rejected_level": "L1"
-                            }}
-                        )
-                        print(f"      ❌ RM: L1 rejected")
+                        status_updates.update({
+                            f"approval_status.{i}.L1.status": False,
+                            f"approval_status.{i}.L1.rejected_by": partner_emp_code,
+                            f"approval_status.{i}.L1.rejected_date": current_time,
+                            f"approval_status.{i}.overall_status": "rejected",
+                            f"approval_status.{i}.rejection_reason": rejection_reason,
+                            f"approval_status.{i}.rejected_level": "L1"
+                        })
                     
                     elif total_levels == 3:
-                        await db["Status"].update_one(
-                            {"employeeId": employee_code},
-                            {"$set": {
-                                f"approval_status.{i}.L2.status": False,
-                                f"approval_status.{i}.L2.rejected_by": partner_emp_code,
-                                f"approval_status.{i}.L2.rejected_date": current_time,
-                                f"approval_status.{i}.overall_status": "rejected",
-                                f"approval_status.{i}.rejection_reason": rejection_reason,
-                                f"approval_status.{i}.rejected_level": "L2"
-                            }}
-                        )
-                        print(f"      ❌ 3-level: L2 rejected")
+                        status_updates.update({
+                            f"approval_status.{i}.L2.status": False,
+                            f"approval_status.{i}.L2.rejected_by": partner_emp_code,
+                            f"approval_status.{i}.L2.rejected_date": current_time,
+                            f"approval_status.{i}.overall_status": "rejected",
+                            f"approval_status.{i}.rejection_reason": rejection_reason,
+                            f"approval_status.{i}.rejected_level": "L2"
+                        })
                     
                     elif total_levels == 2:
-                        await db["Status"].update_one(
-                            {"employeeId": employee_code},
-                            {"$set": {
-                                f"approval_status.{i}.L1.status": False,
-                                f"approval_status.{i}.L1.rejected_by": partner_emp_code,
-                                f"approval_status.{i}.L1.rejected_date": current_time,
-                                f"approval_status.{i}.overall_status": "rejected",
-                                f"approval_status.{i}.rejection_reason": rejection_reason,
-                                f"approval_status.{i}.rejected_level": "L1"
-                            }}
-                        )
-                        print(f"      ❌ 2-level: L1 rejected")
-        
-        await db["Pending"].update_one(
-            {"ReportingEmpCode": partner_emp_code},
-            {"$pull": {"EmployeesCodes": employee_code}}
-        )
-        print(f"\n✅ Removed from Partner's Pending")
+                        status_updates.update({
+                            f"approval_status.{i}.L1.status": False,
+                            f"approval_status.{i}.L1.rejected_by": partner_emp_code,
+                            f"approval_status.{i}.L1.rejected_date": current_time,
+                            f"approval_status.{i}.overall_status": "rejected",
+                            f"approval_status.{i}.rejection_reason": rejection_reason,
+                            f"approval_status.{i}.rejected_level": "L1"
+                        })
+
+            if status_updates:
+                await update_status_and_queue(
+                    employee_code,
+                    {"employeeId": employee_code},
+                    {"$set": status_updates}
+                )
         
-        partner_rejected_doc = await db["Partner_Rejected"].find_one(
-            {"PartnerEmpCode": partner_emp_code}
+        await db["Partner_Rejected"].update_one(
+            {"PartnerEmpCode": partner_emp_code},
+            {"$addToSet": {"EmployeesCodes": employee_code}},
+            upsert=True
         )
+        logger.debug("✅ Added to Partner_Rejected collection")
         
-        if not partner_rejected_doc:
-            await db["Partner_Rejected"].insert_one({
-                "PartnerEmpCode": partner_emp_code,
-                "EmployeesCodes": [employee_code]
-            })
-            print(f"✅ Created NEW Partner_Rejected document")
-        else:
-            if employee_code not in partner_rejected_doc.get("EmployeesCodes", []):
-                await db["Partner_Rejected"].update_one(
-                    {"PartnerEmpCode": partner_emp_code},
-                    {"$addToSet": {"EmployeesCodes": employee_code}}
-                )
-                print(f"✅ Added to Partner_Rejected collection")
-        
-        print(f"\n{'='*60}")
-        print(f"❌ Partner rejected {rejected_count} entries for {employee_code}")
-        print(f"{'='*60}\n")
+        logger.info("❌ Partner rejected %s entries for %s", rejected_count, employee_code)
         
         return {
             "message": f"Successfully rejected {rejected_count} entries",
@@ -4558,35 +6572,35 @@ async def partner_reject_employee(
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error in partner reject: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error in partner reject: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/ope/partner/approved-list")
-async def get_partner_approved_list(current_user=Depends(get_current_user)):
+async def get_partner_approved_list(
+    page: PageRequest = Depends(page_request),
+    current_user=Depends(get_current_user)
+):
     try:
         partner_emp_code = current_user["employee_code"].strip().upper()
         
-        partner = await db["Partner"].find_one({"PartnerEmpCode": partner_emp_code})
+        partner = await get_partner(partner_emp_code)
         if not partner:
             raise HTTPException(status_code=403, detail="You are not a Partner")
         
-        partner_approved_doc = await db["Partner_Approved"].find_one(
-            {"PartnerEmpCode": partner_emp_code}
+        employee_codes, page_info = await read_code_page(
+            "Partner_Approved", {"PartnerEmpCode": partner_emp_code}, page
         )
         
-        employee_codes = []
-        if partner_approved_doc:
-            employee_codes = partner_approved_doc.get("EmployeesCodes", [])
-        
         return {
             "partner_code": partner_emp_code,
             "employee_codes": employee_codes,
-            "count": len(employee_codes)
+            "count": len(employee_codes),
+            "page": page_info
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -4598,7 +6612,7 @@ async def check_user_role_unified(employee_code: str, current_user=Depends(get_c
         if current_user["employee_code"].upper() != emp_code:
             raise HTTPException(status_code=403, detail="Access denied")
         
-        print(f"🔍 Checking unified role for: {emp_code}")
+        logger.debug("🔍 Checking unified role for: %s", emp_code)
         
         role_name = "Employee"
         is_hr = False
@@ -4608,34 +6622,36 @@ async def check_user_role_unified(employee_code: str, current_user=Depends(get_c
         has_approval_permissions = False
         additional_info = {}
         
-        if emp_code == "JHS729":
+        roles = await get_user_roles(emp_code)
+        
+        if roles["is_hr"]:
             is_hr = True
             role_name = "HR"
             has_approval_permissions = True
-            print(f"👔 {emp_code} is HR")
+            logger.debug("👔 %s is HR", emp_code)
             
-        elif await db["Partner"].find_one({"PartnerEmpCode": emp_code}):
-            partner = await db["Partner"].find_one({"PartnerEmpCode": emp_code})
+        elif roles["partner"]:
+            partner = roles["partner"]
             is_partner = True
             role_name = "Partner"
             has_approval_permissions = True
             additional_info["partner_name"] = partner.get("Partner_Name")
-            print(f"👔 {emp_code} is a Partner")
+            logger.debug("👔 %s is a Partner", emp_code)
             
-        elif await db["Reporting_managers"].find_one({"ReportingEmpCode": emp_code}):
-            manager = await db["Reporting_managers"].find_one({"ReportingEmpCode": emp_code})
+        elif roles["manager"]:
+            manager = roles["manager"]
             is_manager = True
             role_name = "Reporting Manager"
             has_approval_permissions = True
             additional_info["manager_name"] = manager.get("ReportingEmpName")
             additional_info["email"] = manager.get("Email ID")
-            print(f"👔 {emp_code} is a Reporting Manager")
+            logger.debug("👔 %s is a Reporting Manager", emp_code)
             
         else:
             is_employee = True
             role_name = "Employee"
             has_approval_permissions = False
-            print(f"👤 {emp_code} is a regular Employee")
+            logger.debug("👤 %s is a regular Employee", emp_code)
         
         return {
             "employee_code": emp_code,
@@ -4651,35 +6667,35 @@ async def check_user_role_unified(employee_code: str, current_user=Depends(get_c
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error checking user role: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error checking user role: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/ope/partner/rejected-list")
-async def get_partner_rejected_list(current_user=Depends(get_current_user)):
+async def get_partner_rejected_list(
+    page: PageRequest = Depends(page_request),
+    current_user=Depends(get_current_user)
+):
     try:
         partner_emp_code = current_user["employee_code"].strip().upper()
         
-        partner = await db["Partner"].find_one({"PartnerEmpCode": partner_emp_code})
+        partner = await get_partner(partner_emp_code)
         if not partner:
             raise HTTPException(status_code=403, detail="You are not a Partner")
         
-        partner_rejected_doc = await db["Partner_Rejected"].find_one(
-            {"PartnerEmpCode": partner_emp_code}
+        employee_codes, page_info = await read_code_page(
+            "Partner_Rejected", {"PartnerEmpCode": partner_emp_code}, page
         )
         
-        employee_codes = []
-        if partner_rejected_doc:
-            employee_codes = partner_rejected_doc.get("EmployeesCodes", [])
-        
         return {
             "partner_code": partner_emp_code,
             "employee_codes": employee_codes,
-            "count": len(employee_codes)
+            "count": len(employee_codes),
+            "page": page_info
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
@@ -4734,15 +6750,13 @@ async def partner_reject_single_entry(
         employee_id = body.get("employee_id")
         reason = body.get("reason", "No reason provided")
         
-        print(f"\n{'='*60}")
-        print(f"❌ PARTNER REJECT SINGLE ENTRY")
-        print(f"Partner: {partner_emp_code}")
-        print(f"Employee: {employee_id}")
-        print(f"Entry ID: {entry_id}")
-        print(f"Reason: {reason}")
-        print(f"{'='*60}\n")
+        logger.debug("❌ PARTNER REJECT SINGLE ENTRY")
+        logger.debug("Partner: %s", partner_emp_code)
+        logger.debug("Employee: %s", employee_id)
+        logger.debug("Entry ID: %s", entry_id)
+        logger.debug("Reason: %s", reason)
         
-        partner = await db["Partner"].find_one({"PartnerEmpCode": partner_emp_code})
+        partner = await get_partner(partner_emp_code)
         if not partner:
             raise HTTPException(status_code=403, detail="You are not a Partner")
         
@@ -4764,9 +6778,9 @@ async def partner_reject_single_entry(
                     if str(entry.get("_id")) == entry_id and entry.get("status") == "approved":
                         payroll_month = month_range
                         
-                        print(f"✅ Found entry: Data.{i}.{month_range}.{j}")
                         
-                        await db["OPE_data"].update_one(
+                        await update_ope_data(
+                            employee_id, [entry.get("_id")],
                             {"employeeId": employee_id},
                             {"$set": {
                                 f"Data.{i}.{month_range}.{j}.status": "rejected",
@@ -4782,14 +6796,13 @@ async def partner_reject_single_entry(
                         )
                         
                         updated = True
-                        print(f"✅ Entry rejected: {entry.get('date')} | ₹{entry.get('amount')}")
                         break
             if updated:
                 break
         
         if not updated:
             raise HTTPException(status_code=404, detail="Entry not found or not approved")
-        
+
         all_rejected = True
         any_approved = False
         
@@ -4803,12 +6816,12 @@ async def partner_reject_single_entry(
                             all_rejected = False
                             break
         
-        print(f"\n📊 Status check:")
-        print(f"   Any approved remaining: {any_approved}")
-        print(f"   All rejected: {all_rejected}")
+        logger.debug("📊 Status check:")
+        logger.debug("   Any approved remaining: %s", any_approved)
+        logger.debug("   All rejected: %s", all_rejected)
         
         if all_rejected and payroll_month:
-            print(f"🔄 All entries rejected - updating Status")
+            logger.debug("🔄 All entries rejected - updating Status")
             
             status_doc = await db["Status"].find_one({"employeeId": employee_id})
             
@@ -4832,7 +6845,8 @@ async def partner_reject_single_entry(
                         else:
                             level_key = "L1"
                         
-                        await db["Status"].update_one(
+                        await update_status_and_queue(
+                            employee_id,
                             {"employeeId": employee_id},
                             {"$set": {
                                 f"approval_status.{i}.{level_key}.status": False,
@@ -4843,17 +6857,16 @@ async def partner_reject_single_entry(
                                 f"approval_status.{i}.rejected_level": level_key
                             }}
                         )
-                        print(f"✅ Status updated: {level_key} rejected")
                         break
         
         if all_rejected:
-            print(f"🔄 Moving employee: Approved → Rejected")
+            logger.debug("🔄 Moving employee: Approved → Rejected")
             
             await db["Partner_Approved"].update_one(
                 {"PartnerEmpCode": partner_emp_code},
                 {"$pull": {"EmployeesCodes": employee_id}}
             )
-            print(f"✅ Removed from Partner_Approved")
+            logger.debug("✅ Removed from Partner_Approved")
             
             partner_rejected_doc = await db["Partner_Rejected"].find_one(
                 {"PartnerEmpCode": partner_emp_code}
@@ -4864,16 +6877,15 @@ async def partner_reject_single_entry(
                     "PartnerEmpCode": partner_emp_code,
                     "EmployeesCodes": [employee_id]
                 })
-                print(f"✅ Created NEW Partner_Rejected document")
+                logger.debug("✅ Created NEW Partner_Rejected document")
             else:
                 if employee_id not in partner_rejected_doc.get("EmployeesCodes", []):
                     await db["Partner_Rejected"].update_one(
                         {"PartnerEmpCode": partner_emp_code},
                         {"$addToSet": {"EmployeesCodes": employee_id}}
                     )
-                    print(f"✅ Added to Partner_Rejected")
+                    logger.debug("✅ Added to Partner_Rejected")
         
-        print(f"{'='*60}\n")
         
         return {
             "message": "Entry rejected successfully",
@@ -4883,9 +6895,7 @@ async def partner_reject_single_entry(
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error in partner_reject_single_entry: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -4901,14 +6911,12 @@ async def partner_approve_single_entry(
         entry_id = body.get("entry_id")
         employee_id = body.get("employee_id")
         
-        print(f"\n{'='*60}")
-        print(f"✅ PARTNER APPROVE SINGLE ENTRY")
-        print(f"Partner: {partner_emp_code}")
-        print(f"Employee: {employee_id}")
-        print(f"Entry ID: {entry_id}")
-        print(f"{'='*60}\n")
+        logger.debug("✅ PARTNER APPROVE SINGLE ENTRY")
+        logger.debug("Partner: %s", partner_emp_code)
+        logger.debug("Employee: %s", employee_id)
+        logger.debug("Entry ID: %s", entry_id)
         
-        partner = await db["Partner"].find_one({"PartnerEmpCode": partner_emp_code})
+        partner = await get_partner(partner_emp_code)
         if not partner:
             raise HTTPException(status_code=403, detail="You are not a Partner")
         
@@ -4930,9 +6938,9 @@ async def partner_approve_single_entry(
                     if str(entry.get("_id")) == entry_id and entry.get("status") == "rejected":
                         payroll_month = month_range
                         
-                        print(f"✅ Found entry: Data.{i}.{month_range}.{j}")
                         
-                        await db["OPE_data"].update_one(
+                        await update_ope_data(
+                            employee_id, [entry.get("_id")],
                             {"employeeId": employee_id},
                             {"$set": {
                                 f"Data.{i}.{month_range}.{j}.status": "approved",
@@ -4949,14 +6957,13 @@ async def partner_approve_single_entry(
                         )
                         
                         updated = True
-                        print(f"✅ Entry approved: {entry.get('date')} | ₹{entry.get('amount')}")
                         break
             if updated:
                 break
         
         if not updated:
             raise HTTPException(status_code=404, detail="Entry not found or not rejected")
-        
+
         no_rejected = True
         any_rejected = False
         
@@ -4970,12 +6977,12 @@ async def partner_approve_single_entry(
                             no_rejected = False
                             break
         
-        print(f"\n📊 Status check:")
-        print(f"   Any rejected remaining: {any_rejected}")
-        print(f"   No rejected: {no_rejected}")
+        logger.debug("📊 Status check:")
+        logger.debug("   Any rejected remaining: %s", any_rejected)
+        logger.debug("   No rejected: %s", no_rejected)
         
         if no_rejected and payroll_month:
-            print(f"🔄 No rejected entries - updating Status")
+            logger.debug("🔄 No rejected entries - updating Status")
             
             status_doc = await db["Status"].find_one({"employeeId": employee_id})
             
@@ -5002,7 +7009,8 @@ async def partner_approve_single_entry(
                             level_key = "L1"
                             next_level = "L2"
                         
-                        await db["Status"].update_one(
+                        await update_status_and_queue(
+                            employee_id,
                             {"employeeId": employee_id},
                             {"$set": {
                                 f"approval_status.{i}.{level_key}.status": True,
@@ -5017,17 +7025,16 @@ async def partner_approve_single_entry(
                                 f"approval_status.{i}.rejected_level": None
                             }}
                         )
-                        print(f"✅ Status updated: {level_key} approved → {next_level} pending")
                         break
         
         if no_rejected:
-            print(f"🔄 Moving employee: Rejected → Approved")
+            logger.debug("🔄 Moving employee: Rejected → Approved")
             
             await db["Partner_Rejected"].update_one(
                 {"PartnerEmpCode": partner_emp_code},
                 {"$pull": {"EmployeesCodes": employee_id}}
             )
-            print(f"✅ Removed from Partner_Rejected")
+            logger.debug("✅ Removed from Partner_Rejected")
             
             partner_approved_doc = await db["Partner_Approved"].find_one(
                 {"PartnerEmpCode": partner_emp_code}
@@ -5038,16 +7045,15 @@ async def partner_approve_single_entry(
                     "PartnerEmpCode": partner_emp_code,
                     "EmployeesCodes": [employee_id]
                 })
-                print(f"✅ Created NEW Partner_Approved document")
+                logger.debug("✅ Created NEW Partner_Approved document")
             else:
                 if employee_id not in partner_approved_doc.get("EmployeesCodes", []):
                     await db["Partner_Approved"].update_one(
                         {"PartnerEmpCode": partner_emp_code},
                         {"$addToSet": {"EmployeesCodes": employee_id}}
                     )
-                    print(f"✅ Added to Partner_Approved")
+                    logger.debug("✅ Added to Partner_Approved")
         
-        print(f"{'='*60}\n")
         
         return {
             "message": "Entry approved successfully",
@@ -5057,9 +7063,7 @@ async def partner_approve_single_entry(
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"❌ Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error in partner_approve_single_entry: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/check-admin/{employee_code}")
@@ -5069,56 +7073,349 @@ async def check_admin(employee_code: str, current_user=Depends(get_current_user)
     Returns: { "isAdmin": true/false }
     """
     try:
-        admin_collection = db["Admin"]
-        admin_doc = await admin_collection.find_one({})
-        print(admin_doc)
-        
-        if not admin_doc:
-            return {"isAdmin": False}
-        
-        is_admin = employee_code.upper() in [code.upper() for code in admin_doc.get("employee_codes", [])]
-        print(f"Is admin: {is_admin}")
+        is_admin = employee_code.strip().upper() in await get_admin_codes()
+        logger.debug("Is admin: %s", is_admin)
         return {"isAdmin": is_admin}
         
     except Exception as e:
-        print(f"Error checking admin: {e}")
+        logger.exception("❌ Error checking admin: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 # ============================================================
 # ADMIN APIs - Add these to the END of main.py (before the static mount)
 # ============================================================
 
-from fastapi import Query
-from fastapi.responses import StreamingResponse
-import io
-from collections import defaultdict
-
-# Try to import openpyxl; install if missing
-try:
-    import openpyxl
-    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-    from openpyxl.utils import get_column_letter
-except ImportError:
-    import subprocess
-    subprocess.run(["pip", "install", "openpyxl", "--break-system-packages"], capture_output=True)
-    import openpyxl
-    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-    from openpyxl.utils import get_column_letter
-
-
 # ── Helper: verify admin ──────────────────────────────────────
 async def verify_admin(current_user: dict):
     emp_code = current_user["employee_code"].strip().upper()
-    admin_collection = db["Admin"]
-    admin_doc = await admin_collection.find_one({})
-    if not admin_doc:
-        raise HTTPException(status_code=403, detail="Not authorized")
-    codes = [c.upper() for c in admin_doc.get("employee_codes", [])]
-    if emp_code not in codes:
+    if emp_code not in await get_admin_codes():
         raise HTTPException(status_code=403, detail="Not authorized")
     return emp_code
 
 
+# ── Identity cache invalidation ───────────────────────────────
+@app.post("/api/admin/cache/invalidate")
+async def invalidate_identity_cache_endpoint(
+    employee_code: Optional[str] = Query(None),
+    current_user=Depends(get_current_user)
+):
+    """
+    Drop cached identity/role lookups after Partner, Reporting_managers,
+    Admin, user, Employee or Employee_details records were changed outside
+    the app. Without employee_code everything is dropped: identity cache,
+    project catalogue and a full reload of the employee directory.
+    """
+    await verify_admin(current_user)
+    invalidate_identity_cache(employee_code)
+    if employee_code is None:
+        invalidate_project_catalogue()
+        await reload_employee_directories()
+    else:
+        await employee_directory.refresh(employee_code)
+        await employee_master.refresh(employee_code)
+    return {"message": "Identity cache cleared", "employee_code": employee_code}
+
+
+# Scrapers authenticate with METRICS_TOKEN as a static bearer token; without
+# it (or for anyone else) an admin JWT is required.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint(request: Request):
+    authorization = request.headers.get("Authorization", "")
+    token = authorization[7:] if authorization.lower().startswith("bearer ") else ""
+    if not (METRICS_TOKEN and token and hmac.compare_digest(token.encode(), METRICS_TOKEN.encode())):
+        current_user = await get_current_user(token)
+        await verify_admin(current_user)
+    return Response(content=render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+# ── Helper: streamed XLSX exports ─────────────────────────────
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+EXPORT_ROW_BATCH = 500
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+class ExportCancelled(Exception):
+    """Raised inside export worker threads once the download is abandoned."""
+
+
+class XlsxChunkSink(io.RawIOBase):
+    """Unseekable file object that hands the zip to the response in fixed-size chunks."""
+
+    def __init__(self, put_chunk):
+        self.put_chunk = put_chunk
+        self.buffer = bytearray()
+        self.abandoned = False
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        # zipfile still flushes its directory on garbage collection after a cancel
+        if self.abandoned:
+            return len(b)
+        self.buffer += b
+        try:
+            while len(self.buffer) >= EXPORT_CHUNK_SIZE:
+                self.put_chunk(bytes(self.buffer[:EXPORT_CHUNK_SIZE]))
+                del self.buffer[:EXPORT_CHUNK_SIZE]
+        except ExportCancelled:
+            self.abandoned = True
+            raise
+        return len(b)
+
+    def drain(self):
+        if self.buffer:
+            self.put_chunk(bytes(self.buffer))
+            self.buffer.clear()
+
+
+def stream_xlsx(render, rows, filename: str, **params) -> StreamingResponse:
+    """
+    Run an excel_reports renderer in a worker thread while `rows` (an async
+    iterator over a Mongo cursor) is still being read. Rows cross over in
+    batches through a bounded queue and the zip comes back in 64 KB chunks,
+    so neither the dataset nor the finished file is ever held in memory.
+    """
+    async def body():
+        rows_q = queue.Queue(maxsize=4)
+        chunks_q = queue.Queue(maxsize=16)
+        cancelled = threading.Event()
+
+        def put(q, item):
+            while not cancelled.is_set():
+                try:
+                    q.put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+            raise ExportCancelled()
+
+        def get(q):
+            while not cancelled.is_set():
+                try:
+                    return q.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+            raise ExportCancelled()
+
+        def row_iter():
+            while True:
+                batch = get(rows_q)
+                if batch is None:
+                    return
+                if isinstance(batch, Exception):
+                    raise batch
+                yield from batch
+
+        def render_worker():
+            try:
+                sink = XlsxChunkSink(lambda chunk: put(chunks_q, chunk))
+                render(row_iter(), sink, **params)
+                sink.drain()
+                put(chunks_q, None)
+            except ExportCancelled:
+                pass
+            except Exception as e:
+                try:
+                    put(chunks_q, e)
+                except ExportCancelled:
+                    pass
+
+        async def feed_rows():
+            batch = []
+            try:
+                async for row in rows:
+                    batch.append(row)
+                    if len(batch) >= EXPORT_ROW_BATCH:
+                        await asyncio.to_thread(put, rows_q, batch)
+                        batch = []
+                if batch:
+                    await asyncio.to_thread(put, rows_q, batch)
+                await asyncio.to_thread(put, rows_q, None)
+            except ExportCancelled:
+                pass
+            except Exception as e:
+                try:
+                    await asyncio.to_thread(put, rows_q, e)
+                except ExportCancelled:
+                    pass
+
+        worker = asyncio.get_running_loop().run_in_executor(None, render_worker)
+        feeder = asyncio.create_task(feed_rows())
+        try:
+            while True:
+                chunk = await asyncio.to_thread(get, chunks_q)
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+            logger.info("✅ Export streamed: %s", filename)
+        except ExportCancelled:
+            pass
+        except Exception as e:
+            logger.exception("❌ Error streaming %s: %s", filename, e)
+            raise
+        finally:
+            cancelled.set()
+            feeder.cancel()
+            await asyncio.gather(feeder, worker, return_exceptions=True)
+
+    return StreamingResponse(
+        body(),
+        media_type=XLSX_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+# ── Helper: Excel render pool ────────────────────────────────
+# Opt-in. With the default EXCEL_RENDER_WORKERS=0, downloads stream through
+# stream_xlsx and start at once, and report jobs render in a thread. With
+# workers > 0, openpyxl runs in a separate process and never holds the API
+# process's GIL. The cost is that the download only starts once the whole
+# file has been rendered.
+EXCEL_RENDER_WORKERS = int(os.getenv("EXCEL_RENDER_WORKERS", "0"))
+EXCEL_RENDER_MAX_QUEUED = int(os.getenv("EXCEL_RENDER_MAX_QUEUED", "8"))
+
+
+class ExcelRenderPool:
+    """
+    Bounded process pool for excel_reports renderers. At most `workers`
+    reports render at once, up to `max_queued` more wait for a slot and
+    anything beyond that is turned away with a 503.
+    """
+
+    def __init__(self, workers: int, max_queued: int):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.slots = asyncio.Semaphore(max(workers, 1))
+        self.pending = 0
+        self.executor = None
+
+    def get_executor(self):
+        if self.executor is None:
+            # spawn, not fork: the API process already runs Motor's threads
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self.executor
+
+    def reserve(self):
+        if self.pending >= self.workers + self.max_queued:
+            logger.warning("⚠️ Excel render queue full (%s pending)", self.pending)
+            raise HTTPException(status_code=503, detail="Report generation is busy, please retry shortly")
+        self.pending += 1
+
+    def release(self):
+        self.pending -= 1
+
+    async def render(self, render, rows_path: str, out_path: str, params: dict):
+        async with self.slots:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self.get_executor(), excel_reports.render_to_file, render, rows_path, out_path, params
+            )
+            try:
+                return await future
+            except asyncio.CancelledError:
+                # The worker keeps going; drop its output once it is done
+                future.add_done_callback(lambda _: remove_export_file(out_path))
+                raise
+            except BrokenProcessPool:
+                logger.error("❌ Excel render pool broken, restarting")
+                self.shutdown()
+                raise
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+excel_render_pool = ExcelRenderPool(EXCEL_RENDER_WORKERS, EXCEL_RENDER_MAX_QUEUED)
+
+
+@app.on_event("shutdown")
+async def shutdown_excel_render_pool():
+    excel_render_pool.shutdown()
+
+
+def remove_export_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def spool_export_rows(rows, on_batch=None) -> str:
+    """Write an async row iterator to a temp file of pickled batches for the render pool."""
+    fd, path = tempfile.mkstemp(prefix="ope_export_", suffix=".rows")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            batch = []
+            written = 0
+            async for row in rows:
+                batch.append(row)
+                if len(batch) >= EXPORT_ROW_BATCH:
+                    pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+                    written += len(batch)
+                    batch = []
+                    if on_batch:
+                        await on_batch(written)
+            if batch:
+                pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+                written += len(batch)
+            if on_batch:
+                await on_batch(written)
+    except BaseException:
+        remove_export_file(path)
+        raise
+    return path
+
+
+async def render_xlsx(render, rows, filename: str, **params):
+    """
+    Stream the export (default), or with EXCEL_RENDER_WORKERS > 0 gather
+    rows, render them in the process pool and return the finished file.
+    """
+    if EXCEL_RENDER_WORKERS <= 0:
+        return stream_xlsx(render, rows, filename, **params)
+
+    excel_render_pool.reserve()
+    rows_path = None
+    out_path = None
+    try:
+        rows_path = await spool_export_rows(rows)
+        out_path = rows_path[:-len(".rows")] + ".xlsx"
+        await excel_render_pool.render(render, rows_path, out_path, params)
+    except BaseException:
+        if out_path:
+            remove_export_file(out_path)
+        raise
+    finally:
+        excel_render_pool.release()
+        if rows_path:
+            remove_export_file(rows_path)
+
+    logger.info("✅ Export rendered: %s (%s bytes)", filename, os.path.getsize(out_path))
+    return FileResponse(
+        out_path,
+        media_type=XLSX_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        background=BackgroundTask(remove_export_file, out_path),
+    )
+
+
+async def get_employee_details_map() -> dict:
+    """EmpID → Employee_details record, for export enrichment (read-only)."""
+    return await employee_directory.all_records()
+
+
 # ── Helper: get all OPE entries (flat list) ───────────────────
 async def get_all_ope_entries(payroll_month: str = None):
     """
@@ -5126,7 +7423,15 @@ async def get_all_ope_entries(payroll_month: str = None):
     Optionally filter by payroll_month.
     """
     entries = []
-    status_docs = await db["Status"].find({}).to_list(length=None)
+    status_query = {}
+    if payroll_month:
+        status_query = {"$or": [
+            {"approval_status.payroll_month": payroll_month},
+            {"approval_status.month_range": payroll_month},
+        ]}
+    status_docs = await db["Status"].find(
+        status_query, {"employeeId": 1, "employeeName": 1, "approval_status": 1}
+    ).to_list(length=None)
 
     # Build a lookup: employeeId -> list of payroll months
     emp_months = {}
@@ -5147,116 +7452,193 @@ async def get_all_ope_entries(payroll_month: str = None):
                 "employee_name": emp_name,
             })
 
-    # Fetch OPE_data for each employee
-    all_ope = await db["OPE_data"].find({}).to_list(length=None)
-    ope_map = {doc.get("employeeId"): doc for doc in all_ope}
-
-    for emp_id, month_list in emp_months.items():
-        ope_doc = ope_map.get(emp_id)
-        for month_info in month_list:
-            pm = month_info["payroll_month"]
-            raw_entries = []
-            if ope_doc:
-                for data_item in ope_doc.get("Data", []):
-                    if pm in data_item:
-                        raw_entries = data_item[pm]
-                        break
+    # Fetch matching entries from the flat OPE_entries store
+    entry_query = {"employee_id": {"$in": list(emp_months.keys())}}
+    if payroll_month:
+        entry_query["payroll_month"] = payroll_month
 
-            for e in raw_entries:
-                entries.append({
-                    "employee_id": emp_id,
-                    "employee_name": month_info["employee_name"] or ope_doc.get("employeeName", ""),
-                    "payroll_month": pm,
-                    "total_amount": month_info["total_amount"],
-                    "limit": month_info["limit"],
-                    "overall_status": month_info["overall_status"],
-                    "current_level": month_info["current_level"],
-                    "total_levels": month_info["total_levels"],
-                    # entry fields
-                    "date": e.get("date"),
-                    "client": e.get("client", ""),
-                    "project_id": e.get("project_id", ""),
-                    "project_name": e.get("project_name", ""),
-                    "project_type": e.get("project_type", ""),
-                    "location_from": e.get("location_from", ""),
-                    "location_to": e.get("location_to", ""),
-                    "travel_mode": e.get("travel_mode", ""),
-                    "amount": safe_float(e.get("amount", 0)),
-                    "remarks": e.get("remarks", ""),
-                    "status": e.get("status", ""),
-                })
+    async for e in db["OPE_entries"].find(entry_query):
+        emp_id = e.get("employee_id")
+        pm = e.get("month_range") or e.get("payroll_month")
+        for month_info in emp_months.get(emp_id, []):
+            if month_info["payroll_month"] != pm:
+                continue
+            entries.append({
+                "employee_id": emp_id,
+                "employee_name": month_info["employee_name"] or e.get("employee_name", ""),
+                "payroll_month": pm,
+                "total_amount": month_info["total_amount"],
+                "limit": month_info["limit"],
+                "overall_status": month_info["overall_status"],
+                "current_level": month_info["current_level"],
+                "total_levels": month_info["total_levels"],
+                # entry fields
+                "date": e.get("date"),
+                "client": e.get("client", ""),
+                "project_id": e.get("project_id", ""),
+                "project_name": e.get("project_name", ""),
+                "project_type": e.get("project_type", ""),
+                "location_from": e.get("location_from", ""),
+                "location_to": e.get("location_to", ""),
+                "travel_mode": e.get("travel_mode", ""),
+                "amount": safe_float(e.get("amount", 0)),
+                "remarks": e.get("remarks", ""),
+                "status": e.get("status", ""),
+            })
     return entries
 
 
+# ── Helper: numeric amount expression for pipelines ──────────
+def safe_amount_expr(field: str) -> dict:
+    """Aggregation-side equivalent of safe_float(): non-numeric, NaN and inf become 0."""
+    return {"$let": {
+        "vars": {"v": {"$convert": {"input": field, "to": "double", "onError": 0.0, "onNull": 0.0}}},
+        "in": {"$cond": [
+            {"$in": ["$$v", [float("nan"), float("inf"), float("-inf")]]}, 0.0, "$$v"
+        ]},
+    }}
+
+
 # ── 1. ADMIN DASHBOARD ────────────────────────────────────────
+# Table sorts; (employee_id, payroll_month) identifies a row
+DASHBOARD_SORTS = {
+    "employee": [("employee_id", 1), ("payroll_month", 1)],
+    "month": [("payroll_month", 1), ("employee_id", 1)],
+    "amount": [("total_amount", 1), ("employee_id", 1), ("payroll_month", 1)],
+}
+
+
 @app.get("/api/admin/dashboard")
 async def admin_dashboard(
     payroll_month: str = Query(None),
     emp_name: str = Query(None),
     emp_id: str = Query(None),
+    page: PageRequest = Depends(page_request),
     current_user: dict = Depends(get_current_user)
 ):
     await verify_admin(current_user)
+    # The dashboard's own filters are part of the query a cursor belongs to
+    for name, value in (("month", payroll_month), ("emp_name", emp_name), ("emp_id", emp_id)):
+        if value and value.strip():
+            page.filters.setdefault(name, value.strip())
+    page.resolve(DASHBOARD_SORTS, "employee", ("month", "status", "emp_name", "emp_id"))
+    payroll_month = page.filters.get("month")
+
+    # --- Status rows: one per (employee, payroll month) ---
+    row_filters = []
+    if payroll_month:
+        row_filters.append({"pm": payroll_month})
+    if "status" in page.filters:
+        row_filters.append({"overall_status": page.filters["status"].lower()})
+    if emp_name:
+        row_filters.append({"employeeName": {"$regex": re.escape(emp_name), "$options": "i"}})
+    if emp_id:
+        row_filters.append({"employeeId": {"$regex": re.escape(emp_id), "$options": "i"}})
+    match_rows = {"$match": {"$and": row_filters}} if row_filters else {"$match": {}}
+
+    base_stages = [
+        {"$unwind": "$approval_status"},
+        {"$project": {
+            "employeeId": {"$ifNull": ["$employeeId", ""]},
+            "employeeName": {"$ifNull": ["$employeeName", ""]},
+            "pm": {"$ifNull": ["$approval_status.payroll_month", "$approval_status.month_range"]},
+            "total_amount": safe_amount_expr("$approval_status.total_amount"),
+            "limit": safe_amount_expr("$approval_status.limit"),
+            "ope_label": {"$ifNull": ["$approval_status.ope_label", ""]},
+            "overall_status": {"$ifNull": ["$approval_status.overall_status", "pending"]},
+            "current_level": {"$ifNull": ["$approval_status.current_level", "L1"]},
+        }},
+        {"$match": {"pm": {"$nin": [None, ""]}}},
+    ]
+    facet_stage = {"$facet": {
+        "all_months": [{"$group": {"_id": "$pm"}}],
+        "kpis": [
+            match_rows,
+            {"$group": {
+                "_id": None,
+                "employees": {"$addToSet": "$employeeId"},
+                "rows": {"$sum": 1},
+                "total_amount": {"$sum": "$total_amount"},
+                "greater_count": {"$sum": {"$cond": [
+                    {"$or": [
+                        {"$eq": ["$ope_label", "Greater"]},
+                        {"$and": [{"$gt": ["$limit", 0]}, {"$gt": ["$total_amount", "$limit"]}]},
+                    ]}, 1, 0
+                ]}},
+            }},
+            {"$project": {"_id": 0, "total_employees": {"$size": "$employees"}, "rows": 1, "total_amount": 1, "greater_count": 1}},
+        ],
+        "payroll_wise": [
+            match_rows,
+            {"$group": {"_id": "$pm", "total": {"$sum": "$total_amount"}}},
+        ],
+        # Summed per employee here; partner names come from the employee directory below
+        "employee_wise": [
+            match_rows,
+            {"$group": {"_id": "$employeeId", "total": {"$sum": "$total_amount"}}},
+        ],
+    }}
+
+    # Table rows come from their own cursor so they are not bound by the
+    # 16 MB single-document limit of $facet
+    table_pipeline = base_stages + [
+        match_rows,
+        {"$project": {
+            "_id": 0,
+            "employee_id": "$employeeId",
+            "employee_name": "$employeeName",
+            "payroll_month": "$pm",
+            "total_amount": 1,
+            "limit": 1,
+            "overall_status": 1,
+            "current_level": 1,
+            "ope_label": 1,
+        }},
+    ]
+    if page.paginated:
+        if page.after is not None:
+            table_pipeline.append({"$match": keyset_filter(page.spec, page.after)})
+        table_pipeline += [{"$sort": dict(page.spec)}, {"$limit": page.fetch_limit}]
+
+    # Later pages only need the next table rows - KPIs and charts came with the first
+    if page.cursor:
+        table_rows = await db["Status"].aggregate(table_pipeline, allowDiskUse=True).to_list(length=None)
+        table_rows, page_info = page.finish(table_rows)
+        return SafeJSONResponse({"table": table_rows, "page": page_info})
+
+    # Top 10 client chart — from the OPE_rollups groups, same filters as table
+    rollup_match = {}
+    if payroll_month:
+        rollup_match["payroll_month"] = payroll_month
+    if emp_name:
+        rollup_match["employee_name"] = {"$regex": re.escape(emp_name), "$options": "i"}
+    if emp_id:
+        rollup_match["employee_id"] = {"$regex": re.escape(emp_id), "$options": "i"}
+    client_pipeline = [
+        {"$match": rollup_match},
+        {"$group": {"_id": "$client", "total": {"$sum": "$total_amount"}}},
+        {"$sort": {"total": -1}},
+        {"$limit": 10},
+    ]
+
+    facet_docs, table_rows, top10_clients = await asyncio.gather(
+        db["Status"].aggregate(base_stages + [facet_stage]).to_list(length=1),
+        db["Status"].aggregate(table_pipeline, allowDiskUse=True).to_list(length=None),
+        db["OPE_rollups"].aggregate(client_pipeline).to_list(length=10),
+    )
+    facets = facet_docs[0]
 
-    # --- All status docs for KPI ---
-    all_status = await db["Status"].find({}).to_list(length=None)
+    kpis = facets["kpis"][0] if facets["kpis"] else {"total_employees": 0, "rows": 0, "total_amount": 0.0, "greater_count": 0}
+    page.total = kpis["rows"]
+    table_rows, page_info = page.finish(table_rows)
+    payroll_totals = {row["_id"]: row["total"] for row in facets["payroll_wise"]}
 
-    # Build flat records for table & charts
-    table_rows = []
+    employees = await employee_directory.get_many(row["_id"] for row in facets["employee_wise"] if row["_id"])
     partner_totals = defaultdict(float)
-    payroll_totals = defaultdict(float)
-    all_months = set()
-    total_employees_set = set()
-    total_amount_all = 0.0
-    amount_greater_count = 0
-
-    # Employee details lookup for partner info
-    emp_details_list = await db["Employee_details"].find({}).to_list(length=None)
-    emp_partner_map = {e.get("EmpID", ""): e.get("Partner", "Unknown") for e in emp_details_list}
-
-    for sdoc in all_status:
-        emp_id_val = sdoc.get("employeeId", "")
-        emp_name_val = sdoc.get("employeeName", "")
-        partner = emp_partner_map.get(emp_id_val, "Unknown")
-
-        for ps in sdoc.get("approval_status", []):
-            pm = ps.get("payroll_month") or ps.get("month_range", "")
-            if not pm:
-                continue
-            all_months.add(pm)
-
-            total_amt = safe_float(ps.get("total_amount", 0))
-            limit_val = safe_float(ps.get("limit", 0))
-            ope_label = ps.get("ope_label", "")
-            overall_st = ps.get("overall_status", "pending")
-            curr_level = ps.get("current_level", "L1")
-
-            # Apply filters
-            if payroll_month and pm != payroll_month:
-                continue
-            if emp_name and emp_name.lower() not in emp_name_val.lower():
-                continue
-            if emp_id and emp_id.upper() not in emp_id_val.upper():
-                continue
-
-            total_employees_set.add(emp_id_val)
-            total_amount_all += total_amt
-            partner_totals[partner] += total_amt
-            payroll_totals[pm] += total_amt
-
-            if ope_label == "Greater" or (limit_val > 0 and total_amt > limit_val):
-                amount_greater_count += 1
-
-            table_rows.append({
-                "employee_id": emp_id_val,
-                "employee_name": emp_name_val,
-                "payroll_month": pm,
-                "total_amount": total_amt,
-                "limit": limit_val,
-                "overall_status": overall_st,
-                "current_level": curr_level,
-                "ope_label": ope_label,
-            })
+    for row in facets["employee_wise"]:
+        partner = employees.get(str(row["_id"] or "").strip().upper(), {}).get("Partner")
+        partner_totals["Unknown" if partner is None else partner] += row["total"]
+    all_months = {row["_id"] for row in facets["all_months"]}
 
     # Payroll diff (compare last 2 months)
     sorted_months = sorted(payroll_totals.keys())
@@ -5275,44 +7657,24 @@ async def admin_dashboard(
             "direction": direction,
         }
 
-    # Top 10 client chart — from OPE_data
-    client_totals = defaultdict(float)
-    # Reuse all_ope_docs fetched earlier in the function (move fetch up if needed)
-    all_ope_docs_for_chart = await db["OPE_data"].find({}).to_list(length=None)
-    for odoc in all_ope_docs_for_chart:
-        odoc_emp_id = odoc.get("employeeId", "")
-        odoc_emp_name = odoc.get("employeeName", "")
- 
-        # ✅ FIXED: Apply same name/ID filters as table
-        if emp_name and emp_name.lower() not in odoc_emp_name.lower():
-            continue
-        if emp_id and emp_id.upper() not in odoc_emp_id.upper():
-            continue
- 
-        for data_item in odoc.get("Data", []):
-            for pm_key, elist in data_item.items():
-                if payroll_month and pm_key != payroll_month:
-                    continue
-                for e in elist:
-                    client_totals[e.get("client", "Unknown")] += safe_float(e.get("amount", 0))
- 
-    top10_clients = sorted(client_totals.items(), key=lambda x: x[1], reverse=True)[:10]
-
-    return {
+    # Returned directly so FastAPI skips its jsonable_encoder pre-walk
+    return SafeJSONResponse({
         "kpis": {
-            "total_employees": len(total_employees_set),
-            "total_amount": round(total_amount_all, 2),
-            "total_amount_greater": amount_greater_count,
+            "total_employees": kpis["total_employees"],
+            "total_amount": round(kpis["total_amount"], 2),
+            "total_amount_greater": kpis["greater_count"],
             "payroll_diff": payroll_diff,
         },
         "charts": {
-            "partner_wise": [{"_id": k, "total": round(v, 2)} for k, v in sorted(partner_totals.items(), key=lambda x: x[1], reverse=True)],
+            "partner_wise": [{"_id": k, "total": round(v, 2)}
+                             for k, v in sorted(partner_totals.items(), key=lambda kv: kv[1], reverse=True)],
             "payroll_wise": [{"_id": k, "total": round(v, 2)} for k, v in sorted(payroll_totals.items())],
-            "client_wise": [{"_id": k, "total": round(v, 2)} for k, v in top10_clients],
+            "client_wise": [{"_id": row["_id"], "total": round(row["total"], 2)} for row in top10_clients],
         },
         "table": table_rows,
+        "page": page_info,
         "all_payroll_months": sorted(all_months),
-    }
+    })
 
 
 # ── 2. CLIENT-WISE ANALYSIS ───────────────────────────────────
@@ -5329,97 +7691,83 @@ async def admin_client_analysis(
     try:
         await verify_admin(current_user)
         
-        all_ope_docs = await db["OPE_data"].find({}).to_list(length=None)
+        rollup_query = {"status": "approved"}
+        if payroll_month:
+            rollup_query["payroll_month"] = payroll_month
+        rollups = await db["OPE_rollups"].find(rollup_query).to_list(length=None)
         
-        if not all_ope_docs:
+        if not rollups:
             return {"clients": [], "all_client_names": []}
         
-        # Structure: client -> payroll_month -> { pass_users, ticket_users, employees, etc }
-        client_months = defaultdict(lambda: defaultdict(lambda: {
-            "payroll_month": None,
-            "employee_count": 0,
-            "total_amount": 0.0,
-            "amount_spread": 0.0,
-            "pass_ticket_conflict": False,
-            "pass_users": [],
-            "ticket_users": [],
-            "employees": []
-        }))
+        # Amount spread is measured across all approved entries of an
+        # employee in a payroll month, whichever client they were filed for
+        emp_month_range = {}
+        for r in rollups:
+            key = (r["employee_id"], r["payroll_month"])
+            lo, hi = emp_month_range.get(key, (r["min_amount"], r["max_amount"]))
+            emp_month_range[key] = (min(lo, r["min_amount"]), max(hi, r["max_amount"]))
         
+        # Structure: client -> payroll_month -> { pass_users, ticket_users, employees, etc }
+        client_months = defaultdict(dict)
+        employee_rows = {}
         all_client_names = set()
         
-        for ope_doc in all_ope_docs:
-            emp_id = ope_doc.get("employeeId", "")
-            emp_name = ope_doc.get("employeeName", "")
+        for r in rollups:
+            client = r["client"]
+            month_range = r["payroll_month"]
+            emp_id = r["employee_id"]
+            all_client_names.add(client)
             
-            for data_item in ope_doc.get("Data", []):
-                for month_range, entries in data_item.items():
-                    # Skip if not matching payroll_month
-                    if payroll_month and month_range != payroll_month:
-                        continue
-                    
-                    for entry in entries:
-                        # Only approved entries
-                        if entry.get("status", "").lower() != "approved":
-                            continue
-                        
-                        # FIX: Strip whitespace from client name
-                        client = str(entry.get("client") or "Unknown").strip()
-                        all_client_names.add(client)
-                        
-                        # Initialize month data
-                        if month_range not in client_months[client]:
-                            client_months[client][month_range]["payroll_month"] = month_range
-                        
-                        month_data = client_months[client][month_range]
-                        amount = float(entry.get("amount") or 0)
-                        travel_mode = entry.get("travel_mode", "").lower()
-                        
-                        # Determine if pass or ticket
-                        is_pass = any(t in travel_mode for t in ["pass", "rail", "bus"])
-                        
-                        # Track amounts for spread calculation
-                        amounts = [e.get("amount", 0) for e in entries if e.get("status", "").lower() == "approved"]
-                        max_amt = max(amounts) if amounts else 0
-                        min_amt = min(amounts) if amounts else 0
-                        month_data["amount_spread"] = max(month_data["amount_spread"], max_amt - min_amt)
-                        
-                        # Add to appropriate list
-                        if is_pass:
-                            if emp_id not in [u["employee_id"] for u in month_data["pass_users"]]:
-                                month_data["pass_users"].append({
-                                    "employee_id": emp_id,
-                                    "employee_name": emp_name
-                                })
-                        else:
-                            if emp_id not in [u["employee_id"] for u in month_data["ticket_users"]]:
-                                month_data["ticket_users"].append({
-                                    "employee_id": emp_id,
-                                    "employee_name": emp_name
-                                })
-                        
-                        # Add employee entry
-                        emp_entry = {
-                            "employee_id": emp_id,
-                            "employee_name": emp_name,
-                            "amount": amount,
-                            "travel_modes": [travel_mode],
-                            "entry_count": len([e for e in entries if e.get("client") == client and e.get("status", "").lower() == "approved"]),
-                            "uses_pass": is_pass,
-                            "uses_ticket": not is_pass
-                        }
-                        
-                        # Check if employee already in list
-                        existing = [e for e in month_data["employees"] if e["employee_id"] == emp_id]
-                        if existing:
-                            existing[0]["amount"] += amount
-                            if travel_mode not in existing[0]["travel_modes"]:
-                                existing[0]["travel_modes"].append(travel_mode)
-                        else:
-                            month_data["employees"].append(emp_entry)
-                        
-                        month_data["total_amount"] += amount
-                        month_data["employee_count"] = len(set(e["employee_id"] for e in month_data["employees"]))
+            month_data = client_months[client].setdefault(month_range, {
+                "payroll_month": month_range,
+                "employee_count": 0,
+                "total_amount": 0.0,
+                "amount_spread": 0.0,
+                "pass_ticket_conflict": False,
+                "pass_users": [],
+                "ticket_users": [],
+                "employees": []
+            })
+            
+            lo, hi = emp_month_range[(emp_id, month_range)]
+            month_data["amount_spread"] = max(month_data["amount_spread"], hi - lo)
+            
+            # One employee row per client/month, merged across projects
+            emp_entry = employee_rows.get((client, month_range, emp_id))
+            if emp_entry is None:
+                emp_entry = employee_rows[(client, month_range, emp_id)] = {
+                    "employee_id": emp_id,
+                    "employee_name": r.get("employee_name", ""),
+                    "amount": 0.0,
+                    "travel_modes": [],
+                    "entry_count": 0,
+                    "uses_pass": False,
+                    "uses_ticket": False
+                }
+                month_data["employees"].append(emp_entry)
+            
+            emp_entry["amount"] += r["total_amount"]
+            emp_entry["entry_count"] += r["entry_count"]
+            emp_entry["uses_pass"] = emp_entry["uses_pass"] or r["pass_count"] > 0
+            emp_entry["uses_ticket"] = emp_entry["uses_ticket"] or r["ticket_count"] > 0
+            for travel_mode in r.get("travel_modes", []):
+                if travel_mode not in emp_entry["travel_modes"]:
+                    emp_entry["travel_modes"].append(travel_mode)
+            
+            month_data["total_amount"] += r["total_amount"]
+        
+        for months_data in client_months.values():
+            for month_data in months_data.values():
+                employees = month_data["employees"]
+                month_data["pass_users"] = [
+                    {"employee_id": e["employee_id"], "employee_name": e["employee_name"]}
+                    for e in employees if e["uses_pass"]
+                ]
+                month_data["ticket_users"] = [
+                    {"employee_id": e["employee_id"], "employee_name": e["employee_name"]}
+                    for e in employees if e["uses_ticket"]
+                ]
+                month_data["employee_count"] = len(employees)
         
         # Detect pass/ticket conflicts and build final response
         clients = []
@@ -5456,7 +7804,7 @@ async def admin_client_analysis(
         # Sort by total amount
         clients.sort(key=lambda x: x["total_amount"], reverse=True)
         
-        print(f"✅ Client analysis: {len(clients)} clients, {len(all_client_names)} unique names")
+        logger.debug("✅ Client analysis: %s clients, %s unique names", len(clients), len(all_client_names))
         
         return {
             "clients": clients,
@@ -5464,13 +7812,46 @@ async def admin_client_analysis(
         }
         
     except Exception as e:
-        print(f"❌ Error in admin_client_analysis: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error in admin_client_analysis: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
  
 
 # ── 3. EXCEL EXPORT: CLIENT-WISE ─────────────────────────────
+async def iter_client_wise_rows(payroll_month: str = None):
+    """One export row per OPE_entries row, employee by employee."""
+    emp_map = await get_employee_details_map()
+
+    query = {"payroll_month": payroll_month} if payroll_month else {}
+    projection = {
+        "employee_id": 1, "employee_name": 1, "payroll_month": 1, "client": 1,
+        "project_id": 1, "project_name": 1, "project_type": 1, "date": 1,
+        "location_from": 1, "location_to": 1, "travel_mode": 1, "amount": 1,
+        "remarks": 1, "status": 1,
+    }
+    cursor = db["OPE_entries"].find(query, projection, allow_disk_use=True).sort(
+        [("employee_id", 1), ("payroll_month", 1)]
+    )
+    async for e in cursor:
+        emp_id = e.get("employee_id", "")
+        yield {
+            "Employee ID": emp_id,
+            "Employee Name": e.get("employee_name", ""),
+            "Partner": emp_map.get(emp_id, {}).get("Partner", "Unknown"),
+            "Payroll Month": e.get("payroll_month", ""),
+            "Client": e.get("client", ""),
+            "Project ID": e.get("project_id", ""),
+            "Project Name": e.get("project_name", ""),
+            "Project Type": e.get("project_type", ""),
+            "Date": e.get("date", ""),
+            "Travel From": e.get("location_from", ""),
+            "Travel To": e.get("location_to", ""),
+            "Travel Mode": e.get("travel_mode", ""),
+            "Amount (₹)": e.get("amount", 0.0),
+            "Remarks": e.get("remarks", ""),
+            "Status": e.get("status", ""),
+        }
+
+
 @app.get("/api/admin/export/client-wise")
 async def export_client_excel(
     payroll_month: str = Query(None),
@@ -5478,96 +7859,60 @@ async def export_client_excel(
 ):
     await verify_admin(current_user)
 
-    all_ope_docs = await db["OPE_data"].find({}).to_list(length=None)
-    all_status = await db["Status"].find({}).to_list(length=None)
-
-    # Build employee → partner map
-    emp_details_list = await db["Employee_details"].find({}).to_list(length=None)
-    emp_partner_map = {e.get("EmpID", ""): e.get("Partner", "Unknown") for e in emp_details_list}
-
-    rows = []
-    for odoc in all_ope_docs:
-        emp_id = odoc.get("employeeId", "")
-        emp_name = odoc.get("employeeName", "")
-        partner = emp_partner_map.get(emp_id, "Unknown")
-        for data_item in odoc.get("Data", []):
-            for pm_key, elist in data_item.items():
-                if payroll_month and pm_key != payroll_month:
-                    continue
-                for e in elist:
-                    rows.append({
-                        "Employee ID": emp_id,
-                        "Employee Name": emp_name,
-                        "Partner": partner,
-                        "Payroll Month": pm_key,
-                        "Client": e.get("client", ""),
-                        "Project ID": e.get("project_id", ""),
-                        "Project Name": e.get("project_name", ""),
-                        "Project Type": e.get("project_type", ""),
-                        "Date": e.get("date", ""),
-                        "Travel From": e.get("location_from", ""),
-                        "Travel To": e.get("location_to", ""),
-                        "Travel Mode": e.get("travel_mode", ""),
-                        "Amount (₹)": safe_float(e.get("amount", 0)),
-                        "Remarks": e.get("remarks", ""),
-                        "Status": e.get("status", ""),
-                    })
-
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Client Wise Claims"
-
-    header_fill = PatternFill("solid", fgColor="1E3A5F")
-    header_font = Font(color="FFFFFF", bold=True, size=11)
-    alt_fill = PatternFill("solid", fgColor="EBF3FF")
-    border = Border(
-        left=Side(style="thin", color="CCCCCC"),
-        right=Side(style="thin", color="CCCCCC"),
-        top=Side(style="thin", color="CCCCCC"),
-        bottom=Side(style="thin", color="CCCCCC"),
-    )
-
-    if rows:
-        headers = list(rows[0].keys())
-        for ci, h in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=ci, value=h)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-            cell.border = border
-
-        for ri, row in enumerate(rows, 2):
-            fill = alt_fill if ri % 2 == 0 else PatternFill("solid", fgColor="FFFFFF")
-            for ci, key in enumerate(headers, 1):
-                cell = ws.cell(row=ri, column=ci, value=row[key])
-                cell.fill = fill
-                cell.alignment = Alignment(horizontal="center", vertical="center")
-                cell.border = border
-
-        # Auto-width
-        for ci, h in enumerate(headers, 1):
-            col_letter = get_column_letter(ci)
-            max_len = max(len(str(h)), max((len(str(r[h])) for r in rows), default=0))
-            ws.column_dimensions[col_letter].width = min(max_len + 4, 40)
-
-        ws.row_dimensions[1].height = 30
-        ws.freeze_panes = "A2"
-    else:
-        ws["A1"] = "No data found"
-
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-
     filename = f"client_wise_claims{'_' + payroll_month if payroll_month else ''}.xlsx"
-    return StreamingResponse(
-        output,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    return await render_xlsx(
+        excel_reports.render_client_wise,
+        iter_client_wise_rows(payroll_month),
+        filename,
     )
 
 
 # ── 4. EXCEL EXPORT: PARTNER-WISE ────────────────────────────
+async def iter_partner_wise_rows(payroll_month: str = None):
+    """One export row per Status payroll month, sorted by partner then employee."""
+    pipeline = [
+        {"$unwind": "$approval_status"},
+        {"$project": {
+            "_id": 0,
+            "employeeId": {"$ifNull": ["$employeeId", ""]},
+            "employeeName": {"$ifNull": ["$employeeName", ""]},
+            "pm": {"$ifNull": ["$approval_status.payroll_month", "$approval_status.month_range"]},
+            "ps": "$approval_status",
+        }},
+    ]
+    if payroll_month:
+        pipeline.append({"$match": {"pm": payroll_month}})
+    pipeline += [
+        {"$lookup": {
+            "from": "Employee_details",
+            "localField": "employeeId",
+            "foreignField": "EmpID",
+            "as": "emp",
+        }},
+        {"$project": {
+            "employeeId": 1, "employeeName": 1, "pm": 1, "ps": 1,
+            "partner": {"$ifNull": [{"$arrayElemAt": ["$emp.Partner", 0]}, "Unknown"]},
+            "emp_name": {"$ifNull": [{"$arrayElemAt": ["$emp.Emp Name", 0]}, ""]},
+        }},
+        {"$sort": {"partner": 1, "employeeId": 1}},
+    ]
+
+    async for r in db["Status"].aggregate(pipeline, allowDiskUse=True):
+        ps = r.get("ps", {})
+        yield {
+            "Partner": r["partner"],
+            "Employee ID": r["employeeId"],
+            "Employee Name": r["employeeName"] or r["emp_name"],
+            "Payroll Month": r.get("pm") or "",
+            "Total Amount (₹)": safe_float(ps.get("total_amount", 0)),
+            "OPE Limit (₹)": safe_float(ps.get("limit", 0)),
+            "OPE Label": ps.get("ope_label", ""),
+            "Overall Status": ps.get("overall_status", ""),
+            "Current Level": ps.get("current_level", ""),
+            "Total Levels": ps.get("total_levels", ""),
+        }
+
+
 @app.get("/api/admin/export/partner-wise")
 async def export_partner_excel(
     payroll_month: str = Query(None),
@@ -5575,94 +7920,11 @@ async def export_partner_excel(
 ):
     await verify_admin(current_user)
 
-    all_status = await db["Status"].find({}).to_list(length=None)
-    emp_details_list = await db["Employee_details"].find({}).to_list(length=None)
-    emp_partner_map = {e.get("EmpID", ""): e.get("Partner", "Unknown") for e in emp_details_list}
-    emp_name_map = {e.get("EmpID", ""): e.get("Emp Name", "") for e in emp_details_list}
-
-    rows = []
-    for sdoc in all_status:
-        emp_id = sdoc.get("employeeId", "")
-        emp_name = sdoc.get("employeeName", "") or emp_name_map.get(emp_id, "")
-        partner = emp_partner_map.get(emp_id, "Unknown")
-
-        for ps in sdoc.get("approval_status", []):
-            pm = ps.get("payroll_month") or ps.get("month_range", "")
-            if payroll_month and pm != payroll_month:
-                continue
-            rows.append({
-                "Partner": partner,
-                "Employee ID": emp_id,
-                "Employee Name": emp_name,
-                "Payroll Month": pm,
-                "Total Amount (₹)": safe_float(ps.get("total_amount", 0)),
-"OPE Limit (₹)": safe_float(ps.get("limit", 0)),
-                "OPE Label": ps.get("ope_label", ""),
-                "Overall Status": ps.get("overall_status", ""),
-                "Current Level": ps.get("current_level", ""),
-                "Total Levels": ps.get("total_levels", ""),
-            })
-
-    rows.sort(key=lambda x: (x["Partner"], x["Employee ID"]))
-
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Partner Wise Claims"
-
-    header_fill = PatternFill("solid", fgColor="1E3A5F")
-    header_font = Font(color="FFFFFF", bold=True, size=11)
-    border = Border(
-        left=Side(style="thin", color="CCCCCC"),
-        right=Side(style="thin", color="CCCCCC"),
-        top=Side(style="thin", color="CCCCCC"),
-        bottom=Side(style="thin", color="CCCCCC"),
-    )
-
-    # Group by partner for coloring
-    partner_colors = {}
-    color_list = ["EBF3FF", "FFF3E0", "E8F5E9", "FCE4EC", "F3E5F5", "E0F7FA"]
-    for i, r in enumerate(rows):
-        p = r["Partner"]
-        if p not in partner_colors:
-            partner_colors[p] = color_list[len(partner_colors) % len(color_list)]
-
-    if rows:
-        headers = list(rows[0].keys())
-        for ci, h in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=ci, value=h)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-            cell.border = border
-
-        for ri, row in enumerate(rows, 2):
-            color = partner_colors.get(row["Partner"], "FFFFFF")
-            fill = PatternFill("solid", fgColor=color)
-            for ci, key in enumerate(headers, 1):
-                cell = ws.cell(row=ri, column=ci, value=row[key])
-                cell.fill = fill
-                cell.alignment = Alignment(horizontal="center", vertical="center")
-                cell.border = border
-
-        for ci, h in enumerate(headers, 1):
-            col_letter = get_column_letter(ci)
-            max_len = max(len(str(h)), max((len(str(r[h])) for r in rows), default=0))
-            ws.column_dimensions[col_letter].width = min(max_len + 4, 40)
-
-        ws.row_dimensions[1].height = 30
-        ws.freeze_panes = "A2"
-    else:
-        ws["A1"] = "No data found"
-
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-
     filename = f"partner_wise_claims{'_' + payroll_month if payroll_month else ''}.xlsx"
-    return StreamingResponse(
-        output,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    return await render_xlsx(
+        excel_reports.render_partner_wise,
+        iter_partner_wise_rows(payroll_month),
+        filename,
     )
 
 
@@ -5763,16 +8025,14 @@ async def admin_duplicate_locations_analysis(
         # Sort by duplicate count descending
         location_analysis.sort(key=lambda x: x["duplicate_claims"], reverse=True)
  
-        return {
+        return SafeJSONResponse({
             "location_analysis": location_analysis,
             "total_locations_analyzed": len(all_locations),
             "total_duplicate_claims": total_duplicates
-        }
+        })
  
     except Exception as e:
-        print(f"❌ Error in admin_duplicate_locations_analysis: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error in admin_duplicate_locations_analysis: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
  
 
@@ -5788,36 +8048,27 @@ async def project_wise_consolidated_reports(
     """
     await verify_admin(current_user)
     
-    all_ope_docs = await db["OPE_data"].find({}).to_list(length=None)
+    rollup_query = {"payroll_month": payroll_month} if payroll_month else {}
+    rollups = await db["OPE_rollups"].find(rollup_query).to_list(length=None)
     
     # project -> { payroll_month -> { employee_id -> amount } }
     project_data = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
     project_details = {}
     
-    for odoc in all_ope_docs:
-        emp_id = odoc.get("employeeId", "")
-        emp_name = odoc.get("employeeName", "")
-        for data_item in odoc.get("Data", []):
-            for pm_key, elist in data_item.items():
-                if payroll_month and pm_key != payroll_month:
-                    continue
-                for e in elist:
-                    project_id = e.get("project_id", "Unknown")
-                    project_name = e.get("project_name", "Unknown")
-                    project_type = e.get("project_type", "Unknown")
-                    client = e.get("client", "Unknown")
-                    amt = safe_float(e.get("amount", 0))
-                    
-                    project_data[project_id][pm_key][emp_id] += amt
-                    
-                    # Store project details
-                    if project_id not in project_details:
-                        project_details[project_id] = {
-                            "project_id": project_id,
-                            "project_name": project_name,
-                            "project_type": project_type,
-                            "client": client
-                        }
+    for r in rollups:
+        project_id = r.get("project_id") or "Unknown"
+        pm_key = r["payroll_month"]
+        
+        project_data[project_id][pm_key][r["employee_id"]] += r["total_amount"]
+        
+        # Store project details
+        if project_id not in project_details:
+            project_details[project_id] = {
+                "project_id": project_id,
+                "project_name": r.get("project_name") or "Unknown",
+                "project_type": r.get("project_type") or "Unknown",
+                "client": r.get("client") or "Unknown"
+            }
     
     # Build consolidated report
     result = []
@@ -5868,70 +8119,58 @@ async def admin_client_project_wise_analysis(
     FIXED: Uses Set to track unique employees globally
     """
     try:
-        await verify_admin(current_user)
-        
-        all_ope_docs = await db["OPE_data"].find({}).to_list(length=None)
-        
-        if not all_ope_docs:
-            return {"clients": [], "global_unique_projects": 0, "global_unique_employees": 0}
-        
-        all_unique_project_ids = set()
-        all_unique_emp_ids = set()  # FIXED: Use Set for true unique count
-        client_projects = {}
-        
-        for ope_doc in all_ope_docs:
-            for data_item in ope_doc.get("Data", []):
-                for month_range, entries in data_item.items():
-                    if payroll_month and month_range != payroll_month:
-                        continue
-                    
-                    for entry in entries:
-                        if entry.get("status", "").lower() != "approved":
-                            continue
-                        
-                        client = str(entry.get("client") or "Unknown").strip()
-                        project_id = entry.get("project_id") or "Unassigned"
-                        project_name = entry.get("project_name") or project_id
-                        project_type = entry.get("project_type") or "Regular"
-                        emp_id = entry.get("employee_id") or "Unknown"
-                        amount = float(entry.get("amount") or 0)
-                        
-                        all_unique_project_ids.add(project_id)
-                        all_unique_emp_ids.add(emp_id)  # FIXED: Add to global set
-                        
-                        if client not in client_projects:
-                            client_projects[client] = {}
-                        
-                        if project_id not in client_projects[client]:
-                            client_projects[client][project_id] = {
-                                "project_id": project_id,
-                                "project_name": project_name,
-                                "project_type": project_type,
-                                "payroll_months": [],
-                                "employees": set(),
-                                "total_amount": 0.0
-                            }
-                        
-                        proj = client_projects[client][project_id]
-                        
-                        # Check if month already exists
-                        existing_month = None
-                        for pm in proj["payroll_months"]:
-                            if pm["payroll_month"] == month_range:
-                                existing_month = pm
-                                break
-                        
-                        if not existing_month:
-                            existing_month = {
-                                "payroll_month": month_range,
-                                "employee_count": 0,
-                                "total_amount": 0.0
-                            }
-                            proj["payroll_months"].append(existing_month)
-                        
-                        existing_month["total_amount"] += amount
-                        proj["employees"].add(emp_id)
-                        proj["total_amount"] += amount
+        await verify_admin(current_user)
+        
+        rollup_query = {"status": "approved"}
+        if payroll_month:
+            rollup_query["payroll_month"] = payroll_month
+        rollups = await db["OPE_rollups"].find(rollup_query).to_list(length=None)
+        
+        if not rollups:
+            return {"clients": [], "global_unique_projects": 0, "global_unique_employees": 0}
+        
+        all_unique_project_ids = set()
+        all_unique_emp_ids = set()  # FIXED: Use Set for true unique count
+        client_projects = {}
+        
+        for r in rollups:
+            client = r["client"]
+            month_range = r["payroll_month"]
+            project_id = r.get("project_id") or "Unassigned"
+            project_name = r.get("project_name") or project_id
+            project_type = r.get("project_type") or "Regular"
+            emp_id = r.get("employee_id") or "Unknown"
+            amount = r["total_amount"]
+            
+            all_unique_project_ids.add(project_id)
+            all_unique_emp_ids.add(emp_id)  # FIXED: Add to global set
+            
+            if client not in client_projects:
+                client_projects[client] = {}
+            
+            if project_id not in client_projects[client]:
+                client_projects[client][project_id] = {
+                    "project_id": project_id,
+                    "project_name": project_name,
+                    "project_type": project_type,
+                    "payroll_months": {},
+                    "employees": set(),
+                    "total_amount": 0.0
+                }
+            
+            proj = client_projects[client][project_id]
+            
+            month_entry = proj["payroll_months"].setdefault(month_range, {
+                "payroll_month": month_range,
+                "employee_count": 0,
+                "total_amount": 0.0,
+                "employees": set()
+            })
+            
+            month_entry["total_amount"] += amount
+            month_entry["employees"].add(emp_id)
+            proj["employees"].add(emp_id)
+            proj["total_amount"] += amount
         
         # Build response
         clients = []
@@ -5943,16 +8182,20 @@ async def admin_client_project_wise_analysis(
             for project_id in sorted(projects_dict.keys(), key=str):
                 proj = projects_dict[project_id]
                 
-                # Recalculate employee count for each month
-                for pm in proj["payroll_months"]:
-                    pm["employee_count"] = len([e for e in proj["employees"] 
-                                               if e])  # This is approximate; ideally track per month
+                # Employee count per month, tracked per month
+                payroll_months = []
+                for pm in proj["payroll_months"].values():
+                    payroll_months.append({
+                        "payroll_month": pm["payroll_month"],
+                        "employee_count": len(pm["employees"]),
+                        "total_amount": pm["total_amount"]
+                    })
                 
                 projects.append({
                     "project_id": proj["project_id"],
                     "project_name": proj["project_name"],
                     "project_type": proj["project_type"],
-                    "payroll_months": proj["payroll_months"],
+                    "payroll_months": payroll_months,
                     "total_employees": len(proj["employees"]),
                     "total_amount": round(proj["total_amount"], 2)
                 })
@@ -5966,7 +8209,7 @@ async def admin_client_project_wise_analysis(
                 "total_amount": round(client_total, 2)
             })
         
-        print(f"✅ Project analysis: {len(all_unique_project_ids)} projects, {len(all_unique_emp_ids)} unique employees")
+        logger.debug("✅ Project analysis: %s projects, %s unique employees", len(all_unique_project_ids), len(all_unique_emp_ids))
         
         return {
             "clients": clients,
@@ -5975,19 +8218,145 @@ async def admin_client_project_wise_analysis(
         }
         
     except Exception as e:
-        print(f"❌ Error in admin_client_project_wise_analysis: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error in admin_client_project_wise_analysis: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
  
  
 
+# ---------- Project Catalogue ----------
+# Every employee under a partner gets the same project / client list, so the
+# rendered /api/projects body is cached per partner (the employee's partner
+# comes from the employee directory) and served with an ETag; the form re-validates on load
+# and usually gets a 304. A change stream on Timesheets.Projects drops the
+# cache whenever the catalogue changes. Without a replica set there is no
+# change stream and entries simply expire after PROJECT_CATALOGUE_TTL_SECONDS.
+PROJECT_CATALOGUE_TTL_SECONDS = float(os.getenv("PROJECT_CATALOGUE_TTL_SECONDS", "600"))
+PROJECT_CATALOGUE_MAX_PARTNERS = int(os.getenv("PROJECT_CATALOGUE_MAX_PARTNERS", "1000"))
+PROJECT_CATALOGUE_RETRY_SECONDS = 30
+PROJECT_CATALOGUE_CACHE_CONTROL = "private, no-cache"
+
+project_catalogue_cache = TTLCache(PROJECT_CATALOGUE_TTL_SECONDS, PROJECT_CATALOGUE_MAX_PARTNERS)
+project_catalogue_loads = {}
+project_catalogue_tasks = set()
+project_catalogue_generation = 0   # bumped on every clear, so an in-flight load can't re-cache stale data
+
+
+def build_project_catalogue(raw: list) -> dict:
+    """De-duplicated project list plus the sorted unique client list."""
+    seen = set()
+    projects = []
+    for p in raw:
+        code = (p.get("project_code") or "").strip()
+        if code in seen:
+            continue
+        seen.add(code)
+        projects.append({
+            "project_code": code,
+            "project_name": (p.get("project_name") or "").strip(),
+            "client_code":  (p.get("client_code")  or "").strip(),
+            "client_name":  (p.get("client_name")  or "").strip(),
+        })
+
+    client_map = {}
+    for p in projects:
+        if p["client_code"] and p["client_name"]:
+            client_map[p["client_code"]] = p["client_name"]
+
+    clients = [
+        {"client_code": k, "client_name": v}
+        for k, v in sorted(client_map.items(), key=lambda x: x[1].lower())
+    ]
+    return {"projects": projects, "clients": clients}
+
+
+def clear_project_catalogue():
+    global project_catalogue_generation
+    project_catalogue_generation += 1
+    project_catalogue_cache.clear()
+
+
+async def load_project_catalogue(partner_emp_code: str) -> tuple:
+    generation = project_catalogue_generation
+    # Query the Timesheets database (different DB on same cluster)
+    cursor = client["Timesheets"]["Projects"].find(
+        {"partner_emp_code": partner_emp_code},
+        {"_id": 0, "project_code": 1, "project_name": 1, "client_code": 1, "client_name": 1}
+    )
+    raw = await cursor.to_list(length=None)
+    body = render_json(build_project_catalogue(raw))
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    if generation == project_catalogue_generation:
+        project_catalogue_cache.set(partner_emp_code, (etag, body))
+    logger.debug("📂 Project catalogue loaded for partner %s: %d rows", partner_emp_code, len(raw))
+    return etag, body
+
+
+async def get_project_catalogue(partner_emp_code: str) -> tuple:
+    """(etag, rendered JSON body) for one partner; concurrent misses share one load."""
+    cached = project_catalogue_cache.get(partner_emp_code)
+    if cached is not _CACHE_MISS:
+        return cached
+
+    load = project_catalogue_loads.get(partner_emp_code)
+    if load is None:
+        load = project_catalogue_loads[partner_emp_code] = asyncio.ensure_future(
+            load_project_catalogue(partner_emp_code))
+        load.add_done_callback(lambda _: project_catalogue_loads.pop(partner_emp_code, None))
+    # A caller that disconnects must not cancel the load the others are waiting on
+    return await asyncio.shield(load)
+
+
+async def get_employee_partner_code(emp_code: str):
+    """PartnerEmpCode from Employee_details, or None when the employee is unknown."""
+    emp = await employee_directory.get(emp_code)
+    if not emp:
+        return None
+    return (emp.get("PartnerEmpCode") or "").strip().upper()
+
+
+def invalidate_project_catalogue():
+    clear_project_catalogue()
+    logger.info("🧹 Project catalogue cache cleared")
+
+
+async def watch_project_catalogue():
+    """Clear the catalogue cache on every Timesheets.Projects change."""
+    while True:
+        try:
+            async with client["Timesheets"]["Projects"].watch() as stream:
+                # Changes made while the stream was down are unknown
+                clear_project_catalogue()
+                logger.info("👀 Watching Timesheets.Projects for catalogue changes")
+                async for _ in stream:
+                    clear_project_catalogue()
+        except asyncio.CancelledError:
+            raise
+        except OperationFailure as e:
+            if e.code == 40573:   # standalone server: no change streams
+                logger.info("ℹ️ Change streams unavailable - project catalogue relies on its %ss TTL",
+                            int(PROJECT_CATALOGUE_TTL_SECONDS))
+                return
+            logger.warning("⚠️ Project catalogue change stream failed: %s", e)
+        except PyMongoError as e:
+            logger.warning("⚠️ Project catalogue change stream failed: %s", e)
+        clear_project_catalogue()
+        await asyncio.sleep(PROJECT_CATALOGUE_RETRY_SECONDS)
+
+
+@app.on_event("startup")
+async def init_project_catalogue():
+    task = asyncio.create_task(watch_project_catalogue())
+    project_catalogue_tasks.add(task)
+    task.add_done_callback(project_catalogue_tasks.discard)
+
+
 @app.get("/api/projects/{employee_code}")
-async def get_employee_projects(employee_code: str, current_user=Depends(get_current_user)):
+async def get_employee_projects(employee_code: str, request: Request, current_user=Depends(get_current_user)):
     """
     Fetch projects from Timesheets.Projects filtered by the
     employee's partner_emp_code.
     Returns a flat project list + a deduplicated client list.
+    Supports If-None-Match (304).
     """
     try:
         emp_code = employee_code.strip().upper()
@@ -5996,63 +8365,123 @@ async def get_employee_projects(employee_code: str, current_user=Depends(get_cur
             raise HTTPException(status_code=403, detail="Access denied")
  
         # Get employee's partner code from Employee_details
-        emp = await db["Employee_details"].find_one({"EmpID": emp_code})
-        if not emp:
+        partner_emp_code = await get_employee_partner_code(emp_code)
+        if partner_emp_code is None:
             raise HTTPException(status_code=404, detail="Employee not found")
  
-        partner_emp_code = emp.get("PartnerEmpCode", "").strip().upper()
-        print(f"📂 Projects request — emp: {emp_code}, partner: {partner_emp_code}")
+        logger.debug("📂 Projects request — emp: %s, partner: %s", emp_code, partner_emp_code)
  
         if not partner_emp_code:
             return {"projects": [], "clients": []}
  
-        # Query the Timesheets database (different DB on same cluster)
-        timesheets_db = client["Timesheets"]
-        cursor = timesheets_db["Projects"].find(
-            {"partner_emp_code": partner_emp_code},
-            {"_id": 0}      # exclude ObjectId to keep JSON simple
-        )
-        raw = await cursor.to_list(length=None)
-        print(f"✅ Found {len(raw)} projects for partner {partner_emp_code}")
- 
-        # Deduplicate by project_code
-        seen = set()
-        projects = []
-        for p in raw:
-            code = (p.get("project_code") or "").strip()
-            if code in seen:
-                continue
-            seen.add(code)
-            projects.append({
-                "project_code": code,
-                "project_name": (p.get("project_name") or "").strip(),
-                "client_code":  (p.get("client_code")  or "").strip(),
-                "client_name":  (p.get("client_name")  or "").strip(),
-            })
- 
-        # Build sorted unique client list
-        client_map = {}
-        for p in projects:
-            if p["client_code"] and p["client_name"]:
-                client_map[p["client_code"]] = p["client_name"]
- 
-        clients = [
-            {"client_code": k, "client_name": v}
-            for k, v in sorted(client_map.items(), key=lambda x: x[1].lower())
-        ]
- 
-        return {
-            "projects": projects,
-            "clients":  clients,
-        }
+        etag, body = await get_project_catalogue(partner_emp_code)
+        headers = {"ETag": etag, "Cache-Control": PROJECT_CATALOGUE_CACHE_CONTROL}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
  
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ get_employee_projects error: {e}")
-        import traceback; traceback.print_exc()
+        logger.exception("❌ get_employee_projects error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+def build_audit_entry(e: dict, emp_details: dict, receipt_claims: dict = None) -> dict:
+    """Audit report row for one OPE_entries row, with its flags detected."""
+    flags = []
+    flag_detail = ""
+
+    # FLAG 1: NO SUPPORTING DOCUMENT
+    if not e.get("ticket_pdf"):
+        flags.append("NO_SUPPORTING_DOCUMENT")
+        flag_detail = "No supporting PDF attached"
+
+    # FLAG 2: WEEKEND CLAIM
+    try:
+        date_obj = datetime.strptime(e.get("date", ""), "%Y-%m-%d")
+        if date_obj.weekday() >= 5:  # Saturday=5, Sunday=6
+            flags.append("WEEKEND_CLAIM")
+            if flag_detail:
+                flag_detail += " | "
+            flag_detail += f"Weekend claim ({date_obj.strftime('%A')})"
+    except:
+        pass
+
+    # FLAG 3: APPROVED WITHOUT HR SIGN-OFF
+    if e.get("status", "") == "approved" and not e.get("hr_approved"):
+        flags.append("APPROVED_NO_HR_SIGNOFF")
+        if flag_detail:
+            flag_detail += " | "
+        flag_detail += "HR approval pending"
+
+    # FLAG 4: SAME RECEIPT ON SEVERAL CLAIMS (receipts are content-addressed,
+    # so an identical PDF always carries the same ticket_pdf id)
+    claims = (receipt_claims or {}).get(e.get("ticket_pdf"), 0)
+    if claims > 1:
+        flags.append("DUPLICATE_RECEIPT")
+        if flag_detail:
+            flag_detail += " | "
+        flag_detail += f"Same receipt attached to {claims} claims"
+
+    return {
+        "employee_id": e.get("employee_id", ""),
+        "employee_name": e.get("employee_name", ""),
+        "designation": emp_details.get("Designation Name", ""),
+        "partner": emp_details.get("Partner", ""),
+        "reporting_manager": emp_details.get("ReportingEmpName", ""),
+        "payroll_month": e.get("payroll_month", ""),
+        "date": e.get("date", ""),
+        "client": e.get("client", ""),
+        "project_id": e.get("project_id", ""),
+        "project_name": e.get("project_name", ""),
+        "project_type": e.get("project_type", ""),
+        "location_from": e.get("location_from", ""),
+        "location_to": e.get("location_to", ""),
+        "travel_mode": e.get("travel_mode", ""),
+        "amount": e.get("amount", 0.0),
+        "original_amount": safe_float(e.get("original_amount") or e.get("amount", 0)),
+        "status": e.get("status", ""),
+        "hr_approved": e.get("hr_approved", False),
+        "approved_by": e.get("approved_by", ""),
+        "approved_date": e.get("approved_date", ""),
+        "has_supporting": bool(e.get("ticket_pdf")),
+        "flags": flags,
+        "flag_detail": flag_detail
+    }
+
+
+async def get_shared_receipts(payroll_month: str = None) -> dict:
+    """
+    ticket_pdf -> number of OPE_entries rows using it, for receipts attached
+    to more than one claim. Both steps run on the ticket_pdf / payroll_month
+    indexes; a month's receipts are also counted against other months.
+    """
+    if payroll_month:
+        ticket_ids = await db["OPE_entries"].distinct("ticket_pdf", {"payroll_month": payroll_month})
+        match = {"ticket_pdf": {"$in": [t for t in ticket_ids if t]}}
+    else:
+        match = {"ticket_pdf": {"$type": "string", "$ne": ""}}
+
+    cursor = db["OPE_entries"].aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$ticket_pdf", "claims": {"$sum": 1}}},
+        {"$match": {"claims": {"$gt": 1}}},
+    ])
+    return {doc["_id"]: doc["claims"] async for doc in cursor}
+
+
+async def iter_audit_entries(payroll_month: str = None):
+    emp_map = await get_employee_details_map()
+    receipt_claims = await get_shared_receipts(payroll_month)
+
+    query = {"payroll_month": payroll_month} if payroll_month else {}
+    cursor = db["OPE_entries"].find(query, allow_disk_use=True).sort(
+        [("employee_id", 1), ("payroll_month", 1)]
+    )
+    async for e in cursor:
+        yield build_audit_entry(e, emp_map.get(e.get("employee_id", ""), {}), receipt_claims)
+
+
 @app.get("/api/admin/export/audit-report")
 async def export_audit_report(
     payroll_month: str = Query(None),
@@ -6068,321 +8497,82 @@ async def export_audit_report(
     """
     try:
         await verify_admin(current_user)
-        
-        # Fetch all data
-        all_ope_docs = await db["OPE_data"].find({}).to_list(length=None)
-        all_status_docs = await db["Status"].find({}).to_list(length=None)
-        emp_details_list = await db["Employee_details"].find({}).to_list(length=None)
-        emp_map = {e.get("EmpID", ""): e for e in emp_details_list}
-        
-        # Build flat entry list
-        all_entries = []
-        for ope_doc in all_ope_docs:
-            emp_id = ope_doc.get("employeeId", "")
-            emp_name = ope_doc.get("employeeName", "")
-            emp_details = emp_map.get(emp_id, {})
-            
-            for data_item in ope_doc.get("Data", []):
-                for month_range, entries in data_item.items():
-                    if payroll_month and month_range != payroll_month:
-                        continue
-                    
-                    for entry in entries:
-                        # Detect flags
-                        flags = []
-                        flag_detail = ""
-                        
-                        # FLAG 1: NO SUPPORTING DOCUMENT
-                        if not entry.get("ticket_pdf"):
-                            flags.append("NO_SUPPORTING_DOCUMENT")
-                            flag_detail = "No supporting PDF attached"
-                        
-                        # FLAG 2: WEEKEND CLAIM
-                        try:
-                            date_obj = datetime.strptime(entry.get("date", ""), "%Y-%m-%d")
-                            if date_obj.weekday() >= 5:  # Saturday=5, Sunday=6
-                                flags.append("WEEKEND_CLAIM")
-                                if flag_detail:
-                                    flag_detail += " | "
-                                flag_detail += f"Weekend claim ({date_obj.strftime('%A')})"
-                        except:
-                            pass
-                        
-                        # FLAG 3: APPROVED WITHOUT HR SIGN-OFF
-                        if entry.get("status", "").lower() == "approved" and not entry.get("hr_approved"):
-                            flags.append("APPROVED_NO_HR_SIGNOFF")
-                            if flag_detail:
-                                flag_detail += " | "
-                            flag_detail += "HR approval pending"
-                        
-                        all_entries.append({
-                            "employee_id": emp_id,
-                            "employee_name": emp_name,
-                            "designation": emp_details.get("Designation Name", ""),
-                            "partner": emp_details.get("Partner", ""),
-                            "reporting_manager": emp_details.get("ReportingEmpName", ""),
-                            "payroll_month": month_range,
-                            "date": entry.get("date", ""),
-                            "client": entry.get("client", ""),
-                            "project_id": entry.get("project_id", ""),
-                            "project_name": entry.get("project_name", ""),
-                            "project_type": entry.get("project_type", ""),
-                            "location_from": entry.get("location_from", ""),
-                            "location_to": entry.get("location_to", ""),
-                            "travel_mode": entry.get("travel_mode", ""),
-                            "amount": safe_float(entry.get("amount", 0)),
-                            "original_amount": safe_float(entry.get("original_amount") or entry.get("amount", 0)),
-                            "status": entry.get("status", ""),
-                            "hr_approved": entry.get("hr_approved", False),
-                            "approved_by": entry.get("approved_by", ""),
-                            "approved_date": entry.get("approved_date", ""),
-                            "has_supporting": bool(entry.get("ticket_pdf")),
-                            "flags": flags,
-                            "flag_detail": flag_detail
-                        })
-        
-        # Calculate summary statistics
-        total_entries = len(all_entries)
-        unique_employees = len(set(e["employee_id"] for e in all_entries))
-        total_amount = sum(e["amount"] for e in all_entries)
-        approved_amount = sum(e["amount"] for e in all_entries if e["status"].lower() == "approved")
-        pending_amount = sum(e["amount"] for e in all_entries if e["status"].lower() == "pending")
-        all_flags = [e for e in all_entries if e["flags"]]
-        critical_flags = [e for e in all_entries if any(f in ["DUPLICATE_CLAIM", "NO_SUPPORTING_DOCUMENT"] for f in e["flags"])]
-        weekend_claims = [e for e in all_entries if "WEEKEND_CLAIM" in e["flags"]]
-        no_supporting = [e for e in all_entries if "NO_SUPPORTING_DOCUMENT" in e["flags"]]
-        
-        # Create workbook
-        wb = openpyxl.Workbook()
-        wb.remove(wb.active)  # Remove default sheet
-        
-        # ─ SHEET 1: SUMMARY DASHBOARD ─
-        ws1 = wb.create_sheet("Summary Dashboard", 0)
-        ws1.column_dimensions["A"].width = 30
-        ws1.column_dimensions["B"].width = 20
-        
-        header_fill = PatternFill("solid", fgColor="1E3A5F")
-        header_font = Font(color="FFFFFF", bold=True, size=12)
-        
-        row = 1
-        ws1[f"A{row}"] = "AUDIT REPORT SUMMARY"
-        ws1[f"A{row}"].font = Font(bold=True, size=14, color="FFFFFF")
-        ws1[f"A{row}"].fill = PatternFill("solid", fgColor="1E3A5F")
-        row += 2
-        
-        summary_data = [
-            ("Total Entries", total_entries),
-            ("Total Employees", unique_employees),
-            ("Total Amount (₹)", f"₹{total_amount:,.2f}"),
-            ("Approved Amount (₹)", f"₹{approved_amount:,.2f}"),
-            ("Pending Amount (₹)", f"₹{pending_amount:,.2f}"),
-            ("Total Flags", len(all_flags)),
-            ("Weekend Claims", len(weekend_claims)),
-            ("No Supporting Docs", len(no_supporting)),
-            ("Critical Flags", len(critical_flags)),
-        ]
-        
-        for label, value in summary_data:
-            ws1[f"A{row}"] = label
-            ws1[f"A{row}"].font = Font(bold=True)
-            ws1[f"B{row}"] = value
-            ws1[f"B{row}"].font = Font(size=11)
-            row += 1
-        
-        # ─ SHEET 2: EMPLOYEE SUMMARY ─
-        ws2 = wb.create_sheet("Employee Summary", 1)
-        
-        # Build employee summary
-        emp_summary = defaultdict(lambda: {
-            "name": "",
-            "designation": "",
-            "total_claims": 0,
-            "total_amount": 0.0,
-            "approved_amt": 0.0,
-            "pending_amt": 0.0,
-            "rejected_amt": 0.0,
-            "no_supporting": 0,
-            "weekend_claims": 0,
-            "total_flags": 0
-        })
-        
-        for entry in all_entries:
-            emp_id = entry["employee_id"]
-            emp_summary[emp_id]["name"] = entry["employee_name"]
-            emp_summary[emp_id]["designation"] = entry["designation"]
-            emp_summary[emp_id]["total_claims"] += 1
-            emp_summary[emp_id]["total_amount"] += entry["amount"]
-            
-            if entry["status"].lower() == "approved":
-                emp_summary[emp_id]["approved_amt"] += entry["amount"]
-            elif entry["status"].lower() == "pending":
-                emp_summary[emp_id]["pending_amt"] += entry["amount"]
-            else:
-                emp_summary[emp_id]["rejected_amt"] += entry["amount"]
-            
-            if "NO_SUPPORTING_DOCUMENT" in entry["flags"]:
-                emp_summary[emp_id]["no_supporting"] += 1
-            if "WEEKEND_CLAIM" in entry["flags"]:
-                emp_summary[emp_id]["weekend_claims"] += 1
-            
-            emp_summary[emp_id]["total_flags"] += len(entry["flags"])
-        
-        # Write headers
-        headers = ["Employee ID", "Name", "Designation", "Total Claims", "Total Amount (₹)", 
-                  "Approved (₹)", "Pending (₹)", "Rejected (₹)", "No Supporting", "Weekend Claims", "Total Flags"]
-        for col, header in enumerate(headers, 1):
-            cell = ws2.cell(row=1, column=col, value=header)
-            cell.fill = PatternFill("solid", fgColor="1E3A5F")
-            cell.font = Font(color="FFFFFF", bold=True)
-        
-        row = 2
-        for emp_id in sorted(emp_summary.keys()):
-            data = emp_summary[emp_id]
-            ws2.cell(row=row, column=1, value=emp_id)
-            ws2.cell(row=row, column=2, value=data["name"])
-            ws2.cell(row=row, column=3, value=data["designation"])
-            ws2.cell(row=row, column=4, value=data["total_claims"])
-            ws2.cell(row=row, column=5, value=f"₹{data['total_amount']:,.2f}")
-            ws2.cell(row=row, column=6, value=f"₹{data['approved_amt']:,.2f}")
-            ws2.cell(row=row, column=7, value=f"₹{data['pending_amt']:,.2f}")
-            ws2.cell(row=row, column=8, value=f"₹{data['rejected_amt']:,.2f}")
-            ws2.cell(row=row, column=9, value=data["no_supporting"])
-            ws2.cell(row=row, column=10, value=data["weekend_claims"])
-            ws2.cell(row=row, column=11, value=data["total_flags"])
-            row += 1
-        
-        # Auto-width columns
-        for col in range(1, len(headers) + 1):
-            ws2.column_dimensions[get_column_letter(col)].width = 18
-        
-        # ─ SHEET 3: ALL FLAGS - DETAILED ─
-        ws3 = wb.create_sheet("All Flags - Detailed", 2)
-        
-        flag_headers = ["Sr.No", "Flag Type", "Employee ID", "Name", "Date", "From", "To", 
-                       "Travel Mode", "Amount (₹)", "Status", "Flag Detail"]
-        for col, header in enumerate(flag_headers, 1):
-            cell = ws3.cell(row=1, column=col, value=header)
-            cell.fill = PatternFill("solid", fgColor="D97706")
-            cell.font = Font(color="FFFFFF", bold=True)
-        
-        row = 2
-        sr_no = 1
-        for entry in all_entries:
-            if entry["flags"]:
-                for flag in entry["flags"]:
-                    ws3.cell(row=row, column=1, value=sr_no)
-                    ws3.cell(row=row, column=2, value=flag)
-                    ws3.cell(row=row, column=3, value=entry["employee_id"])
-                    ws3.cell(row=row, column=4, value=entry["employee_name"])
-                    ws3.cell(row=row, column=5, value=entry["date"])
-                    ws3.cell(row=row, column=6, value=entry["location_from"])
-                    ws3.cell(row=row, column=7, value=entry["location_to"])
-                    ws3.cell(row=row, column=8, value=entry["travel_mode"])
-                    ws3.cell(row=row, column=9, value=f"₹{entry['amount']:,.2f}")
-                    ws3.cell(row=row, column=10, value=entry["status"])
-                    ws3.cell(row=row, column=11, value=entry["flag_detail"])
-                    row += 1
-                    sr_no += 1
-        
-        for col in range(1, len(flag_headers) + 1):
-            ws3.column_dimensions[get_column_letter(col)].width = 16
-        
-        # ─ SHEET 4: CRITICAL FLAGS ─
-        ws4 = wb.create_sheet("Critical Flags", 3)
-        
-        for col, header in enumerate(flag_headers, 1):
-            cell = ws4.cell(row=1, column=col, value=header)
-            cell.fill = PatternFill("solid", fgColor="EF4444")
-            cell.font = Font(color="FFFFFF", bold=True)
-        
-        row = 2
-        sr_no = 1
-        for entry in critical_flags:
-            critical_flags_only = [f for f in entry["flags"] 
-                                  if f in ["DUPLICATE_CLAIM", "NO_SUPPORTING_DOCUMENT"]]
-            if critical_flags_only:
-                for flag in critical_flags_only:
-                    ws4.cell(row=row, column=1, value=sr_no)
-                    ws4.cell(row=row, column=2, value=flag)
-                    ws4.cell(row=row, column=3, value=entry["employee_id"])
-                    ws4.cell(row=row, column=4, value=entry["employee_name"])
-                    ws4.cell(row=row, column=5, value=entry["date"])
-                    ws4.cell(row=row, column=6, value=entry["location_from"])
-                    ws4.cell(row=row, column=7, value=entry["location_to"])
-                    ws4.cell(row=row, column=8, value=entry["travel_mode"])
-                    ws4.cell(row=row, column=9, value=f"₹{entry['amount']:,.2f}")
-                    ws4.cell(row=row, column=10, value=entry["status"])
-                    ws4.cell(row=row, column=11, value=entry["flag_detail"])
-                    row += 1
-                    sr_no += 1
-        
-        for col in range(1, len(flag_headers) + 1):
-            ws4.column_dimensions[get_column_letter(col)].width = 16
-        
-        # ─ SHEET 5: ORIGINAL DATA ─
-        ws5 = wb.create_sheet("Original Data", 4)
-        
-        data_headers = ["Employee ID", "Name", "Designation", "Partner", "Reporting Manager", 
-                       "Payroll Month", "Date", "Client", "Project ID", "Project Name", "Project Type",
-                       "From", "To", "Travel Mode", "Amount (₹)", "Original Amount (₹)", 
-                       "Status", "HR Approved", "Approved By", "Approved Date", "Has Supporting"]
-        
-        for col, header in enumerate(data_headers, 1):
-            cell = ws5.cell(row=1, column=col, value=header)
-            cell.fill = PatternFill("solid", fgColor="1E40AF")
-            cell.font = Font(color="FFFFFF", bold=True, size=10)
-        
-        row = 2
-        for entry in all_entries:
-            ws5.cell(row=row, column=1, value=entry["employee_id"])
-            ws5.cell(row=row, column=2, value=entry["employee_name"])
-            ws5.cell(row=row, column=3, value=entry["designation"])
-            ws5.cell(row=row, column=4, value=entry["partner"])
-            ws5.cell(row=row, column=5, value=entry["reporting_manager"])
-            ws5.cell(row=row, column=6, value=entry["payroll_month"])
-            ws5.cell(row=row, column=7, value=entry["date"])
-            ws5.cell(row=row, column=8, value=entry["client"])
-            ws5.cell(row=row, column=9, value=entry["project_id"])
-            ws5.cell(row=row, column=10, value=entry["project_name"])
-            ws5.cell(row=row, column=11, value=entry["project_type"])
-            ws5.cell(row=row, column=12, value=entry["location_from"])
-            ws5.cell(row=row, column=13, value=entry["location_to"])
-            ws5.cell(row=row, column=14, value=entry["travel_mode"])
-            ws5.cell(row=row, column=15, value=f"₹{entry['amount']:,.2f}")
-            ws5.cell(row=row, column=16, value=f"₹{entry['original_amount']:,.2f}")
-            ws5.cell(row=row, column=17, value=entry["status"])
-            ws5.cell(row=row, column=18, value="Yes" if entry["hr_approved"] else "No")
-            ws5.cell(row=row, column=19, value=entry["approved_by"])
-            ws5.cell(row=row, column=20, value=entry["approved_date"])
-            ws5.cell(row=row, column=21, value="Yes" if entry["has_supporting"] else "No")
-            row += 1
-        
-        for col in range(1, len(data_headers) + 1):
-            ws5.column_dimensions[get_column_letter(col)].width = 14
-        
-        # Freeze panes for all sheets
-        for ws in [ws2, ws3, ws4, ws5]:
-            ws.freeze_panes = "A2"
-        
-        # Save to bytes
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
+
         filename = f"OPE_Audit_Report{'_' + payroll_month if payroll_month else ''}_{datetime.now().strftime('%Y%m%d')}.xlsx"
-        
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        return await render_xlsx(
+            excel_reports.render_audit_report,
+            iter_audit_entries(payroll_month),
+            filename,
         )
-        
+
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Error generating audit report: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error generating audit report: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
- 
+
+
+DUPLICATE_ROUTE_CHUNK = 50
+
+
+def build_duplicate_claim(e: dict, emp_info: dict) -> dict:
+    return {
+        "route": e.get("route", ""),
+        "employee_id": e.get("employee_id", ""),
+        "employee_name": e.get("employee_name", ""),
+        "designation": emp_info.get("Designation Name", ""),
+        "partner": emp_info.get("Partner", ""),
+        "reporting_manager": emp_info.get("ReportingEmpName", ""),
+        "payroll_month": e.get("payroll_month", ""),
+        "date": e.get("date", ""),
+        "client": e.get("client", ""),
+        "project_id": e.get("project_id", ""),
+        "project_name": e.get("project_name", ""),
+        "travel_mode": e.get("travel_mode", ""),
+        "amount": e.get("amount", 0.0),
+        "status": e.get("status", ""),
+        "remarks": e.get("remarks", ""),
+    }
+
+
+async def iter_duplicate_route_groups(payroll_month: str = None):
+    """
+    Yields (route, claims) for every approved route claimed more than once,
+    most-claimed first. Route counts come from one $group; claims are then
+    fetched a few routes at a time so only one chunk is held in memory.
+    """
+    match = {"status": "approved"}
+    if payroll_month:
+        match["payroll_month"] = payroll_month
+
+    route_pipeline = [
+        {"$match": match},
+        {"$group": {"_id": "$route", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$sort": {"count": -1, "_id": 1}},
+    ]
+    routes = [r["_id"] async for r in db["OPE_entries"].aggregate(route_pipeline, allowDiskUse=True)]
+    if not routes:
+        return
+
+    emp_map = await get_employee_details_map()
+    projection = {
+        "route": 1, "employee_id": 1, "employee_name": 1, "payroll_month": 1, "date": 1,
+        "client": 1, "project_id": 1, "project_name": 1, "travel_mode": 1, "amount": 1,
+        "status": 1, "remarks": 1,
+    }
+
+    for i in range(0, len(routes), DUPLICATE_ROUTE_CHUNK):
+        chunk = routes[i:i + DUPLICATE_ROUTE_CHUNK]
+        route_claims = {route: [] for route in chunk}
+        async for e in db["OPE_entries"].find({**match, "route": {"$in": chunk}}, projection):
+            route_claims[e.get("route")].append(
+                build_duplicate_claim(e, emp_map.get(e.get("employee_id", ""), {}))
+            )
+        for route in chunk:
+            yield route, route_claims[route]
+
+
 @app.get("/api/admin/export/duplicate-claims")
 async def export_duplicate_claims_excel(
     payroll_month: str = Query(None),
@@ -6394,287 +8584,344 @@ async def export_duplicate_claims_excel(
     """
     try:
         await verify_admin(current_user)
- 
-        all_ope_docs = await db["OPE_data"].find({}).to_list(length=None)
-        emp_details_list = await db["Employee_details"].find({}).to_list(length=None)
-        emp_map = {e.get("EmpID", ""): e for e in emp_details_list}
- 
-        # Build location → claims map
-        location_claims = {}
- 
-        for ope_doc in all_ope_docs:
-            emp_id = ope_doc.get("employeeId", "")
-            emp_name = ope_doc.get("employeeName", "")
-            emp_info = emp_map.get(emp_id, {})
- 
-            for data_item in ope_doc.get("Data", []):
-                for month_range, entries in data_item.items():
-                    if payroll_month and month_range != payroll_month:
-                        continue
- 
-                    for entry in entries:
-                        if entry.get("status", "").lower() != "approved":
-                            continue
- 
-                        loc_from = entry.get("location_from", "Unknown")
-                        loc_to = entry.get("location_to", "Unknown")
-                        route = f"{loc_from} → {loc_to}"
- 
-                        if route not in location_claims:
-                            location_claims[route] = []
- 
-                        location_claims[route].append({
-                            "route": route,
-                            "employee_id": emp_id,
-                            "employee_name": emp_name,
-                            "designation": emp_info.get("Designation Name", ""),
-                            "partner": emp_info.get("Partner", ""),
-                            "reporting_manager": emp_info.get("ReportingEmpName", ""),
-                            "payroll_month": month_range,
-                            "date": entry.get("date", ""),
-                            "client": entry.get("client", ""),
-                            "project_id": entry.get("project_id", ""),
-                            "project_name": entry.get("project_name", ""),
-                            "travel_mode": entry.get("travel_mode", ""),
-                            "amount": safe_float(entry.get("amount", 0)),
-                            "status": entry.get("status", ""),
-                            "remarks": entry.get("remarks", ""),
-                        })
- 
-        # Filter to only locations with duplicates
-        duplicate_routes = {
-            route: claims
-            for route, claims in location_claims.items()
-            if len(claims) > len(set(c["employee_id"] for c in claims))
-               or len(claims) > 1
-        }
- 
-        # Sort by duplicate count
-        sorted_routes = sorted(
-            duplicate_routes.items(),
-            key=lambda x: len(x[1]),
-            reverse=True
-        )
- 
-        # Build Excel
-        wb = openpyxl.Workbook()
- 
-        # ─ SHEET 1: SUMMARY ─
-        ws_sum = wb.active
-        ws_sum.title = "Summary"
- 
-        hdr_fill = PatternFill("solid", fgColor="1E3A5F")
-        hdr_font = Font(color="FFFFFF", bold=True, size=11)
-        border = Border(
-            left=Side(style="thin", color="CCCCCC"),
-            right=Side(style="thin", color="CCCCCC"),
-            top=Side(style="thin", color="CCCCCC"),
-            bottom=Side(style="thin", color="CCCCCC"),
-        )
- 
-        # Title
-        ws_sum["A1"] = "DUPLICATE LOCATION CLAIMS REPORT"
-        ws_sum["A1"].font = Font(bold=True, size=14, color="FFFFFF")
-        ws_sum["A1"].fill = PatternFill("solid", fgColor="991B1B")
-        ws_sum.merge_cells("A1:G1")
-        ws_sum["A2"] = f"Generated: {datetime.now().strftime('%d %b %Y %H:%M')}"
-        ws_sum["A2"].font = Font(italic=True, size=10, color="666666")
-        if payroll_month:
-            ws_sum["A3"] = f"Filter: Payroll Month = {payroll_month}"
-            ws_sum["A3"].font = Font(italic=True, size=10, color="666666")
- 
-        sum_headers = ["#", "Route (From → To)", "Total Claims", "Unique Employees",
-                       "Duplicate Claims", "Avg Amount (₹)", "Amount Spread (₹)"]
-        for ci, h in enumerate(sum_headers, 1):
-            cell = ws_sum.cell(row=5, column=ci, value=h)
-            cell.fill = hdr_fill
-            cell.font = hdr_font
-            cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-            cell.border = border
- 
-        ws_sum.row_dimensions[5].height = 30
- 
-        for idx, (route, claims) in enumerate(sorted_routes, 1):
-            unique_emps = len(set(c["employee_id"] for c in claims))
-            amounts = [c["amount"] for c in claims]
-            avg_amt = sum(amounts) / len(amounts) if amounts else 0
-            spread = max(amounts) - min(amounts) if amounts else 0
-            dup_count = len(claims) - unique_emps
- 
-            row_num = idx + 5
-            alt_fill = PatternFill("solid", fgColor="FFF3F3" if dup_count > 5 else "FFFFFF")
-            vals = [idx, route, len(claims), unique_emps, dup_count,
-                    round(avg_amt, 2), round(spread, 2)]
- 
-            for ci, v in enumerate(vals, 1):
-                cell = ws_sum.cell(row=row_num, column=ci, value=v)
-                cell.fill = alt_fill
-                cell.alignment = Alignment(horizontal="center" if ci != 2 else "left",
-                                           vertical="center")
-                cell.border = border
- 
-        # Column widths for summary
-        widths = [5, 45, 14, 16, 16, 18, 18]
-        for ci, w in enumerate(widths, 1):
-            ws_sum.column_dimensions[get_column_letter(ci)].width = w
- 
-        ws_sum.freeze_panes = "A6"
- 
-        # ─ SHEET 2: DETAILED CLAIMS ─
-        ws_det = wb.create_sheet("Detailed Claims", 1)
- 
-        det_headers = ["#", "Route (From → To)", "Employee ID", "Employee Name",
-                       "Designation", "Partner", "Payroll Month", "Date",
-                       "Client", "Project Name", "Travel Mode",
-                       "Amount (₹)", "Status", "Claim Type", "% of Route Avg"]
- 
-        for ci, h in enumerate(det_headers, 1):
-            cell = ws_det.cell(row=1, column=ci, value=h)
-            cell.fill = hdr_fill
-            cell.font = hdr_font
-            cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-            cell.border = border
-        ws_det.row_dimensions[1].height = 30
- 
-        # Color fills
-        fill_normal = PatternFill("solid", fgColor="FFFFFF")
-        fill_short = PatternFill("solid", fgColor="FEE2E2")    # Red - short claims
-        fill_excess = PatternFill("solid", fgColor="FEF3C7")   # Yellow - excess claims
-        fill_route_hdr = PatternFill("solid", fgColor="EFF6FF") # Blue - route separator
- 
-        det_row = 2
-        sr_no = 1
- 
-        for route, claims in sorted_routes:
-            amounts = [c["amount"] for c in claims]
-            avg_amt = sum(amounts) / len(amounts) if amounts else 0
- 
-            # Route separator row
-            sep_cell = ws_det.cell(row=det_row, column=1,
-                                   value=f"▶ {route}  |  {len(claims)} claims  |  Avg ₹{avg_amt:,.2f}")
-            sep_cell.fill = fill_route_hdr
-            sep_cell.font = Font(bold=True, size=11, color="1E3A5F")
-            ws_det.merge_cells(f"A{det_row}:O{det_row}")
-            det_row += 1
- 
-            for claim in sorted(claims, key=lambda x: x["amount"], reverse=True):
-                amt = claim["amount"]
-                pct = (amt / avg_amt * 100) if avg_amt > 0 else 0
- 
-                if pct < 80:
-                    claim_type = "⬇ SHORT"
-                    row_fill = fill_short
-                elif pct > 120:
-                    claim_type = "⬆ EXCESS"
-                    row_fill = fill_excess
-                else:
-                    claim_type = "✓ NORMAL"
-                    row_fill = fill_normal
- 
-                vals = [sr_no, route, claim["employee_id"], claim["employee_name"],
-                        claim["designation"], claim["partner"], claim["payroll_month"],
-                        claim["date"], claim["client"], claim["project_name"],
-                        claim["travel_mode"], amt, claim["status"],
-                        claim_type, f"{pct:.1f}%"]
- 
-                for ci, v in enumerate(vals, 1):
-                    cell = ws_det.cell(row=det_row, column=ci, value=v)
-                    cell.fill = row_fill
-                    cell.alignment = Alignment(horizontal="center" if ci not in [2, 4, 5, 6, 9, 10]
-                                               else "left", vertical="center")
-                    cell.border = border
-                    if ci == 12:  # Amount column
-                        cell.number_format = '#,##0.00'
- 
-                det_row += 1
-                sr_no += 1
- 
-        # Column widths for detail
-        det_widths = [5, 35, 12, 20, 18, 15, 18, 12, 25, 25, 15, 14, 10, 10, 12]
-        for ci, w in enumerate(det_widths, 1):
-            ws_det.column_dimensions[get_column_letter(ci)].width = w
- 
-        ws_det.freeze_panes = "A2"
- 
-        # ─ SHEET 3: EMPLOYEE SUMMARY ─
-        ws_emp = wb.create_sheet("Employee Analysis", 2)
- 
-        emp_dup_stats = defaultdict(lambda: {
-            "name": "", "designation": "", "partner": "",
-            "total_claims": 0, "total_amount": 0.0,
-            "routes": set(), "short_claims": 0, "excess_claims": 0
-        })
- 
-        for route, claims in duplicate_routes.items():
-            amounts = [c["amount"] for c in claims]
-            avg = sum(amounts) / len(amounts) if amounts else 0
-            for c in claims:
-                eid = c["employee_id"]
-                emp_dup_stats[eid]["name"] = c["employee_name"]
-                emp_dup_stats[eid]["designation"] = c["designation"]
-                emp_dup_stats[eid]["partner"] = c["partner"]
-                emp_dup_stats[eid]["total_claims"] += 1
-                emp_dup_stats[eid]["total_amount"] += c["amount"]
-                emp_dup_stats[eid]["routes"].add(route)
-                pct = (c["amount"] / avg * 100) if avg > 0 else 100
-                if pct < 80:
-                    emp_dup_stats[eid]["short_claims"] += 1
-                elif pct > 120:
-                    emp_dup_stats[eid]["excess_claims"] += 1
- 
-        emp_headers = ["Employee ID", "Name", "Designation", "Partner",
-                       "Total Claims", "Total Amount (₹)", "Unique Routes",
-                       "Short Claims", "Excess Claims"]
- 
-        for ci, h in enumerate(emp_headers, 1):
-            cell = ws_emp.cell(row=1, column=ci, value=h)
-            cell.fill = hdr_fill
-            cell.font = hdr_font
-            cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-            cell.border = border
-        ws_emp.row_dimensions[1].height = 30
- 
-        for ri, (eid, stats) in enumerate(
-            sorted(emp_dup_stats.items(), key=lambda x: x[1]["total_claims"], reverse=True), 2
-        ):
-            has_issue = stats["short_claims"] > 0 or stats["excess_claims"] > 0
-            row_fill = PatternFill("solid", fgColor="FEF3C7" if has_issue else "FFFFFF")
- 
-            vals = [eid, stats["name"], stats["designation"], stats["partner"],
-                    stats["total_claims"], round(stats["total_amount"], 2),
-                    len(stats["routes"]), stats["short_claims"], stats["excess_claims"]]
- 
-            for ci, v in enumerate(vals, 1):
-                cell = ws_emp.cell(row=ri, column=ci, value=v)
-                cell.fill = row_fill
-                cell.alignment = Alignment(horizontal="center" if ci not in [2, 3, 4] else "left",
-                                           vertical="center")
-                cell.border = border
- 
-        emp_widths = [12, 22, 18, 18, 14, 18, 15, 14, 14]
-        for ci, w in enumerate(emp_widths, 1):
-            ws_emp.column_dimensions[get_column_letter(ci)].width = w
-        ws_emp.freeze_panes = "A2"
- 
-        # Save
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
- 
+
         filename = f"Duplicate_Claims_Report{'_' + payroll_month if payroll_month else ''}_{datetime.now().strftime('%Y%m%d')}.xlsx"
- 
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        return await render_xlsx(
+            excel_reports.render_duplicate_claims,
+            iter_duplicate_route_groups(payroll_month),
+            filename,
+            payroll_month=payroll_month,
         )
- 
+
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Error exporting duplicate claims: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error exporting duplicate claims: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
- 
+
+
+# ── 6. REPORT JOBS (ASYNC EXPORTS) ───────────────────────────
+# Month-end exports can outlive a proxy timeout, so admins can queue them
+# instead: POST a job, poll it, then download the file from GridFS. Jobs
+# for the same (report type, month, data version) share one result.
+REPORT_JOB_TTL_HOURS = int(os.getenv("REPORT_JOB_TTL_HOURS", "24"))
+REPORT_JOB_CONCURRENCY = int(os.getenv("REPORT_JOB_CONCURRENCY", "1"))
+REPORT_JOB_STALE_SECONDS = int(os.getenv("REPORT_JOB_STALE_SECONDS", "300"))
+REPORT_JOB_HEARTBEAT_SECONDS = 30
+REPORT_JOB_SWEEP_SECONDS = 600
+
+REPORT_JOB_TYPES = {
+    "client_wise": {
+        "render": excel_reports.render_client_wise,
+        "rows": iter_client_wise_rows,
+        "filename": lambda pm: f"client_wise_claims{'_' + pm if pm else ''}.xlsx",
+    },
+    "partner_wise": {
+        "render": excel_reports.render_partner_wise,
+        "rows": iter_partner_wise_rows,
+        "filename": lambda pm: f"partner_wise_claims{'_' + pm if pm else ''}.xlsx",
+    },
+    "audit_report": {
+        "render": excel_reports.render_audit_report,
+        "rows": iter_audit_entries,
+        "filename": lambda pm: f"OPE_Audit_Report{'_' + pm if pm else ''}_{datetime.now().strftime('%Y%m%d')}.xlsx",
+    },
+    "duplicate_claims": {
+        "render": excel_reports.render_duplicate_claims,
+        "rows": iter_duplicate_route_groups,
+        "filename": lambda pm: f"Duplicate_Claims_Report{'_' + pm if pm else ''}_{datetime.now().strftime('%Y%m%d')}.xlsx",
+        "params": lambda pm: {"payroll_month": pm},
+    },
+}
+
+report_job_slots = asyncio.Semaphore(max(REPORT_JOB_CONCURRENCY, 1))
+report_job_tasks = set()
+
+
+class ReportJobCreate(BaseModel):
+    report_type: str
+    payroll_month: Optional[str] = None
+
+
+def report_files_bucket():
+    return AsyncIOMotorGridFSBucket(db, bucket_name="report_files")
+
+
+async def get_report_data_version(payroll_month: str = None) -> str:
+    """
+    Cheap fingerprint of the OPE data behind a report: entry count plus the
+    latest OPE_entries sync time. Every write path (including approvals)
+    re-syncs the employee's rows, so any change moves one or the other.
+    """
+    entries = db["OPE_entries"]
+    if payroll_month:
+        count = await entries.count_documents({"payroll_month": payroll_month})
+        latest = await entries.find_one({"payroll_month": payroll_month}, {"synced_at": 1}, sort=[("synced_at", -1)])
+    else:
+        count = await entries.estimated_document_count()
+        latest = await entries.find_one({}, {"synced_at": 1}, sort=[("synced_at", -1)])
+    return f"{count}:{(latest or {}).get('synced_at', '')}"
+
+
+def report_job_view(job: dict) -> dict:
+    job_id = str(job["_id"])
+    return {
+        "job_id": job_id,
+        "report_type": job.get("report_type"),
+        "payroll_month": job.get("payroll_month"),
+        "status": job.get("status"),
+        "progress": job.get("progress", {}),
+        "filename": job.get("filename"),
+        "size": job.get("size"),
+        "error": job.get("error"),
+        "created_at": job["created_at"].isoformat() if job.get("created_at") else None,
+        "finished_at": job["finished_at"].isoformat() if job.get("finished_at") else None,
+        "expires_at": job["expires_at"].isoformat() if job.get("expires_at") else None,
+        "download_url": f"/api/admin/reports/jobs/{job_id}/download" if job.get("status") == "done" else None,
+    }
+
+
+async def expire_report_job_if_stale(job: dict) -> dict:
+    """Fail queued/running jobs whose worker stopped heart-beating (e.g. a restart)."""
+    if job.get("status") not in ("queued", "running"):
+        return job
+    heartbeat = job.get("heartbeat_at") or job.get("created_at")
+    if heartbeat and heartbeat > datetime.utcnow() - timedelta(seconds=REPORT_JOB_STALE_SECONDS):
+        return job
+    logger.warning("⚠️ Report job %s went stale, marking failed", job['_id'])
+    return await db["Report_jobs"].find_one_and_update(
+        {"_id": job["_id"], "status": job["status"]},
+        {"$set": {"status": "failed", "error": "Report worker stopped before finishing", "finished_at": datetime.utcnow()},
+         "$unset": {"dedupe": ""}},
+        return_document=True
+    ) or await db["Report_jobs"].find_one({"_id": job["_id"]})
+
+
+async def run_report_job(job_id: ObjectId):
+    jobs = db["Report_jobs"]
+    job = await jobs.find_one({"_id": job_id})
+    spec = REPORT_JOB_TYPES[job["report_type"]]
+    payroll_month = job.get("payroll_month")
+    rows_path = None
+    out_path = None
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(REPORT_JOB_HEARTBEAT_SECONDS)
+            await jobs.update_one({"_id": job_id}, {"$set": {"heartbeat_at": datetime.utcnow()}})
+
+    gathered = 0
+
+    async def set_progress(stage: str, rows: int = None, **fields):
+        nonlocal gathered
+        if rows is not None:
+            gathered = rows
+        progress = {"stage": stage, "rows": gathered}
+        await jobs.update_one({"_id": job_id}, {"$set": {"progress": progress, "heartbeat_at": datetime.utcnow(), **fields}})
+
+    beat = asyncio.create_task(heartbeat())
+    try:
+        async with report_job_slots:
+            logger.info("📊 Report job %s: %s %s", job_id, job['report_type'], payroll_month or 'all months')
+            await set_progress("gathering", 0, status="running", started_at=datetime.utcnow())
+            rows_path = await spool_export_rows(
+                spec["rows"](payroll_month),
+                on_batch=lambda n: set_progress("gathering", n)
+            )
+
+            await set_progress("rendering")
+            out_path = rows_path[:-len(".rows")] + ".xlsx"
+            params = spec["params"](payroll_month) if "params" in spec else {}
+            if EXCEL_RENDER_WORKERS > 0:
+                await excel_render_pool.render(spec["render"], rows_path, out_path, params)
+            else:
+                await asyncio.to_thread(excel_reports.render_to_file, spec["render"], rows_path, out_path, params)
+
+            await set_progress("uploading")
+            expires_at = datetime.utcnow() + timedelta(hours=REPORT_JOB_TTL_HOURS)
+            with open(out_path, "rb") as f:
+                file_id = await report_files_bucket().upload_from_stream(
+                    job["filename"], f,
+                    metadata={"job_id": job_id, "content_type": XLSX_MEDIA_TYPE, "expires_at": expires_at}
+                )
+
+            await jobs.update_one({"_id": job_id}, {"$set": {
+                "status": "done",
+                "progress": {"stage": "done", "rows": gathered},
+                "file_id": file_id,
+                "size": os.path.getsize(out_path),
+                "finished_at": datetime.utcnow(),
+                "expires_at": expires_at,
+            }})
+            logger.info("✅ Report job %s done: %s", job_id, job['filename'])
+
+    except Exception as e:
+        logger.exception("❌ Report job %s failed: %s", job_id, e)
+        await jobs.update_one({"_id": job_id}, {
+            "$set": {"status": "failed", "error": str(e), "finished_at": datetime.utcnow(),
+                     "expires_at": datetime.utcnow() + timedelta(hours=REPORT_JOB_TTL_HOURS)},
+            "$unset": {"dedupe": ""}
+        })
+    finally:
+        beat.cancel()
+        for path in (rows_path, out_path):
+            if path:
+                remove_export_file(path)
+
+
+async def purge_expired_report_jobs():
+    """Delete expired jobs together with their GridFS files (a TTL index would orphan the chunks)."""
+    bucket = report_files_bucket()
+    purged = 0
+    async for job in db["Report_jobs"].find({"expires_at": {"$lt": datetime.utcnow()}}, {"file_id": 1}):
+        if job.get("file_id"):
+            try:
+                await bucket.delete(job["file_id"])
+            except Exception:
+                pass  # already removed by another worker
+        await db["Report_jobs"].delete_one({"_id": job["_id"]})
+        purged += 1
+    if purged:
+        logger.info("🗑️ Purged %s expired report jobs", purged)
+
+
+async def sweep_report_jobs():
+    while True:
+        try:
+            await purge_expired_report_jobs()
+        except Exception as e:
+            logger.exception("⚠️ Report job sweep failed: %s", e)
+        await asyncio.sleep(REPORT_JOB_SWEEP_SECONDS)
+
+
+@app.on_event("startup")
+async def init_report_jobs():
+    task = asyncio.create_task(sweep_report_jobs())
+    report_job_tasks.add(task)
+
+
+@app.post("/api/admin/reports/jobs")
+async def create_report_job(
+    payload: ReportJobCreate,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Queue an export. Returns the existing job when the same report for the
+    same month and data version is already queued, running or finished.
+    """
+    try:
+        emp_code = await verify_admin(current_user)
+
+        if payload.report_type not in REPORT_JOB_TYPES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown report_type. Use one of: {', '.join(REPORT_JOB_TYPES)}"
+            )
+
+        payroll_month = payload.payroll_month or None
+        data_version = await get_report_data_version(payroll_month)
+        job_key = f"{payload.report_type}|{payroll_month or '*'}|{data_version}"
+        jobs = db["Report_jobs"]
+        now = datetime.utcnow()
+
+        existing = await jobs.find_one({"job_key": job_key, "dedupe": True})
+        if existing:
+            existing = await expire_report_job_if_stale(existing)
+            if existing.get("status") == "done" and existing.get("expires_at") and existing["expires_at"] <= now:
+                await jobs.update_one({"_id": existing["_id"]}, {"$unset": {"dedupe": ""}})
+                existing = None
+            elif existing.get("status") == "failed":
+                existing = None
+        if existing:
+            logger.info("♻️ Report job %s reused for %s", existing['_id'], job_key)
+            return {**report_job_view(existing), "deduplicated": True}
+
+        job = {
+            "job_key": job_key,
+            "dedupe": True,
+            "report_type": payload.report_type,
+            "payroll_month": payroll_month,
+            "data_version": data_version,
+            "filename": REPORT_JOB_TYPES[payload.report_type]["filename"](payroll_month),
+            "status": "queued",
+            "progress": {"stage": "queued"},
+            "requested_by": emp_code,
+            "created_at": now,
+            "heartbeat_at": now,
+            "expires_at": now + timedelta(hours=REPORT_JOB_TTL_HOURS),
+        }
+        try:
+            result = await jobs.insert_one(job)
+        except DuplicateKeyError:
+            # Another request queued the same job first
+            existing = await jobs.find_one({"job_key": job_key, "dedupe": True})
+            return {**report_job_view(existing), "deduplicated": True}
+
+        job["_id"] = result.inserted_id
+        task = asyncio.create_task(run_report_job(result.inserted_id))
+        report_job_tasks.add(task)
+        task.add_done_callback(report_job_tasks.discard)
+
+        logger.info("📥 Report job %s queued by %s: %s", result.inserted_id, emp_code, job_key)
+        return {**report_job_view(job), "deduplicated": False}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("❌ Error creating report job: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def get_report_job_or_404(job_id: str) -> dict:
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=404, detail="Report job not found")
+    job = await db["Report_jobs"].find_one({"_id": ObjectId(job_id)})
+    if not job:
+        raise HTTPException(status_code=404, detail="Report job not found")
+    return await expire_report_job_if_stale(job)
+
+
+@app.get("/api/admin/reports/jobs/{job_id}")
+async def get_report_job(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    await verify_admin(current_user)
+    return report_job_view(await get_report_job_or_404(job_id))
+
+
+@app.get("/api/admin/reports/jobs/{job_id}/download")
+async def download_report_job(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    await verify_admin(current_user)
+    job = await get_report_job_or_404(job_id)
+    if job.get("status") != "done":
+        raise HTTPException(status_code=409, detail=f"Report is not ready (status: {job.get('status')})")
+
+    try:
+        stream = await report_files_bucket().open_download_stream(job["file_id"])
+    except Exception as e:
+        logger.warning("❌ Report file missing for job %s: %s", job_id, e)
+        raise HTTPException(status_code=410, detail="Report file has expired")
+
+    async def body():
+        while True:
+            chunk = await stream.readchunk()
+            if not chunk:
+                break
+            yield chunk
+
+    return StreamingResponse(
+        body(),
+        media_type=XLSX_MEDIA_TYPE,
+        headers={
+            "Content-Disposition": f'attachment; filename="{job["filename"]}"',
+            "Content-Length": str(stream.length),
+        }
+    )
+
 
 # ---------- Serve static HTML ----------
 app.mount("/", StaticFiles(directory="static", html=True), name="static")
@@ -6691,7 +8938,7 @@ async def delete_ope_entry(
         employee_code = current_user["employee_code"]
         month_range = delete_data.get("month_range")
         
-        print(f"🗑️ Deleting entry: {entry_id} for employee: {employee_code}, month: {month_range}")
+        logger.debug("🗑️ Deleting entry: %s for employee: %s, month: %s", entry_id, employee_code, month_range)
         
         if not month_range:
             return JSONResponse(
@@ -6721,12 +8968,10 @@ async def delete_ope_entry(
                         deleted_amount = entry.get("amount", 0)
                         entries.pop(i)  # Remove the entry
                         entry_found = True
-                        print(f"✅ Found and removed entry: Amount ₹{deleted_amount}")
                         break
                 
                 # If this was the last entry in the month, remove the entire month
                 if entry_found and len(entries) == 0:
-                    print(f"🗑️ Removing entire month range: {month_range}")
                     # Remove the entire month object from data_array
                     for j, item in enumerate(data_array):
                         if month_range in item:
@@ -6741,11 +8986,12 @@ async def delete_ope_entry(
             )
         
         # Update the document in MongoDB
-        await db["OPE_data"].update_one(
+        await update_ope_data(
+            employee_code, [entry_id],
             {"employeeId": employee_code},
             {"$set": {"Data": data_array}}
         )
-        
+
         # Recalculate total amount for this employee and month
         new_total = 0
         remaining_entries_count = 0
@@ -6757,12 +9003,13 @@ async def delete_ope_entry(
                 new_total = sum(entry.get('amount', 0) for entry in entries)
                 break
         
-        print(f"📊 Recalculated total for {employee_code} in {month_range}: ₹{new_total} ({remaining_entries_count} entries)")
+        logger.debug("📊 Recalculated total for %s in %s: ₹%s (%s entries)", employee_code, month_range, new_total, remaining_entries_count)
         
         # Update or delete employee status
         if new_total > 0:
             # Update existing status with new total
-            await db["Status"].update_one(
+            await update_status_and_queue(
+                employee_code,
                 {"employeeId": employee_code, "month_range": month_range},
                 {
                     "$set": {
@@ -6772,15 +9019,20 @@ async def delete_ope_entry(
                 },
                 upsert=True
             )
-            print(f"✅ Updated employee status: ₹{new_total}")
+            logger.debug("✅ Updated employee status: ₹%s", new_total)
         else:
             # No entries left, remove status record
-            await db["Status"].delete_one({
-                "employeeId": employee_code, 
-                "month_range": month_range
-            })
-            print(f"🗑️ Removed employee status (no entries left)")
-        
+            async def remove_status(session):
+                await db["Status"].delete_one({
+                    "employeeId": employee_code, 
+                    "month_range": month_range
+                }, session=session)
+                await sync_approval_queue(employee_code, session=session)
+
+            await run_in_transaction(remove_status)
+            logger.debug("🗑️ Removed employee status (no entries left)")
+
+        logger.info("✅ Entry %s deleted for %s (₹%s)", entry_id, employee_code, deleted_amount)
         return JSONResponse(
             status_code=200,
             content={
@@ -6793,7 +9045,7 @@ async def delete_ope_entry(
         )
         
     except Exception as e:
-        print(f"❌ Delete entry error: {str(e)}")
+        logger.exception("❌ Delete entry error: %s", e)
         return JSONResponse(
             status_code=500,
             content={"success": False, "message": f"Server error: {str(e)}"}
@@ -0,0 +1,78 @@
+"""
+rebuild_ope_rollups.py
+──────────────────────
+Recomputes the OPE_rollups collection (monthly sums/counts per
+payroll_month, client, project_id, partner, employee_id, status) from the
+flat OPE_entries store. Run backfill_ope_entries.py first if OPE_entries
+itself is missing or stale.
+
+The app keeps OPE_rollups up to date on every write; this is for the first
+deployment or to repair the collection after manual data fixes.
+
+Usage:
+    python rebuild_ope_rollups.py
+"""
+
+import asyncio
+from datetime import datetime
+
+from main import client, db, build_rollup_docs, write_employee_rollups, ensure_ope_entry_indexes
+
+
+async def rebuild():
+    await ensure_ope_entry_indexes()
+    print("✅ OPE_rollups indexes ensured")
+
+    started_at = datetime.utcnow().isoformat()
+    employees = 0
+    groups = 0
+    current_emp = None
+    current_rows = []
+
+    async def flush():
+        nonlocal employees, groups
+        if current_emp is None:
+            return
+        docs = build_rollup_docs(current_rows)
+        await write_employee_rollups(current_emp, docs)
+        employees += 1
+        groups += len(docs)
+        if employees % 100 == 0:
+            print(f"➡️ Rebuilt {employees} employees | Groups: {groups}")
+
+    # Sorted by employee so each employee's rows arrive together
+    cursor = db["OPE_entries"].find({}).sort([("employee_id", 1), ("payroll_month", 1)])
+    async for row in cursor:
+        if row.get("employee_id") != current_emp:
+            await flush()
+            current_emp = row.get("employee_id")
+            current_rows = []
+        current_rows.append(row)
+    await flush()
+
+    # Employees with no entries left still have groups from older data
+    pruned = await db["OPE_rollups"].delete_many({"updated_at": {"$lt": started_at}})
+
+    print("\n📊 OPE_rollups DONE")
+    print(f"   👤 Employees : {employees}")
+    print(f"   ✅ Groups    : {groups}")
+    print(f"   🗑️ Pruned    : {pruned.deleted_count}")
+
+
+async def main():
+    print("\n" + "#"*60)
+    print("# OPE_entries → OPE_rollups Rebuild")
+    print(f"# Started: {datetime.utcnow().isoformat()}")
+    print("#"*60)
+
+    try:
+        await rebuild()
+        print("\n" + "#"*60)
+        print(f"# Finished: {datetime.utcnow().isoformat()}")
+        print("#"*60)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -548,6 +548,7 @@ document.addEventListener("DOMContentLoaded", () => {
 
   loadEmployeeDetails();
   loadProjectsData();
+  startQueueEvents();
   
   // ✅ Setup navigation
   setupNavigation();
@@ -3855,6 +3856,7 @@ document.addEventListener('DOMContentLoaded', function() {
   }
   loadEmployeeDetails();
   loadProjectsData();
+  startQueueEvents();
 
   setupNavigation();
   checkUserRole();
@@ -4079,6 +4081,94 @@ async function loadProjectsData() {
     }
 }
 
+// ── Live approval updates (Server-Sent Events) ──────────────────────────
+// /api/ope/queue/events pushes a message whenever an approval-queue item for
+// this user (or one of their own claims) changes. The open Pending /
+// Approved / Rejected / Status section is reloaded then, so dashboards stay
+// current without polling. fetch() is used instead of EventSource because
+// the stream needs the Authorization header.
+let queueEventsStarted = false;
+let queueRefreshTimer = null;
+
+function refreshActiveApprovalSection() {
+    const token   = localStorage.getItem('access_token');
+    const empCode = localStorage.getItem('employee_code');
+    if (!token || !empCode) return;
+
+    const isActive = (id) => document.getElementById(id)?.classList.contains('active');
+    if (isActive('navPending')) {
+        loadPendingData(token, empCode);
+    } else if (isActive('navApprove')) {
+        loadApproveData(token, empCode);
+    } else if (isActive('navReject')) {
+        loadRejectData(token, empCode);
+    } else if (isActive('navStatus')) {
+        loadStatusData(token, empCode);
+    }
+}
+
+function scheduleApprovalRefresh() {
+    // One approval touches several queue items - reload once per burst
+    clearTimeout(queueRefreshTimer);
+    queueRefreshTimer = setTimeout(refreshActiveApprovalSection, 1000);
+}
+
+async function startQueueEvents() {
+    if (queueEventsStarted) return;
+    queueEventsStarted = true;
+
+    let retryMs = 5000;
+    let connectedBefore = false;
+
+    while (true) {
+        const token = localStorage.getItem('access_token');
+        if (!token) return;
+
+        try {
+            const res = await fetch(`${API_URL}/api/ope/queue/events`, {
+                headers: { 'Authorization': `Bearer ${token}`, 'Accept': 'text/event-stream' }
+            });
+            if (res.status === 401) return;
+            if (!res.ok || !res.body) throw new Error(`HTTP ${res.status}`);
+
+            const reader  = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const message = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+
+                    let eventType = 'message';
+                    message.split('\n').forEach(line => {
+                        if (line.startsWith('event:')) eventType = line.slice(6).trim();
+                        if (line.startsWith('retry:')) retryMs = parseInt(line.slice(6), 10) || retryMs;
+                    });
+
+                    if (eventType === 'ready') {
+                        // Anything may have changed while we were disconnected
+                        if (connectedBefore) scheduleApprovalRefresh();
+                        connectedBefore = true;
+                    } else if (eventType === 'queue' || eventType === 'status' || eventType === 'resync') {
+                        console.log(`🔔 Live update: ${eventType}`);
+                        scheduleApprovalRefresh();
+                    }
+                }
+            }
+        } catch (err) {
+            console.warn('⚠️ Live updates disconnected:', err.message);
+        }
+
+        await new Promise(resolve => setTimeout(resolve, retryMs));
+    }
+}
+
 function createSearchableDropdown(config) {
     const {
         id,
@@ -0,0 +1,207 @@
+"""
+verify_indexes.py
+─────────────────
+Checks the database against the index registry (MANAGED_INDEXES in main.py):
+
+  1. Missing indexes and indexes that exist with different options
+     (e.g. a unique index that fell back to a plain one on duplicates).
+  2. Indexes on managed collections that are not in the registry, and
+     indexes with no recorded use ($indexStats, counted since the last
+     mongod restart).
+  3. explain() of the hot queries - each must be served by an index
+     (IXSCAN / IDHACK), never by a COLLSCAN.
+
+Exits with status 1 when anything in 1 or 3 fails, so it can gate a deploy
+or run after restoring a backup.
+
+--rebuild drops and recreates conflicting indexes, but only once the
+collection has no duplicate keys; otherwise the duplicates are listed.
+
+Usage:
+    python verify_indexes.py            # report only
+    python verify_indexes.py --apply    # build missing indexes first
+    python verify_indexes.py --rebuild  # also fix conflicting indexes
+"""
+
+import argparse
+import asyncio
+from datetime import datetime
+
+from pymongo.errors import PyMongoError
+
+from main import (
+    client, MANAGED_INDEXES, apply_managed_indexes, existing_indexes, index_key,
+    index_options_match, managed_collection, collection_label, find_winning_plan,
+)
+
+SAMPLE_CODE = "JHS729"
+SAMPLE_MONTH = "Mar 2026"
+INDEXED_STAGES = ("IXSCAN", "IDHACK", "EXPRESS_IXSCAN", "EXPRESS_IDHACK", "COUNT_SCAN", "DISTINCT_SCAN")
+
+# (label, (database, collection), filter) - the lookups behind the busiest endpoints
+HOT_QUERIES = [
+    ("login / current user", (None, "user"), {"employee_code": SAMPLE_CODE}),
+    ("employee details", (None, "Employee_details"), {"EmpID": SAMPLE_CODE}),
+    ("employee master", (None, "Employee"), {"EmployeeId": {"$in": [SAMPLE_CODE]}}),
+    ("partner role", (None, "Partner"), {"PartnerEmpCode": SAMPLE_CODE}),
+    ("manager role", (None, "Reporting_managers"), {"ReportingEmpCode": SAMPLE_CODE}),
+    ("submitter is RM", (None, "Reporting_Managers"), {"EmployeeId": SAMPLE_CODE}),
+    ("OPE history", (None, "OPE_data"), {"employeeId": SAMPLE_CODE}),
+    ("draft entries", (None, "Temp_OPE_data"), {"employeeId": SAMPLE_CODE}),
+    ("employee status", (None, "Status"), {"employeeId": SAMPLE_CODE}),
+    ("status by payroll month", (None, "Status"), {"$or": [
+        {"approval_status.payroll_month": SAMPLE_MONTH},
+        {"approval_status.month_range": SAMPLE_MONTH},
+    ]}),
+    ("approved list", (None, "Approved"), {"ReportingEmpCode": SAMPLE_CODE}),
+    ("rejected list", (None, "Rejected"), {"ReportingEmpCode": SAMPLE_CODE}),
+    ("approver queue", (None, "Approval_queue"), {"approver_code": SAMPLE_CODE}),
+    ("entries by employee", (None, "OPE_entries"), {"employee_id": SAMPLE_CODE, "payroll_month": SAMPLE_MONTH}),
+    ("entries by month", (None, "OPE_entries"), {"payroll_month": SAMPLE_MONTH, "status": "approved"}),
+    ("rollups by month", (None, "OPE_rollups"), {"payroll_month": SAMPLE_MONTH, "status": "approved"}),
+    ("receipt refcount", (None, "Ticket_blobs"), {"file_id": "0" * 24}),
+    ("partner projects", ("Timesheets", "Projects"), {"partner_emp_code": SAMPLE_CODE}),
+]
+
+
+def plan_stages(plan) -> list:
+    """Every stage name in a winning plan, including all branches of an OR."""
+    stages = []
+    if isinstance(plan, dict):
+        if plan.get("stage"):
+            stages.append(plan["stage"])
+        stages += plan_stages(plan.get("inputStage"))
+        for child in plan.get("inputStages") or []:
+            stages += plan_stages(child)
+    return stages
+
+
+async def check_registry() -> list:
+    problems = []
+    print("\n🗂️ Registry")
+    for (database, collection), specs in MANAGED_INDEXES.items():
+        label = collection_label(database, collection)
+        existing = await existing_indexes(managed_collection(database, collection))
+        wanted = {index_key(keys) for keys, _ in specs}
+        for keys, options in specs:
+            current = existing.get(index_key(keys))
+            name = f"{label} {dict(keys)}"
+            if current is None:
+                problems.append(f"missing   {name}")
+            elif not index_options_match(current, options):
+                problems.append(f"conflict  {name} (has {current['name']}, wants {options})")
+        for key, info in existing.items():
+            if info["name"] != "_id_" and key not in wanted:
+                print(f"   ℹ️ unmanaged {label}.{info['name']}")
+    for problem in problems:
+        print(f"   ❌ {problem}")
+    if not problems:
+        print("   ✅ Every managed index is present")
+    return problems
+
+
+async def report_unused():
+    print("\n📉 Unused indexes (no accesses since mongod start)")
+    unused = 0
+    for database, collection in MANAGED_INDEXES:
+        coll = managed_collection(database, collection)
+        try:
+            async for stat in coll.aggregate([{"$indexStats": {}}]):
+                if stat["name"] != "_id_" and stat["accesses"]["ops"] == 0:
+                    since = stat["accesses"]["since"].strftime("%Y-%m-%d %H:%M")
+                    print(f"   ⚠️ {collection_label(database, collection)}.{stat['name']} (since {since})")
+                    unused += 1
+        except PyMongoError as e:
+            print(f"   ⚠️ {collection_label(database, collection)}: $indexStats failed: {e}")
+    if not unused:
+        print("   ✅ None")
+
+
+async def check_hot_queries() -> list:
+    problems = []
+    print("\n🔎 Hot query plans")
+    for label, (database, collection), query in HOT_QUERIES:
+        coll = managed_collection(database, collection)
+        try:
+            explain = await coll.find(query).explain()
+        except PyMongoError as e:
+            problems.append(f"{label}: explain failed: {e}")
+            print(f"   ❌ {label:<26} explain failed: {e}")
+            continue
+        stages = plan_stages(find_winning_plan(explain))
+        chain = " <- ".join(stages) or "no plan"
+        if stages == ["EOF"]:
+            print(f"   ⚠️ {label:<26} {collection_label(database, collection)} does not exist")
+        elif "COLLSCAN" in stages or not any(stage in INDEXED_STAGES for stage in stages):
+            problems.append(f"{label}: {chain}")
+            print(f"   ❌ {label:<26} {chain}")
+        else:
+            print(f"   ✅ {label:<26} {chain}")
+    return problems
+
+
+async def rebuild_conflicts():
+    print("\n🔧 Rebuilding conflicting indexes")
+    for (database, collection), specs in MANAGED_INDEXES.items():
+        coll = managed_collection(database, collection)
+        label = collection_label(database, collection)
+        existing = await existing_indexes(coll)
+        for keys, options in specs:
+            current = existing.get(index_key(keys))
+            if current is None or index_options_match(current, options):
+                continue
+            if options.get("unique"):
+                group_id = {field.replace(".", "_"): f"${field}" for field, _ in keys}
+                duplicates = await coll.aggregate([
+                    {"$match": options.get("partialFilterExpression", {})},
+                    {"$group": {"_id": group_id, "count": {"$sum": 1}}},
+                    {"$match": {"count": {"$gt": 1}}},
+                    {"$limit": 10},
+                ]).to_list(length=None)
+                if duplicates:
+                    print(f"   ❌ {label} {dict(keys)}: duplicate keys, clean these up first:")
+                    for dup in duplicates:
+                        print(f"      {dup['_id']} x{dup['count']}")
+                    continue
+            await coll.drop_index(current["name"])
+            await coll.create_index(keys, **options)
+            print(f"   ✅ {label}.{current['name']} rebuilt with {options}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Verify MongoDB indexes against the registry in main.py")
+    parser.add_argument("--apply", action="store_true", help="build missing indexes before verifying")
+    parser.add_argument("--rebuild", action="store_true", help="drop and recreate conflicting indexes")
+    args = parser.parse_args()
+
+    print("\n" + "#"*60)
+    print("# Index verification")
+    print(f"# Started: {datetime.utcnow().isoformat()}")
+    print("#"*60)
+
+    try:
+        if args.apply or args.rebuild:
+            report = await apply_managed_indexes()
+            print(f"\n🏗️ Built {len(report['created'])} missing indexes")
+            for name in report["created"]:
+                print(f"   ✅ {name}")
+        if args.rebuild:
+            await rebuild_conflicts()
+
+        problems = await check_registry()
+        await report_unused()
+        problems += await check_hot_queries()
+
+        print("\n" + "#"*60)
+        print(f"# {'FAILED - ' + str(len(problems)) + ' problem(s)' if problems else 'OK'}")
+        print(f"# Finished: {datetime.utcnow().isoformat()}")
+        print("#"*60)
+    finally:
+        client.close()
+
+    if problems:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())